@@ -2,6 +2,13 @@
 Full Orchestrator — ADK 1.19
 Workflow:
 Intent → Validation → NL2SQL → DB → Answer
+
+Shortcut:
+Intent → question cache hit → Answer (Validation and NL2SQL are skipped)
+Intent → recent failure / empty result (negative cache) → same answer again
+
+BigQuery is awaited (run_sql_tool_async) - a slow query never blocks
+the event loop the other chat sessions run on.
 """
 
 import sys
@@ -26,12 +33,37 @@ from agents.intent_recognition_agent.intent_recognition_agent import (
 )
 from agents.validation_agent.validation_agent import validation_agent
 from agents.nl2sql.nl2sql_agent import nl2sql_agent
-from agents.db.tools import run_sql_tool, RunSQLInput
+from agents.db.tools import (
+    run_sql_tool_async,
+    RunSQLInput,
+    lookup_question_cache,
+    lookup_negative_question,
+    record_question_failure,
+    run_in_cache_pool,
+)
+from agents.cache_sql.negative import EMPTY_RESULT, FALLBACK_NO_EXECUTION
+from agents.db.cost_guard import QueryBudgetExceeded
+from agents.cache_sql.slots import append_question_log
 
 
 # =============================================================================
 # Answer formatter (replaces Answer Agent)
 # =============================================================================
+NO_SQL_MESSAGE = "Unable to generate a valid SQL query for your request."
+
+# Rows shown in a chat answer - run_sql fetches no more (max_rows)
+ANSWER_MAX_ROWS = 20
+
+
+def format_negative_answer(entry) -> str:
+    """Answer for a question that recently failed or returned no rows."""
+    if entry.error_class == FALLBACK_NO_EXECUTION:
+        return NO_SQL_MESSAGE
+    if entry.error_class == EMPTY_RESULT:
+        return "No results found."
+    return f"Query execution failed: {entry.message}"
+
+
 def format_answer(db_output: dict) -> str:
     if not db_output:
         return "No results found."
@@ -43,28 +75,34 @@ def format_answer(db_output: dict) -> str:
         return "No results found."
 
     source_note = "  (from cache)" if from_cache else "  (from database)"
+    if db_output.get("stale"):
+        source_note = "  (from cache, refreshing)"
+
+    # Rows shown, read once - a compressed ColumnarRows decodes its table per read
+    shown = rows[:ANSWER_MAX_ROWS]
 
     # Single scalar result
-    if len(rows) == 1 and len(rows[0]) == 1:
-        value = list(rows[0].values())[0]
+    if len(rows) == 1 and len(shown[0]) == 1:
+        value = list(shown[0].values())[0]
         if value is None:
             return f"**Result**: No data found{source_note}"
         return f"**Result**: {value:,}{source_note}"
 
     # Table result
-    headers = list(rows[0].keys())
+    total_rows = db_output.get("total_rows", len(rows))
+    headers = list(shown[0].keys())
     lines = [
-        f"**Query returned {len(rows)} rows**{source_note}",
+        f"**Query returned {total_rows} rows**{source_note}",
         "",
         "| " + " | ".join(headers) + " |",
         "| " + " | ".join(["---"] * len(headers)) + " |",
     ]
 
-    for row in rows[:20]:
+    for row in shown:
         lines.append("| " + " | ".join(str(row[h]) for h in headers) + " |")
 
-    if len(rows) > 20:
-        lines.append(f"\n*Showing 20 of {len(rows)} rows*")
+    if total_rows > ANSWER_MAX_ROWS:
+        lines.append(f"\n*Showing {ANSWER_MAX_ROWS} of {total_rows} rows*")
 
     return "\n".join(lines)
 
@@ -117,6 +155,7 @@ class ClickInflationOrchestrator(BaseAgent):
         status = intent_result.get("status")
         message = intent_result.get("message_to_user")
         final_question = intent_result.get("final_question")
+        question_slots = intent_result.get("slots")
 
         # Make final_question available downstream
         state["final_question"] = final_question
@@ -136,6 +175,34 @@ class ClickInflationOrchestrator(BaseAgent):
                 )
             return
 
+        # ---------------------------------------------------------------------
+        # 3b. Question cache - a repeated question needs no Validation/NL2SQL
+        #     (lookups run in the cache pool - they may wait on the shared tier)
+        # ---------------------------------------------------------------------
+        if status != "anomaly" and final_question:
+            cached_result = await run_in_cache_pool(lookup_question_cache, final_question, slots=question_slots)
+            if cached_result is not None:
+                await run_in_cache_pool(append_question_log, final_question, question_slots, cached_result.get("sql"))
+                yield Event(
+                    author=self.name,
+                    content=Content(
+                        role="model",
+                        parts=[Part(text=format_answer(cached_result))]
+                    )
+                )
+                return
+
+            negative = await run_in_cache_pool(lookup_negative_question, final_question)
+            if negative is not None:
+                yield Event(
+                    author=self.name,
+                    content=Content(
+                        role="model",
+                        parts=[Part(text=format_negative_answer(negative))]
+                    )
+                )
+                return
+
         # ---------------------------------------------------------------------
         # 4. Validation (technical gate only)
         # ---------------------------------------------------------------------
@@ -159,14 +226,14 @@ class ClickInflationOrchestrator(BaseAgent):
         # ---------------------------------------------------------------------
         # ❌ No valid SQL
         # ---------------------------------------------------------------------
-        if not sql or sql == "FALLBACK_NO_EXECUTION":
+        if not sql or sql == FALLBACK_NO_EXECUTION:
+            if status != "anomaly":
+                await run_in_cache_pool(record_question_failure, final_question, FALLBACK_NO_EXECUTION)
             yield Event(
                 author=self.name,
                 content=Content(
                     role="model",
-                    parts=[Part(
-                        text="Unable to generate a valid SQL query for your request."
-                    )]
+                    parts=[Part(text=NO_SQL_MESSAGE)]
                 )
             )
             return
@@ -176,7 +243,7 @@ class ClickInflationOrchestrator(BaseAgent):
         # ---------------------------------------------------------------------
         if output_tables:
             try:
-                db_result = run_sql_tool(
+                db_result = await run_sql_tool_async(
                     RunSQLInput(
                         sql=sql,
                         final_question=final_question,
@@ -225,10 +292,11 @@ class ClickInflationOrchestrator(BaseAgent):
                 try:
                     # Query each table to get sample data
                     query = f"SELECT * FROM `{table_name}` LIMIT 20"
-                    table_result = run_sql_tool(
+                    table_result = await run_sql_tool_async(
                         RunSQLInput(
                             sql=query,
-                            final_question=None  # No caching for table preview queries
+                            final_question=None,  # No caching for table preview queries
+                            max_rows=ANSWER_MAX_ROWS
                         )
                     )
                     
@@ -268,12 +336,26 @@ class ClickInflationOrchestrator(BaseAgent):
         # ---------------------------------------------------------------------
         # NORMAL MODE
         # ---------------------------------------------------------------------
-        db_result = run_sql_tool(
-            RunSQLInput(
-                sql=sql,
-                final_question=final_question
+        try:
+            db_result = await run_sql_tool_async(
+                RunSQLInput(
+                    sql=sql,
+                    final_question=final_question,
+                    question_slots=question_slots,
+                    max_rows=ANSWER_MAX_ROWS
+                )
             )
-        )
+        except QueryBudgetExceeded as e:
+            # Rejected by the dry run - nothing was billed
+            yield Event(
+                author=self.name,
+                content=Content(
+                    role="model",
+                    parts=[Part(text=f"Query not executed: {e}")]
+                )
+            )
+            return
+        await run_in_cache_pool(append_question_log, final_question, question_slots, db_result.get("sql"))
 
         answer = format_answer(db_result)
 
@@ -0,0 +1,157 @@
+"""
+Cache Admission - TinyLFU Filter in Front of the LRU
+=====================================================
+Analysts ask a long tail of one-off exploratory questions. With plain
+LRU every one of them is inserted, and once the cache is full each
+insert evicts an entry that was going to be used again.
+
+TinyLFU admits a new result into a full cache only if it is likely to
+be used more often than the entry it would evict:
+
+1. Every lookup (hit or miss) is counted in a count-min sketch - a few
+   small counters per key, fixed memory, no per-key state
+2. When the cache is full, the candidate's estimated frequency is
+   compared to that of the LRU victim - the candidate is admitted only
+   if it is strictly more frequent
+3. Aging: after SAMPLE_FACTOR x width increments all counters are
+   halved, so old popularity fades
+
+Results that were expensive to compute (>= CACHE_ADMISSION_MIN_BYTES
+scanned) are always admitted - recomputing them costs more than the
+entry they evict.
+
+While the cache has room, everything is admitted (as before).
+"""
+
+import os
+import threading
+from array import array
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# TinyLFU admission for a full cache ("false" disables - plain LRU)
+CACHE_ADMISSION = os.getenv("CACHE_ADMISSION", "true").lower() not in ("0", "false", "no")
+
+# Results that scanned at least this many bytes are always admitted (1 GiB)
+CACHE_ADMISSION_MIN_BYTES = int(os.getenv("CACHE_ADMISSION_MIN_BYTES", str(1024 ** 3)))
+
+# Rows of the count-min sketch (independent hash functions)
+SKETCH_DEPTH = 4
+
+# Smallest sketch width (counters per row)
+MIN_SKETCH_WIDTH = 1024
+
+# Counters are halved after SAMPLE_FACTOR x width increments
+SAMPLE_FACTOR = 10
+
+# Counter ceiling (4-bit counters in the TinyLFU paper)
+MAX_COUNT = 15
+
+_SEEDS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0x27D4EB2F165667C5)
+_MASK64 = (1 << 64) - 1
+
+
+# =============================================================================
+# Count-Min Sketch
+# =============================================================================
+
+class FrequencySketch:
+    """
+    Count-min sketch of access frequencies with periodic aging.
+
+    Attributes:
+        width: Counters per row (a power of two)
+        additions: Increments since the last aging
+        resets: Number of agings so far
+    """
+
+    def __init__(self, capacity: int):
+        width = MIN_SKETCH_WIDTH
+        while width < capacity:
+            width *= 2
+        self.width = width
+        self.additions = 0
+        self.resets = 0
+        self._sample_size = SAMPLE_FACTOR * width
+        self._rows = [array("B", bytes(width)) for _ in range(SKETCH_DEPTH)]
+        self._lock = threading.Lock()
+
+    def _indexes(self, item):
+        h = hash(item) & _MASK64
+        for seed in _SEEDS[:SKETCH_DEPTH]:
+            yield (((h ^ seed) * 0x100000001B3) & _MASK64) >> 32 & (self.width - 1)
+
+    def increment(self, item) -> None:
+        """Counts one access of item."""
+        with self._lock:
+            for row, index in zip(self._rows, self._indexes(item)):
+                if row[index] < MAX_COUNT:
+                    row[index] += 1
+            self.additions += 1
+            if self.additions >= self._sample_size:
+                self._age()
+
+    def estimate(self, item) -> int:
+        """Estimated number of recent accesses of item (never underestimated before aging)."""
+        return min(row[index] for row, index in zip(self._rows, self._indexes(item)))
+
+    def _age(self) -> None:
+        for row in self._rows:
+            for index in range(self.width):
+                row[index] >>= 1
+        self.additions //= 2
+        self.resets += 1
+
+
+# =============================================================================
+# Admission Filter
+# =============================================================================
+
+class TinyLFUAdmission:
+    """
+    Decides whether a new result may replace the LRU victim of a full cache.
+
+    Attributes:
+        sketch: Access frequencies of (layer, key)
+        min_bytes: Bytes scanned from which a result is always admitted
+        admitted / rejected: Decisions taken while the cache was full
+    """
+
+    def __init__(self, capacity: int, min_bytes: int = None):
+        self.sketch = FrequencySketch(capacity)
+        self.min_bytes = min_bytes if min_bytes is not None else CACHE_ADMISSION_MIN_BYTES
+        self.admitted = 0
+        self.rejected = 0
+
+    def record(self, layer: str, key: str) -> None:
+        """Counts a lookup of an entry (hit or miss)."""
+        self.sketch.increment((layer, key))
+
+    def admit(self, candidate: tuple, victim: tuple, bytes_scanned: int = None) -> bool:
+        """
+        Compares a candidate to the entry it would evict.
+
+        Args:
+            candidate: (layer, key) of the new result
+            victim: (layer, key) of the least recently used entry, or None
+            bytes_scanned: Bytes BigQuery scanned for the candidate, if known
+
+        Returns:
+            True if the candidate should be stored
+        """
+        if victim is None or (bytes_scanned is not None and bytes_scanned >= self.min_bytes):
+            admitted = True
+        else:
+            admitted = self.sketch.estimate(candidate) > self.sketch.estimate(victim)
+        if admitted:
+            self.admitted += 1
+        else:
+            self.rejected += 1
+        return admitted
@@ -0,0 +1,168 @@
+"""
+Cache Codec - Data-Only Serialization of Cache Values
+======================================================
+Cache values leave the process in three places: the SQLite file
+(storage.py), the shared tier (shared.py) and snapshots (snapshot.py).
+pickle would run code from any of them on load, so values are written
+in a format that can only describe data:
+
+    b"CACHEV1"                            - magic + version
+    length (uint32) + JSON document       - the value, with tagged types
+    (length (uint32) + Arrow IPC stream)* - one per ColumnarRows in the value
+
+JSON has no dates, decimals or tuples, so those are written as tagged
+objects ({"__type__": "date", "value": "2025-01-01"}). Dicts whose keys
+are not all strings, or that contain "__type__" themselves, are tagged
+too. A ColumnarRows is a tag pointing at its Arrow IPC blob - compressed
+payloads are stored as they are.
+
+decode_value raises CodecError for anything that is not such a payload
+(e.g. a pickle); callers treat that as a miss.
+"""
+
+import base64
+import json
+import struct
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from agents.cache_sql.columnar import ColumnarRows
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+CODEC_MAGIC = b"CACHEV1"
+
+_LENGTH_FORMAT = ">I"
+_LENGTH_SIZE = struct.calcsize(_LENGTH_FORMAT)
+_TYPE = "__type__"
+
+
+class CodecError(ValueError):
+    """Raised for values that cannot be encoded and payloads that cannot be decoded."""
+
+
+# =============================================================================
+# Encode
+# =============================================================================
+
+def _tag(value, blobs: list):
+    """Converts a value to JSON-compatible data (blobs collects the Arrow streams)."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, ColumnarRows):
+        payload, compression = value.to_ipc()
+        blobs.append(payload)
+        return {_TYPE: "arrow", "blob": len(blobs) - 1, "rows": len(value), "compression": compression}
+    if isinstance(value, list):
+        return [_tag(item, blobs) for item in value]
+    if isinstance(value, tuple):
+        return {_TYPE: "tuple", "items": [_tag(item, blobs) for item in value]}
+    if isinstance(value, dict):
+        if _TYPE in value or not all(isinstance(key, str) for key in value):
+            return {_TYPE: "dict", "items": [[_tag(k, blobs), _tag(v, blobs)] for k, v in value.items()]}
+        return {key: _tag(item, blobs) for key, item in value.items()}
+    # datetime before date - datetime is a subclass of date
+    if isinstance(value, datetime):
+        return {_TYPE: "datetime", "value": value.isoformat()}
+    if isinstance(value, date):
+        return {_TYPE: "date", "value": value.isoformat()}
+    if isinstance(value, time):
+        return {_TYPE: "time", "value": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {_TYPE: "decimal", "value": str(value)}
+    if isinstance(value, bytes):
+        return {_TYPE: "bytes", "value": base64.b64encode(value).decode("ascii")}
+    raise CodecError(f"Cannot encode a {type(value).__name__} in the cache")
+
+
+def encode_value(value) -> bytes:
+    """
+    Serializes a cache value (result dict, timestamp, sources...).
+
+    Args:
+        value: None, bool, int, float, str, list, tuple, dict, date,
+            datetime, time, Decimal, bytes or ColumnarRows (nested freely)
+
+    Returns:
+        Payload for decode_value
+
+    Raises:
+        CodecError: If the value holds another type
+    """
+    blobs = []
+    document = json.dumps(_tag(value, blobs), separators=(",", ":")).encode("utf-8")
+    parts = [CODEC_MAGIC, struct.pack(_LENGTH_FORMAT, len(document)), document]
+    for blob in blobs:
+        parts.append(struct.pack(_LENGTH_FORMAT, len(blob)))
+        parts.append(blob)
+    return b"".join(parts)
+
+
+# =============================================================================
+# Decode
+# =============================================================================
+
+_SCALARS = {
+    "datetime": datetime.fromisoformat,
+    "date": date.fromisoformat,
+    "time": time.fromisoformat,
+    "decimal": Decimal,
+    "bytes": base64.b64decode,
+}
+
+
+def _untag(value, blobs: list):
+    if isinstance(value, list):
+        return [_untag(item, blobs) for item in value]
+    if not isinstance(value, dict):
+        return value
+    kind = value.get(_TYPE)
+    if kind is None:
+        return {key: _untag(item, blobs) for key, item in value.items()}
+    if kind == "tuple":
+        return tuple(_untag(item, blobs) for item in value["items"])
+    if kind == "dict":
+        return {_untag(k, blobs): _untag(v, blobs) for k, v in value["items"]}
+    if kind == "arrow":
+        return ColumnarRows.from_ipc(blobs[value["blob"]], value["rows"], value["compression"])
+    if kind in _SCALARS:
+        return _SCALARS[kind](value["value"])
+    raise CodecError(f"Unknown cache value type {kind!r}")
+
+
+def _read_block(payload: bytes, offset: int) -> tuple:
+    if offset + _LENGTH_SIZE > len(payload):
+        raise CodecError("Truncated cache value")
+    (length,) = struct.unpack_from(_LENGTH_FORMAT, payload, offset)
+    start = offset + _LENGTH_SIZE
+    if start + length > len(payload):
+        raise CodecError("Truncated cache value")
+    return payload[start:start + length], start + length
+
+
+def decode_value(payload: bytes):
+    """
+    Reads a payload written by encode_value.
+
+    Raises:
+        CodecError: Not a cache value payload, truncated or malformed
+    """
+    if not isinstance(payload, (bytes, bytearray, memoryview)):
+        raise CodecError("Cache value payload must be bytes")
+    payload = bytes(payload)
+    if not payload.startswith(CODEC_MAGIC):
+        raise CodecError("Not a cache value payload")
+    document, offset = _read_block(payload, len(CODEC_MAGIC))
+    blobs = []
+    while offset < len(payload):
+        blob, offset = _read_block(payload, offset)
+        blobs.append(blob)
+    try:
+        return _untag(json.loads(document), blobs)
+    except CodecError:
+        raise
+    except Exception as e:
+        raise CodecError(f"Malformed cache value: {e}") from e
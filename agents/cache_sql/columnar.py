@@ -0,0 +1,237 @@
+"""
+Columnar Results - Compact Storage of Cached Result Sets
+=========================================================
+A result set stored as a list of row dicts costs a dict, a key table and
+a boxed Python object per cell - hundreds of bytes per cell for large
+breakdowns (hourly x media_source over a month).
+
+ColumnarRows keeps the same rows as an Arrow table instead:
+- One contiguous buffer per column (ints, floats, dates...)
+- String columns dictionary-encoded (media_source repeats a few values)
+- Optional compression of the whole table (CACHE_COMPRESSION=zstd / lz4)
+
+It is a read-only Sequence of row dicts - len(), rows[0], rows[:20] and
+iteration work as before, and rows are only turned back into dicts when
+they are read (format_answer reads at most 20).
+
+A compressed table is decoded when it is read. The last few decoded
+tables are kept (DECODED_CACHE_SIZE), so back-to-back reads of the same
+result - rows[0] then rows[:20], a subsumption or daily merge right
+after the lookup - decompress it once.
+
+Results that Arrow cannot represent (mixed-type columns) stay a list.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+
+import pyarrow as pa
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# Compression codec for cached tables: "zstd", "lz4" or "none"
+CACHE_COMPRESSION = os.getenv("CACHE_COMPRESSION", "none").lower()
+
+# Rows materialized per batch while iterating
+ITER_BATCH_ROWS = 1024
+
+# Decoded (decompressed) tables kept for back-to-back reads
+DECODED_CACHE_SIZE = 4
+
+
+# =============================================================================
+# Columnar Rows
+# =============================================================================
+
+def _dictionary_encode(table: pa.Table) -> pa.Table:
+    """Dictionary-encodes every string column."""
+    for index, field in enumerate(table.schema):
+        if pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+            table = table.set_column(index, field.name, table.column(index).dictionary_encode())
+    return table
+
+
+def _serialize(table: pa.Table, compression=None) -> bytes:
+    """Writes a table as an Arrow IPC stream (optionally compressed)."""
+    sink = pa.BufferOutputStream()
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _deserialize(payload: bytes) -> pa.Table:
+    return pa.ipc.open_stream(pa.py_buffer(payload)).read_all()
+
+
+# {id(payload): (payload, table)} - the payload is kept so its id is not reused
+_decoded = OrderedDict()
+_decoded_lock = threading.Lock()
+
+
+def _decode_cached(payload: bytes) -> pa.Table:
+    """Deserializes a compressed payload, reusing the recently decoded tables."""
+    with _decoded_lock:
+        cached = _decoded.get(id(payload))
+        if cached is not None and cached[0] is payload:
+            _decoded.move_to_end(id(payload))
+            return cached[1]
+    table = _deserialize(payload)
+    with _decoded_lock:
+        _decoded[id(payload)] = (payload, table)
+        while len(_decoded) > DECODED_CACHE_SIZE:
+            _decoded.popitem(last=False)
+    return table
+
+
+class ColumnarRows(Sequence):
+    """
+    Read-only sequence of row dicts backed by an Arrow table.
+
+    Attributes:
+        compression: Codec of the stored table, or None if uncompressed
+        nbytes: Bytes held by the stored table (buffers or compressed payload)
+    """
+
+    def __init__(self, table: pa.Table = None, payload: bytes = None,
+                 num_rows: int = 0, compression: str = None):
+        self._table = table        # Uncompressed table, or None if compressed
+        self._payload = payload    # Compressed IPC stream, or None
+        self._num_rows = table.num_rows if table is not None else num_rows
+        self.compression = compression
+
+    @classmethod
+    def from_rows(cls, rows: list, compression: str = None):
+        """
+        Converts a list of row dicts to columnar form.
+
+        Args:
+            rows: List of dicts (one per row, same keys)
+            compression: "zstd" / "lz4" / "none" (default: CACHE_COMPRESSION)
+
+        Returns:
+            ColumnarRows, or the original list if Arrow cannot represent it
+        """
+        if isinstance(rows, ColumnarRows) or not rows:
+            return rows
+        try:
+            table = _dictionary_encode(pa.Table.from_pylist(rows))
+        except (pa.ArrowException, TypeError, ValueError):
+            return rows
+        return cls._from_table(table, compression)
+
+    @classmethod
+    def from_pages(cls, pages, compression: str = None):
+        """
+        Converts a result page by page - only one page of dicts is alive at a time.
+
+        Args:
+            pages: Iterable of lists of row dicts (e.g. StreamingRows.pages())
+            compression: "zstd" / "lz4" / "none" (default: CACHE_COMPRESSION)
+
+        Returns:
+            ColumnarRows, or a list of dicts if Arrow cannot represent the rows
+        """
+        tables, rows = [], None
+        for page in pages:
+            if rows is not None:
+                rows.extend(page)
+                continue
+            try:
+                tables.append(pa.Table.from_pylist(page))
+            except (pa.ArrowException, TypeError, ValueError):
+                rows = [row for table in tables for row in table.to_pylist()] + list(page)
+        if rows is None:
+            try:
+                table = pa.concat_tables(tables, promote_options="permissive") if tables else None
+            except (pa.ArrowException, TypeError, ValueError):
+                rows = [row for table in tables for row in table.to_pylist()]
+        if rows is not None:
+            return rows
+        if table is None or table.num_rows == 0:
+            return []
+        return cls._from_table(_dictionary_encode(table), compression)
+
+    @classmethod
+    def _from_table(cls, table: pa.Table, compression: str = None):
+        compression = (compression or CACHE_COMPRESSION).lower()
+        if compression in ("", "none") or not pa.Codec.is_available(compression):
+            return cls(table=table)
+        payload = _serialize(table, compression)
+        return cls(payload=payload, num_rows=table.num_rows, compression=compression)
+
+    @property
+    def table(self) -> pa.Table:
+        """The Arrow table (a compressed table is decoded, or reused if decoded recently)."""
+        if self._table is not None:
+            return self._table
+        return _decode_cached(self._payload)
+
+    @property
+    def nbytes(self) -> int:
+        if self._payload is not None:
+            return len(self._payload)
+        return self._table.nbytes
+
+    def __len__(self) -> int:
+        return self._num_rows
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._num_rows)
+            if step != 1:
+                return self.to_list()[index]
+            return self.table.slice(start, max(stop - start, 0)).to_pylist()
+        if index < 0:
+            index += self._num_rows
+        if not 0 <= index < self._num_rows:
+            raise IndexError("row index out of range")
+        return self.table.slice(index, 1).to_pylist()[0]
+
+    def __iter__(self):
+        table = self.table
+        for offset in range(0, self._num_rows, ITER_BATCH_ROWS):
+            yield from table.slice(offset, ITER_BATCH_ROWS).to_pylist()
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (ColumnarRows, list, tuple)):
+            return len(self) == len(other) and self.to_list() == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"ColumnarRows(rows={self._num_rows}, bytes={self.nbytes}, compression={self.compression})"
+
+    def to_list(self) -> list:
+        """Materializes all rows as a list of dicts (e.g. for JSON responses)."""
+        return self.table.to_pylist()
+
+    def to_ipc(self) -> tuple:
+        """
+        Returns the stored table as an Arrow IPC stream.
+
+        Returns:
+            (payload, compression) - compressed payloads are returned as stored
+        """
+        if self._payload is not None:
+            return self._payload, self.compression
+        return _serialize(self._table), None
+
+    @classmethod
+    def from_ipc(cls, payload: bytes, num_rows: int, compression: str = None):
+        """Inverse of to_ipc - compressed payloads stay compressed."""
+        if compression:
+            return cls(payload=payload, num_rows=num_rows, compression=compression)
+        return cls(table=_deserialize(payload))
+
+    def __reduce__(self):
+        # Copied / pickled as an IPC stream (the cache itself stores it with codec.py)
+        payload, compression = self.to_ipc()
+        return (ColumnarRows.from_ipc, (payload, self._num_rows, compression))
@@ -0,0 +1,189 @@
+"""
+Per-Day Partials - Incremental Caching of Date-Range Queries
+=============================================================
+"clicks by media_source for 2025-01-01..2025-01-31" and the same
+question for 2025-01-02..2025-02-01 share 30 days, but are two unrelated
+SQL cache entries - the sliding window scans the whole month again.
+
+Aggregate queries over a date range of a DAILY_TABLES table are split
+into one partial per day: the same query with the range replaced by a
+single day (and no ORDER BY). Each partial is an ordinary SQL cache
+entry (fingerprint of its SQL), so a one-day question with the same
+shape shares it too.
+
+Flow (see run_sql - _execute_and_cache_sql):
+1. Look up the partial of every day in the range
+2. Fetch all missing days in ONE BigQuery query:
+       SELECT <projections>, DATE(event_time) AS _cache_day ...
+       WHERE ... AND DATE(event_time) IN ('2025-02-01')
+       GROUP BY <dimensions>, DATE(event_time)
+3. Cache each fetched day as its partial (days with no rows go to the
+   negative cache, like any empty result)
+4. Merge the partials locally: re-aggregate the measures
+   (SUM -> sum, COUNT -> sum, MIN -> min, MAX -> max - see subsumption.py)
+
+Only queries subsumption.py can re-aggregate are split (SUM / COUNT /
+MIN / MAX, one bounded DATE(...) range, no LIMIT).
+"""
+
+import os
+from collections import namedtuple
+from datetime import timedelta
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from dotenv import load_dotenv
+
+from agents.cache_sql.fingerprint import fingerprint_sql
+from agents.cache_sql.subsumption import query_shape, evaluate, date_condition
+
+load_dotenv()
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# Split date-range queries into cached per-day partials ("false" disables)
+CACHE_DAILY_PARTIALS = os.getenv("CACHE_DAILY_PARTIALS", "true").lower() not in ("0", "false", "no")
+
+# Tables whose range queries are split (comma-separated table names)
+DAILY_TABLES = {
+    name.strip().lower()
+    for name in os.getenv("CACHE_DAILY_TABLES", "optimized_clicks").split(",")
+    if name.strip()
+}
+
+# Longest range that is split (longer ranges run as one query)
+DAILY_MAX_DAYS = 366
+
+# Day column added to the batched query of missing days
+DAY_COLUMN = "_cache_day"
+
+
+DailyPlan = namedtuple("DailyPlan", [
+    "shape",        # QueryShape of the range query
+    "select",       # Parsed range query without its date range and ORDER BY
+    "date_column",  # Date expression of the range, e.g. DATE(event_time)
+    "days",         # Every day of the range (datetime.date)
+])
+
+
+# =============================================================================
+# Plan
+# =============================================================================
+
+def _conjuncts(where) -> list:
+    if where is None:
+        return []
+    condition = where.this
+    return list(condition.flatten()) if isinstance(condition, exp.And) else [condition]
+
+
+def daily_plan(sql: str):
+    """
+    Splits a date-range aggregate query into days.
+
+    Args:
+        sql: SQL query (absolute dates)
+
+    Returns:
+        DailyPlan, or None if the query is not a range aggregate over a
+        DAILY_TABLES table that can be merged from per-day partials
+    """
+    if not CACHE_DAILY_PARTIALS:
+        return None
+    canonical = fingerprint_sql(sql)
+    shape = query_shape(canonical)
+    if shape is None or shape.limit is not None or len(shape.dates) != 1:
+        return None
+    if shape.table.rsplit(".", 1)[-1] not in DAILY_TABLES:
+        return None
+    date_column, (first, last) = next(iter(shape.dates.items()))
+    if first is None or last is None or not 0 < (last - first).days < DAILY_MAX_DAYS:
+        return None
+
+    try:
+        select = sqlglot.parse_one(canonical, read="bigquery")
+    except (SqlglotError, ValueError, RecursionError):
+        return None
+    kept = []
+    for conjunct in _conjuncts(select.args.get("where")):
+        condition = date_condition(conjunct.unnest())
+        if condition is None or condition[0] != date_column:
+            kept.append(conjunct)
+    select.set("where", exp.Where(this=exp.and_(*kept)) if kept else None)
+    select.set("order", None)
+
+    days = [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+    return DailyPlan(shape, select, date_column, days)
+
+
+def _with_condition(plan: DailyPlan, condition: str) -> exp.Select:
+    select = plan.select.copy()
+    return select.where(condition, dialect="bigquery")
+
+
+def day_sql(plan: DailyPlan, day) -> str:
+    """SQL of the partial of one day (its fingerprint is the cache key)."""
+    select = _with_condition(plan, f"{plan.date_column} = '{day.isoformat()}'")
+    return select.sql(dialect="bigquery")
+
+
+def batch_sql(plan: DailyPlan, days: list) -> str:
+    """
+    One query returning the partials of several days, tagged with DAY_COLUMN.
+
+    Args:
+        plan: Result of daily_plan
+        days: Days to fetch
+    """
+    values = ", ".join(f"'{day.isoformat()}'" for day in days)
+    select = _with_condition(plan, f"{plan.date_column} IN ({values})")
+    date_expression = sqlglot.parse_one(plan.date_column, read="bigquery")
+    select = select.select(exp.alias_(date_expression, DAY_COLUMN), append=True)
+    grouped = [e.sql(dialect="bigquery") for e in (select.args["group"].expressions if select.args.get("group") else [])]
+    if plan.date_column not in grouped:
+        select = select.group_by(date_expression.copy(), append=True)
+    return select.sql(dialect="bigquery")
+
+
+def split_by_day(rows) -> dict:
+    """
+    Splits the rows of batch_sql by day.
+
+    Returns:
+        {"YYYY-MM-DD": [row dicts without DAY_COLUMN]}
+    """
+    by_day = {}
+    for row in rows:
+        row = dict(row)
+        day = str(row.pop(DAY_COLUMN))[:10]
+        by_day.setdefault(day, []).append(row)
+    return by_day
+
+
+def merge_days(plan: DailyPlan, parts) -> list:
+    """
+    Merges per-day partials into the rows of the range query.
+
+    Args:
+        plan: Result of daily_plan
+        parts: Rows of each day (lists / ColumnarRows)
+
+    Returns:
+        List of row dicts, as BigQuery would return them for the range
+    """
+    rows = [dict(row) for part in parts for row in part]
+    shape = plan.shape
+    if not rows:
+        if shape.dimensions:
+            return []
+        # Aggregate without GROUP BY - one row (SUM of nothing is NULL, COUNT is 0)
+        return [{
+            output: (0 if identity[0] == "COUNT" else None)
+            for _, identity, output in shape.outputs
+        }]
+    # Partials have the range query's columns - re-aggregate them as-is
+    return evaluate(rows, shape, shape, {"value_filters": {}, "date_filters": {}})
@@ -0,0 +1,260 @@
+"""
+Relative Date Resolution - Make "yesterday"-Style Queries Cacheable
+====================================================================
+The NL2SQL agent writes relative dates as expressions, e.g.
+    DATE('2025-01-10') - INTERVAL 1 DAY
+    DATE_SUB(CURRENT_DATE(), INTERVAL 7 DAY)
+Queries like these were never cached (is_cacheable refuses "interval",
+"current_date", ...). This module rewrites them into absolute bounds
+before execution:
+    DATE('2025-01-09')
+
+The rewritten query means exactly the same thing on the day it runs,
+so its result can be cached under the absolute key.
+
+The query is rewritten on its sqlglot AST (BigQuery dialect), so string
+literals and comments that mention CURRENT_DATE are never touched, and
+is only regenerated when something was resolved. Queries sqlglot cannot
+parse are left as they are (and stay uncached).
+
+"Today" is BigQuery's: CURRENT_DATE() is the UTC date, CURRENT_DATE('zone')
+the date in that time zone - never the server's local clock.
+
+Supported expressions (nested/chained):
+- CURRENT_DATE / CURRENT_DATE() / CURRENT_DATE('time zone')
+- DATE('YYYY-MM-DD') +/- INTERVAL n DAY|WEEK|MONTH|QUARTER|YEAR
+- DATE_SUB / DATE_ADD(DATE('YYYY-MM-DD'), INTERVAL n unit)
+- DATE_TRUNC(DATE('YYYY-MM-DD'), WEEK|MONTH|QUARTER|YEAR)
+- LAST_DAY(DATE('YYYY-MM-DD') [, MONTH])
+(DATE 'YYYY-MM-DD' and CAST('YYYY-MM-DD' AS DATE) count as DATE('YYYY-MM-DD'))
+
+Sub-day expressions (CURRENT_TIMESTAMP, NOW()) are left untouched.
+"""
+
+import calendar
+import re
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import sqlglot
+from sqlglot import exp
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# Any date literal - used to find the newest date a query touches
+_DATE_LITERAL = re.compile(r"'(\d{4}-\d{2}-\d{2})'")
+
+_UNITS = ("DAY", "WEEK", "MONTH", "QUARTER", "YEAR")
+
+
+def utc_today(now: datetime = None) -> date:
+    """The date BigQuery's CURRENT_DATE() returns (UTC)."""
+    return (now or datetime.now(timezone.utc)).astimezone(timezone.utc).date()
+
+
+# =============================================================================
+# Date Arithmetic (BigQuery semantics)
+# =============================================================================
+
+def _add_months(day: date, months: int) -> date:
+    """Adds months like BigQuery DATE_ADD - clamps to the last day of the month."""
+    month_index = day.year * 12 + (day.month - 1) + months
+    year, month = divmod(month_index, 12)
+    month += 1
+    last = calendar.monthrange(year, month)[1]
+    return date(year, month, min(day.day, last))
+
+
+def _shift(day: date, amount: int, unit: str) -> date:
+    """Shifts a date by amount units (amount may be negative)."""
+    unit = unit.upper()
+    if unit == "DAY":
+        return day + timedelta(days=amount)
+    if unit == "WEEK":
+        return day + timedelta(weeks=amount)
+    if unit == "MONTH":
+        return _add_months(day, amount)
+    if unit == "QUARTER":
+        return _add_months(day, 3 * amount)
+    return _add_months(day, 12 * amount)  # YEAR
+
+
+def _truncate(day: date, unit: str) -> date:
+    """DATE_TRUNC - WEEK starts on Sunday, as in BigQuery."""
+    unit = unit.upper()
+    if unit == "WEEK":
+        return day - timedelta(days=(day.weekday() + 1) % 7)
+    if unit == "MONTH":
+        return day.replace(day=1)
+    if unit == "QUARTER":
+        return date(day.year, 3 * ((day.month - 1) // 3) + 1, 1)
+    return date(day.year, 1, 1)  # YEAR
+
+
+def _parse(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+# =============================================================================
+# AST Folding
+# =============================================================================
+
+def _date_value(node):
+    """The date of an absolute date node (DATE('...'), DATE '...', CAST('...' AS DATE)), or None."""
+    if isinstance(node, exp.Date) and not node.expressions and not node.args.get("zone"):
+        literal = node.this
+    elif isinstance(node, exp.Cast) and node.to.is_type(exp.DataType.Type.DATE):
+        literal = node.this
+    else:
+        return None
+    if not isinstance(literal, exp.Literal) or not literal.is_string:
+        return None
+    try:
+        return _parse(literal.this)
+    except ValueError:
+        return None
+
+
+def _date_node(day: date) -> exp.Expression:
+    return exp.Date(this=exp.Literal.string(day.isoformat()))
+
+
+def _unit(node) -> str:
+    """Unit name of a DAY / WEEK / ... node (Var, string literal or WEEK(SUNDAY)), or None."""
+    if isinstance(node, exp.WeekStart):
+        return "WEEK" if node.name.upper() == "SUNDAY" else None
+    if isinstance(node, (exp.Var, exp.Literal)):
+        unit = node.name.upper()
+        return unit if unit in _UNITS else None
+    return None
+
+
+def _amount(node):
+    """Integer of an INTERVAL amount, or None."""
+    if isinstance(node, exp.Literal):
+        try:
+            return int(node.this)
+        except ValueError:
+            return None
+    return None
+
+
+def _current_date(node: exp.CurrentDate, today: date, now: datetime):
+    zone = node.this
+    if zone is None:
+        return today
+    if not isinstance(zone, exp.Literal) or not zone.is_string:
+        return None
+    if now is None:
+        return today  # Fixed reference day (see resolve_relative_dates)
+    try:
+        return now.astimezone(ZoneInfo(zone.this)).date()
+    except (ZoneInfoNotFoundError, ValueError):
+        return None  # Unknown zone - left for BigQuery (the query stays uncached)
+
+
+def _fold(node, today: date, now: datetime):
+    """Returns the absolute date a relative date node resolves to, or None."""
+    if isinstance(node, exp.CurrentDate):
+        return _current_date(node, today, now)
+    if isinstance(node, (exp.Add, exp.Sub)) and isinstance(node.expression, exp.Interval):
+        day, interval = _date_value(node.this), node.expression
+        amount, unit = _amount(interval.this), _unit(interval.args.get("unit"))
+        if day is None or amount is None or unit is None:
+            return None
+        return _shift(day, amount if isinstance(node, exp.Add) else -amount, unit)
+    if isinstance(node, (exp.DateAdd, exp.DateSub)):
+        day = _date_value(node.this)
+        amount, unit = _amount(node.expression), _unit(node.args.get("unit"))
+        if day is None or amount is None or unit is None:
+            return None
+        return _shift(day, amount if isinstance(node, exp.DateAdd) else -amount, unit)
+    if isinstance(node, exp.DateTrunc):
+        day, unit = _date_value(node.this), _unit(node.args.get("unit"))
+        if day is None or unit is None or unit == "DAY":
+            return None
+        return _truncate(day, unit)
+    if isinstance(node, exp.LastDay):
+        day, unit = _date_value(node.this), node.args.get("unit")
+        if day is None or (unit is not None and _unit(unit) != "MONTH"):
+            return None
+        return _add_months(_truncate(day, "MONTH"), 1) - timedelta(days=1)
+    return None
+
+
+# =============================================================================
+# Public API
+# =============================================================================
+
+def resolve_relative_dates(sql: str, today: date = None, now: datetime = None) -> tuple:
+    """
+    Rewrites relative date expressions into absolute DATE('YYYY-MM-DD') bounds.
+
+    Args:
+        sql: SQL query
+        today: Date of CURRENT_DATE() (default: the UTC date of now).
+            Given without now, it is also used for CURRENT_DATE('zone')
+        now: Current time (aware datetime) for CURRENT_DATE('zone') (default: the clock)
+
+    Returns:
+        (resolved_sql, was_resolved) - was_resolved is True if anything changed
+    """
+    if not sql:
+        return sql, False
+    try:
+        statements = sqlglot.parse(sql, read="bigquery")
+    except sqlglot.errors.SqlglotError:
+        return sql, False
+    if today is None:
+        now = now or datetime.now(timezone.utc)
+        today = utc_today(now)
+
+    resolved = False
+    for tree in statements:
+        if tree is None:
+            continue
+        # Children before parents - nested expressions fold from the inside out
+        for node in reversed(list(tree.walk(bfs=True))):
+            day = _fold(node, today, now)
+            if day is not None and node is not tree:
+                node.replace(_date_node(day))
+                resolved = True
+    if not resolved:
+        return sql, False
+    return ";\n".join(tree.sql(dialect="bigquery") for tree in statements if tree is not None), True
+
+
+def date_range_in_sql(sql: str):
+    """
+    Returns the oldest and newest 'YYYY-MM-DD' literals in a query.
+
+    Args:
+        sql: SQL query (after resolve_relative_dates)
+
+    Returns:
+        (first, last) datetime.date tuple, or None if the query has no date literal
+    """
+    dates = []
+    for value in _DATE_LITERAL.findall(sql or ""):
+        try:
+            dates.append(_parse(value))
+        except ValueError:
+            continue
+    return (min(dates), max(dates)) if dates else None
+
+
+def latest_date_in_sql(sql: str):
+    """
+    Returns the newest 'YYYY-MM-DD' literal in a query.
+
+    Args:
+        sql: SQL query (after resolve_relative_dates)
+
+    Returns:
+        datetime.date, or None if the query has no date literal
+    """
+    date_range = date_range_in_sql(sql)
+    return date_range[1] if date_range else None
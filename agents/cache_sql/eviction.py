@@ -0,0 +1,306 @@
+"""
+Cache Eviction - Bounded, Size-Aware LRU
+=========================================
+This module keeps the two-layer cache (question + SQL) within a fixed
+budget of entries and bytes.
+
+Components:
+1. estimate_result_bytes - cheap size estimate of a cached result
+2. LRUPolicy - one LRU order shared by both cache layers
+3. CacheLayer - dict-like cache layer that reports to the policy
+
+Size estimate:
+- row count x estimated width of one row (sampled from the first rows)
+- Columnar rows (see columnar.py) report their exact buffer size
+- A constant overhead per entry (result dict, keys)
+"""
+
+import sys
+import threading
+from collections import OrderedDict, deque
+from collections.abc import MutableMapping
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# Fixed overhead of one cached result (result dict, summary, sql string)
+BASE_ENTRY_BYTES = 512
+
+# Per-column overhead inside a row dict (key pointer + hash slot)
+ROW_COLUMN_OVERHEAD = 64
+
+# Number of rows sampled to estimate the row width
+WIDTH_SAMPLE_ROWS = 5
+
+# Estimated size of common BigQuery value types
+VALUE_TYPE_BYTES = {
+    int: 28,
+    float: 24,
+    bool: 28,
+    type(None): 16,
+}
+
+
+# =============================================================================
+# Size Estimation
+# =============================================================================
+
+def _value_bytes(value) -> int:
+    """Estimates the memory of one cell value."""
+    size = VALUE_TYPE_BYTES.get(type(value))
+    if size is not None:
+        return size
+    if isinstance(value, str):
+        return 49 + len(value)
+    return sys.getsizeof(value)
+
+
+def estimate_result_bytes(result) -> int:
+    """
+    Estimates the memory footprint of a cached result.
+
+    Uses row count x column widths (sampled from the first rows)
+    instead of walking every cell, so it stays cheap for big results.
+
+    Args:
+        result: Cached result dict with a "rows" list
+
+    Returns:
+        Estimated size in bytes
+    """
+    if not isinstance(result, dict):
+        return BASE_ENTRY_BYTES
+    rows = result.get("rows") or []
+    if not rows:
+        return BASE_ENTRY_BYTES
+    if hasattr(rows, "nbytes"):
+        return BASE_ENTRY_BYTES + rows.nbytes  # ColumnarRows
+
+    sample = rows[:WIDTH_SAMPLE_ROWS]
+    sample_bytes = sum(
+        sum(_value_bytes(value) + ROW_COLUMN_OVERHEAD for value in row.values())
+        for row in sample
+    )
+    row_width = sample_bytes / len(sample)
+    return BASE_ENTRY_BYTES + int(row_width * len(rows))
+
+
+# =============================================================================
+# LRU Policy
+# =============================================================================
+
+class LRUPolicy:
+    """
+    Least-recently-used order shared by all cache layers.
+
+    Entries are identified by (layer_name, key). The policy only tracks
+    order and sizes - the layers own the data and remove evicted entries.
+
+    Attributes:
+        max_entries: Max number of entries over all layers (0 = unlimited)
+        max_bytes: Max estimated bytes over all layers (0 = unlimited)
+        total_bytes: Current estimated bytes
+        evictions: Number of entries evicted so far
+        evicted_bytes: Estimated bytes evicted so far
+    """
+
+    def __init__(self, max_entries: int = 0, max_bytes: int = 0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self._order = OrderedDict()  # {(layer, key): size} - oldest first
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __contains__(self, entry) -> bool:
+        """entry is a (layer, key) tuple."""
+        return entry in self._order
+
+    def record(self, layer: str, key: str, size: int) -> list:
+        """
+        Records an insert/update as most recently used.
+
+        Returns:
+            List of (layer, key) entries that must be evicted
+        """
+        with self._lock:
+            entry = (layer, key)
+            self.total_bytes -= self._order.pop(entry, 0)
+            self._order[entry] = size
+            self.total_bytes += size
+            return self._evict_over_budget(keep=entry)
+
+    def touch(self, layer: str, key: str) -> None:
+        """Marks an entry as most recently used."""
+        with self._lock:
+            entry = (layer, key)
+            if entry in self._order:
+                self._order.move_to_end(entry)
+
+    def resize(self, layer: str, key: str, size: int) -> list:
+        """Updates the size of an entry without changing its position."""
+        with self._lock:
+            entry = (layer, key)
+            if entry not in self._order:
+                return []
+            self.total_bytes += size - self._order[entry]
+            self._order[entry] = size
+            return self._evict_over_budget(keep=entry)
+
+    def size_of(self, layer: str, key: str) -> int:
+        """Returns the recorded size of an entry (0 if unknown)."""
+        return self._order.get((layer, key), 0)
+
+    def remove(self, layer: str, key: str) -> None:
+        """Forgets an entry (deleted or expired)."""
+        with self._lock:
+            self.total_bytes -= self._order.pop((layer, key), 0)
+
+    def clear_layer(self, layer: str) -> None:
+        """Forgets all entries of one layer."""
+        with self._lock:
+            for entry in [e for e in self._order if e[0] == layer]:
+                self.total_bytes -= self._order.pop(entry)
+
+    def is_full(self) -> bool:
+        """True if one more entry would exceed the budget (evict something)."""
+        with self._lock:
+            if self.max_entries and len(self._order) >= self.max_entries:
+                return True
+            return bool(self.max_bytes and self.total_bytes >= self.max_bytes)
+
+    def victim(self):
+        """Returns the (layer, key) entry evicted next, or None if empty."""
+        with self._lock:
+            return next(iter(self._order), None)
+
+    def _over_budget(self) -> bool:
+        if self.max_entries and len(self._order) > self.max_entries:
+            return True
+        if self.max_bytes and self.total_bytes > self.max_bytes:
+            return True
+        return False
+
+    def _evict_over_budget(self, keep) -> list:
+        """Pops least recently used entries until within budget."""
+        evicted = []
+        while self._over_budget() and len(self._order) > 1:
+            entry, size = next(iter(self._order.items()))
+            if entry == keep:
+                break
+            del self._order[entry]
+            self.total_bytes -= size
+            self.evictions += 1
+            self.evicted_bytes += size
+            evicted.append(entry)
+        return evicted
+
+
+# =============================================================================
+# Cache Layer
+# =============================================================================
+
+class CacheLayer(MutableMapping):
+    """
+    One cache layer (question or SQL) bound to the shared LRU policy.
+
+    Behaves like a dict {key: result}. Every insert is sized and recorded
+    in the policy; entries evicted by the policy are removed from their
+    layer together with their TTL timestamp.
+
+    With lock_for (lock striping - see CacheState), an evicted entry is
+    removed under its key's lock. If that lock is busy the removal is
+    queued and retried by drain_evictions(), so evicting never waits on
+    another key's lock (no lock-order deadlocks).
+
+    Attributes:
+        name: Layer name used in the policy ("question" / "sql")
+        store: Underlying dict (plain dict or PersistentDict)
+        ttl_store: Companion TTL dict {key: timestamp}
+    """
+
+    def __init__(self, name: str, store, ttl_store, policy: LRUPolicy, registry: dict,
+                 lock_for=None):
+        self.name = name
+        self.store = store
+        self.ttl_store = ttl_store
+        self._policy = policy
+        self._registry = registry  # {layer_name: CacheLayer} - for cross-layer evictions
+        self._lock_for = lock_for  # key -> lock, or None (single-threaded use)
+        self._pending_evictions = deque()
+        registry[name] = self
+
+        # Existing (persisted) entries: register oldest first, size unknown until loaded
+        for key in sorted(store, key=lambda k: ttl_store.get(k, 0)):
+            policy.record(name, key, 0)
+
+    def __contains__(self, key) -> bool:
+        return key in self.store
+
+    def __getitem__(self, key):
+        value = self.store[key]
+        if self._policy.size_of(self.name, key) == 0:
+            # Lazily loaded entry - account for it now that it is in memory
+            self._drop(self._policy.resize(self.name, key, estimate_result_bytes(value)))
+        self._policy.touch(self.name, key)
+        return value
+
+    def __setitem__(self, key, value) -> None:
+        self.store[key] = value
+        self._drop(self._policy.record(self.name, key, estimate_result_bytes(value)))
+
+    def __delitem__(self, key) -> None:
+        del self.store[key]
+        self._policy.remove(self.name, key)
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def clear(self) -> None:
+        self.store.clear()
+        self._policy.clear_layer(self.name)
+
+    def discard(self, key) -> None:
+        """Removes an evicted entry and its TTL (policy already forgot it)."""
+        if (self.name, key) in self._policy:
+            return  # Stored again since it was evicted
+        if key in self.store:
+            del self.store[key]  # No value load for persistent stores
+        self.ttl_store.pop(key, None)
+
+    def evict(self, key) -> None:
+        """Discards an evicted entry under its key lock, or queues it if the lock is busy."""
+        if self._lock_for is None:
+            self.discard(key)
+            return
+        lock = self._lock_for(key)
+        if not lock.acquire(blocking=False):
+            self._pending_evictions.append(key)
+            return
+        try:
+            self.discard(key)
+        finally:
+            lock.release()
+
+    def drain_evictions(self) -> None:
+        """Discards queued evictions - call without holding any key lock."""
+        while self._pending_evictions:
+            try:
+                key = self._pending_evictions.popleft()
+            except IndexError:
+                return  # Drained by another thread
+            with self._lock_for(key):
+                self.discard(key)
+
+    def _drop(self, evicted: list) -> None:
+        for layer_name, key in evicted:
+            self._registry[layer_name].evict(key)
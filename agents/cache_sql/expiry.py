@@ -0,0 +1,229 @@
+"""
+Cache Expiry - Time-Ordered Expiry Index and Background Sweeper
+================================================================
+This module removes expired cache entries proactively, instead of only
+when the same key is looked up again.
+
+Components:
+1. ExpiryIndex - min-heap of (expires_at, generation, layer, key, stored_at)
+2. TimestampMap - TTL dict that registers every timestamp in the index
+3. run_expiry_sweeper - asyncio task that purges expired entries
+
+Complexity:
+- Insert: O(log n) heap push
+- Purge: O(expired * log n) - never scans the whole cache
+- Stale heap items (entry refreshed or deleted) are skipped when popped,
+  and dropped by a compaction once they outnumber the live entries 2:1
+"""
+
+import asyncio
+import heapq
+import logging
+import threading
+import time
+from collections.abc import MutableMapping
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# Seconds between sweeps when there is nothing left to purge
+SWEEP_INTERVAL_SECONDS = 60
+
+# Max entries purged per batch - the sweeper yields to the event loop between batches
+SWEEP_BATCH_SIZE = 500
+
+# The heap is compacted when dead items (refreshed / deleted entries) exceed
+# COMPACT_RATIO x the live entries - and at least COMPACT_MIN_DEAD of them
+COMPACT_RATIO = 2
+COMPACT_MIN_DEAD = 64
+
+
+# =============================================================================
+# Expiry Index
+# =============================================================================
+
+class ExpiryIndex:
+    """
+    Min-heap of cache entries ordered by expiry time.
+
+    Items are never removed from the middle of the heap: when an entry is
+    refreshed or deleted, its old item stays in the heap ("dead") and is
+    skipped on pop. Each key's live item is tracked by generation, so
+    dead items are counted - once they outnumber the live entries
+    COMPACT_RATIO times, the heap is rebuilt from the live items only.
+    The heap therefore grows with the cache size, not with the writes.
+    """
+
+    def __init__(self):
+        self._heap = []  # [(expires_at, generation, layer, key, stored_at)]
+        self._live = {}  # {(layer, key): (generation, expires_at, stored_at)} - the key's current item
+        self._generation = 0
+        self._dead = 0
+        self.compactions = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    @property
+    def live(self) -> int:
+        """Entries with a live heap item."""
+        return len(self._live)
+
+    def push(self, layer: str, key: str, stored_at: float, ttl_seconds: float) -> None:
+        """Registers an entry stored at stored_at that lives ttl_seconds (replaces its old item)."""
+        with self._lock:
+            self._generation += 1
+            expires_at = stored_at + ttl_seconds
+            if self._live.get((layer, key)) is not None:
+                self._dead += 1
+            self._live[(layer, key)] = (self._generation, expires_at, stored_at)
+            heapq.heappush(self._heap, (expires_at, self._generation, layer, key, stored_at))
+            self._maybe_compact()
+
+    def discard(self, layer: str, key: str) -> None:
+        """Forgets an entry that was deleted (evicted, purged, invalidated)."""
+        with self._lock:
+            if self._live.pop((layer, key), None) is not None:
+                self._dead += 1
+                self._maybe_compact()
+
+    def pop_expired(self, now: float, limit: int) -> list:
+        """
+        Pops up to `limit` live items whose expiry time has passed.
+
+        Returns:
+            List of (layer, key, stored_at), oldest expiry first
+        """
+        expired = []
+        with self._lock:
+            while self._heap and len(expired) < limit and self._heap[0][0] <= now:
+                _, generation, layer, key, stored_at = heapq.heappop(self._heap)
+                live = self._live.get((layer, key))
+                if live is None or live[0] != generation:
+                    self._dead -= 1  # Refreshed or deleted since it was pushed
+                    continue
+                del self._live[(layer, key)]
+                expired.append((layer, key, stored_at))
+        return expired
+
+    def clear_layer(self, layer: str) -> None:
+        """Drops all items of one layer (used when a layer is cleared)."""
+        with self._lock:
+            for entry in [entry for entry in self._live if entry[0] == layer]:
+                del self._live[entry]
+            self._rebuild()
+
+    def _maybe_compact(self) -> None:
+        if self._dead > COMPACT_MIN_DEAD and self._dead > COMPACT_RATIO * len(self._live):
+            self._rebuild()
+            self.compactions += 1
+
+    def _rebuild(self) -> None:
+        """Rebuilds the heap from the live items (caller holds the lock)."""
+        self._heap = [
+            (expires_at, generation, layer, key, stored_at)
+            for (layer, key), (generation, expires_at, stored_at) in self._live.items()
+        ]
+        heapq.heapify(self._heap)
+        self._dead = 0
+
+
+# =============================================================================
+# TTL Dict
+# =============================================================================
+
+class TimestampMap(MutableMapping):
+    """
+    TTL dict {key: stored_at timestamp} that feeds the expiry index.
+
+    Behaves like the plain TTL dicts of CacheState. Every timestamp written
+    is pushed to the ExpiryIndex with the entry's TTL (ttl_for), or the
+    layer's TTL.
+
+    Attributes:
+        layer: Layer name ("question" / "sql")
+        store: Underlying dict (plain dict or PersistentDict)
+        ttl_seconds: Lifetime of entries in this layer
+        ttl_for: Function (layer, key, stored_at) -> lifetime of one entry, or None
+    """
+
+    def __init__(self, layer: str, store, index: ExpiryIndex, ttl_seconds: float, ttl_for=None):
+        self.layer = layer
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self._ttl_for = ttl_for
+        self._index = index
+
+        # Existing (persisted) timestamps
+        for key, stored_at in list(store.items()):
+            index.push(layer, key, stored_at, self._ttl(key, stored_at))
+
+    def _ttl(self, key, stored_at: float) -> float:
+        if self._ttl_for is None:
+            return self.ttl_seconds
+        return self._ttl_for(self.layer, key, stored_at)
+
+    def __contains__(self, key) -> bool:
+        return key in self.store
+
+    def __getitem__(self, key):
+        return self.store[key]
+
+    def __setitem__(self, key, stored_at) -> None:
+        self.store[key] = stored_at
+        self._index.push(self.layer, key, stored_at, self._ttl(key, stored_at))
+
+    def __delitem__(self, key) -> None:
+        del self.store[key]
+        self._index.discard(self.layer, key)
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def clear(self) -> None:
+        self.store.clear()
+        self._index.clear_layer(self.layer)
+
+
+# =============================================================================
+# Background Sweeper
+# =============================================================================
+
+async def run_expiry_sweeper(state, interval: float = SWEEP_INTERVAL_SECONDS,
+                             batch_size: int = SWEEP_BATCH_SIZE) -> None:
+    """
+    Background task that purges expired cache entries.
+
+    Each batch runs in the default executor - purging takes the per-key
+    locks request threads hold and may flush the SQLite backend, so it
+    never runs on the event loop. Sleeps `interval` seconds once nothing
+    is left to purge.
+
+    Args:
+        state: CacheState to sweep
+        interval: Seconds between sweeps
+        batch_size: Max entries purged before yielding
+    """
+    logging.info("Cache expiry sweeper started (interval=%ss)", interval)
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            purged = await loop.run_in_executor(None, state.purge_expired, time.time(), batch_size)
+        except Exception as e:
+            logging.error(f"Cache expiry sweep failed: {e}")
+            purged = 0
+
+        if purged:
+            logging.debug("Cache expiry sweeper purged %d entries", purged)
+
+        if purged >= batch_size:
+            # More may be waiting - continue with the next batch
+            await asyncio.sleep(0)
+        else:
+            await asyncio.sleep(interval)
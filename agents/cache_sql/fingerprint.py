@@ -0,0 +1,259 @@
+"""
+SQL Fingerprint - Parser-Based Canonical Cache Keys
+====================================================
+This module turns a SQL query into a canonical form used as the SQL-layer
+cache key, so equivalent queries generated by the LLM share one entry.
+
+Canonicalization (on the BigQuery AST, via sqlglot):
+1. Unquoted identifiers lowercased (BigQuery rules), keywords uppercased
+2. String literals kept case-preserved ('Facebook' != 'facebook')
+3. DATE('2025-01-02') / DATE '2025-01-02' written as '2025-01-02'
+4. Redundant parentheses removed
+5. Commutative predicates sorted (AND / OR operands, = / != sides)
+6. Aliases normalized: single-table aliases dropped, others renamed t0, t1...,
+   CTE names renamed cte0, cte1...
+
+Column aliases (AS total_clicks) are kept - they name the result columns.
+If the SQL cannot be parsed, the key falls back to normalize_sql().
+"""
+
+import re
+from functools import lru_cache
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlglot.optimizer.normalize_identifiers import normalize_identifiers
+
+from agents.cache_sql.tools import normalize_sql
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+SQL_DIALECT = "bigquery"
+
+# Date literal inside DATE('...') that can be written as a plain literal
+DATE_LITERAL_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+# Expressions that never need parentheses around them
+_ATOMIC_TYPES = (exp.Column, exp.Literal, exp.Func, exp.Paren, exp.Boolean, exp.Null)
+
+# Predicates - need no parentheses unless an operand of another operator: (b = c) = d
+_COMPARISON_TYPES = (
+    exp.EQ, exp.NEQ, exp.GT, exp.GTE, exp.LT, exp.LTE,
+    exp.In, exp.Between, exp.Like, exp.Is,
+)
+
+# Comparisons whose two sides can be swapped
+_SYMMETRIC_TYPES = (exp.EQ, exp.NEQ)
+
+
+# =============================================================================
+# AST Rewrites
+# =============================================================================
+
+def _compared_to_column(node) -> bool:
+    """True if node is compared (=, <, BETWEEN, IN...) to an expression over a column."""
+    child, parent = node, node.parent
+    while isinstance(parent, exp.Paren):
+        child, parent = parent, parent.parent
+    if isinstance(parent, (exp.Between, exp.In)):
+        other = parent.this
+    elif isinstance(parent, (exp.EQ, exp.NEQ, exp.GT, exp.GTE, exp.LT, exp.LTE)):
+        other = parent.expression if child is parent.this else parent.this
+    else:
+        return False
+    return other is not child and other.find(exp.Column) is not None
+
+
+def _unwrap_date_literal(node):
+    """
+    DATE('2025-01-02') and DATE '2025-01-02' -> '2025-01-02'.
+
+    Only as a comparison operand - BigQuery coerces the string there, but
+    a projected DATE('...') is a DATE column, not a STRING one.
+    """
+    if isinstance(node, (exp.Date, exp.Cast)):
+        if isinstance(node, exp.Cast) and not node.to.is_type(exp.DataType.Type.DATE):
+            return node
+        if not _compared_to_column(node):
+            return node
+        args = [a for a in node.args.values() if isinstance(a, exp.Expression) and not isinstance(a, exp.DataType)]
+        if (
+            len(args) == 1
+            and isinstance(args[0], exp.Literal)
+            and args[0].is_string
+            and DATE_LITERAL_PATTERN.match(args[0].this)
+        ):
+            return exp.Literal.string(args[0].this)
+    return node
+
+
+def _remove_redundant_parens(node):
+    """(a = 1) AND b -> a = 1 AND b. Keeps parens that change precedence."""
+    if not isinstance(node, exp.Paren):
+        return node
+    inner = node.this
+    parent = node.parent
+    if isinstance(inner, (exp.Select, exp.Union)):
+        return node
+    if isinstance(inner, _ATOMIC_TYPES) and not isinstance(inner, exp.Connector):
+        return inner  # Note: AND / OR are Func subclasses in sqlglot
+    if isinstance(inner, _COMPARISON_TYPES):
+        if isinstance(parent, exp.Binary) and not isinstance(parent, exp.Connector):
+            return node
+        return inner
+    if isinstance(parent, (exp.Where, exp.Having, exp.Paren)) or parent is None:
+        return inner
+    if isinstance(inner, exp.And) and isinstance(parent, exp.And):
+        return inner
+    if isinstance(inner, exp.Or) and isinstance(parent, exp.Or):
+        return inner
+    return node
+
+
+def _sort_connector(node):
+    """Flattens an AND / OR chain and sorts its operands."""
+    if not isinstance(node, exp.Connector):
+        return node
+    if type(node.parent) is type(node):
+        return node  # Inner link of a chain - handled at the chain root
+    operands = sorted(
+        (operand.copy() for operand in node.flatten()),
+        key=lambda operand: operand.sql(dialect=SQL_DIALECT),
+    )
+    combine = exp.and_ if isinstance(node, exp.And) else exp.or_
+    return combine(*operands, copy=False)
+
+
+def _operand_order(node) -> tuple:
+    """Sort key for comparison sides - expressions first, constants last."""
+    is_constant = isinstance(node, (exp.Literal, exp.Boolean, exp.Null))
+    return (is_constant, node.sql(dialect=SQL_DIALECT))
+
+
+def _sort_symmetric(node):
+    """'x' = col -> col = 'x' (constants on the right, otherwise by SQL text)."""
+    if isinstance(node, _SYMMETRIC_TYPES):
+        left, right = node.this, node.expression
+        if _operand_order(left) > _operand_order(right):
+            return node.__class__(this=right.copy(), expression=left.copy())
+    return node
+
+
+def _transform_bottom_up(tree, rewrite):
+    """
+    Applies a rewrite to every node, children before parents.
+
+    sqlglot's transform() is top-down and does not revisit the children
+    of a replaced node, which would leave nested chains unsorted.
+    """
+    for node in reversed(list(tree.walk(bfs=False))):
+        new_node = rewrite(node)
+        if new_node is node:
+            continue
+        if node is tree:
+            tree = new_node
+        else:
+            node.replace(new_node)
+    return tree
+
+
+def _normalize_aliases(tree):
+    """
+    Renames table aliases and CTE names to positional names.
+
+    A SELECT over a single table needs no qualifiers at all, so its alias
+    and the matching column qualifiers are dropped.
+    """
+    # CTE names -> cte0, cte1, ...
+    cte_names = {}
+    for index, cte in enumerate(tree.find_all(exp.CTE)):
+        cte_names[cte.alias] = f"cte{index}"
+        cte.set("alias", exp.TableAlias(this=exp.to_identifier(cte_names[cte.alias])))
+    for table in tree.find_all(exp.Table):
+        if not table.args.get("db") and table.name in cte_names:
+            table.set("this", exp.to_identifier(cte_names[table.name]))
+
+    # Single-table SELECTs - drop alias and qualifiers
+    for select in tree.find_all(exp.Select):
+        from_ = select.args.get("from") or select.args.get("from_")
+        if not from_ or select.args.get("joins"):
+            continue
+        table = from_.this
+        if not isinstance(table, exp.Table) or not table.alias:
+            continue
+        alias = table.alias
+        for column in select.find_all(exp.Column):
+            if column.table == alias and column.find_ancestor(exp.Select) is select:
+                column.set("table", None)
+        table.set("alias", None)
+
+    # Remaining aliases (joins) -> t0, t1, ...
+    aliases = {}
+    for table in tree.find_all(exp.Table):
+        if table.alias and table.alias not in aliases:
+            aliases[table.alias] = f"t{len(aliases)}"
+        if table.alias:
+            table.set("alias", exp.TableAlias(this=exp.to_identifier(aliases[table.alias])))
+    for column in tree.find_all(exp.Column):
+        if column.table in aliases:
+            column.set("table", exp.to_identifier(aliases[column.table]))
+    return tree
+
+
+def _canonicalize_statement(tree) -> str:
+    """Applies all rewrites to one parsed statement and renders it."""
+    tree = normalize_identifiers(tree, dialect=SQL_DIALECT)
+    tree = _normalize_aliases(tree)
+    for rewrite in (_unwrap_date_literal, _remove_redundant_parens, _sort_symmetric, _sort_connector):
+        tree = _transform_bottom_up(tree, rewrite)
+    return tree.sql(dialect=SQL_DIALECT, normalize_functions="upper")
+
+
+# =============================================================================
+# Public API
+# =============================================================================
+
+@lru_cache(maxsize=4096)
+def canonicalize_sql(sql: str):
+    """
+    Returns the canonical form of a SQL query (or script).
+    
+    Memoized on the raw text - the same generated SQL is parsed only once.
+
+    Args:
+        sql: Original SQL (BigQuery dialect)
+
+    Returns:
+        Canonical SQL text, or None if the SQL cannot be parsed
+    """
+    if not sql or not sql.strip():
+        return None
+    try:
+        statements = [s for s in sqlglot.parse(sql, read=SQL_DIALECT) if s is not None]
+        if not statements:
+            return None
+        return ";\n".join(_canonicalize_statement(s) for s in statements)
+    except (SqlglotError, ValueError, RecursionError):
+        return None
+
+
+def fingerprint_sql(sql: str) -> str:
+    """
+    Returns the SQL-layer cache key for a query.
+
+    Uses the canonical AST form when the SQL parses,
+    otherwise falls back to the whitespace/case normalization.
+
+    Args:
+        sql: Original SQL query (can be None)
+
+    Returns:
+        Cache key, or empty string if input is empty/None
+    """
+    if not sql:
+        return ""
+    return canonicalize_sql(sql) or normalize_sql(sql)
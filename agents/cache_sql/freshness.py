@@ -0,0 +1,522 @@
+"""
+Cache Freshness - Invalidation Driven by BigQuery Table Metadata
+=================================================================
+The TTL alone cannot tell whether the tables behind a cached result have
+changed. This module remembers, for every cached entry, which tables it
+read and which dates it covered, and compares that to the tables'
+last modification times reported by BigQuery.
+
+Components:
+1. extract_source_tables - tables a query reads (CTE names excluded)
+2. extract_written_tables - tables a statement writes (CREATE / INSERT / MERGE...)
+3. FreshnessTracker - table -> entries dependency index + known table versions
+4. run_freshness_checker - asyncio task that periodically refreshes metadata
+
+Metadata check (batched, cheap):
+- One `dataset.__TABLES__` query per dataset for table last_modified_time
+  (metadata only - no table data is scanned)
+- Only for tables that changed: one INFORMATION_SCHEMA.PARTITIONS query per
+  dataset, for partitions modified since the previous check
+- An entry is stale if a partition inside its date range (or the whole
+  table, if it is not partitioned) was modified after the entry was stored
+
+So a write to today's partition invalidates only the entries that read
+today's partition - historical entries stay cached.
+
+Entries are indexed by (table, day) as well as by table, so a changed
+partition only visits the entries whose date range covers it. Versions
+are pruned: a table no entry depends on any more is forgotten, and once
+a table has more than MAX_PARTITION_VERSIONS partition versions, the
+ones changed before its oldest entry was stored are dropped (entries
+older than a dropped change count as stale).
+
+Writes through run_sql (the anomaly flow's CREATE OR REPLACE TABLE) do not
+wait for the next check: the written tables are marked changed right away
+and every entry that read them is invalidated (mark_written).
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from datetime import date
+from functools import lru_cache
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from dotenv import load_dotenv
+
+from agents.cache_sql.dates import utc_today
+
+load_dotenv()
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# Seconds between metadata checks - 0 disables the background checker
+FRESHNESS_CHECK_INTERVAL = int(os.getenv("CACHE_FRESHNESS_INTERVAL", "300"))
+
+# Partition that holds rows still in the streaming buffer
+STREAMING_PARTITION_ID = "__UNPARTITIONED__"
+
+# Longest date range indexed day by day - longer / open ranges are checked on every change
+MAX_INDEXED_DAYS = 366
+
+# Partition versions kept per table before the ones older than every entry are pruned
+MAX_PARTITION_VERSIONS = 64
+
+
+# =============================================================================
+# Source Tables / Partitions
+# =============================================================================
+
+@lru_cache(maxsize=1024)
+def extract_source_tables(sql: str) -> tuple:
+    """
+    Returns the tables a query reads.
+
+    Args:
+        sql: SQL query (BigQuery dialect)
+
+    Returns:
+        Sorted tuple of "project.dataset.table" / "dataset.table" names,
+        or an empty tuple if the SQL cannot be parsed
+    """
+    if not sql:
+        return ()
+    try:
+        statements = [s for s in sqlglot.parse(sql, read="bigquery") if s is not None]
+    except (SqlglotError, ValueError, RecursionError):
+        return ()
+
+    tables = set()
+    for statement in statements:
+        cte_names = {cte.alias for cte in statement.find_all(exp.CTE)}
+        for table in statement.find_all(exp.Table):
+            if not table.db or table.name in cte_names:
+                continue  # CTE reference
+            parts = [table.catalog, table.db, table.name]
+            tables.add(".".join(part for part in parts if part))
+    return tuple(sorted(tables))
+
+
+# Statements that write the table in their `this` argument
+_WRITE_STATEMENTS = tuple(
+    getattr(exp, name) for name in ("Create", "Insert", "Update", "Delete", "Merge", "Drop", "TruncateTable", "Alter")
+    if hasattr(exp, name)
+)
+
+
+def _table_name(table: exp.Table):
+    if not table.db:
+        return None
+    return ".".join(part for part in (table.catalog, table.db, table.name) if part)
+
+
+@lru_cache(maxsize=1024)
+def extract_written_tables(sql: str) -> tuple:
+    """
+    Returns the tables a statement (or script) writes.
+
+    Args:
+        sql: SQL statement(s) (BigQuery dialect)
+
+    Returns:
+        Sorted tuple of table names (as in extract_source_tables), or an
+        empty tuple for read-only queries / SQL that cannot be parsed
+    """
+    if not sql:
+        return ()
+    try:
+        statements = [s for s in sqlglot.parse(sql, read="bigquery") if s is not None]
+    except (SqlglotError, ValueError, RecursionError):
+        return ()
+
+    tables = set()
+    for statement in statements:
+        if not isinstance(statement, _WRITE_STATEMENTS):
+            continue
+        targets = [statement.this] + statement.args.get("tables", []) + (
+            statement.expressions if isinstance(statement, exp.TruncateTable) else []
+        )
+        for target in targets:
+            if isinstance(target, exp.Schema):
+                target = target.this
+            if isinstance(target, exp.Table) and _table_name(target):
+                tables.add(_table_name(target))
+    return tuple(sorted(tables))
+
+
+def partition_date_span(partition_id, today: date = None):
+    """
+    Returns the dates covered by a BigQuery partition.
+
+    Args:
+        partition_id: YYYYMMDD / YYYYMMDDHH / YYYYMM / YYYY, or a special id
+        today: Reference day for the streaming buffer partition
+               (default: the current UTC day, BigQuery's CURRENT_DATE())
+
+    Returns:
+        (first, last) datetime.date tuple, or None if the partition
+        can hold any date (unpartitioned table, __NULL__)
+    """
+    if partition_id == STREAMING_PARTITION_ID:
+        # Streamed rows not yet in a partition - they are recent data
+        today = today or utc_today()
+        return today, today
+    if not partition_id or not partition_id.isdigit():
+        return None
+    try:
+        year = int(partition_id[:4])
+        if len(partition_id) >= 8:
+            day = date(year, int(partition_id[4:6]), int(partition_id[6:8]))
+            return day, day
+        if len(partition_id) == 6:
+            month = int(partition_id[4:6])
+            next_month = date(year + month // 12, month % 12 + 1, 1)
+            return date(year, month, 1), date.fromordinal(next_month.toordinal() - 1)
+        if len(partition_id) == 4:
+            return date(year, 1, 1), date(year, 12, 31)
+    except ValueError:
+        return None
+    return None
+
+
+def _range_days(date_range):
+    """ISO days of a date range, or None if it is open or longer than MAX_INDEXED_DAYS."""
+    if date_range is None:
+        return None
+    first, last = date.fromisoformat(date_range[0]), date.fromisoformat(date_range[1])
+    if (last - first).days >= MAX_INDEXED_DAYS:
+        return None
+    return [date.fromordinal(day).isoformat() for day in range(first.toordinal(), last.toordinal() + 1)]
+
+
+def _overlaps(span, date_range) -> bool:
+    """True if a partition span and an entry's date range share a day."""
+    if span is None or date_range is None:
+        return True
+    first, last = date.fromisoformat(date_range[0]), date.fromisoformat(date_range[1])
+    return span[0] <= last and first <= span[1]
+
+
+def _discard(index: dict, name, entry) -> bool:
+    """Removes an entry from index[name] - True if that emptied (and removed) it."""
+    entries = index.get(name)
+    if entries is None:
+        return False
+    entries.discard(entry)
+    if entries:
+        return False
+    del index[name]
+    return True
+
+
+# =============================================================================
+# Freshness Tracker
+# =============================================================================
+
+class FreshnessTracker:
+    """
+    Tracks which cached entries depend on which tables.
+
+    Each cache layer has a sources store {key: (tables, date_range)} -
+    a plain dict or an eager PersistentDict, so dependencies survive
+    restarts together with the entries. The table -> entries and
+    (table, day) -> entries indexes are rebuilt from the stores on startup.
+
+    Attributes:
+        table_versions: {table: last_modified (ms)} from the last check
+        partition_versions: {table: {partition_id: last_modified (ms)}}
+        checks: Number of metadata checks performed
+        invalidated: Number of entries found stale
+    """
+
+    def __init__(self):
+        self.table_versions = {}
+        self.partition_versions = {}
+        self.checks = 0
+        self.invalidated = 0
+        self._sources = {}     # {layer_name: {key: (tables, date_range)}}
+        self._dependents = {}  # {table: set of (layer_name, key)}
+        self._by_day = {}      # {table: {iso_day: set of (layer_name, key)}}
+        self._undated = {}     # {table: set of (layer_name, key)} - open / long ranges
+        self._pruned_ms = {}   # {table: newest partition change dropped by _prune_partitions}
+        self._lock = threading.RLock()
+
+    def add_layer(self, layer: str, store) -> None:
+        """Attaches the sources store of a layer and indexes its entries."""
+        with self._lock:
+            self._sources[layer] = store
+            for key, (tables, date_range) in list(store.items()):
+                self._index((layer, key), tables, date_range)
+
+    def _index(self, entry, tables, date_range) -> None:
+        days = _range_days(date_range)
+        for table in tables:
+            self._dependents.setdefault(table, set()).add(entry)
+            if days is None:
+                self._undated.setdefault(table, set()).add(entry)
+                continue
+            by_day = self._by_day.setdefault(table, {})
+            for day in days:
+                by_day.setdefault(day, set()).add(entry)
+
+    def _unindex(self, entry, tables, date_range, keep_versions: bool = False) -> None:
+        days = _range_days(date_range)
+        for table in tables:
+            if days is None:
+                _discard(self._undated, table, entry)
+            else:
+                by_day = self._by_day.get(table, {})
+                for day in days:
+                    _discard(by_day, day, entry)
+                if not by_day:
+                    self._by_day.pop(table, None)
+            if _discard(self._dependents, table, entry) and not keep_versions:
+                # No entry reads the table any more - its versions are not needed
+                self.table_versions.pop(table, None)
+                self.partition_versions.pop(table, None)
+                self._pruned_ms.pop(table, None)
+
+    def dependents(self, table: str, span="all") -> set:
+        """
+        Returns the entries that read a table - within a partition's days.
+
+        Args:
+            table: Table name
+            span: (first, last) dates of a partition (see partition_date_span),
+                None for a partition that can hold any date, or "all"
+
+        Returns:
+            Set of (layer, key) entries
+        """
+        with self._lock:
+            if span is None or span == "all":
+                return set(self._dependents.get(table, ()))
+            entries = set(self._undated.get(table, ()))
+            by_day = self._by_day.get(table, {})
+            for day in range(span[0].toordinal(), span[1].toordinal() + 1):
+                entries.update(by_day.get(date.fromordinal(day).isoformat(), ()))
+            return entries
+
+    def register(self, layer: str, key: str, tables, date_range=None) -> None:
+        """
+        Records the source tables (and date range) of a cached entry.
+
+        The date range is kept even without tables - the TTL policy reads it.
+
+        Args:
+            layer: Cache layer name
+            key: Entry key
+            tables: Tables the query read
+            date_range: (first, last) ISO dates the query covered, or None
+        """
+        with self._lock:
+            self.forget(layer, key)
+            if not tables and not date_range:
+                return
+            self._sources[layer][key] = (tuple(tables), date_range)
+            self._index((layer, key), tables, date_range)
+
+    def forget(self, layer: str, key: str, keep_versions: bool = False) -> None:
+        """
+        Removes an entry from the dependency index.
+
+        The versions of tables no other entry reads are dropped too,
+        unless keep_versions is set.
+        """
+        with self._lock:
+            store = self._sources[layer]
+            if key not in store:
+                return
+            tables, date_range = store[key]
+            del store[key]
+            self._unindex((layer, key), tables, date_range, keep_versions)
+
+    def sources(self, layer: str, key: str):
+        """Returns (tables, date_range) of an entry, or None if untracked."""
+        return self._sources[layer].get(key)
+
+    def tables(self) -> list:
+        """Returns all tables that cached entries depend on."""
+        with self._lock:
+            return sorted(self._dependents)
+
+    def mark_written(self, table: str, written_ms: float) -> list:
+        """
+        Records a write to a whole table and returns the entries that read it.
+
+        Entries stored before written_ms are stale from now on, in every
+        layer - including copies loaded later from the shared tier.
+
+        Args:
+            table: Table name (as in extract_source_tables)
+            written_ms: Time of the write (ms since epoch)
+
+        Returns:
+            List of (layer, key) entries to invalidate (already forgotten)
+        """
+        with self._lock:
+            self.table_versions[table] = max(self.table_versions.get(table, 0), written_ms)
+            self.partition_versions.pop(table, None)  # The whole table changed
+            dependents = list(self._dependents.get(table, ()))
+            for layer, key in dependents:
+                self.forget(layer, key, keep_versions=True)
+            self.invalidated += len(dependents)
+        return dependents
+
+    def is_stale(self, tables, date_range, stored_at: float) -> bool:
+        """
+        Checks an entry against the known table/partition versions.
+
+        Args:
+            tables: Tables the entry read
+            date_range: (first, last) ISO dates, or None (any date)
+            stored_at: time.time() when the entry was stored
+
+        Returns:
+            True if a relevant partition changed after stored_at
+        """
+        stored_ms = stored_at * 1000
+        for table in tables:
+            version = self.table_versions.get(table)
+            if version is None or version <= stored_ms:
+                continue
+            if stored_ms < self._pruned_ms.get(table, 0):
+                return True  # Older than a partition change that was pruned
+            partitions = self.partition_versions.get(table)
+            if not partitions:
+                return True  # Changed, and no partition info - the whole table
+            for partition_id, modified in partitions.items():
+                if modified > stored_ms and _overlaps(partition_date_span(partition_id), date_range):
+                    return True
+        return False
+
+    def refresh(self, client, stored_at_of) -> list:
+        """
+        Fetches table metadata and returns the entries that became stale.
+
+        Args:
+            client: Metadata client with get_tables_last_modified(tables)
+                and get_partitions_last_modified(tables, since_ms)
+            stored_at_of: Function (layer, key) -> stored timestamp, or None
+
+        Returns:
+            List of (layer, key) entries to invalidate (already forgotten)
+        """
+        tables = self.tables()
+        self.checks += 1
+        if not tables:
+            return []
+
+        versions = client.get_tables_last_modified(tables)
+        changed = [
+            table for table in tables
+            if versions.get(table) is not None and versions[table] != self.table_versions.get(table)
+        ]
+        if not changed:
+            return []
+
+        # Only partitions modified since the oldest version we already knew
+        known = [self.table_versions[t] for t in changed if t in self.table_versions]
+        since_ms = min(known) if len(known) == len(changed) else None
+        partitions = client.get_partitions_last_modified(changed, since_ms)
+
+        stale = []
+        with self._lock:
+            for table in changed:
+                self.table_versions[table] = versions[table]
+                self.partition_versions.setdefault(table, {}).update(partitions.get(table, {}))
+
+            for table in changed:
+                # Only the entries whose dates cover a changed partition
+                candidates = set()
+                for partition_id in partitions.get(table) or (None,):
+                    span = partition_date_span(partition_id) if partition_id is not None else None
+                    candidates |= self.dependents(table, span)
+                for layer, key in candidates:
+                    sources = self._sources[layer].get(key)
+                    if sources is None:
+                        continue  # Invalidated through another changed table
+                    stored_at = stored_at_of(layer, key)
+                    if stored_at is None or self.is_stale(sources[0], sources[1], stored_at):
+                        self.forget(layer, key)
+                        stale.append((layer, key))
+                self._prune_partitions(table, stored_at_of)
+            self.invalidated += len(stale)
+        return stale
+
+    def _prune_partitions(self, table: str, stored_at_of) -> None:
+        """Drops partition versions older than every entry that reads the table."""
+        partitions = self.partition_versions.get(table)
+        if not partitions or len(partitions) <= MAX_PARTITION_VERSIONS:
+            return
+        stored = [stored_at_of(layer, key) for layer, key in self._dependents.get(table, ())]
+        oldest_ms = min((s for s in stored if s is not None), default=None)
+        if oldest_ms is None:
+            return
+        oldest_ms *= 1000
+        dropped = [pid for pid, modified in partitions.items() if modified <= oldest_ms]
+        if not dropped:
+            return
+        self._pruned_ms[table] = max(
+            self._pruned_ms.get(table, 0), max(partitions[pid] for pid in dropped)
+        )
+        for partition_id in dropped:
+            del partitions[partition_id]
+
+    def prune(self, exists) -> int:
+        """
+        Forgets entries that left the cache (evicted / expired).
+
+        Args:
+            exists: Function (layer, key) -> bool
+
+        Returns:
+            Number of entries forgotten
+        """
+        with self._lock:
+            gone = [
+                (layer, key)
+                for layer, store in self._sources.items()
+                for key in list(store)
+                if not exists(layer, key)
+            ]
+            for layer, key in gone:
+                self.forget(layer, key)
+        return len(gone)
+
+
+# =============================================================================
+# Background Checker
+# =============================================================================
+
+async def run_freshness_checker(state, get_client, interval: float = FRESHNESS_CHECK_INTERVAL) -> None:
+    """
+    Background task that invalidates entries whose source tables changed.
+
+    The metadata queries are blocking, so each check runs in the
+    default executor and never blocks the event loop.
+
+    Args:
+        state: CacheState to check
+        get_client: Function returning the metadata client (e.g. db.tools.get_bq)
+        interval: Seconds between checks
+    """
+    logging.info("Cache freshness checker started (interval=%ss)", interval)
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            invalidated = await loop.run_in_executor(
+                None, lambda: state.refresh_freshness(get_client())
+            )
+        except Exception as e:
+            logging.error(f"Cache freshness check failed: {e}")
+            continue
+        if invalidated:
+            logging.info("Cache freshness check invalidated %d entries", invalidated)
@@ -0,0 +1,135 @@
+"""
+Negative Cache - Short-Lived Entries for Failures and Empty Results
+===================================================================
+Questions that end without an answer were retried in full on every
+repeat (users hit "retry"): another LLM call, another BigQuery job.
+This cache remembers those outcomes for a short time, separately from
+the positive cache:
+
+Outcomes (error_class of an entry):
+- EmptyResult - the query returned zero rows
+- RuntimeError - BigQuery rejected the SQL (BQClient.execute_query)
+- FALLBACK_NO_EXECUTION - NL2SQL could not produce a query
+
+Entries are kept per layer ("question" / "sql") for CACHE_NEGATIVE_TTL
+seconds (default 60) - short, because data may arrive and prompts /
+tables may be fixed. They are in-process only and never persisted.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# Seconds a failure / empty result is remembered - 0 disables negative caching
+CACHE_NEGATIVE_TTL = float(os.getenv("CACHE_NEGATIVE_TTL", "60"))
+
+# Max entries (both layers) - the oldest entries are dropped first
+NEGATIVE_MAX_ENTRIES = 10000
+
+# Outcome names (error_class of an entry)
+EMPTY_RESULT = "EmptyResult"
+FALLBACK_NO_EXECUTION = "FALLBACK_NO_EXECUTION"
+
+# Error classes that can be raised again on a repeat
+_RAISABLE = {"RuntimeError": RuntimeError}
+
+
+NegativeEntry = namedtuple("NegativeEntry", ["error_class", "message", "stored_at"])
+
+
+# =============================================================================
+# Negative Cache
+# =============================================================================
+
+class NegativeCache:
+    """
+    Short-TTL cache of failures and empty results, keyed by (layer, key).
+
+    Attributes:
+        ttl_seconds: Lifetime of an entry
+        hits: Lookups answered from the negative cache
+        stored: Entries recorded
+    """
+
+    def __init__(self, ttl_seconds: float = None, max_entries: int = NEGATIVE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else CACHE_NEGATIVE_TTL
+        self.max_entries = max_entries
+        self.hits = 0
+        self.stored = 0
+        self._entries = OrderedDict()  # {(layer, key): NegativeEntry} - oldest first
+        self._lock = threading.Lock()
+
+    def record(self, layer: str, key: str, error_class: str, message: str = "", now: float = None) -> None:
+        """
+        Remembers a failure / empty result.
+
+        Args:
+            layer: "question" or "sql"
+            key: Cache key of the layer (normalized question / SQL fingerprint)
+            error_class: Outcome name (EMPTY_RESULT, "RuntimeError", ...)
+            message: Error message shown on a repeat
+            now: Current time (default: time.time())
+        """
+        if self.ttl_seconds <= 0 or not key:
+            return
+        now = time.time() if now is None else now
+        with self._lock:
+            self._entries.pop((layer, key), None)
+            self._entries[(layer, key)] = NegativeEntry(error_class, message, now)
+            self.stored += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record_error(self, layer: str, key: str, error: Exception, now: float = None) -> None:
+        """Remembers a query error - only error classes that can be raised again."""
+        if type(error) in _RAISABLE.values():
+            self.record(layer, key, type(error).__name__, str(error), now)
+
+    def get(self, layer: str, key: str, now: float = None):
+        """
+        Returns the live entry for a key, or None (expired entries are removed).
+        """
+        if not key:
+            return None
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get((layer, key))
+            if entry is None:
+                return None
+            if now - entry.stored_at > self.ttl_seconds:
+                del self._entries[(layer, key)]
+                return None
+            self.hits += 1
+            return entry
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def raise_negative(entry: NegativeEntry) -> None:
+    """
+    Raises the error recorded in an entry again.
+
+    Args:
+        entry: Entry with a raisable error_class (see is_error)
+    """
+    raise _RAISABLE[entry.error_class](entry.message)
+
+
+def is_error(entry: NegativeEntry) -> bool:
+    """True if the entry records a query error (as opposed to an empty result / fallback)."""
+    return entry.error_class in _RAISABLE
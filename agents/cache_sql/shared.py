@@ -0,0 +1,228 @@
+"""
+Shared Cache Tier - One Cache for All Workers on a Node
+========================================================
+With several uvicorn workers every process has its own CacheState, so
+each worker misses (and pays BigQuery) for results another worker
+already has. This module provides a second cache tier (L2) shared by
+all workers; the in-process CacheState stays in front of it as L1.
+
+Tiers:
+1. RedisSharedTier - any Redis-protocol store (Redis, Valkey, KeyDB...)
+   Enabled with CACHE_SHARED_URL=redis://localhost:6379/0
+2. InMemorySharedTier - in-process fake with the same interface (tests)
+
+Flow (see CacheState.get_fresh / put):
+- L1 miss -> L2 lookup -> on hit, the entry is copied into L1
+- put() writes L1 and L2 (write-through)
+- Stale entries (source data changed) are deleted from both tiers
+- L2 expires entries by itself (the remaining TTL is sent with each write)
+
+L2 errors (store down, timeouts) are logged and treated as misses -
+the shared tier never fails a query.
+
+Entries are written with codec.py (JSON + Arrow IPC), never pickled -
+whoever can write to the store cannot run code in the workers. Payloads
+that cannot be decoded (corrupt, foreign, older format) are logged and
+counted as misses.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from agents.cache_sql.codec import encode_value, decode_value, CodecError
+
+load_dotenv()
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# URL of the shared store, e.g. redis://localhost:6379/0 (unset = no shared tier)
+CACHE_SHARED_URL = os.getenv("CACHE_SHARED_URL")
+
+# Prefix of all keys written to the shared store
+CACHE_SHARED_PREFIX = os.getenv("CACHE_SHARED_PREFIX", "click_cache:")
+
+# Socket timeout (seconds) for the shared store - a slow store must not stall queries
+SHARED_TIMEOUT_SECONDS = 0.5
+
+
+def _entry_key(prefix: str, layer: str, key: str) -> str:
+    """Fixed-size store key (cache keys can be long SQL texts)."""
+    return f"{prefix}{layer}:{hashlib.sha256(key.encode('utf-8')).hexdigest()}"
+
+
+def _encode_entry(value, stored_at: float, sources):
+    """Payload of an entry, or None if the value cannot be encoded."""
+    try:
+        return encode_value((stored_at, value, sources))
+    except CodecError as e:
+        logging.warning(f"Shared cache entry cannot be encoded: {e}")
+        return None
+
+
+def _decode_entry(payload):
+    """
+    (stored_at, value, sources) of a payload.
+
+    Raises:
+        CodecError: If the payload is not an entry written by this module
+    """
+    entry = decode_value(payload)
+    if not isinstance(entry, tuple) or len(entry) != 3:
+        raise CodecError("Not a shared cache entry")
+    return entry
+
+
+# =============================================================================
+# Redis Tier
+# =============================================================================
+
+class RedisSharedTier:
+    """
+    Shared tier on a Redis-protocol store.
+
+    Each entry is one key holding an encoded (stored_at, value, sources)
+    tuple, written with an expiry equal to the entry's remaining TTL.
+
+    Attributes:
+        name: Tier name for stats
+        hits / misses / errors: Lookup counters (per process)
+    """
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = CACHE_SHARED_PREFIX, client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise ImportError("CACHE_SHARED_URL requires the 'redis' package (pip install redis)") from e
+            client = redis.Redis.from_url(
+                url,
+                socket_timeout=SHARED_TIMEOUT_SECONDS,
+                socket_connect_timeout=SHARED_TIMEOUT_SECONDS,
+            )
+        self.url = url
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._client = client
+
+    def get(self, layer: str, key: str):
+        """
+        Returns (stored_at, value, sources) of an entry, or None on a miss/error.
+        """
+        try:
+            payload = self._client.get(_entry_key(self.prefix, layer, key))
+        except Exception as e:
+            self.errors += 1
+            logging.warning(f"Shared cache read failed: {e}")
+            return None
+        if payload is None:
+            self.misses += 1
+            return None
+        try:
+            entry = _decode_entry(payload)
+        except CodecError as e:
+            self.misses += 1
+            logging.warning(f"Shared cache entry cannot be decoded: {e}")
+            return None
+        self.hits += 1
+        return entry
+
+    def set(self, layer: str, key: str, value, stored_at: float, sources, ttl_seconds: float) -> None:
+        """Writes an entry that expires ttl_seconds from now."""
+        if ttl_seconds <= 0:
+            return
+        payload = _encode_entry(value, stored_at, sources)
+        if payload is None:
+            return
+        try:
+            self._client.set(_entry_key(self.prefix, layer, key), payload, px=int(ttl_seconds * 1000))
+        except Exception as e:
+            self.errors += 1
+            logging.warning(f"Shared cache write failed: {e}")
+
+    def delete(self, layer: str, key: str) -> None:
+        try:
+            self._client.delete(_entry_key(self.prefix, layer, key))
+        except Exception as e:
+            self.errors += 1
+            logging.warning(f"Shared cache delete failed: {e}")
+
+
+# =============================================================================
+# In-Memory Tier (tests)
+# =============================================================================
+
+class InMemorySharedTier:
+    """
+    In-process stand-in for the shared tier - same interface as RedisSharedTier.
+
+    Several CacheState objects given the same instance behave like
+    workers sharing one Redis. Values are encoded like in Redis, so
+    entries are never shared by reference.
+    """
+    name = "memory"
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._entries = {}  # {(layer, key): (expires_at, payload)}
+        self._lock = threading.Lock()
+
+    def get(self, layer: str, key: str):
+        with self._lock:
+            entry = self._entries.get((layer, key))
+            if entry is not None and entry[0] <= time.time():
+                del self._entries[(layer, key)]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+        try:
+            decoded = _decode_entry(entry[1])
+        except CodecError as e:
+            with self._lock:
+                self.misses += 1
+            logging.warning(f"Shared cache entry cannot be decoded: {e}")
+            return None
+        with self._lock:
+            self.hits += 1
+        return decoded
+
+    def set(self, layer: str, key: str, value, stored_at: float, sources, ttl_seconds: float) -> None:
+        if ttl_seconds <= 0:
+            return
+        payload = _encode_entry(value, stored_at, sources)
+        if payload is None:
+            return
+        with self._lock:
+            self._entries[(layer, key)] = (time.time() + ttl_seconds, payload)
+
+    def delete(self, layer: str, key: str) -> None:
+        with self._lock:
+            self._entries.pop((layer, key), None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def create_shared_tier():
+    """
+    Creates the shared tier from the environment.
+
+    Returns:
+        RedisSharedTier if CACHE_SHARED_URL is set, otherwise None
+    """
+    if not CACHE_SHARED_URL:
+        return None
+    return RedisSharedTier(CACHE_SHARED_URL)
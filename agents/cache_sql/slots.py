@@ -0,0 +1,471 @@
+"""
+Question Slots - Structured Question Cache Keys
+================================================
+normalize_question() only lowercases and collapses whitespace, so
+"clicks by media source on 2025-01-02" and "media_source clicks for
+Jan 2 2025" - or the same request in Hebrew - are different keys.
+
+The Intent Agent also returns the question as slots (IntentResult.slots):
+    metric, aggregation, dimensions, filters, start_date / end_date
+    (absolute), top_n, order
+This module turns them into a canonical key, so every phrasing of the
+same request shares one question cache entry:
+    slots:{"dates":["2025-01-02","2025-01-02"],"dimensions":["media_source"],...}
+
+The slots come from an LLM, so they are checked against the generated SQL
+before a result is saved under them (slots_match_sql): same metric and
+aggregate (the one aggregate column of the projection), same date range,
+same equality / IN filters, same GROUP BY columns, same ORDER BY
+direction of the metric, same LIMIT. A result is never saved under slots
+that do not describe its query.
+
+Metrics are the ones the schema has - all counted in total_events:
+clicks (is_engaged_view = FALSE), views (is_engaged_view = TRUE) and
+events (both). The metric's is_engaged_view filter is part of the key.
+
+Set QUESTION_LOG_PATH to append every answered question (with its slots
+and SQL) to a JSONL chat log - replay it with scripts/bench_question_keys.py
+to measure the question cache hit rate.
+"""
+
+import json
+import os
+import threading
+from datetime import date
+
+from dotenv import load_dotenv
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+
+from agents.cache_sql.dates import date_range_in_sql
+
+load_dotenv()
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+SLOT_KEY_PREFIX = "slots:"
+
+# JSONL chat log of answered questions (unset = no log)
+QUESTION_LOG_PATH = os.getenv("QUESTION_LOG_PATH")
+
+_log_lock = threading.Lock()
+
+# Metric names -> canonical metric
+METRIC_SYNONYMS = {
+    "click": "clicks",
+    "total_clicks": "clicks",
+    "view": "views",
+    "engaged_views": "views",
+    "event": "events",
+    "total_events": "events",
+}
+
+# Canonical metric -> its is_engaged_view filter (None = no filter)
+METRIC_ENGAGED_VIEW = {
+    "clicks": "false",
+    "views": "true",
+    "events": None,
+}
+
+# Column every metric aggregates
+METRIC_COLUMN = "total_events"
+
+# Slot aggregation names -> canonical aggregation
+AGGREGATIONS = {
+    "sum": "sum",
+    "total": "sum",
+    "avg": "avg",
+    "average": "avg",
+    "mean": "avg",
+    "max": "max",
+    "maximum": "max",
+    "min": "min",
+    "minimum": "min",
+}
+
+# SQL aggregate functions -> canonical aggregation
+_AGGREGATE_FUNCTIONS = {exp.Sum: "sum", exp.Avg: "avg", exp.Max: "max", exp.Min: "min"}
+
+_ORDERS = ("asc", "desc")
+
+# Dimension / filter field names -> schema field (config/schema.py)
+FIELD_SYNONYMS = {
+    "media": "media_source",
+    "mediasource": "media_source",
+    "source": "media_source",
+    "app": "app_id",
+    "application": "app_id",
+    "site": "site_id",
+    "hour": "hr",
+    "day": "date",
+    "event_date": "date",
+    "event_time": "date",
+}
+
+
+# =============================================================================
+# Canonical Form
+# =============================================================================
+
+def _name(value) -> str:
+    return "_".join(str(value).strip().lower().replace("-", " ").split())
+
+
+def _field(value) -> str:
+    name = _name(value)
+    return FIELD_SYNONYMS.get(name, name)
+
+
+def _iso_date(value):
+    try:
+        return date.fromisoformat(str(value)).isoformat()
+    except ValueError:
+        return None
+
+
+def _is_date_literal(value: str) -> bool:
+    """'2025-01-02' or a timestamp on that day ('2025-01-02 00:00:00')."""
+    return _iso_date(value[:10]) is not None and value[10:11] in ("", " ", "T")
+
+
+def _canonical_value(value) -> str:
+    """Filter values keep their case (BigQuery compares strings case-sensitively)."""
+    value = str(value).strip()
+    return value.lower() if value.lower() in ("true", "false") else value
+
+
+def _filters(raw) -> dict:
+    """{field: sorted values} from a dict or a list of {field, values}."""
+    if isinstance(raw, dict):
+        items = raw.items()
+    else:
+        items = [(f.get("field"), f.get("values", f.get("value"))) for f in raw or ()]
+    filters = {}
+    for field, values in items:
+        if not field or values is None:
+            continue
+        if not isinstance(values, (list, tuple, set)):
+            values = [values]
+        filters.setdefault(_field(field), set()).update(_canonical_value(v) for v in values)
+    return {field: sorted(values) for field, values in sorted(filters.items())}
+
+
+def _metric(filters: dict):
+    """Metric of a query's is_engaged_view filter, or None for any other filter on it."""
+    engaged = filters.get("is_engaged_view")
+    for metric, value in METRIC_ENGAGED_VIEW.items():
+        if engaged == ([value] if value else None):
+            return metric
+    return None
+
+
+def canonical_slots(slots):
+    """
+    Returns the canonical form of question slots.
+
+    Args:
+        slots: dict (or pydantic model) with metric, aggregation, dimensions,
+            filters, start_date, end_date, top_n and order
+
+    Returns:
+        dict with metric, aggregation, dimensions, filters, dates, top_n and
+        order - or None if the slots are incomplete (no known metric / no
+        absolute date range) or contradict themselves
+    """
+    if slots is None:
+        return None
+    if hasattr(slots, "model_dump"):
+        slots = slots.model_dump()
+    metric = _name(slots.get("metric") or "")
+    metric = METRIC_SYNONYMS.get(metric, metric)
+    aggregation = AGGREGATIONS.get(_name(slots.get("aggregation") or "sum"))
+    order = _name(slots.get("order") or "") or None
+    start, end = _iso_date(slots.get("start_date")), _iso_date(slots.get("end_date"))
+    if metric not in METRIC_ENGAGED_VIEW or aggregation is None or order not in (None,) + _ORDERS:
+        return None
+    if start is None or end is None or start > end:
+        return None
+    try:
+        top_n = int(slots["top_n"]) if slots.get("top_n") is not None else None
+    except (TypeError, ValueError):
+        return None
+
+    # The metric's is_engaged_view filter - stated or not, the key is the same
+    filters = _filters(slots.get("filters"))
+    engaged = METRIC_ENGAGED_VIEW[metric]
+    if engaged is not None:
+        if filters.get("is_engaged_view", [engaged]) != [engaged]:
+            return None  # "clicks" of views
+        filters["is_engaged_view"] = [engaged]
+        filters = dict(sorted(filters.items()))
+    metric = _metric(filters)
+    if metric is None:
+        return None
+    return {
+        "metric": metric,
+        "aggregation": aggregation,
+        "dimensions": sorted({_field(d) for d in slots.get("dimensions") or ()}),
+        "filters": filters,
+        "dates": [start, end],
+        "top_n": top_n,
+        "order": order or ("desc" if top_n is not None else None),
+    }
+
+
+def slot_cache_key(slots):
+    """
+    Returns the question cache key of question slots.
+
+    Args:
+        slots: Slots from the Intent Agent (dict / pydantic model), or None
+
+    Returns:
+        "slots:{...}" key, or None if the slots are missing or incomplete
+    """
+    canonical = canonical_slots(slots)
+    if canonical is None:
+        return None
+    return SLOT_KEY_PREFIX + json.dumps(canonical, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+# =============================================================================
+# Check Against the Generated SQL
+# =============================================================================
+
+def _group_by_fields(select: exp.Select):
+    """Schema fields the query groups by, or None if a grouping cannot be resolved."""
+    group = select.args.get("group")
+    if group is None:
+        return set()
+    projections = select.expressions
+    aliases = {p.alias.lower(): p.this for p in projections if isinstance(p, exp.Alias)}
+    fields = set()
+    for expression in group.expressions:
+        if isinstance(expression, exp.Literal) and expression.is_int:
+            index = int(expression.this) - 1
+            if not 0 <= index < len(projections):
+                return None
+            expression = projections[index].unalias()
+        elif isinstance(expression, exp.Column) and expression.name.lower() in aliases:
+            expression = aliases[expression.name.lower()]
+        columns = list(expression.find_all(exp.Column))
+        if not columns:
+            return None
+        fields.update(_field(column.name) for column in columns)
+    return fields
+
+
+def _aggregate(select: exp.Select, dimensions: set):
+    """
+    (aggregation, alias) of the one metric column of the projection.
+
+    Returns None unless every other projection is a grouped column and the
+    metric is AGGREGATE(total_events).
+    """
+    aggregates = []
+    for projection in select.expressions:
+        expression = projection.unalias()
+        if isinstance(expression, exp.Column) and _field(expression.name) in dimensions:
+            continue
+        aggregation = _AGGREGATE_FUNCTIONS.get(type(expression))
+        argument = expression.this if aggregation else None
+        if not isinstance(argument, exp.Column) or argument.name.lower() != METRIC_COLUMN:
+            return None
+        aggregates.append((aggregation, projection.alias_or_name.lower()))
+    return aggregates[0] if len(aggregates) == 1 else None
+
+
+def _metric_order(select: exp.Select, alias: str):
+    """
+    Direction the query sorts its metric by ("asc" / "desc"), or None.
+
+    Ordering by grouped columns only (e.g. ORDER BY hr) counts as None.
+    Returns False for an ORDER BY that cannot be resolved.
+    """
+    order = select.args.get("order")
+    if order is None:
+        return None
+    direction = None
+    for ordered in order.expressions:
+        expression = ordered.this
+        if isinstance(expression, exp.Literal) and expression.is_int:
+            index = int(expression.this) - 1
+            if not 0 <= index < len(select.expressions):
+                return False
+            expression = select.expressions[index]
+        if isinstance(expression, exp.Alias):
+            expression = exp.column(expression.alias)
+        if isinstance(expression, exp.Column) and expression.name.lower() == alias:
+            is_metric = True
+        elif isinstance(expression, exp.Column):
+            is_metric = False
+        elif type(expression) in _AGGREGATE_FUNCTIONS:
+            is_metric = True
+        else:
+            return False
+        if is_metric:
+            if direction is not None:
+                return False
+            direction = "desc" if ordered.args.get("desc") else "asc"
+    return direction
+
+
+def _value(node):
+    """Value of a literal / boolean, or None for other expressions."""
+    if isinstance(node, exp.Boolean):
+        return "true" if node.this else "false"
+    if isinstance(node, exp.Literal):
+        return _canonical_value(node.this)
+    return None
+
+
+def _where_filters(where):
+    """
+    {field: sorted values} of the equality / IN filters of a WHERE clause.
+
+    Returns None if a non-date value is used in any other way (e.g. !=, >,
+    LIKE), or for OR / NOT - such queries are not described by slots.
+    """
+    if where.find(exp.Or, exp.Not):
+        return None
+    filters = {}
+    covered = set()
+    for node in where.find_all(exp.EQ, exp.In):
+        if isinstance(node, exp.In):
+            column_side, values = node.this, node.expressions
+        elif _value(node.expression) is not None:
+            column_side, values = node.this, [node.expression]
+        else:
+            column_side, values = node.expression, [node.this]
+        columns = list(column_side.find_all(exp.Column))
+        if len(columns) != 1 or any(_value(v) is None for v in values):
+            continue
+        if all(isinstance(v, exp.Literal) and v.is_string and _is_date_literal(v.this) for v in values):
+            continue  # Date filter - compared as the date range
+        filters.setdefault(_field(columns[0].name), set()).update(_value(v) for v in values)
+        covered.update(id(v) for v in values)
+
+    for node in where.find_all(exp.Literal, exp.Boolean):
+        if id(node) in covered:
+            continue
+        if isinstance(node, exp.Literal) and node.is_string and _is_date_literal(node.this):
+            continue
+        if isinstance(node.parent, exp.Interval):
+            continue
+        return None
+    return {field: sorted(values) for field, values in sorted(filters.items())}
+
+
+def sql_slots(sql: str):
+    """
+    Returns what the slots of a query can be checked against.
+
+    Args:
+        sql: Generated SQL (absolute dates)
+
+    Returns:
+        dict with metric, aggregation, dimensions, filters, dates, top_n and
+        order - or None if the SQL cannot be parsed, is not a single SELECT,
+        or selects / filters / sorts in ways slots cannot describe
+    """
+    try:
+        statement = sqlglot.parse_one(sql, read="bigquery")
+    except (SqlglotError, ValueError, RecursionError):
+        return None
+    if not isinstance(statement, exp.Select):
+        return None
+    if (
+        any(select is not statement for select in statement.find_all(exp.Select))
+        or statement.args.get("joins") or statement.args.get("having") or statement.args.get("qualify")
+    ):
+        return None  # Subqueries / CTEs / joins / HAVING filter beyond the slots
+    dimensions = _group_by_fields(statement)
+    if dimensions is None:
+        return None
+    aggregate = _aggregate(statement, dimensions)
+    if aggregate is None:
+        return None
+    aggregation, alias = aggregate
+    order = _metric_order(statement, alias)
+    if order is False:
+        return None
+
+    where = statement.args.get("where")
+    filters = _where_filters(where) if where is not None else {}
+    if filters is None:
+        return None
+
+    date_range = date_range_in_sql(sql)
+    limit = statement.args.get("limit")
+    top_n = None
+    if limit is not None:
+        value = limit.expression
+        if not (isinstance(value, exp.Literal) and value.is_int):
+            return None
+        top_n = int(value.this)
+    return {
+        "metric": _metric(filters),
+        "aggregation": aggregation,
+        "dimensions": sorted(dimensions),
+        "filters": filters,
+        "dates": [d.isoformat() for d in date_range] if date_range else None,
+        "top_n": top_n,
+        "order": order,
+    }
+
+
+def slots_match_sql(slots, sql: str) -> bool:
+    """
+    Checks that question slots describe a query.
+
+    Args:
+        slots: Slots from the Intent Agent
+        sql: The query generated for them
+
+    Returns:
+        True if metric, aggregation, dates, filters, GROUP BY fields,
+        ORDER BY direction and LIMIT agree
+    """
+    canonical = canonical_slots(slots)
+    from_sql = sql_slots(sql)
+    if canonical is None or from_sql is None:
+        return False
+    filters = {field: values for field, values in canonical["filters"].items() if field != "date"}
+    return (
+        from_sql["metric"] == canonical["metric"]
+        and from_sql["aggregation"] == canonical["aggregation"]
+        and from_sql["dates"] == canonical["dates"]
+        and from_sql["filters"] == filters
+        and from_sql["dimensions"] == canonical["dimensions"]
+        and from_sql["top_n"] == canonical["top_n"]
+        and from_sql["order"] == canonical["order"]
+    )
+
+
+# =============================================================================
+# Chat Log (for hit-rate replays)
+# =============================================================================
+
+def append_question_log(final_question: str, slots, sql: str, path: str = None) -> None:
+    """
+    Appends an answered question to the JSONL chat log.
+
+    Args:
+        final_question: Question from the Intent Agent
+        slots: Its slots (dict / pydantic model), or None
+        sql: The SQL that answered it
+        path: Log file (default: QUESTION_LOG_PATH; nothing is written if unset)
+    """
+    path = path or QUESTION_LOG_PATH
+    if not path or not final_question:
+        return
+    if hasattr(slots, "model_dump"):
+        slots = slots.model_dump()
+    line = json.dumps({"final_question": final_question, "slots": slots, "sql": sql}, ensure_ascii=False)
+    with _log_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
@@ -0,0 +1,288 @@
+"""
+Cache Snapshots - Export / Import for Warm Starts and Node Seeding
+==================================================================
+A fresh replica starts with an empty cache. This module writes the live
+cache entries of a CacheState to a versioned snapshot stream, and loads
+such a stream into another CacheState (at startup, in the background).
+
+Format (version 1):
+    b"CACHESNAP" + version (uint16)      - magic header
+    record*                              - until end of stream
+    record = length (uint32) + codec.py payload of a tuple:
+        first record: ("header", {"version", "created_at", "ttl_seconds"})
+        entries:      (layer, key, stored_at, value, sources)
+
+- Records are length-prefixed, so a snapshot is read one entry at a time
+  (from a file or straight from a running node over HTTP)
+- stored_at is kept - imported entries expire when they would have
+  expired on the source node; already expired entries are skipped
+- Source tables (freshness tracking) travel with their entries;
+  imported SQL entries are indexed for subsumption (subsumption.py)
+- Records are data only (JSON + Arrow IPC, see codec.py) - loading a
+  snapshot cannot run code
+- The HTTP endpoints serve every cached result, so they are disabled
+  unless CACHE_SNAPSHOT_TOKEN is set, and require it as a bearer token;
+  load_snapshot sends it to the source node
+"""
+
+import asyncio
+import logging
+import hmac
+import os
+import struct
+import time
+import urllib.request
+
+from dotenv import load_dotenv
+
+from agents.cache_sql.codec import encode_value, decode_value, CodecError
+
+load_dotenv()
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+SNAPSHOT_MAGIC = b"CACHESNAP"
+SNAPSHOT_VERSION = 1
+
+# Snapshot file written by POST /cache/snapshot and scripts/cache_snapshot.py
+CACHE_SNAPSHOT_PATH = os.getenv("CACHE_SNAPSHOT_PATH", "cache.snapshot")
+
+# Snapshot loaded at startup - file path or URL of a running node's /cache/snapshot
+CACHE_SNAPSHOT_SOURCE = os.getenv("CACHE_SNAPSHOT_SOURCE")
+
+# Shared secret of the snapshot endpoints (Authorization: Bearer) - unset disables them
+CACHE_SNAPSHOT_TOKEN = os.getenv("CACHE_SNAPSHOT_TOKEN")
+
+# Socket timeout (seconds) when loading a snapshot from a URL - a hung node must not stall warm-up
+CACHE_SNAPSHOT_TIMEOUT = float(os.getenv("CACHE_SNAPSHOT_TIMEOUT", "30"))
+
+_VERSION_FORMAT = ">H"
+_LENGTH_FORMAT = ">I"
+
+
+class SnapshotError(ValueError):
+    """Raised for a stream that is not a (supported) cache snapshot."""
+
+
+# =============================================================================
+# Export
+# =============================================================================
+
+def snapshot_token_matches(authorization: str, token: str = None) -> bool:
+    """
+    Checks the Authorization header of a snapshot request.
+
+    Args:
+        authorization: Header value ("Bearer <token>"), or None
+        token: Expected token (default: CACHE_SNAPSHOT_TOKEN)
+
+    Returns:
+        True if a token is configured and the header carries it
+    """
+    token = token if token is not None else CACHE_SNAPSHOT_TOKEN
+    if not token or not authorization:
+        return False
+    scheme, _, value = authorization.partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(value.strip().encode(), token.encode())
+
+
+def _record(obj) -> bytes:
+    payload = encode_value(obj)
+    return struct.pack(_LENGTH_FORMAT, len(payload)) + payload
+
+
+def iter_snapshot_chunks(state, now: float = None):
+    """
+    Yields a snapshot of the cache as byte chunks (one per entry).
+
+    Suitable for streaming responses - entries are read one at a time,
+    so a large persistent cache is never loaded into memory at once.
+
+    Args:
+        state: CacheState to export
+        now: Current time (default: time.time())
+    """
+    now = time.time() if now is None else now
+    yield SNAPSHOT_MAGIC + struct.pack(_VERSION_FORMAT, SNAPSHOT_VERSION)
+    yield _record(("header", {
+        "version": SNAPSHOT_VERSION,
+        "created_at": now,
+        "ttl_seconds": state.ttl_seconds,
+    }))
+    for layer in (state.question_cache, state.cache):
+        for key in list(layer.store):
+            stored_at = layer.ttl_store.get(key)
+            if stored_at is None or now - stored_at > state.entry_ttl(layer.name, key, stored_at):
+                continue
+            try:
+                value = layer.store[key]  # Not via the layer - exporting is not a "use"
+            except KeyError:
+                continue  # Evicted / purged while exporting
+            sources = state.freshness.sources(layer.name, key)
+            yield _record((layer.name, key, stored_at, value, sources))
+
+
+def export_snapshot(state, path: str, now: float = None) -> int:
+    """
+    Writes a snapshot of the cache to a file.
+
+    Written to a temporary file first, so readers never see a partial snapshot.
+
+    Args:
+        state: CacheState to export
+        path: Snapshot file path
+        now: Current time (default: time.time())
+
+    Returns:
+        Number of entries written
+    """
+    temp_path = f"{path}.tmp"
+    count = -2  # Magic + header are not entries
+    with open(temp_path, "wb") as f:
+        for chunk in iter_snapshot_chunks(state, now):
+            f.write(chunk)
+            count += 1
+    os.replace(temp_path, path)
+    return count
+
+
+# =============================================================================
+# Import
+# =============================================================================
+
+def _read_exact(stream, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def iter_snapshot(stream):
+    """
+    Reads snapshot records from a binary stream one at a time.
+
+    Args:
+        stream: File-like object (file, HTTP response)
+
+    Yields:
+        (layer, key, stored_at, value, sources) tuples
+
+    Raises:
+        SnapshotError: Bad magic header, unsupported version or truncated record
+    """
+    magic = _read_exact(stream, len(SNAPSHOT_MAGIC))
+    if magic != SNAPSHOT_MAGIC:
+        raise SnapshotError("Not a cache snapshot")
+    (version,) = struct.unpack(_VERSION_FORMAT, _read_exact(stream, struct.calcsize(_VERSION_FORMAT)))
+    if version != SNAPSHOT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot version {version}")
+
+    while True:
+        prefix = _read_exact(stream, struct.calcsize(_LENGTH_FORMAT))
+        if not prefix:
+            return
+        (length,) = struct.unpack(_LENGTH_FORMAT, prefix)
+        payload = _read_exact(stream, length)
+        if len(payload) != length:
+            raise SnapshotError("Truncated snapshot record")
+        try:
+            record = decode_value(payload)
+        except CodecError as e:
+            raise SnapshotError(f"Invalid snapshot record: {e}") from e
+        if not isinstance(record, tuple) or not record:
+            raise SnapshotError("Invalid snapshot record")
+        if record[0] == "header":
+            continue
+        if len(record) != 5:
+            raise SnapshotError("Invalid snapshot entry")
+        yield record
+
+
+def import_snapshot(state, stream, now: float = None) -> dict:
+    """
+    Loads a snapshot stream into a CacheState.
+
+    TTLs are honored: expired entries are skipped, and imported entries keep
+    their original timestamp. Entries already in the cache with the same or
+    a newer timestamp are kept.
+
+    Args:
+        state: CacheState to load into
+        stream: Binary file-like object with a snapshot
+        now: Current time (default: time.time())
+
+    Returns:
+        dict with loaded / skipped counters
+    """
+    now = time.time() if now is None else now
+    layers = {"question": state.question_cache, "sql": state.cache}
+    loaded = skipped = 0
+    for layer_name, key, stored_at, value, sources in iter_snapshot(stream):
+        layer = layers.get(layer_name)
+        tables, date_range = sources if sources is not None else ((), None)
+        if layer is None or now - stored_at > state.ttl_policy.ttl_for(date_range, stored_at):
+            skipped += 1
+            continue
+        if state.put(layer, key, value, stored_at, tables, date_range, only_if_newer=True):
+            if layer is state.cache:
+                state.subsumption.add(key)  # Coarser queries can be derived from it
+            loaded += 1
+        else:
+            skipped += 1
+    state.flush()
+    return {"loaded": loaded, "skipped": skipped}
+
+
+def load_snapshot(state, source: str, now: float = None) -> dict:
+    """
+    Loads a snapshot from a file path or an http(s) URL.
+
+    URLs are requested with CACHE_SNAPSHOT_TOKEN as a bearer token,
+    with a CACHE_SNAPSHOT_TIMEOUT socket timeout.
+
+    Args:
+        state: CacheState to load into
+        source: File path, or URL of a running node's GET /cache/snapshot
+
+    Returns:
+        dict with loaded / skipped counters
+    """
+    if source.startswith(("http://", "https://")):
+        headers = {"Authorization": f"Bearer {CACHE_SNAPSHOT_TOKEN}"} if CACHE_SNAPSHOT_TOKEN else {}
+        request = urllib.request.Request(source, headers=headers)
+        with urllib.request.urlopen(request, timeout=CACHE_SNAPSHOT_TIMEOUT) as response:
+            return import_snapshot(state, response, now)
+    with open(source, "rb") as f:
+        return import_snapshot(state, f, now)
+
+
+async def load_snapshot_in_background(state, source: str) -> None:
+    """
+    Background task that warms the cache from a snapshot.
+
+    Runs in the default executor so startup (and readiness) is not delayed;
+    requests are served from the partially loaded cache meanwhile.
+
+    Args:
+        state: CacheState to load into
+        source: File path or URL (see load_snapshot)
+    """
+    logging.info("Cache warm-up from snapshot started: %s", source)
+    started = time.time()
+    try:
+        counters = await asyncio.get_running_loop().run_in_executor(
+            None, load_snapshot, state, source
+        )
+    except Exception as e:
+        logging.error(f"Cache warm-up from snapshot failed: {e}")
+        return
+    logging.info(
+        "Cache warm-up finished in %.1fs: %d loaded, %d skipped",
+        time.time() - started, counters["loaded"], counters["skipped"]
+    )
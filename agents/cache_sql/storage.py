@@ -0,0 +1,304 @@
+"""
+Cache Storage - Persistent Backends for CacheState
+===================================================
+This module provides on-disk storage for the SQL/question cache so it
+survives process restarts.
+
+Components:
+1. SQLiteBackend - SQLite file in WAL mode with batched writes
+2. PersistentDict - dict-like view over one backend namespace
+
+Design:
+- Keys are loaded eagerly on startup (small), values lazily on first access
+- Writes are buffered in memory and flushed in batches (one transaction)
+- A background flusher writes buffered entries at most flush_interval
+  seconds after they were buffered (and close() / CacheState.flush at
+  shutdown), so an idle process does not keep the last writes in memory
+- Reads check the pending buffer first, so unflushed writes are visible
+- Values are written with codec.py (JSON + Arrow IPC), never pickled -
+  loading a cache file cannot run code. Values that cannot be decoded
+  are treated as missing
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+
+from agents.cache_sql.codec import encode_value, decode_value, CodecError
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# Number of pending writes that triggers a flush
+DEFAULT_BATCH_SIZE = 64
+
+# Max seconds a write stays in the buffer before the background flusher writes it
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+# Table of the entries
+ENTRIES_TABLE = "cache_values"
+
+# Marker for a pending delete in the write buffer
+_DELETED = object()
+
+
+# =============================================================================
+# SQLite Backend
+# =============================================================================
+
+class SQLiteBackend:
+    """
+    SQLite file backend for the cache.
+
+    All namespaces (question_cache, question_ttl, cache, ttl) share one
+    table keyed by (namespace, key). The database runs in WAL mode so
+    readers are never blocked by the batched writer.
+
+    Pending writes are flushed when batch_size is reached, by a daemon
+    thread once they are flush_interval seconds old, and on close().
+
+    Attributes:
+        path: Path of the SQLite file
+        batch_size: Pending writes that trigger a flush
+        flush_interval: Max age (seconds) of the write buffer
+    """
+    name = "sqlite"
+
+    def __init__(self, path: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._lock = threading.RLock()
+        self._pending = {}  # {(namespace, key): encoded value or _DELETED}
+        self._last_flush = time.time()
+        self._closed = threading.Event()
+
+        # isolation_level=None - we manage transactions ourselves in flush()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {ENTRIES_TABLE} ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value BLOB NOT NULL,"
+            " PRIMARY KEY (namespace, key)"
+            ") WITHOUT ROWID"
+        )
+
+        if flush_interval > 0:
+            threading.Thread(target=self._flush_loop, name="cache-flush", daemon=True).start()
+
+    # -------------------------------------------------------------------------
+    # Reads
+    # -------------------------------------------------------------------------
+
+    def keys(self, namespace: str) -> list:
+        """Returns all keys of a namespace (including unflushed writes)."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key FROM {ENTRIES_TABLE} WHERE namespace = ?", (namespace,)
+            ).fetchall()
+            keys = dict.fromkeys(row[0] for row in rows)
+            for (ns, key), value in self._pending.items():
+                if ns != namespace:
+                    continue
+                if value is _DELETED:
+                    keys.pop(key, None)
+                else:
+                    keys[key] = None
+            return list(keys)
+
+    def items(self, namespace: str) -> list:
+        """Returns all (key, value) pairs of a namespace - used for small namespaces."""
+        items = []
+        for key in self.keys(namespace):
+            try:
+                items.append((key, self.get(namespace, key)))
+            except KeyError:
+                continue  # Undecodable value (see get)
+        return items
+
+    def get(self, namespace: str, key: str):
+        """
+        Loads one value.
+
+        Raises:
+            KeyError: If the key does not exist, or its value cannot be decoded
+        """
+        with self._lock:
+            blob = self._pending.get((namespace, key))
+            if blob is _DELETED:
+                raise KeyError(key)
+            if blob is None:
+                row = self._conn.execute(
+                    f"SELECT value FROM {ENTRIES_TABLE} WHERE namespace = ? AND key = ?",
+                    (namespace, key)
+                ).fetchone()
+                if row is None:
+                    raise KeyError(key)
+                blob = row[0]
+        try:
+            return decode_value(blob)
+        except CodecError as e:
+            logging.warning(f"Cache value {namespace}/{key[:60]} cannot be decoded: {e}")
+            raise KeyError(key) from e
+
+    # -------------------------------------------------------------------------
+    # Writes (buffered)
+    # -------------------------------------------------------------------------
+
+    def put(self, namespace: str, key: str, value) -> None:
+        """Buffers a write. Flushed with the next batch (at most flush_interval later)."""
+        blob = encode_value(value)
+        with self._lock:
+            self._pending[(namespace, key)] = blob
+            self._maybe_flush()
+
+    def delete(self, namespace: str, key: str) -> None:
+        """Buffers a delete. Flushed with the next batch."""
+        with self._lock:
+            self._pending[(namespace, key)] = _DELETED
+            self._maybe_flush()
+
+    def clear(self, namespace: str) -> None:
+        """Deletes a whole namespace immediately."""
+        with self._lock:
+            for pending_key in [k for k in self._pending if k[0] == namespace]:
+                del self._pending[pending_key]
+            self._conn.execute(f"DELETE FROM {ENTRIES_TABLE} WHERE namespace = ?", (namespace,))
+
+    def flush(self) -> None:
+        """Writes all pending changes in a single transaction."""
+        with self._lock:
+            if not self._pending:
+                self._last_flush = time.time()
+                return
+            upserts = [
+                (ns, key, blob) for (ns, key), blob in self._pending.items()
+                if blob is not _DELETED
+            ]
+            deletes = [
+                (ns, key) for (ns, key), blob in self._pending.items()
+                if blob is _DELETED
+            ]
+            self._conn.execute("BEGIN")
+            try:
+                if upserts:
+                    self._conn.executemany(
+                        f"INSERT OR REPLACE INTO {ENTRIES_TABLE} (namespace, key, value) VALUES (?, ?, ?)",
+                        upserts
+                    )
+                if deletes:
+                    self._conn.executemany(
+                        f"DELETE FROM {ENTRIES_TABLE} WHERE namespace = ? AND key = ?",
+                        deletes
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._pending.clear()
+            self._last_flush = time.time()
+
+    def close(self) -> None:
+        """Flushes pending writes and closes the connection."""
+        self._closed.set()
+        with self._lock:
+            self.flush()
+            self._conn.close()
+
+    def _maybe_flush(self) -> None:
+        """Flushes when the batch is full or the buffer is too old."""
+        if (
+            len(self._pending) >= self.batch_size
+            or time.time() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def _flush_loop(self) -> None:
+        """Background flusher - writes the buffer once it is flush_interval old."""
+        while not self._closed.wait(self.flush_interval):
+            with self._lock:
+                if self._closed.is_set():
+                    return
+                if self._pending and time.time() - self._last_flush >= self.flush_interval:
+                    try:
+                        self.flush()
+                    except sqlite3.Error as e:
+                        logging.warning(f"Cache flush failed: {e}")
+
+
+# =============================================================================
+# Dict View over a Backend Namespace
+# =============================================================================
+
+class PersistentDict(MutableMapping):
+    """
+    Dict-like view of one backend namespace.
+
+    Behaves like the plain dicts CacheState used before, so run_sql and
+    the tests can keep using `in`, `[]`, `pop` and `clear` unchanged.
+
+    Keys are kept in memory; values are loaded from the backend on first
+    access and then kept in memory (lazy loading).
+
+    Attributes:
+        namespace: Backend namespace name
+    """
+
+    def __init__(self, backend, namespace: str, eager: bool = False):
+        self.namespace = namespace
+        self._backend = backend
+        if eager:
+            # Small values (timestamps) - load everything up front
+            self._values = dict(backend.items(namespace))
+            self._keys = dict.fromkeys(self._values)
+        else:
+            self._values = {}
+            self._keys = dict.fromkeys(backend.keys(namespace))
+
+    def __contains__(self, key) -> bool:
+        return key in self._keys
+
+    def __getitem__(self, key):
+        if key in self._values:
+            return self._values[key]
+        if key not in self._keys:
+            raise KeyError(key)
+        try:
+            value = self._backend.get(self.namespace, key)
+        except KeyError:
+            self._keys.pop(key, None)  # Gone or undecodable - forget the key
+            raise
+        self._values[key] = value
+        return value
+
+    def __setitem__(self, key, value) -> None:
+        self._keys[key] = None
+        self._values[key] = value
+        self._backend.put(self.namespace, key, value)
+
+    def __delitem__(self, key) -> None:
+        if key not in self._keys:
+            raise KeyError(key)
+        del self._keys[key]
+        self._values.pop(key, None)
+        self._backend.delete(self.namespace, key)
+
+    def __iter__(self):
+        return iter(list(self._keys))
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def clear(self) -> None:
+        self._keys.clear()
+        self._values.clear()
+        self._backend.clear(self.namespace)
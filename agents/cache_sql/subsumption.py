@@ -0,0 +1,509 @@
+"""
+Query Subsumption - Answer Coarser Queries from Cached Finer Results
+=====================================================================
+If the SQL cache holds "clicks by media_source and hr on 2025-01-02",
+then "clicks by media_source on 2025-01-02", "clicks of Facebook by hr
+on 2025-01-02" and the day's total can all be computed from it - without
+BigQuery.
+
+A query is reduced to a shape (single table, no joins / subqueries):
+- dimensions: GROUP BY expressions, with their output column names
+- measures: SUM(x) / COUNT(*) / COUNT(x) / MIN(x) / MAX(x), aliased
+- filters: `expr = value` / `expr IN (...)` conjuncts of the WHERE clause
+- date range: DATE(...) = / BETWEEN / >= / <= conjuncts with date literals
+- residual: every other conjunct (must be identical in both queries)
+
+A cached (source) query subsumes a new (target) query when the target's
+dimensions and measures are a subset of the source's, and every row the
+target needs is in the source: the source's filters / date range are the
+same or wider, and anything narrower is on a source dimension (so rows
+can be filtered locally).
+
+The target is then evaluated on the cached Arrow table: filter, then a
+vectorized group-by (pyarrow) that re-aggregates the measures -
+SUM -> sum, COUNT -> sum of counts, MIN -> min, MAX -> max. Integer sums
+stay int64 and NULL groups / NULL sums behave as in BigQuery, so the
+numbers are exactly those BigQuery would return.
+"""
+
+import os
+import threading
+from collections import namedtuple
+from datetime import date, timedelta
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from dotenv import load_dotenv
+
+from agents.cache_sql.columnar import ColumnarRows
+
+load_dotenv()
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# Answer queries from cached finer-grained results ("false" disables)
+CACHE_SUBSUMPTION = os.getenv("CACHE_SUBSUMPTION", "true").lower() not in ("0", "false", "no")
+
+# Aggregate -> how its per-group results are combined again
+_REAGGREGATE = {"SUM": "sum", "COUNT": "sum", "MIN": "min", "MAX": "max"}
+
+_AGGREGATE_TYPES = {exp.Sum: "SUM", exp.Count: "COUNT", exp.Min: "MIN", exp.Max: "MAX"}
+
+
+QueryShape = namedtuple("QueryShape", [
+    "table",        # Table name
+    "dimensions",   # {expression: output column}
+    "measures",     # {(function, argument): output column}
+    "outputs",      # Output columns in SELECT order: (kind, identity, name)
+    "filters",      # {expression: frozenset of values}
+    "dates",        # {expression: (first, last)} - None = unbounded side
+    "residual",     # frozenset of other conjuncts (SQL text)
+    "order",        # [(output column, descending)]
+    "limit",        # int or None
+])
+
+
+# =============================================================================
+# Query Shape
+# =============================================================================
+
+def _literal_value(node):
+    """Python value of a literal / boolean, or raises ValueError."""
+    if isinstance(node, exp.Boolean):
+        return bool(node.this)
+    if isinstance(node, exp.Literal):
+        if node.is_string:
+            return node.this
+        text = node.this
+        return int(text) if text.lstrip("-").isdigit() else float(text)
+    raise ValueError("not a literal")
+
+
+def _date_literal(node):
+    """datetime.date of a 'YYYY-MM-DD' literal, or None."""
+    if isinstance(node, exp.Literal) and node.is_string:
+        try:
+            return date.fromisoformat(node.this)
+        except ValueError:
+            return None
+    return None
+
+
+_FLIPPED = {exp.GT: exp.LT, exp.GTE: exp.LTE, exp.LT: exp.GT, exp.LTE: exp.GTE, exp.EQ: exp.EQ}
+
+
+def date_condition(conjunct):
+    """(expression, first, last) for a day-range condition on a DATE(...) expression, else None."""
+    if isinstance(conjunct, exp.Between):
+        low, high = _date_literal(conjunct.args.get("low")), _date_literal(conjunct.args.get("high"))
+        if isinstance(conjunct.this, exp.Date) and low and high:
+            return conjunct.this.sql(dialect="bigquery"), low, high
+        return None
+    kind = type(conjunct)
+    if kind not in _FLIPPED:
+        return None
+    left, right = conjunct.this, conjunct.expression
+    if _date_literal(left) is not None:
+        left, right, kind = right, left, _FLIPPED[kind]
+    day = _date_literal(right)
+    if day is None or not isinstance(left, exp.Date):
+        return None
+    first, last = {
+        exp.EQ: (day, day),
+        exp.GTE: (day, None),
+        exp.GT: (day + timedelta(days=1), None),
+        exp.LTE: (None, day),
+        exp.LT: (None, day - timedelta(days=1)),
+    }[kind]
+    return left.sql(dialect="bigquery"), first, last
+
+
+def _intersect(a, b):
+    first = max((d for d in (a[0], b[0]) if d is not None), default=None)
+    last = min((d for d in (a[1], b[1]) if d is not None), default=None)
+    return first, last
+
+
+def _filter_condition(conjunct):
+    """(expression, values) for `expr = value` / `expr IN (values)`, else None."""
+    try:
+        if isinstance(conjunct, exp.In) and conjunct.expressions and not conjunct.args.get("query"):
+            values = [_literal_value(v) for v in conjunct.expressions]
+            target = conjunct.this
+        elif isinstance(conjunct, exp.EQ):
+            left, right = conjunct.this, conjunct.expression
+            if isinstance(left, (exp.Literal, exp.Boolean)):
+                left, right = right, left
+            values = [_literal_value(right)]
+            target = left
+        else:
+            return None
+    except ValueError:
+        return None
+    if target.find(exp.AggFunc) or not target.find(exp.Column):
+        return None
+    return target.sql(dialect="bigquery"), frozenset(values)
+
+
+def _measure(expression):
+    """(function, argument) of a re-aggregatable measure, else None."""
+    function = _AGGREGATE_TYPES.get(type(expression))
+    if function is None or expression.args.get("distinct") or isinstance(expression.this, exp.Distinct):
+        return None
+    argument = expression.this
+    if isinstance(argument, exp.Star):
+        return (function, "*") if function == "COUNT" else None
+    if argument is None or argument.find(exp.AggFunc):
+        return None
+    return function, argument.sql(dialect="bigquery")
+
+
+def query_shape(sql: str):
+    """
+    Reduces a query to its shape.
+
+    Args:
+        sql: SQL query (canonical form - see fingerprint_sql)
+
+    Returns:
+        QueryShape, or None if the query is not a single-table aggregate
+        this module can reason about
+    """
+    try:
+        select = sqlglot.parse_one(sql, read="bigquery")
+    except (SqlglotError, ValueError, RecursionError):
+        return None
+    if not isinstance(select, exp.Select) or select.args.get("distinct"):
+        return None
+    if (
+        any(s is not select for s in select.find_all(exp.Select))
+        or select.args.get("joins") or select.args.get("having")
+        or select.args.get("qualify") or select.args.get("with")
+        or select.find(exp.Window) or any(isinstance(p, exp.Star) for p in select.expressions)
+    ):
+        return None
+    tables = list(select.find_all(exp.Table))
+    if len(tables) != 1:
+        return None
+
+    # Projections: dimensions (grouped expressions) and measures
+    dimensions, measures, outputs = {}, {}, []
+    aliases = {}
+    for projection in select.expressions:
+        name = projection.alias_or_name
+        inner = projection.unalias()
+        if not name or (not isinstance(projection, exp.Alias) and not isinstance(inner, exp.Column)):
+            return None  # BigQuery would name it f0_ - not mappable
+        if inner.find(exp.AggFunc):
+            measure = _measure(inner)
+            if measure is None or measure in measures:
+                return None
+            measures[measure] = name
+            outputs.append(("measure", measure, name))
+        else:
+            identity = inner.sql(dialect="bigquery")
+            dimensions[identity] = name
+            outputs.append(("dimension", identity, name))
+        aliases[name.lower()] = inner
+
+    # GROUP BY must be exactly the projected dimensions
+    group = select.args.get("group")
+    grouped = set()
+    for expression in (group.expressions if group else []):
+        if isinstance(expression, exp.Literal) and expression.is_int:
+            index = int(expression.this) - 1
+            if not 0 <= index < len(select.expressions):
+                return None
+            expression = select.expressions[index].unalias()
+        elif isinstance(expression, exp.Column) and not expression.table and expression.name.lower() in aliases:
+            expression = aliases[expression.name.lower()]
+        grouped.add(expression.sql(dialect="bigquery"))
+    if grouped != set(dimensions):
+        return None
+
+    # WHERE: filters, date ranges and residual conjuncts
+    filters, dates, residual = {}, {}, set()
+    where = select.args.get("where")
+    conjuncts = list(where.this.flatten()) if where is not None and isinstance(where.this, exp.And) else (
+        [where.this] if where is not None else []
+    )
+    for conjunct in conjuncts:
+        conjunct = conjunct.unnest()
+        day_range = date_condition(conjunct)
+        if day_range is not None:
+            identity, first, last = day_range
+            dates[identity] = _intersect(dates.get(identity, (None, None)), (first, last))
+            continue
+        filter_condition = _filter_condition(conjunct)
+        if filter_condition is not None and filter_condition[0] not in filters:
+            filters[filter_condition[0]] = filter_condition[1]
+            continue
+        residual.add(conjunct.sql(dialect="bigquery"))
+
+    order = []
+    for ordered in (select.args["order"].expressions if select.args.get("order") else []):
+        target = ordered.this
+        names = {name.lower(): name for _, _, name in outputs}
+        if not isinstance(target, exp.Column) or target.table or target.name.lower() not in names:
+            return None
+        order.append((names[target.name.lower()], bool(ordered.args.get("desc"))))
+
+    limit = None
+    if select.args.get("limit") is not None:
+        value = select.args["limit"].expression
+        if not (isinstance(value, exp.Literal) and value.is_int) or select.args.get("offset"):
+            return None
+        limit = int(value.this)
+
+    return QueryShape(
+        table=exp.table_name(tables[0]).lower(),
+        dimensions=dimensions,
+        measures=measures,
+        outputs=outputs,
+        filters=filters,
+        dates=dates,
+        residual=frozenset(residual),
+        order=order,
+        limit=limit,
+    )
+
+
+# =============================================================================
+# Subsumption Check
+# =============================================================================
+
+def _contains(outer, inner) -> bool:
+    """True if the day range inner lies within outer (None = unbounded)."""
+    return (
+        (outer[0] is None or (inner[0] is not None and inner[0] >= outer[0]))
+        and (outer[1] is None or (inner[1] is not None and inner[1] <= outer[1]))
+    )
+
+
+def plan_derivation(source: QueryShape, target: QueryShape):
+    """
+    Checks whether target can be computed from the rows of source.
+
+    Args:
+        source: Shape of the cached query
+        target: Shape of the new query
+
+    Returns:
+        dict with the local row filters (value filters / date ranges on
+        source output columns), or None if source does not subsume target
+    """
+    if (
+        source.table != target.table
+        or source.residual != target.residual
+        or source.limit is not None
+        or not set(target.dimensions) <= set(source.dimensions)
+        or not set(target.measures) <= set(source.measures)
+        or any(function not in _REAGGREGATE for function, _ in target.measures)
+    ):
+        return None
+
+    value_filters = {}
+    for identity in set(source.filters) | set(target.filters):
+        source_values, target_values = source.filters.get(identity), target.filters.get(identity)
+        if target_values is None:
+            return None  # Source is narrower than the target
+        if source_values == target_values:
+            continue
+        if source_values is not None and not target_values <= source_values:
+            return None
+        if identity not in source.dimensions:
+            return None  # Cannot filter rows on a column the source does not return
+        value_filters[source.dimensions[identity]] = target_values
+
+    date_filters = {}
+    for identity in set(source.dates) | set(target.dates):
+        source_range = source.dates.get(identity, (None, None))
+        target_range = target.dates.get(identity, (None, None))
+        if source_range == target_range:
+            continue
+        if not _contains(source_range, target_range) or identity not in source.dimensions:
+            return None
+        date_filters[source.dimensions[identity]] = target_range
+
+    return {"value_filters": value_filters, "date_filters": date_filters}
+
+
+# =============================================================================
+# Local Evaluation (vectorized)
+# =============================================================================
+
+def _as_table(rows) -> pa.Table:
+    if isinstance(rows, ColumnarRows):
+        return rows.table
+    return pa.Table.from_pylist(list(rows))
+
+
+def _decoded(column):
+    if pa.types.is_dictionary(column.type):
+        return column.cast(column.type.value_type)
+    return column
+
+
+def _as_day(column):
+    """Day (date32) of a DATE / TIMESTAMP / 'YYYY-MM-DD' column."""
+    column = _decoded(column)
+    if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        return pc.cast(pc.utf8_slice_codeunits(column, 0, 10), pa.date32())
+    return pc.cast(column, pa.date32())
+
+
+def evaluate(rows, source: QueryShape, target: QueryShape, plan: dict) -> list:
+    """
+    Computes the target's rows from the source's cached rows.
+
+    Args:
+        rows: Cached rows of the source (ColumnarRows or list of dicts)
+        source: Shape of the cached query
+        target: Shape of the new query
+        plan: Result of plan_derivation(source, target)
+
+    Returns:
+        List of row dicts, as BigQuery would return them for target
+    """
+    table = _as_table(rows)
+
+    mask = None
+    for name, values in plan["value_filters"].items():
+        condition = pc.is_in(_decoded(table[name]), value_set=pa.array(sorted(values, key=repr)))
+        mask = condition if mask is None else pc.and_(mask, condition)
+    for name, (first, last) in plan["date_filters"].items():
+        day = _as_day(table[name])
+        if first is not None:
+            condition = pc.greater_equal(day, pa.scalar(first, pa.date32()))
+            mask = condition if mask is None else pc.and_(mask, condition)
+        if last is not None:
+            condition = pc.less_equal(day, pa.scalar(last, pa.date32()))
+            mask = condition if mask is None else pc.and_(mask, condition)
+    if mask is not None:
+        table = table.filter(pc.fill_null(mask, False))
+
+    keys = [source.dimensions[identity] for identity in target.dimensions]
+    aggregations = [
+        (source.measures[measure], _REAGGREGATE[measure[0]]) for measure in target.measures
+    ]
+
+    if keys:
+        key_columns = {name: _decoded(table[name]) for name in keys}
+        value_columns = {name: table[name] for name, _ in aggregations}
+        grouped_input = pa.table({**key_columns, **value_columns})
+        grouped = grouped_input.group_by(keys, use_threads=False).aggregate(aggregations)
+        columns = {name: grouped[name] for name in keys}
+        for (name, function), measure in zip(aggregations, target.measures):
+            columns[measure] = grouped[f"{name}_{function}"]
+        result = pa.table({
+            output: columns[identity if kind == "measure" else source.dimensions[identity]]
+            for kind, identity, output in target.outputs
+        })
+    else:
+        # Aggregate without GROUP BY - always one row (SUM of nothing is NULL, COUNT is 0)
+        values = {}
+        for (name, function), measure in zip(aggregations, target.measures):
+            column = table[name]
+            if function == "sum":
+                value = pc.sum(column, min_count=1)
+                if measure[0] == "COUNT" and not value.is_valid:
+                    value = pa.scalar(0, pa.int64())
+            else:
+                value = getattr(pc, function)(column)
+            values[measure] = value
+        result = pa.table({
+            output: pa.array([values[identity].as_py()], type=values[identity].type)
+            for _, identity, output in target.outputs
+        })
+
+    if target.order:
+        # BigQuery: ASC puts NULLs first, DESC puts them last
+        sort_keys = [
+            (name, "descending", "at_end") if descending else (name, "ascending", "at_start")
+            for name, descending in target.order
+        ]
+        result = result.take(pc.sort_indices(result, sort_keys=sort_keys))
+    if target.limit is not None:
+        result = result.slice(0, target.limit)
+    return result.to_pylist()
+
+
+# =============================================================================
+# Index of Cached Shapes
+# =============================================================================
+
+class SubsumptionIndex:
+    """
+    Shapes of the cached SQL entries, by table.
+
+    Entries are added when they are saved; entries that left the cache are
+    dropped when a lookup finds them gone.
+
+    Attributes:
+        derived: Number of queries answered from a cached finer result
+    """
+
+    def __init__(self):
+        self.derived = 0
+        self._shapes = {}  # {table: {sql_key: QueryShape}}
+        self._lock = threading.Lock()
+
+    def add(self, key: str) -> None:
+        """Indexes a cached SQL entry (its key is the canonical SQL)."""
+        shape = query_shape(key)
+        if shape is None:
+            return
+        with self._lock:
+            self._shapes.setdefault(shape.table, {})[key] = shape
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            for shapes in self._shapes.values():
+                shapes.pop(key, None)
+
+    def __len__(self) -> int:
+        return sum(len(shapes) for shapes in self._shapes.values())
+
+    def derive(self, sql: str, load):
+        """
+        Computes a query from a cached entry that subsumes it.
+
+        Args:
+            sql: Canonical SQL of the new query (fingerprint_sql)
+            load: Function key -> (rows, stored_at) of a live entry, or None
+
+        Returns:
+            (rows, source_key, stored_at), or None if no cached entry subsumes it
+        """
+        target = query_shape(sql)
+        if target is None:
+            return None
+        with self._lock:
+            candidates = list(self._shapes.get(target.table, {}).items())
+
+        # Fewest dimensions first - the smallest tables to re-aggregate
+        candidates.sort(key=lambda item: len(item[1].dimensions))
+        for key, source in candidates:
+            if key == sql:
+                continue
+            plan = plan_derivation(source, target)
+            if plan is None:
+                continue
+            loaded = load(key)
+            if loaded is None:
+                self.discard(key)
+                continue
+            rows, stored_at = loaded
+            try:
+                derived_rows = evaluate(rows, source, target, plan)
+            except (pa.ArrowException, KeyError, ValueError, TypeError):
+                continue
+            self.derived += 1
+            return derived_rows, key, stored_at
+        return None
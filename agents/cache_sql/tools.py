@@ -10,16 +10,101 @@ Functions:
 
 Caching rules:
 - Queries with relative dates (today, yesterday) are not cached
+  (run_sql first rewrites them to absolute dates - see dates.py)
+- Queries reaching today's date are cached briefly (today's data is still arriving)
 - Queries with LIMIT are not cached
 - Queries with absolute dates (2025-01-01) are cached
 
 TTL (Time To Live):
-- Queries are cached for 180 days
+- Per entry, by the newest date the query read (see ttl_policy.py):
+  minutes for today, an hour for the last few days, 180 days for older data
+
+Storage:
+- In-memory dicts by default
+- Set CACHE_DB_PATH to persist the cache in a SQLite file (survives restarts)
+
+Capacity:
+- Both layers share one LRU budget (CACHE_MAX_ENTRIES / CACHE_MAX_BYTES)
+- Least recently used entries are evicted when the budget is exceeded
+- Once full, new results must beat the LRU victim's lookup frequency
+  (TinyLFU admission - see admission.py) so one-off queries cannot churn it
+
+Expiry:
+- Every TTL timestamp is indexed in a min-heap ordered by expiry time
+- A background sweeper (started by api.py) purges expired entries
+
+Freshness:
+- Each entry records the tables and dates it read
+- A background checker (started by api.py) compares them to BigQuery
+  table/partition metadata and invalidates entries whose data changed
+- Statements run_sql executes that write a table (CREATE OR REPLACE...)
+  invalidate the entries that read it at once (invalidate_written)
+
+Concurrency:
+- Keys are guarded by CACHE_LOCK_STRIPES striped locks
+- get_fresh() / put() are atomic per key (no check-then-pop races)
+
+Stale-while-revalidate:
+- Past CACHE_SOFT_TTL_SECONDS (before the hard TTL) an entry is served
+  stale and refreshed once in the background
+- Hot entries are refreshed a little early, at random (XFetch), so the
+  refresh rarely waits for the soft TTL
+
+Shared tier:
+- Set CACHE_SHARED_URL (Redis) to share results between uvicorn workers
+- The in-process cache stays in front of it as L1
+
+Negative cache:
+- Empty results, rejected SQL and FALLBACK_NO_EXECUTION are remembered
+  for CACHE_NEGATIVE_TTL seconds, apart from the positive entries
+
+Subsumption:
+- A query that is a coarser view of a cached SQL entry (fewer GROUP BY
+  columns, narrower filters) is computed from it - see subsumption.py
 """
 
+import os
+import math
+import random
 import time
 import re
+import atexit
+import threading
 from pydantic import BaseModel
+from dotenv import load_dotenv
+
+from agents.cache_sql.storage import SQLiteBackend, PersistentDict
+from agents.cache_sql.eviction import LRUPolicy, CacheLayer
+from agents.cache_sql.expiry import ExpiryIndex, TimestampMap
+from agents.cache_sql.freshness import FreshnessTracker
+from agents.cache_sql.shared import create_shared_tier
+from agents.cache_sql.negative import NegativeCache
+from agents.cache_sql.subsumption import SubsumptionIndex, CACHE_SUBSUMPTION
+from agents.cache_sql.ttl_policy import TTLPolicy, TIERS
+from agents.cache_sql.admission import TinyLFUAdmission, CACHE_ADMISSION
+from agents.cache_sql.dates import latest_date_in_sql, utc_today
+
+load_dotenv()
+
+# Optional path of the SQLite file for the persistent cache
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH")
+
+# Capacity of the cache (both layers together) - 0 means unlimited
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Number of key locks (lock striping) - more stripes, less contention
+CACHE_LOCK_STRIPES = int(os.getenv("CACHE_LOCK_STRIPES", "64"))
+
+# Stale-while-revalidate: entries older than the soft TTL are still served,
+# and refreshed in the background (unset = off, entries are fresh until the TTL)
+CACHE_SOFT_TTL_SECONDS = os.getenv("CACHE_SOFT_TTL_SECONDS")
+
+# Probabilistic early refresh (XFetch) - higher refreshes earlier, 0 disables
+CACHE_EARLY_REFRESH_BETA = float(os.getenv("CACHE_EARLY_REFRESH_BETA", "1.0"))
+
+# Assumed recompute time (seconds) of entries without a measured one
+DEFAULT_COMPUTE_SECONDS = 1.0
 
 
 # =============================================================================
@@ -43,23 +128,401 @@ class CacheState:
     1. question_cache - cache by normalized question (more stable)
     2. cache - cache by normalized SQL (fallback)
     
+    With a backend (e.g. SQLiteBackend) the four dicts are PersistentDict
+    views: same dict interface, but entries are written to disk in batches
+    and cached values are loaded lazily on first access.
+    
+    question_cache and cache are CacheLayer objects sharing one LRU policy,
+    so the total number of entries and estimated bytes stay bounded.
+    
+    question_ttl and ttl are TimestampMap objects: every timestamp is also
+    pushed to a time-ordered expiry index used by purge_expired().
+    
+    The source tables of every entry are tracked by a FreshnessTracker,
+    used by refresh_freshness() and get_fresh().
+    
+    Thread/task safety (lock striping):
+    keys are spread over CACHE_LOCK_STRIPES locks by hash. get_fresh() and
+    put() run the whole check-expire-read / write sequence of a key under
+    its lock, so concurrent requests never lose or resurrect entries, and
+    requests for different keys rarely wait for each other.
+    
+    Shared tier (optional, see shared.py): this object is the in-process
+    L1; misses fall through to the shared L2 and put() writes both.
+    
     Attributes:
         question_cache: dict {normalized_question: result}
         question_ttl: dict {normalized_question: timestamp}
         cache: dict {normalized_sql: result}
         ttl: dict {normalized_sql: timestamp}
+        backend: Storage backend, or None for in-memory only
+        policy: LRU policy shared by both layers
+        expiry: Expiry index over both layers
+        freshness: Source table tracker over both layers
+        shared: Shared tier (L2) used by all workers, or None
+        negative: Short-TTL cache of failures and empty results (see negative.py)
+        subsumption: Shapes of cached SQL entries, for deriving coarser queries
+        admission: TinyLFU filter for inserts into a full cache, or None (see admission.py)
+        soft_ttl_seconds: Age after which entries are served stale, or None (off)
+        compute_seconds: Measured recompute time per entry (XFetch)
     """
-    def __init__(self):
+    def __init__(self, backend=None, max_entries: int = None,
+                 max_bytes: int = None, ttl_seconds: float = None,
+                 lock_stripes: int = None, shared=None, negative_ttl_seconds: float = None,
+                 soft_ttl_seconds: float = None, early_refresh_beta: float = None,
+                 ttl_policy: TTLPolicy = None, admission: bool = None):
+        self.backend = backend
+        self.shared = shared
+        self.shared_hits = 0
+        self.negative = NegativeCache(negative_ttl_seconds)
+        self.subsumption = SubsumptionIndex()
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else TTL_SECONDS
+        self.ttl_policy = ttl_policy if ttl_policy is not None else TTLPolicy(self.ttl_seconds)
+        self.stored_by_tier = dict.fromkeys(TIERS, 0)
+        if soft_ttl_seconds is None and CACHE_SOFT_TTL_SECONDS:
+            soft_ttl_seconds = float(CACHE_SOFT_TTL_SECONDS)
+        self.soft_ttl_seconds = soft_ttl_seconds
+        self.early_refresh_beta = early_refresh_beta if early_refresh_beta is not None else CACHE_EARLY_REFRESH_BETA
+        self.compute_seconds = {}  # {(layer_name, key): seconds the result took to compute}
+        self.stale_served = 0
+        self.early_refreshes = 0
+        self.write_invalidations = 0
+        self._random = random.random
+        self.policy = LRUPolicy(
+            max_entries=max_entries if max_entries is not None else CACHE_MAX_ENTRIES,
+            max_bytes=max_bytes if max_bytes is not None else CACHE_MAX_BYTES,
+        )
+        admission = admission if admission is not None else CACHE_ADMISSION
+        self.admission = TinyLFUAdmission(self.policy.max_entries) if admission else None
+        self.expiry = ExpiryIndex()
+        self.expired_purged = 0
+        self.freshness = FreshnessTracker()
+        self._layers = {}
+        stripes = lock_stripes if lock_stripes is not None else CACHE_LOCK_STRIPES
+        self._locks = [threading.RLock() for _ in range(max(stripes, 1))]
+
+        if backend is None:
+            question_ttl_store, question_store = {}, {}
+            sql_ttl_store, sql_store = {}, {}
+            question_sources, sql_sources = {}, {}
+        else:
+            # Results are loaded lazily, timestamps and sources eagerly (they are tiny)
+            question_ttl_store = PersistentDict(backend, "question_ttl", eager=True)
+            question_store = PersistentDict(backend, "question_cache")
+            sql_ttl_store = PersistentDict(backend, "ttl", eager=True)
+            sql_store = PersistentDict(backend, "cache")
+            question_sources = PersistentDict(backend, "question_sources", eager=True)
+            sql_sources = PersistentDict(backend, "sql_sources", eager=True)
+        self.freshness.add_layer("question", question_sources)
+        self.freshness.add_layer("sql", sql_sources)
+
         # Question-level cache - preferred! Same question always returns same result
-        self.question_cache = {}  # Cache dict: {normalized_question: result}
-        self.question_ttl = {}    # TTL dict: {normalized_question: timestamp}
-        
+        self.question_ttl = TimestampMap("question", question_ttl_store, self.expiry, self.ttl_seconds,
+                                         ttl_for=self.entry_ttl)
+        self.question_cache = CacheLayer("question", question_store, self.question_ttl, self.policy,
+                                         self._layers, lock_for=self.lock_for)
+
         # SQL-level cache - fallback for identical queries
-        self.cache = {}  # Cache dict: {normalized_sql: result}
-        self.ttl = {}    # TTL dict: {normalized_sql: timestamp}
+        self.ttl = TimestampMap("sql", sql_ttl_store, self.expiry, self.ttl_seconds,
+                                ttl_for=self.entry_ttl)
+        self.cache = CacheLayer("sql", sql_store, self.ttl, self.policy,
+                                self._layers, lock_for=self.lock_for)
+
+        if backend is not None and CACHE_SUBSUMPTION:
+            # Persisted SQL entries become subsumption sources (parsing them can take a while)
+            keys = list(sql_ttl_store.keys())
+            threading.Thread(target=lambda: [self.subsumption.add(k) for k in keys], daemon=True).start()
+
+    def lock_for(self, key: str):
+        """Returns the lock (stripe) guarding a key."""
+        return self._locks[hash(key) % len(self._locks)]
+
+    def entry_ttl(self, layer_name: str, key: str, stored_at: float) -> float:
+        """
+        Returns the TTL of an entry - by the newest date its query read (see ttl_policy.py).
+        
+        Args:
+            layer_name: "question" / "sql"
+            key: Entry key
+            stored_at: time.time() when the entry was stored
+        """
+        sources = self.freshness.sources(layer_name, key)
+        return self.ttl_policy.ttl_for(sources[1] if sources is not None else None, stored_at)
+
+    def get_fresh(self, layer, key: str, now: float = None) -> tuple:
+        """
+        Atomic get-or-expire of one entry.
+        
+        Under the key's lock: an expired entry (TTL) or a stale one (source
+        data changed - see FreshnessTracker) is removed, otherwise returned.
+        On an L1 miss the shared tier (if any) is checked, and a hit there
+        is copied into L1.
+        
+        Args:
+            layer: CacheLayer (question_cache / cache)
+            key: Entry key
+            now: Current time (default: time.time())
+        
+        Returns:
+            (value, status) - status is "hit", "shared_hit", "miss",
+            "expired" or "stale", or for a hit that should be refreshed in
+            the background: "soft_expired" (served stale, past the soft TTL)
+            or "early_refresh" (still fresh, XFetch picked it);
+            value is None unless it is a hit
+        """
+        now = time.time() if now is None else now
+        if self.admission is not None:
+            self.admission.record(layer.name, key)
+        with self.lock_for(key):
+            stored_at = layer.ttl_store.get(key)
+            if stored_at is not None and now - stored_at > self.entry_ttl(layer.name, key, stored_at):
+                self._remove(layer, key)
+                return None, "expired"
+
+            sources = self.freshness.sources(layer.name, key)
+            if sources is not None and stored_at is not None:
+                if self.freshness.is_stale(sources[0], sources[1], stored_at):
+                    self._remove(layer, key)
+                    self._remove_shared(layer, key)
+                    self.freshness.invalidated += 1
+                    return None, "stale"
+
+            try:
+                value = layer[key]
+            except KeyError:
+                pass
+            else:
+                return value, self._age_status(layer, key, stored_at, now)
+
+        if self.shared is None:
+            return None, "miss"
+        return self._get_shared(layer, key, now)
+
+    def _age_status(self, layer, key: str, stored_at: float, now: float) -> str:
+        """
+        Status of a live entry: "hit", "soft_expired" or "early_refresh".
+        
+        XFetch: the entry is refreshed early with a probability that grows
+        as it nears the soft TTL (or the TTL), and with its recompute time -
+        now - delta * beta * ln(rand) >= refresh_at.
+        """
+        if stored_at is None:
+            return "hit"
+        if self.soft_ttl_seconds is not None and now - stored_at > self.soft_ttl_seconds:
+            self.stale_served += 1
+            return "soft_expired"
+        if self.early_refresh_beta <= 0:
+            return "hit"
+        ttl = self.entry_ttl(layer.name, key, stored_at)
+        refresh_at = stored_at + (min(self.soft_ttl_seconds, ttl) if self.soft_ttl_seconds is not None else ttl)
+        delta = self.compute_seconds.get((layer.name, key), DEFAULT_COMPUTE_SECONDS)
+        if now - delta * self.early_refresh_beta * math.log(self._random() or 1e-300) >= refresh_at:
+            self.early_refreshes += 1
+            return "early_refresh"
+        return "hit"
+
+    def admit(self, layer, key: str, bytes_scanned: int = None) -> bool:
+        """
+        Checks whether a new result may be stored (TinyLFU admission).
+        
+        Always True while the cache has room, for updates of an existing
+        entry, and without an admission filter. Otherwise the result must
+        be looked up more often than the entry it would evict, or have
+        scanned at least CACHE_ADMISSION_MIN_BYTES.
+        
+        Args:
+            layer: CacheLayer (question_cache / cache)
+            key: Entry key
+            bytes_scanned: Bytes BigQuery scanned for the result, if known
+        """
+        if self.admission is None or key in layer or not self.policy.is_full():
+            return True
+        return self.admission.admit((layer.name, key), self.policy.victim(), bytes_scanned)
 
-# Shared global instance - all agents use the same cache
-_global_cache_state = CacheState()
+    def put(self, layer, key: str, value, stored_at: float, tables=(), date_range=None,
+            only_if_newer: bool = False, compute_seconds: float = None) -> bool:
+        """
+        Atomically stores an entry with its timestamp and source tables.
+        
+        The entry is also written to the shared tier (if any).
+        
+        Args:
+            layer: CacheLayer (question_cache / cache)
+            key: Entry key
+            value: Result dict
+            stored_at: time.time() when the result was read from BigQuery
+            tables: Tables the query read (see freshness.extract_source_tables)
+            date_range: (first, last) ISO dates the query covered, or None
+            only_if_newer: Keep an existing entry with the same or a newer timestamp
+            compute_seconds: Seconds the result took to compute (for early refresh)
+        
+        Returns:
+            True if the entry was stored
+        """
+        if not self._put_local(layer, key, value, stored_at, tables, date_range, only_if_newer):
+            return False
+        if compute_seconds is not None:
+            self.compute_seconds[(layer.name, key)] = compute_seconds
+        if self.shared is not None:
+            sources = (tuple(tables), date_range) if tables or date_range else None
+            # The shared store needs a finite expiry ("never expires" entries get the cache TTL)
+            ttl = min(self.ttl_policy.ttl_for(date_range, stored_at), self.ttl_seconds)
+            remaining = ttl - (time.time() - stored_at)
+            self.shared.set(layer.name, key, value, stored_at, sources, remaining)
+        return True
+
+    def _put_local(self, layer, key: str, value, stored_at: float, tables, date_range,
+                   only_if_newer: bool) -> bool:
+        """Stores an entry in L1 only (see put)."""
+        with self.lock_for(key):
+            if only_if_newer and layer.ttl_store.get(key, float("-inf")) >= stored_at:
+                return False
+            layer[key] = value
+            # Sources first - the expiry index reads the entry's TTL from them
+            self.freshness.register(layer.name, key, tables, date_range)
+            layer.ttl_store[key] = stored_at
+            self.stored_by_tier[self.ttl_policy.tier(date_range, stored_at)] += 1
+        self._drain_evictions()
+        return True
+
+    def _get_shared(self, layer, key: str, now: float) -> tuple:
+        """L2 lookup after an L1 miss - a fresh hit is copied into L1."""
+        entry = self.shared.get(layer.name, key)
+        if entry is None:
+            return None, "miss"
+        stored_at, value, sources = entry
+        tables, date_range = sources if sources is not None else ((), None)
+        if now - stored_at > self.ttl_policy.ttl_for(date_range, stored_at):
+            return None, "miss"
+        if tables and self.freshness.is_stale(tables, date_range, stored_at):
+            self._remove_shared(layer, key)
+            self.freshness.invalidated += 1
+            return None, "stale"
+        self._put_local(layer, key, value, stored_at, tables, date_range, only_if_newer=True)
+        self.shared_hits += 1
+        return value, "shared_hit"
+
+    def _remove(self, layer, key: str) -> None:
+        """Removes an entry, its timestamp and its sources (caller holds the key lock)."""
+        if key in layer:
+            del layer[key]  # No value load - only the key is removed
+        layer.ttl_store.pop(key, None)
+        self.freshness.forget(layer.name, key)
+        self.compute_seconds.pop((layer.name, key), None)
+
+    def _remove_shared(self, layer, key: str) -> None:
+        """Removes an entry from the shared tier (stale data - other workers must not use it)."""
+        if self.shared is not None:
+            self.shared.delete(layer.name, key)
+
+    def _drain_evictions(self) -> None:
+        for layer in self._layers.values():
+            layer.drain_evictions()
+
+    def purge_expired(self, now: float = None, limit: int = 500) -> int:
+        """
+        Removes expired entries using the expiry index.
+        
+        Only entries whose expiry time has passed are visited - O(expired).
+        Heap items of refreshed or already deleted entries are skipped.
+        
+        Args:
+            now: Current time (default: time.time())
+            limit: Max entries to purge in this call
+        
+        Returns:
+            Number of entries purged
+        """
+        now = time.time() if now is None else now
+        purged = 0
+        for layer_name, key, stored_at in self.expiry.pop_expired(now, limit):
+            layer = self._layers[layer_name]
+            with self.lock_for(key):
+                if layer.ttl_store.get(key) != stored_at:
+                    continue  # Refreshed or already deleted
+                self._remove(layer, key)
+            purged += 1
+        self._drain_evictions()
+        self.expired_purged += purged
+        if len(self.compute_seconds) > len(self.policy):
+            # Recompute times of evicted entries
+            for layer_name, key in list(self.compute_seconds):
+                if key not in self._layers[layer_name]:
+                    self.compute_seconds.pop((layer_name, key), None)
+        return purged
+
+    def track_sources(self, layer, key: str, tables, date_range=None) -> None:
+        """
+        Records the source tables and date range of a cached entry.
+        
+        Args:
+            layer: CacheLayer the entry was saved in
+            key: Entry key
+            tables: Tables the query read (see freshness.extract_source_tables)
+            date_range: (first, last) ISO dates the query covered, or None
+        """
+        self.freshness.register(layer.name, key, tables, date_range)
+
+    def refresh_freshness(self, client) -> int:
+        """
+        Checks BigQuery table metadata and invalidates stale entries.
+        
+        Args:
+            client: Metadata client (BQClient)
+        
+        Returns:
+            Number of entries invalidated
+        """
+        self.freshness.prune(lambda layer_name, key: key in self._layers[layer_name])
+        stale = self.freshness.refresh(
+            client, lambda layer_name, key: self._layers[layer_name].ttl_store.get(key)
+        )
+        for layer_name, key in stale:
+            with self.lock_for(key):
+                if self.freshness.sources(layer_name, key) is not None:
+                    continue  # Stored again since the check - the new entry is fresh
+                self._remove(self._layers[layer_name], key)
+                self._remove_shared(self._layers[layer_name], key)
+        return len(stale)
+
+    def invalidate_written(self, tables, written_at: float = None) -> int:
+        """
+        Invalidates every entry that read one of the given tables (they were just written).
+        
+        Both layers and the shared tier are cleared, and entries stored
+        before the write are treated as stale from now on (see
+        FreshnessTracker.mark_written). The negative cache is cleared too -
+        a query that failed on a missing table may succeed now.
+        
+        Args:
+            tables: Tables the statement wrote (see freshness.extract_written_tables)
+            written_at: time.time() of the write (default: now)
+        
+        Returns:
+            Number of entries invalidated
+        """
+        written_ms = (time.time() if written_at is None else written_at) * 1000
+        invalidated = 0
+        for table in tables:
+            for layer_name, key in self.freshness.mark_written(table, written_ms):
+                layer = self._layers[layer_name]
+                with self.lock_for(key):
+                    self._remove(layer, key)
+                    self._remove_shared(layer, key)
+                invalidated += 1
+        self.negative.clear()
+        self.write_invalidations += invalidated
+        return invalidated
+
+    @property
+    def backend_name(self) -> str:
+        """Name of the storage backend ("memory" when not persistent)."""
+        return self.backend.name if self.backend is not None else "memory"
+
+    def flush(self):
+        """Writes pending changes to the backend (no-op for in-memory cache)."""
+        if self.backend is not None:
+            self.backend.flush()
 
 
 # =============================================================================
@@ -87,6 +550,9 @@ DATE_PATTERNS = [
     r"\b\d{8}\b",            # 20250101
 ]
 
+# Quoted string literals - their case is preserved by normalize_sql
+STRING_LITERAL_PATTERN = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")""")
+
 # Cache save time - 180 days in seconds
 TTL_SECONDS = 60 * 60 * 24 * 180
 
@@ -99,9 +565,13 @@ def normalize_sql(sql: str) -> str:
     """
     Normalizes SQL query for cache comparison.
     
-    Removes extra whitespace and converts to lowercase.
+    Removes extra whitespace and converts to lowercase - except inside
+    string literals, so 'Facebook' and 'facebook' stay different keys.
     This allows finding identical queries even if there are whitespace differences.
     
+    run_sql keys the SQL layer with fingerprint.fingerprint_sql(), which
+    falls back to this function when the SQL cannot be parsed.
+    
     Args:
         sql: Original SQL query (can be None)
     
@@ -111,7 +581,11 @@ def normalize_sql(sql: str) -> str:
     # Check for empty input - return empty string to prevent errors
     if not sql:
         return ""
-    return " ".join(sql.lower().split())
+    # split() with a capturing group - odd parts are the string literals
+    parts = STRING_LITERAL_PATTERN.split(sql)
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r"\s+", " ", parts[i].lower())
+    return "".join(parts).strip()
 
 
 def normalize_question(question: str) -> str:
@@ -135,33 +609,65 @@ def normalize_question(question: str) -> str:
         return ""
     return " ".join(question.lower().strip().split())
 
+
+def question_cache_key(question: str, day=None) -> str:
+    """
+    Returns the question-layer cache key.
+    
+    Questions answered with relative dates ("yesterday") mean a different
+    range every day, so their key is scoped to the day they were resolved on.
+    
+    Args:
+        question: User's original question
+        day: datetime.date the relative dates were resolved against (None = not relative)
+    
+    Returns:
+        Cache key, or empty string if question is empty/None
+    """
+    normalized_q = normalize_question(question)
+    if not normalized_q or day is None:
+        return normalized_q
+    return f"{normalized_q} @{day.isoformat()}"
+
 # =============================================================================
 # Implementation Functions
 # =============================================================================
 
-def is_cacheable_impl(input: IsCacheableInput) -> bool:
+def is_cacheable_impl(input: IsCacheableInput, ttl_policy=None) -> bool:
     """
     Checks if SQL query is cacheable.
     
     Checking rules:
     1. Queries with relative dates (today, yesterday) - not cached
-    2. Queries with LIMIT or TOP - not cached (results can change)
-    3. Queries with absolute dates - cached
-    4. Queries with month names - cached
+       (run_sql resolves them to absolute dates first - see dates.py)
+    2. Queries reaching today or later - cached only with a live TTL
+       (data still arriving - see ttl_policy.py; CACHE_TTL_LIVE_SECONDS=0 disables)
+    3. Queries with LIMIT or TOP - not cached (results can change)
+    4. Queries with absolute dates - cached
+    5. Queries with month names - cached
     
     Args:
         input: Model with SQL query
+        ttl_policy: TTLPolicy of the cache the result goes to
+                    (default: the global cache state's policy)
     
     Returns:
         True if can be cached, False otherwise
     """
     sql = input.sql.lower()
+    if ttl_policy is None:
+        ttl_policy = get_global_cache_state().ttl_policy
 
     # Check for relative dates - if exists, cannot cache
     for word in RELATIVE_KEYWORDS:
         if word in sql:
             return False
 
+    # Check for today's (still changing) partition - only cached with a short (live) TTL
+    latest = latest_date_in_sql(sql)
+    if latest is not None and latest >= utc_today() and not ttl_policy.caches_live:
+        return False
+
     # Check for LIMIT/TOP - if exists, cannot cache (results can change)
     if "limit" in sql or re.search(r"\btop\s+\d+", sql):
         return False
@@ -195,6 +701,24 @@ def is_cacheable_impl(input: IsCacheableInput) -> bool:
 # =============================================================================
 # Cache Helper Functions
 # =============================================================================
+def _create_backend():
+    """
+    Creates the storage backend from the environment.
+    
+    Returns:
+        SQLiteBackend if CACHE_DB_PATH is set, otherwise None (in-memory)
+    """
+    if not CACHE_DB_PATH:
+        return None
+    return SQLiteBackend(CACHE_DB_PATH)
+
+
+# Shared global instance - all agents use the same cache
+_global_cache_state = CacheState(backend=_create_backend(), shared=create_shared_tier())
+
+# Make sure buffered writes reach the disk on shutdown
+atexit.register(_global_cache_state.flush)
+
 
 def get_global_cache_state():
     """
@@ -216,12 +740,40 @@ def get_cache_stats() -> dict:
     Useful for monitoring and debugging.
     
     Returns:
-        dict with number of items in each cache
+        dict with number of items in each cache and eviction counters
     """
     state = _global_cache_state
+    policy = state.policy
     return {
+        "backend": state.backend_name,
         "question_cache_size": len(state.question_cache),
         "sql_cache_size": len(state.cache),
+        "estimated_bytes": policy.total_bytes,
+        "max_entries": policy.max_entries,
+        "max_bytes": policy.max_bytes,
+        "evictions": policy.evictions,
+        "evicted_bytes": policy.evicted_bytes,
+        "expiry_index_size": len(state.expiry),
+        "expiry_index_live": state.expiry.live,
+        "expired_purged": state.expired_purged,
+        "freshness_tables": len(state.freshness.tables()),
+        "freshness_checks": state.freshness.checks,
+        "freshness_invalidated": state.freshness.invalidated,
+        "write_invalidations": state.write_invalidations,
+        "admission": state.admission is not None,
+        "admission_admitted": state.admission.admitted if state.admission is not None else 0,
+        "admission_rejected": state.admission.rejected if state.admission is not None else 0,
+        "shared_tier": state.shared.name if state.shared is not None else None,
+        "shared_hits": state.shared_hits,
+        "negative_cache_size": len(state.negative),
+        "negative_hits": state.negative.hits,
+        "ttl_policy": state.ttl_policy.describe(),
+        "stored_by_ttl_tier": dict(state.stored_by_tier),
+        "soft_ttl_seconds": state.soft_ttl_seconds,
+        "stale_served": state.stale_served,
+        "early_refreshes": state.early_refreshes,
+        "subsumption_indexed": len(state.subsumption),
+        "subsumption_derived": state.subsumption.derived,
         "question_cache_keys": list(state.question_cache.keys())[:5],  # Only first 5
         "sql_cache_keys": list(state.cache.keys())[:5]  # Only first 5
     }
\ No newline at end of file
@@ -0,0 +1,136 @@
+"""
+TTL Policy - Entry Lifetime by the Recency of the Data It Read
+===============================================================
+One TTL for every entry is wrong both ways: a result covering today's
+partition changes within minutes, while a result over last year's data
+never changes. The TTL of an entry is derived from the newest date its
+query touches, relative to the day the entry was stored:
+
+Tiers:
+- live       - the range reaches the day of storing (or later):
+               CACHE_TTL_LIVE_SECONDS (default 5 minutes, 0 = not cached)
+- recent     - the newest date is less than CACHE_TTL_RECENT_DAYS old
+               (default 3 - late events still arrive):
+               CACHE_TTL_RECENT_SECONDS (default 1 hour)
+- historical - older data: CACHE_TTL_HISTORICAL_SECONDS
+               (default: the cache TTL, 180 days; "inf" = never expires)
+- undated    - no date range found in the query: the cache TTL
+
+The tier only depends on (date range, stored_at), both persisted with
+the entry, so the TTL survives restarts without being stored itself.
+Days are UTC days, like BigQuery's CURRENT_DATE().
+Live and recent TTLs never exceed the cache TTL.
+"""
+
+import math
+import os
+from datetime import date, datetime, timezone
+
+from dotenv import load_dotenv
+
+from agents.cache_sql.dates import utc_today
+
+load_dotenv()
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# Results reaching the current day (0 = not cached, as before)
+CACHE_TTL_LIVE_SECONDS = float(os.getenv("CACHE_TTL_LIVE_SECONDS", "300"))
+
+# Results whose newest date is less than CACHE_TTL_RECENT_DAYS old
+CACHE_TTL_RECENT_SECONDS = float(os.getenv("CACHE_TTL_RECENT_SECONDS", "3600"))
+CACHE_TTL_RECENT_DAYS = int(os.getenv("CACHE_TTL_RECENT_DAYS", "3"))
+
+# Results over older data (unset = the cache TTL, "inf" = never expires)
+CACHE_TTL_HISTORICAL_SECONDS = os.getenv("CACHE_TTL_HISTORICAL_SECONDS")
+
+TIERS = ("live", "recent", "historical", "undated")
+
+
+def _as_date(value):
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+# =============================================================================
+# TTL Policy
+# =============================================================================
+
+class TTLPolicy:
+    """
+    Maps the date range of an entry to its TTL.
+
+    Attributes:
+        default_seconds: TTL of undated entries (the cache TTL)
+        live_seconds / recent_seconds / historical_seconds: TTL per tier
+        recent_days: Age (days) of the newest date below which data is "recent"
+    """
+
+    def __init__(self, default_seconds: float, live_seconds: float = None,
+                 recent_seconds: float = None, recent_days: int = None,
+                 historical_seconds: float = None):
+        self.default_seconds = default_seconds
+        live_seconds = live_seconds if live_seconds is not None else CACHE_TTL_LIVE_SECONDS
+        recent_seconds = recent_seconds if recent_seconds is not None else CACHE_TTL_RECENT_SECONDS
+        if historical_seconds is None:
+            historical_seconds = (
+                float(CACHE_TTL_HISTORICAL_SECONDS) if CACHE_TTL_HISTORICAL_SECONDS else default_seconds
+            )
+        self.live_seconds = min(live_seconds, default_seconds)
+        self.recent_seconds = min(recent_seconds, default_seconds)
+        self.recent_days = recent_days if recent_days is not None else CACHE_TTL_RECENT_DAYS
+        self.historical_seconds = historical_seconds
+
+    def tier(self, date_range, stored_at: float) -> str:
+        """
+        Returns the tier of an entry.
+
+        Args:
+            date_range: (first, last) dates (ISO strings / dates) the query covered, or None
+            stored_at: time.time() when the entry was stored
+        """
+        if not date_range:
+            return "undated"
+        newest = _as_date(date_range[1])
+        age_days = (utc_today(datetime.fromtimestamp(stored_at, timezone.utc)) - newest).days
+        if age_days <= 0:
+            return "live"
+        if age_days < self.recent_days:
+            return "recent"
+        return "historical"
+
+    def ttl_for(self, date_range, stored_at: float) -> float:
+        """
+        Returns the TTL (seconds) of an entry - math.inf if it never expires.
+
+        Args:
+            date_range: (first, last) dates the query covered, or None
+            stored_at: time.time() when the entry was stored
+        """
+        return {
+            "live": self.live_seconds,
+            "recent": self.recent_seconds,
+            "historical": self.historical_seconds,
+            "undated": self.default_seconds,
+        }[self.tier(date_range, stored_at)]
+
+    @property
+    def caches_live(self) -> bool:
+        """True if results reaching the current day are cached at all."""
+        return self.live_seconds > 0
+
+    def describe(self) -> dict:
+        """The policy, for cache stats (None = never expires)."""
+        def seconds(value):
+            return None if value == math.inf else value
+        return {
+            "live_seconds": seconds(self.live_seconds),
+            "recent_seconds": seconds(self.recent_seconds),
+            "recent_days": self.recent_days,
+            "historical_seconds": seconds(self.historical_seconds),
+            "undated_seconds": seconds(self.default_seconds),
+        }
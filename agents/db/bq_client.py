@@ -1,10 +1,14 @@
 import os
+from itertools import chain
 from google.cloud import bigquery
 from google.oauth2 import service_account
 from dotenv import load_dotenv
 import logging
 import json
-from google.api_core.exceptions import Forbidden, NotFound, BadRequest
+from google.api_core.exceptions import Forbidden, NotFound, BadRequest, GoogleAPICallError
+
+from agents.db.cost_guard import CostGuard, QueryBudgetExceeded, format_bytes
+from agents.db.job_stats import JobStatsLog, collect_job_stats
 
 load_dotenv()
 
@@ -12,6 +16,13 @@ PROJECT_ID = "practicode-2025"
 BQ_LOCATION = "EU"
 BQ_DATA_FILE_PATH = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 
+# Rows per result page - results are fetched page by page (see streaming.py)
+BQ_PAGE_SIZE = int(os.getenv("BQ_PAGE_SIZE", "1000"))
+
+# Arrow results (execute_query_arrow) through the BigQuery Storage Read API
+# when google-cloud-bigquery-storage is installed ("false" = REST pages only)
+BQ_STORAGE_API = os.getenv("BQ_STORAGE_API", "true").lower() not in ("0", "false", "no")
+
 
 class BQClient:
     def __init__(self):
@@ -23,16 +34,19 @@ class BQClient:
             project=self.project_id,
             credentials=self.creds
         )
+        self._storage_client = None  # BigQueryReadClient, created on first Arrow fetch (False = unavailable)
+        self.cost_guard = CostGuard()  # Dry-run estimates + bytes-billed budget (see cost_guard.py)
+        self.job_stats = JobStatsLog()  # Statistics of the recent jobs (see job_stats.py)
         logging.info("BQ client project=%s location=%s sa_email=%s",
                      self.project_id, BQ_LOCATION, self.sa_email)
 
-    def execute_query(self, query, query_type):
+    def execute_query(self, query, query_type, page_size=None):
         logging.info('*********** QUERY %s START ***********', query_type)
         logging.info(query)
         try:
-            job = self.bq_client.query(query)
-            result = job.result()  # RowIterator
-            logging.info('*********** QUERY %s DONE ***********', query_type)
+            job = self._start_guarded(query, query_type)
+            result = job.result(page_size=page_size or BQ_PAGE_SIZE)  # RowIterator - pages fetched lazily
+            result.job_stats = self._record_job(job, query_type, query)
             return result
         except Forbidden as e:
             raise PermissionError(
@@ -44,6 +58,200 @@ class BQClient:
         except (BadRequest, NotFound) as e:
             raise RuntimeError(f"BigQuery query failed: {e}") from e
 
+    def execute_query_arrow(self, query, query_type):
+        """
+        Runs a query and returns its result as Arrow record batches.
+
+        High-throughput path for large results (whole anomaly tables):
+        no Row objects, no per-cell JSON parsing.
+        - Storage Read API (BQ_STORAGE_API, google-cloud-bigquery-storage):
+          the result is streamed as Arrow over gRPC
+        - Otherwise, or if the Storage API is refused (e.g. the service
+          account lacks bigquery.readsessions.create): RowIterator.to_arrow
+          over the REST pages
+        Small results that came back with the job are never sent through
+        the Storage API (the client library decides).
+
+        Args:
+            query: SQL query
+            query_type: Label for the query log
+
+        Returns:
+            Iterator of pyarrow.RecordBatch (consumed once). Batches are
+            fetched while iterating - errors then are translated like
+            errors of the query itself (PermissionError / RuntimeError)
+        """
+        logging.info('*********** ARROW QUERY %s START ***********', query_type)
+        logging.info(query)
+        try:
+            job = self._start_guarded(query, query_type)
+            result = job.result(page_size=BQ_PAGE_SIZE)
+            self._record_job(job, query_type, query)
+            storage_client = self._get_storage_client()
+            if storage_client is not None:
+                try:
+                    batches = result.to_arrow_iterable(bqstorage_client=storage_client)
+                    first = next(batches, None)
+                except GoogleAPICallError as e:
+                    logging.warning("BigQuery Storage API unavailable, Arrow via REST pages: %s", e)
+                    self._storage_client = False
+                else:
+                    logging.info('*********** ARROW QUERY %s DONE (storage API) ***********', query_type)
+                    return self._translate_arrow_errors(chain([first] if first is not None else [], batches))
+            # Fresh iterator - the failed storage attempt may have started the first one
+            table = job.result(page_size=BQ_PAGE_SIZE).to_arrow(create_bqstorage_client=False)
+            logging.info('*********** ARROW QUERY %s DONE (REST) ***********', query_type)
+            return iter(table.to_batches())
+        except (Forbidden, BadRequest, NotFound) as e:
+            raise self._arrow_error(e) from e
+
+    def _arrow_error(self, error):
+        """PermissionError / RuntimeError for a BigQuery error of an Arrow fetch."""
+        if isinstance(error, Forbidden):
+            return PermissionError(
+                f"BigQuery permission error for service account '{self.sa_email}' "
+                f"on project '{self.project_id}'. Original error: {error}"
+            )
+        return RuntimeError(f"BigQuery query failed: {error}")
+
+    def _translate_arrow_errors(self, batches):
+        """Yields the batches, translating errors of the lazily fetched ones."""
+        try:
+            yield from batches
+        except (Forbidden, BadRequest, NotFound) as e:
+            raise self._arrow_error(e) from e
+
+    def dry_run(self, query):
+        """
+        Returns the bytes a query would process (BigQuery dry run - nothing is billed).
+
+        Args:
+            query: SQL query
+
+        Returns:
+            total_bytes_processed of the dry-run job
+        """
+        job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+        return self.bq_client.query(query, job_config=job_config).total_bytes_processed
+
+    def _start_guarded(self, query, query_type):
+        """
+        Starts a query job within the bytes-billed budget.
+
+        The query is dry-run first (memoized per SQL fingerprint) and
+        rejected if its estimate is over BQ_MAX_BYTES_BILLED; the job
+        runs with maximum_bytes_billed either way.
+
+        Raises:
+            QueryBudgetExceeded: If the estimate is over budget (nothing was billed)
+        """
+        try:
+            estimated = self.cost_guard.check(query, self.dry_run)
+        except QueryBudgetExceeded as e:
+            logging.warning('*********** QUERY %s REJECTED: %s ***********', query_type, e)
+            raise
+        except GoogleAPICallError as e:
+            # Not an estimate - the job itself reports real errors
+            logging.warning("Dry run of %s failed, running under maximum_bytes_billed only: %s", query_type, e)
+        else:
+            if estimated is not None:
+                logging.info('Dry run %s: %s', query_type, format_bytes(estimated))
+        job_config = bigquery.QueryJobConfig(maximum_bytes_billed=self.cost_guard.max_bytes or None)
+        return self.bq_client.query(query, job_config=job_config)
+
+    def _record_job(self, job, query_type, query):
+        """Captures the statistics of a finished job into job_stats and returns them."""
+        stats = collect_job_stats(job, query_type, query)
+        self.job_stats.record(stats)
+        logging.info(
+            '*********** QUERY %s DONE job=%s billed=%s slot_ms=%s cache_hit=%s queue_ms=%s exec_ms=%s ***********',
+            query_type, stats["job_id"], stats["bytes_billed"], stats["slot_ms"],
+            stats["cache_hit"], stats["queue_ms"], stats["execution_ms"]
+        )
+        return stats
+
+    def _get_storage_client(self):
+        """BigQueryReadClient for Arrow fetches, or None if the Storage API is off / not installed."""
+        if self._storage_client is None:
+            self._storage_client = False
+            if BQ_STORAGE_API:
+                try:
+                    from google.cloud import bigquery_storage
+                except ImportError:
+                    logging.info("google-cloud-bigquery-storage not installed - Arrow results via REST pages")
+                else:
+                    self._storage_client = bigquery_storage.BigQueryReadClient(credentials=self.creds)
+        return self._storage_client or None
+
+    def get_tables_last_modified(self, tables):
+        """
+        Returns the last modification time of tables.
+
+        Runs one `dataset.__TABLES__` query per dataset - metadata only,
+        no table data is scanned.
+
+        Args:
+            tables: "project.dataset.table" or "dataset.table" names
+
+        Returns:
+            {table: last_modified_time in ms} for the tables that exist
+        """
+        versions = {}
+        for dataset, names in self._group_by_dataset(tables).items():
+            query = (
+                f"SELECT table_id, last_modified_time FROM `{dataset}.__TABLES__` "
+                f"WHERE table_id IN UNNEST(@table_ids)"
+            )
+            job_config = bigquery.QueryJobConfig(query_parameters=[
+                bigquery.ArrayQueryParameter("table_ids", "STRING", sorted(names)),
+            ])
+            for row in self.bq_client.query(query, job_config=job_config).result():
+                versions[names[row["table_id"]]] = row["last_modified_time"]
+        return versions
+
+    def get_partitions_last_modified(self, tables, since_ms=None):
+        """
+        Returns the last modification time of table partitions.
+
+        Runs one INFORMATION_SCHEMA.PARTITIONS query per dataset.
+
+        Args:
+            tables: "project.dataset.table" or "dataset.table" names
+            since_ms: Only partitions modified after this time (ms), None = all
+
+        Returns:
+            {table: {partition_id: last_modified_time in ms}}
+            (partition_id is None for unpartitioned tables)
+        """
+        partitions = {}
+        for dataset, names in self._group_by_dataset(tables).items():
+            query = (
+                f"SELECT table_name, partition_id, UNIX_MILLIS(last_modified_time) AS last_modified "
+                f"FROM `{dataset}.INFORMATION_SCHEMA.PARTITIONS` "
+                f"WHERE table_name IN UNNEST(@table_names)"
+            )
+            params = [bigquery.ArrayQueryParameter("table_names", "STRING", sorted(names))]
+            if since_ms is not None:
+                query += " AND last_modified_time > TIMESTAMP_MILLIS(@since_ms)"
+                params.append(bigquery.ScalarQueryParameter("since_ms", "INT64", since_ms))
+            job_config = bigquery.QueryJobConfig(query_parameters=params)
+            for row in self.bq_client.query(query, job_config=job_config).result():
+                table = names[row["table_name"]]
+                partitions.setdefault(table, {})[row["partition_id"]] = row["last_modified"]
+        return partitions
+
+    def _group_by_dataset(self, tables):
+        """Groups table names by "project.dataset" -> {table_id: original name}."""
+        datasets = {}
+        for name in tables:
+            parts = name.split(".")
+            if len(parts) == 2:
+                parts = [self.project_id] + parts
+            if len(parts) != 3:
+                continue
+            datasets.setdefault(f"{parts[0]}.{parts[1]}", {})[parts[2]] = name
+        return datasets
+
     def _load_bq_creds(self):
         with open(self.path_of_bq_data_user, 'r') as f:
             info = json.load(f)
@@ -0,0 +1,176 @@
+"""
+Cost Guard - Dry-Run Estimates and a Bytes-Billed Budget
+=========================================================
+LLM-generated SQL went to BigQuery with no idea of its cost - a query
+that forgets the DATE(event_time) filter on optimized_clicks scans the
+whole table.
+
+Before a query runs (BQClient.execute_query / execute_query_arrow):
+1. It is dry-run - BigQuery returns total_bytes_processed without
+   running it (free, but a round trip of ~100-300 ms)
+2. Estimates are memoized per SQL fingerprint for DRY_RUN_TTL_SECONDS -
+   a repeated / re-phrased query is checked without a round trip
+3. A query estimated above BQ_MAX_BYTES_BILLED is rejected with
+   QueryBudgetExceeded, before any bytes are billed
+4. The job itself runs with maximum_bytes_billed = BQ_MAX_BYTES_BILLED,
+   so BigQuery enforces the budget even where the estimate was off
+
+Over-budget queries are rejected, not downgraded: a LIMIT does not
+reduce the bytes BigQuery scans, and narrowing the date range would
+silently answer a different question.
+
+A dry run that fails for another reason (e.g. a statement type it
+does not support) does not block the query - the job still runs under
+maximum_bytes_billed.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from agents.cache_sql.fingerprint import fingerprint_sql
+
+load_dotenv()
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# Dry-run every query before running it ("false" disables the estimate)
+BQ_DRY_RUN = os.getenv("BQ_DRY_RUN", "true").lower() not in ("0", "false", "no")
+
+# Bytes one query may bill (0 = no limit) - default 100 GiB
+BQ_MAX_BYTES_BILLED = int(os.getenv("BQ_MAX_BYTES_BILLED", str(100 * 1024 ** 3)))
+
+# Seconds a dry-run estimate is reused (tables grow - new partitions every day)
+DRY_RUN_TTL_SECONDS = float(os.getenv("BQ_DRY_RUN_TTL_SECONDS", "3600"))
+
+# Max memoized estimates - the least recently used are dropped first
+DRY_RUN_MEMO_SIZE = 4096
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """A query's dry-run estimate is above BQ_MAX_BYTES_BILLED."""
+
+    def __init__(self, bytes_estimated: int, max_bytes: int):
+        self.bytes_estimated = bytes_estimated
+        self.max_bytes = max_bytes
+        super().__init__(
+            f"Query would scan {format_bytes(bytes_estimated)}, above the limit of "
+            f"{format_bytes(max_bytes)} - add a date filter (e.g. DATE(event_time)) "
+            f"or select fewer columns"
+        )
+
+
+def format_bytes(value: int) -> str:
+    """Human-readable byte count (e.g. "12.3 GiB")."""
+    value = float(value)
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if value < 1024:
+            return f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} TiB"
+
+
+# =============================================================================
+# Cost Guard
+# =============================================================================
+
+class CostGuard:
+    """
+    Checks queries against the bytes-billed budget, memoizing dry runs.
+
+    Attributes:
+        max_bytes: Budget per query (0 = no limit)
+        dry_runs: Dry runs sent to BigQuery
+        memo_hits: Estimates answered from the memo
+        rejected: Queries rejected as over budget
+        bytes_estimated: Sum of the estimates of the queries allowed to run
+    """
+
+    def __init__(self, max_bytes: int = None, ttl_seconds: float = None,
+                 max_entries: int = DRY_RUN_MEMO_SIZE, enabled: bool = None):
+        self.max_bytes = max_bytes if max_bytes is not None else BQ_MAX_BYTES_BILLED
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else DRY_RUN_TTL_SECONDS
+        self.max_entries = max_entries
+        self.enabled = enabled if enabled is not None else BQ_DRY_RUN
+        self.dry_runs = 0
+        self.memo_hits = 0
+        self.rejected = 0
+        self.bytes_estimated = 0
+        self._memo = OrderedDict()  # {fingerprint: (bytes, estimated_at)} - LRU first
+        self._lock = threading.Lock()
+
+    def estimate(self, query: str, dry_run, now: float = None):
+        """
+        Returns the bytes a query would process.
+
+        Args:
+            query: SQL query
+            dry_run: Function(query) -> total_bytes_processed (one BigQuery dry run)
+            now: Current time (default: time.time())
+
+        Returns:
+            Estimated bytes, or None if the dry run is disabled
+        """
+        if not self.enabled:
+            return None
+        now = time.time() if now is None else now
+        key = fingerprint_sql(query)
+        with self._lock:
+            memoized = self._memo.get(key)
+            if memoized is not None and now - memoized[1] <= self.ttl_seconds:
+                self._memo.move_to_end(key)
+                self.memo_hits += 1
+                return memoized[0]
+
+        estimated = int(dry_run(query) or 0)
+        with self._lock:
+            self.dry_runs += 1
+            self._memo[key] = (estimated, now)
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+        return estimated
+
+    def check(self, query: str, dry_run, now: float = None):
+        """
+        Estimates a query and rejects it if it is over budget.
+
+        Args:
+            query: SQL query
+            dry_run: Function(query) -> total_bytes_processed
+
+        Returns:
+            Estimated bytes (None if the dry run is disabled)
+
+        Raises:
+            QueryBudgetExceeded: If the estimate is above max_bytes
+        """
+        estimated = self.estimate(query, dry_run, now)
+        if estimated is None:
+            return None
+        if self.max_bytes and estimated > self.max_bytes:
+            with self._lock:
+                self.rejected += 1
+            raise QueryBudgetExceeded(estimated, self.max_bytes)
+        with self._lock:
+            self.bytes_estimated += estimated
+        return estimated
+
+    def stats(self) -> dict:
+        """Returns dry-run / budget counters."""
+        with self._lock:
+            return {
+                "dry_run": self.enabled,
+                "max_bytes_billed": self.max_bytes or None,
+                "dry_runs": self.dry_runs,
+                "memo_hits": self.memo_hits,
+                "memoized": len(self._memo),
+                "rejected": self.rejected,
+                "bytes_estimated": self.bytes_estimated,
+            }
@@ -0,0 +1,173 @@
+"""
+Job Stats - Statistics of Every Executed BigQuery Job
+======================================================
+execute_query only logged start / done markers - nothing told which
+queries dominate cost and latency.
+
+After every job (BQClient.execute_query / execute_query_arrow) its
+statistics are captured:
+- job_id, query_type, statement_type
+- bytes_processed / bytes_billed
+- slot_ms - slot-milliseconds consumed
+- cache_hit - BigQuery answered from its own result cache
+- queue_ms - created -> started (waiting for slots)
+- execution_ms - started -> ended
+
+They are attached to the result (RowIterator.job_stats, and the
+"job_stats" key of run_sql results) and kept in a rolling in-memory
+table of the last JOB_STATS_SIZE jobs. JobStatsLog.report aggregates
+the table per SQL fingerprint (GET /bigquery/jobs in api.py).
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+from agents.cache_sql.fingerprint import fingerprint_sql
+
+load_dotenv()
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# Jobs kept in the rolling stats table
+JOB_STATS_SIZE = int(os.getenv("JOB_STATS_SIZE", "1000"))
+
+# Characters of SQL kept per job
+SQL_PREVIEW_CHARS = 300
+
+# Per-job measures that can be summed and ranked (report "by")
+MEASURES = ("bytes_processed", "bytes_billed", "slot_ms", "queue_ms", "execution_ms")
+RANKINGS = MEASURES + ("count",)
+
+
+def _ms(start, end):
+    if start is None or end is None:
+        return None
+    return int((end - start).total_seconds() * 1000)
+
+
+def collect_job_stats(job, query_type: str, query: str) -> dict:
+    """
+    Reads the statistics of a finished query job.
+
+    Args:
+        job: google.cloud.bigquery QueryJob (after result())
+        query_type: Label of the query (e.g. "agent_query")
+        query: SQL of the job
+
+    Returns:
+        dict of job statistics (None for statistics BigQuery did not report)
+    """
+    created = getattr(job, "created", None)
+    started = getattr(job, "started", None)
+    ended = getattr(job, "ended", None)
+    return {
+        "job_id": getattr(job, "job_id", None),
+        "query_type": query_type,
+        "statement_type": getattr(job, "statement_type", None),
+        "fingerprint": fingerprint_sql(query),
+        "sql": query.strip()[:SQL_PREVIEW_CHARS],
+        "bytes_processed": getattr(job, "total_bytes_processed", None),
+        "bytes_billed": getattr(job, "total_bytes_billed", None),
+        "slot_ms": getattr(job, "slot_millis", None),
+        "cache_hit": getattr(job, "cache_hit", None),
+        "queue_ms": _ms(created, started),
+        "execution_ms": _ms(started, ended),
+        "finished_at": time.time(),
+    }
+
+
+# =============================================================================
+# Rolling Stats Table
+# =============================================================================
+
+class JobStatsLog:
+    """
+    Statistics of the most recent jobs, aggregated on demand.
+
+    Attributes:
+        max_jobs: Jobs kept (older jobs are dropped)
+        recorded: Jobs recorded since start (including dropped ones)
+    """
+
+    def __init__(self, max_jobs: int = JOB_STATS_SIZE):
+        self.max_jobs = max_jobs
+        self.recorded = 0
+        self._jobs = deque(maxlen=max_jobs)
+        self._lock = threading.Lock()
+
+    def record(self, stats: dict) -> None:
+        """Adds the statistics of one job (see collect_job_stats)."""
+        with self._lock:
+            self._jobs.append(stats)
+            self.recorded += 1
+
+    def recent(self, limit: int = 20) -> list:
+        """The last jobs, newest first."""
+        with self._lock:
+            jobs = list(self._jobs)
+        return jobs[::-1][:limit]
+
+    def top(self, by: str = "bytes_billed", limit: int = 20) -> list:
+        """
+        Aggregates the jobs per SQL fingerprint and ranks them.
+
+        Args:
+            by: A measure of MEASURES (summed) or "count"
+            limit: Number of queries returned
+
+        Returns:
+            List of per-query dicts (count, sum of every measure,
+            max_execution_ms, cache_hits, last job), largest first
+        """
+        if by not in RANKINGS:
+            raise ValueError(f"by must be one of {', '.join(RANKINGS)}")
+        with self._lock:
+            jobs = list(self._jobs)
+
+        queries = {}
+        for job in jobs:
+            query = queries.get(job["fingerprint"])
+            if query is None:
+                query = queries[job["fingerprint"]] = {
+                    "fingerprint": job["fingerprint"],
+                    "sql": job["sql"],
+                    "query_type": job["query_type"],
+                    "count": 0,
+                    "cache_hits": 0,
+                    "max_execution_ms": 0,
+                    **{measure: 0 for measure in MEASURES},
+                }
+            query["count"] += 1
+            query["cache_hits"] += bool(job["cache_hit"])
+            query["max_execution_ms"] = max(query["max_execution_ms"], job["execution_ms"] or 0)
+            query["last_job_id"] = job["job_id"]
+            for measure in MEASURES:
+                query[measure] += job[measure] or 0
+        return sorted(queries.values(), key=lambda query: query[by], reverse=True)[:limit]
+
+    def summary(self) -> dict:
+        """Totals over the jobs in the table."""
+        with self._lock:
+            jobs = list(self._jobs)
+        return {
+            "jobs": len(jobs),
+            "recorded": self.recorded,
+            "max_jobs": self.max_jobs,
+            "cache_hits": sum(bool(job["cache_hit"]) for job in jobs),
+            **{measure: sum(job[measure] or 0 for job in jobs) for measure in MEASURES},
+        }
+
+    def report(self, by: str = "bytes_billed", limit: int = 20) -> dict:
+        """Summary, top queries and recent jobs - the /bigquery/jobs response."""
+        return {
+            "summary": self.summary(),
+            "top": self.top(by, limit),
+            "recent": self.recent(limit),
+        }
@@ -0,0 +1,113 @@
+"""
+Single-Flight - Coalescing of Concurrent Identical Queries
+===========================================================
+When several callers miss the cache for the same query at the same time,
+only the first one (the "leader") executes it. Every concurrent duplicate
+waits for the leader's result instead of starting its own BigQuery job.
+
+Works for both kinds of callers, sharing one in-flight table:
+- sync callers (FastAPI thread pool) - do()
+- async callers (event loop) - do_async()
+
+Errors are shared too: if the leader fails, all waiters get the same exception.
+A cancelled async waiter only stops waiting - the execution and the
+other waiters are not affected.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent executions by key.
+
+    Attributes:
+        executions: Number of times fn was actually executed
+        deduplicated: Number of calls that waited for another caller's execution
+    """
+
+    def __init__(self):
+        self.executions = 0
+        self.deduplicated = 0
+        self._calls = {}  # {key: Future} - executions in flight
+        self._lock = threading.Lock()
+
+    def _join(self, key):
+        """Returns (future, is_leader) for a key."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.deduplicated += 1
+                return future, False
+            future = Future()
+            # Running - a waiter's cancellation (asyncio.wrap_future) cannot cancel it
+            future.set_running_or_notify_cancel()
+            self._calls[key] = future
+            self.executions += 1
+            return future, True
+
+    def _finish(self, key) -> None:
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def _run(self, key, future: Future, fn) -> None:
+        """Executes fn for the leader and publishes its outcome to every waiter."""
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            self._finish(key)
+
+    def do(self, key, fn):
+        """
+        Runs fn() once for all concurrent callers with the same key.
+
+        Args:
+            key: Deduplication key (e.g. normalized SQL)
+            fn: Function without arguments that executes the work
+
+        Returns:
+            fn's result (the same object for every caller)
+        """
+        future, is_leader = self._join(key)
+        if is_leader:
+            self._run(key, future, fn)
+        return future.result()
+
+    async def do_async(self, key, fn, executor=None):
+        """
+        Async version of do() - fn is blocking and runs in an executor.
+
+        Waiting never blocks the event loop, and async callers share
+        in-flight executions with sync callers of do().
+
+        The execution belongs to the shared future, not to the leader's
+        task: if any waiter is cancelled (client disconnected) - the
+        leader included - fn keeps running and the other waiters still
+        get its result. A cancellation is never published to them.
+
+        Args:
+            key: Deduplication key
+            fn: Blocking function without arguments
+            executor: Executor for fn (default: the loop's default executor)
+        """
+        future, is_leader = self._join(key)
+        if is_leader:
+            # Not awaited - _run publishes the outcome through the shared future
+            asyncio.get_running_loop().run_in_executor(executor, self._run, key, future, fn)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        """Returns execution / deduplication counters."""
+        with self._lock:
+            in_flight = len(self._calls)
+        return {
+            "executions": self.executions,
+            "deduplicated": self.deduplicated,
+            "in_flight": in_flight,
+        }
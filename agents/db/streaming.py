@@ -0,0 +1,98 @@
+"""
+Streaming Rows - Page-by-Page Access to a BigQuery Result
+==========================================================
+`[dict(row) for row in result]` pulls every page of a result into Python
+dicts at once, although a chat answer shows 20 rows.
+
+StreamingRows wraps the RowIterator of a query and fetches its pages
+lazily (BQ_PAGE_SIZE rows each, see BQClient.execute_query):
+- head(n)  - the first n rows; only the pages holding them are fetched
+- pages()  - one list of row dicts per page (e.g. into ColumnarRows.from_pages)
+- iteration - every row, one page in memory at a time
+
+Peak memory is one page of dicts, not the whole result.
+A StreamingRows can be consumed once - pages are not kept. Reading it
+again raises StreamConsumedError, a programming error - deliberately not
+a RuntimeError, which callers handle as a failed BigQuery query.
+"""
+
+from itertools import islice
+
+from agents.db.bq_client import BQ_PAGE_SIZE
+
+
+class StreamConsumedError(Exception):
+    """Raised when a StreamingRows is read a second time."""
+
+
+class StreamingRows:
+    """
+    Lazily fetched rows of one query result.
+
+    Attributes:
+        page_size: Rows per page for results without their own pages (lists)
+        total_rows: Rows in the full result, or None if unknown
+        bytes_scanned: Bytes BigQuery processed for the query, or None
+        job_stats: Statistics of the job (see job_stats.py), or None
+        pages_fetched: Pages read so far
+    """
+
+    def __init__(self, result, page_size: int = None):
+        """
+        Args:
+            result: RowIterator of a finished job (or any iterable of rows)
+            page_size: Page size for iterables without pages (default BQ_PAGE_SIZE)
+        """
+        self._result = result
+        self.page_size = page_size or BQ_PAGE_SIZE
+        self.total_rows = getattr(result, "total_rows", None)
+        if self.total_rows is None and hasattr(result, "__len__"):
+            self.total_rows = len(result)
+        self.bytes_scanned = getattr(result, "total_bytes_processed", None)
+        self.job_stats = getattr(result, "job_stats", None)
+        self.pages_fetched = 0
+        self._consumed = False
+
+    def _raw_pages(self):
+        pages = getattr(self._result, "pages", None)
+        if pages is not None:
+            yield from pages
+            return
+        iterator = iter(self._result)
+        while True:
+            page = list(islice(iterator, self.page_size))
+            if not page:
+                return
+            yield page
+
+    def pages(self):
+        """Yields the result as lists of row dicts, one page at a time."""
+        if self._consumed:
+            raise StreamConsumedError("StreamingRows can only be consumed once")
+        self._consumed = True
+        for page in self._raw_pages():
+            self.pages_fetched += 1
+            yield [dict(row) for row in page]
+
+    def __iter__(self):
+        for page in self.pages():
+            yield from page
+
+    def head(self, limit: int) -> list:
+        """
+        Returns the first rows, fetching only the pages that hold them.
+
+        Args:
+            limit: Maximum number of rows
+
+        Returns:
+            List of at most limit row dicts
+        """
+        rows = []
+        if limit <= 0:
+            return rows
+        for page in self.pages():
+            rows.extend(page[:limit - len(rows)])
+            if len(rows) >= limit:
+                break
+        return rows
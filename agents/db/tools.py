@@ -11,6 +11,24 @@ This module provides:
 Performance improvements:
 - Caching saves repeated calls to BigQuery
 - Cache Agent was removed - caching is performed here directly
+- Cache can be persisted to disk (CACHE_DB_PATH) so it survives restarts
+- Concurrent identical cache misses are coalesced into one BigQuery job
+- Relative dates are resolved to absolute dates, so "yesterday" is cacheable
+- Entries are invalidated when their source tables/partitions change
+- Cached rows are stored columnar (Arrow) and turned into dicts on read
+- Empty results and rejected SQL are remembered briefly (negative cache)
+- Entries past the soft TTL are served stale and refreshed in the background
+- Coarser queries are computed from cached finer-grained results (subsumption)
+- Date-range queries are cached per day - only missing days are fetched
+- Statements that write tables bypass the cache and invalidate their readers
+- Async callers (orchestrator, /chat) await run_sql_async - BigQuery runs
+  in a bounded thread pool, never on the event loop
+- Results are fetched page by page - a chat answer (max_rows) of a query
+  that is not cached only fetches the pages it shows
+- Queries are dry-run first and rejected above the bytes-billed budget
+  (BQClient - see cost_guard.py); cache hits never reach the dry run
+- Statistics of every executed job (bytes billed, slot-ms, queue /
+  execution time...) are returned as job_stats and kept in BQClient.job_stats
 """
 
 import sys
@@ -22,19 +40,36 @@ from pathlib import Path
 project_root = Path(__file__).resolve().parent.parent.parent
 sys.path.insert(0, str(project_root))
 
+import asyncio
+import functools
+import os
+import threading
 import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from typing import Dict, List, Any
 from pydantic import BaseModel
+import pyarrow as pa
 
 from agents.cache_sql.tools import (
     is_cacheable_impl as is_cacheable,
-    normalize_sql,
     normalize_question,
-    TTL_SECONDS,
+    question_cache_key,
     get_global_cache_state,
     IsCacheableInput
 )
+from agents.cache_sql.fingerprint import fingerprint_sql
+from agents.cache_sql.slots import slot_cache_key, slots_match_sql
+from agents.cache_sql.subsumption import CACHE_SUBSUMPTION
+from agents.cache_sql.daily import daily_plan, day_sql, batch_sql, split_by_day, merge_days
+from agents.cache_sql.dates import resolve_relative_dates, date_range_in_sql, utc_today
+from agents.cache_sql.freshness import extract_source_tables, extract_written_tables
+from agents.cache_sql.columnar import ColumnarRows
+from agents.cache_sql.negative import EMPTY_RESULT, FALLBACK_NO_EXECUTION, is_error, raise_negative
 from agents.db.bq_client import BQClient
+from agents.db.singleflight import SingleFlight
+from agents.db.streaming import StreamingRows
 
 
 # =============================================================================
@@ -48,9 +83,25 @@ class RunSQLInput(BaseModel):
     Attributes:
         sql: SQL query to execute on BigQuery
         final_question: User's original question (optional, for question-level caching)
+        question_slots: Structured question from the Intent Agent (optional, slot cache key)
+        output_tables: Tables the statement creates (anomaly mode, from NL2SQL)
+        max_rows: Rows the caller shows (chat answer) - rows are capped to it,
+            total_rows still counts the full result
     """
     sql: str
     final_question: str = None  # Optional - for question-level caching
+    question_slots: dict = None  # Optional - see agents/cache_sql/slots.py
+    output_tables: list = None  # Optional - returned as-is for write statements
+    max_rows: int = None  # Optional - display cap (None = every row)
+
+
+CacheMiss = namedtuple("CacheMiss", [
+    "sql",             # SQL to execute (relative dates resolved)
+    "normalized_sql",  # SQL cache key (None for write statements)
+    "normalized_q",    # Question cache key, or None
+    "now",             # Time of the lookup
+    "written_tables",  # Tables a write statement writes (empty for queries)
+])
 
 
 # =============================================================================
@@ -60,6 +111,28 @@ class RunSQLInput(BaseModel):
 # Global instance - created only on first use (lazy initialization)
 _bq_instance = None
 
+# Coalesces concurrent identical cache misses into one BigQuery job
+_query_flight = SingleFlight()
+
+# Background refreshes of stale / soon-stale entries (stale-while-revalidate)
+REFRESH_WORKERS = 2
+_refresh_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="cache-refresh")
+_refreshing = set()  # Normalized SQL of refreshes scheduled or running
+_refreshing_lock = threading.Lock()
+
+# BigQuery executions of async callers (run_sql_async) - at most this many
+# queries of one process wait on BigQuery at a time, the rest queue
+BQ_QUERY_WORKERS = int(os.getenv("BQ_QUERY_WORKERS", "8"))
+_query_executor = ThreadPoolExecutor(max_workers=BQ_QUERY_WORKERS, thread_name_prefix="bq-query")
+
+# Cache lookups / saves of async callers (shared tier round trips, SQLite reads,
+# subsumption) - a separate pool, so cache hits never queue behind BigQuery queries
+CACHE_LOOKUP_WORKERS = int(os.getenv("CACHE_LOOKUP_WORKERS", "4"))
+_cache_executor = ThreadPoolExecutor(max_workers=CACHE_LOOKUP_WORKERS, thread_name_prefix="cache-lookup")
+
+# get_fresh statuses of hits that should be refreshed in the background
+_REFRESH_STATUSES = ("soft_expired", "early_refresh")
+
 
 def get_bq() -> BQClient:
     """
@@ -77,6 +150,115 @@ def get_bq() -> BQClient:
     return _bq_instance
 
 
+# =============================================================================
+# Question-Level Cache Lookup
+# =============================================================================
+
+def lookup_question_cache(final_question: str, now: float = None, slots: dict = None):
+    """
+    Looks up a question in the question-level cache.
+    
+    Called by run_sql, and by the orchestrator right after the Intent Agent
+    so a repeated question skips the Validation and NL2SQL LLM calls.
+    The slot key (any phrasing / language of the same request) is checked
+    first, then the plain key and today's day-scoped key (questions
+    answered with relative dates - see question_cache_key).
+    Expired or stale entries are deleted on lookup (atomically - get_fresh).
+    
+    Args:
+        final_question: User's question (as produced by the Intent Agent)
+        now: Current time (default: time.time())
+        slots: Question slots from the Intent Agent (optional)
+    
+    Returns:
+        Result dict (same shape as run_sql) on a hit, None on a miss
+    """
+    if not final_question or not normalize_question(final_question):
+        return None
+
+    cache_state = get_global_cache_state()
+    now = time.time() if now is None else now
+    today = utc_today(datetime.fromtimestamp(now, timezone.utc))
+
+    keys = [question_cache_key(final_question), question_cache_key(final_question, today)]
+    slot_key = slot_cache_key(slots)
+    if slot_key:
+        keys.insert(0, slot_key)
+    for key in keys:
+        # Get the entry - expired (TTL) or stale (source data changed) entries are deleted
+        cached_result, status = cache_state.get_fresh(cache_state.question_cache, key, now)
+        if status == "expired":
+            print(f"[CACHE] ⏰ Cache expired for question: {final_question[:50]}...")
+        elif status == "stale":
+            print(f"[CACHE] 🔄 Source data changed for question: {final_question[:50]}...")
+        if cached_result is None:
+            continue
+
+        print(f"[CACHE HIT] ✅ Question found in cache: {final_question[:60]}...")
+        print(f"[CACHE DEBUG] Question key: {key[:60]}...")
+        if status in _REFRESH_STATUSES and cached_result.get("sql"):
+            schedule_refresh(cached_result["sql"], key)
+        return {
+            "sql": cached_result.get("sql"),
+            "rows": cached_result["rows"],
+            "summary": f"Query returned {len(cached_result['rows'])} rows",
+            "from_cache": True,
+            "stale": status == "soft_expired"
+        }
+    return None
+
+
+def lookup_negative_question(final_question: str, now: float = None):
+    """
+    Looks up a question in the negative cache (recent failure / empty result).
+    
+    Args:
+        final_question: The question from Intent Agent
+        now: Current time (default: time.time())
+    
+    Returns:
+        NegativeEntry (error_class, message, stored_at), or None
+    """
+    if not final_question or not normalize_question(final_question):
+        return None
+
+    negative = get_global_cache_state().negative
+    now = time.time() if now is None else now
+    today = utc_today(datetime.fromtimestamp(now, timezone.utc))
+    for key in (question_cache_key(final_question), question_cache_key(final_question, today)):
+        entry = negative.get("question", key, now)
+        if entry is not None:
+            print(f"[CACHE HIT] ⛔ Question recently ended with {entry.error_class}: {final_question[:50]}...")
+            return entry
+    return None
+
+
+def record_question_failure(final_question: str, error_class: str, message: str = "") -> None:
+    """
+    Remembers that a question ended without an answer (e.g. FALLBACK_NO_EXECUTION).
+    
+    Args:
+        final_question: The question from Intent Agent
+        error_class: Outcome name (see agents/cache_sql/negative.py)
+        message: Message shown on a repeat
+    """
+    if final_question and normalize_question(final_question):
+        get_global_cache_state().negative.record("question", question_cache_key(final_question), error_class, message)
+
+
+def _negative_result(entry, sql: str) -> Dict[str, Any]:
+    """Replays a negative entry - raises the recorded error, or returns the empty result."""
+    if is_error(entry):
+        raise_negative(entry)
+    return {
+        "sql": sql,
+        "rows": [],
+        "summary": "Query returned 0 rows",
+        "from_cache": True,
+        "stale": False
+    }
+
+
 # =============================================================================
 # Main SQL Execution Function
 # =============================================================================
@@ -86,121 +268,597 @@ def run_sql(input: RunSQLInput, tool_context=None) -> Dict[str, Any]:
     Executes SQL query on BigQuery with two-layer caching support.
     
     Workflow (two-layer cache):
-    1. Check question-level cache (if final_question exists)
+    0. Resolve relative dates (DATE_SUB(CURRENT_DATE(), ...)) to absolute dates
+       Statements that write tables (CREATE OR REPLACE TABLE...) are executed
+       without the cache, and every entry that read those tables is invalidated
+    1. Check question-level cache (if final_question exists - slot key first)
     2. Check SQL-level cache (fallback)
+       (each layer is followed by its negative cache - a recent empty
+       result is returned, a recent BigQuery error is raised again)
+    2b. Derive from a cached result the query is a coarser view of
     3. If not found - execute on BigQuery and save to both caches
+       (concurrent callers with the same SQL wait for one execution;
+       date ranges reuse cached days and fetch only the missing ones)
     
     Advantage of two-layer cache:
     - Identical question always returns same result (even if SQL slightly differs)
     - Identical SQL is also saved (for future use)
     
+    Results are read page by page. The full result is only materialized
+    when it is cached (streamed into columnar form) or wanted in full
+    (max_rows not set) - otherwise fetching stops after max_rows rows.
+    
+    Blocks until BigQuery answers - async callers use run_sql_async.
+    
     Args:
         input: Model with SQL query and final_question (optional)
         tool_context: Tool context (not currently used)
     
     Returns:
         Dict with:
-        - sql: The executed query
-        - rows: Results list
+        - sql: The executed query (relative dates resolved)
+        - rows: Results list (at most max_rows rows)
+        - total_rows: Rows of the full result (when known)
         - summary: Summary (how many rows)
         - from_cache: Whether the result is from cache
+        - stale: Whether a cached result past its soft TTL was served
+          (a background refresh is then in progress)
+        - output_tables: Tables written (write statements only)
+        - job_stats: Statistics of the BigQuery job (executed queries only -
+          see agents/db/job_stats.py; shared by coalesced callers)
+    """
+    cached_result, miss = _lookup_caches(input)
+    if miss is None:
+        return _cap_rows(cached_result, input.max_rows)
+    if miss.written_tables:
+        return _execute_write(miss.sql, miss.written_tables, input.output_tables)
+
+    # Concurrent identical misses share one BigQuery job (and one SQL cache save)
+    max_rows = _fetch_cap(miss, input.max_rows)
+    try:
+        shared_result = _query_flight.do(
+            _flight_key(miss, max_rows), lambda: _execute_miss(miss, max_rows)
+        )
+    except RuntimeError as e:
+        _record_question_error(miss, e)
+        raise
+    return _finish_miss(input, miss, shared_result)
+
+
+async def run_sql_async(input: RunSQLInput, tool_context=None) -> Dict[str, Any]:
+    """
+    Async version of run_sql - never blocks the event loop on I/O.
+    
+    Cache lookups (steps 0-2b) and saves run in the cache pool
+    (CACHE_LOOKUP_WORKERS): they may wait on the shared tier (up to
+    SHARED_TIMEOUT_SECONDS), read lazily loaded SQLite values and compute
+    derived results. Statements that reach BigQuery run in a bounded thread
+    pool (BQ_QUERY_WORKERS), so a slow query only holds its own session
+    while every other session served by the same worker keeps going.
+    In-flight executions are shared with sync callers of run_sql.
+    
+    Args:
+        input: Model with SQL query and final_question (optional)
+        tool_context: Tool context (not currently used)
+    
+    Returns:
+        Same dict as run_sql
+    """
+    loop = asyncio.get_running_loop()
+    cached_result, miss = await loop.run_in_executor(_cache_executor, _lookup_caches, input)
+    if miss is None:
+        return _cap_rows(cached_result, input.max_rows)
+    if miss.written_tables:
+        return await loop.run_in_executor(
+            _query_executor, _execute_write, miss.sql, miss.written_tables, input.output_tables
+        )
+
+    max_rows = _fetch_cap(miss, input.max_rows)
+    try:
+        shared_result = await _query_flight.do_async(
+            _flight_key(miss, max_rows), lambda: _execute_miss(miss, max_rows), executor=_query_executor
+        )
+    except RuntimeError as e:
+        _record_question_error(miss, e)
+        raise
+    return await loop.run_in_executor(_cache_executor, _finish_miss, input, miss, shared_result)
+
+
+async def run_in_cache_pool(func, *args, **kwargs):
+    """
+    Runs a blocking cache call (lookups, failure records, the question log)
+    in the cache pool, off the event loop - like run_sql_async's lookups.
+    
+    Args:
+        func: Function to call
+        *args, **kwargs: Its arguments
+    
+    Returns:
+        The function's return value
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        _cache_executor, functools.partial(func, *args, **kwargs)
+    )
+
+
+def _lookup_caches(input: RunSQLInput):
+    """
+    Steps 0-2b of run_sql - everything that does not need BigQuery.
+    
+    Returns:
+        (result, None) if the caches answer the query,
+        (None, CacheMiss) if it has to run on BigQuery
     """
     # Get global cache state
     cache_state = get_global_cache_state()
-    sql = input.sql
     final_question = input.final_question
-    
-    # Normalize the keys
-    normalized_sql = normalize_sql(sql)
-    normalized_q = normalize_question(final_question) if final_question else None
-    
     now = time.time()
+    clock = datetime.fromtimestamp(now, timezone.utc)
+    today = utc_today(clock)  # BigQuery's CURRENT_DATE() - UTC
+
+    # Resolve relative dates - the resolved query means the same thing today
+    sql, dates_resolved = resolve_relative_dates(input.sql, today, clock)
+    if dates_resolved:
+        print(f"[CACHE DEBUG] Relative dates resolved: {sql[:60]}...")
+
+    # Write statements - never cached, and the cached readers of their tables are now stale
+    written_tables = extract_written_tables(sql)
+    if written_tables:
+        return None, CacheMiss(sql, None, None, now, written_tables)
+
+    # Normalize the keys (SQL key = canonical AST fingerprint)
+    # Questions with relative dates are keyed per day ("yesterday" changes daily)
+    normalized_sql = fingerprint_sql(sql)
+    normalized_q = question_cache_key(final_question, today if dates_resolved else None) if final_question else None
 
     # ===================
     # Step 1: Check Question-Level Cache (preferred!)
     # ===================
     if normalized_q:
-        # Check TTL for question - if expired, delete safely
-        if normalized_q in cache_state.question_ttl:
-            if now - cache_state.question_ttl[normalized_q] > TTL_SECONDS:
-                # Expired - delete safely (pop prevents KeyError)
-                cache_state.question_cache.pop(normalized_q, None)
-                cache_state.question_ttl.pop(normalized_q, None)
-                print(f"[CACHE] ⏰ Cache expired for question: {final_question[:50]}...")
-        
-        # Check if question is in cache
-        if normalized_q in cache_state.question_cache:
-            cached_result = cache_state.question_cache[normalized_q]
-            print(f"[CACHE HIT] ✅ Question found in cache: {final_question[:60]}...")
-            print(f"[CACHE DEBUG] Question key: {normalized_q[:60]}...")
-            return {
-                "sql": sql,
-                "rows": cached_result["rows"],
-                "summary": f"Query returned {len(cached_result['rows'])} rows",
-                "from_cache": True
-            }
+        cached_result = lookup_question_cache(final_question, now, input.question_slots)
+        if cached_result is not None:
+            cached_result["sql"] = sql
+            return cached_result, None
+        negative = lookup_negative_question(final_question, now)
+        if negative is not None and negative.error_class != FALLBACK_NO_EXECUTION:
+            return _negative_result(negative, sql), None
 
     # ===================
     # Step 2: Check SQL-Level Cache (fallback)
     # ===================
-    # Check TTL for SQL - if expired, delete safely
-    if normalized_sql in cache_state.ttl:
-        if now - cache_state.ttl[normalized_sql] > TTL_SECONDS:
-            # Expired - delete safely (pop prevents KeyError)
-            cache_state.cache.pop(normalized_sql, None)
-            cache_state.ttl.pop(normalized_sql, None)
-            print(f"[CACHE] ⏰ Cache expired for SQL")
-    
-    if normalized_sql in cache_state.cache:
+    # Get the entry - expired (TTL) or stale (source data changed) entries are deleted
+    cached_result, status = cache_state.get_fresh(cache_state.cache, normalized_sql, now)
+    if status == "expired":
+        print(f"[CACHE] ⏰ Cache expired for SQL")
+    elif status == "stale":
+        print(f"[CACHE] 🔄 Source data changed for SQL")
+    elif status == "shared_hit":
+        print(f"[CACHE] 🔗 SQL found in shared cache (another worker)")
+
+    if cached_result is not None:
         # Found query in SQL cache - return result immediately
         print(f"[CACHE HIT] ✅ SQL found in cache: {sql[:60]}...")
         print(f"[CACHE DEBUG] SQL key: {normalized_sql[:60]}...")
+        if status in _REFRESH_STATUSES:
+            schedule_refresh(sql)
         return {
             "sql": sql,
-            "rows": cache_state.cache[normalized_sql]["rows"],
-            "summary": f"Query returned {len(cache_state.cache[normalized_sql]['rows'])} rows",
-            "from_cache": True
-        }
+            "rows": cached_result["rows"],
+            "summary": f"Query returned {len(cached_result['rows'])} rows",
+            "from_cache": True,
+            "stale": status == "soft_expired"
+        }, None
+
+    negative = cache_state.negative.get("sql", normalized_sql, now)
+    if negative is not None:
+        print(f"[CACHE HIT] ⛔ SQL recently ended with {negative.error_class}: {sql[:60]}...")
+        return _negative_result(negative, sql), None
+
+    # ===================
+    # Step 2b: Derive from a cached finer-grained result (subsumption)
+    # ===================
+    derived = _derive_from_cache(sql, normalized_sql) if CACHE_SUBSUMPTION else None
+    if derived is not None:
+        _save_question_result(input, normalized_q, normalized_sql, derived, sql)
+        return dict(derived, stale=False), None
 
     # ===================
-    # Step 3: Cache MISS - Execute on BigQuery
+    # Step 3: Cache MISS - the query has to run on BigQuery
     # ===================
     print(f"[CACHE MISS] 🔄 Executing new query on BigQuery: {sql[:60]}...")
     if final_question:
         print(f"[CACHE DEBUG] Question: {final_question[:60]}...")
         print(f"[CACHE DEBUG] Question key (normalized): {normalized_q[:60] if normalized_q else 'N/A'}...")
     print(f"[CACHE DEBUG] SQL key (normalized): {normalized_sql[:60]}...")
+    return None, CacheMiss(sql, normalized_sql, normalized_q, now, ())
+
+
+def _execute_miss(miss: CacheMiss, max_rows: int = None) -> Dict[str, Any]:
+    """Runs a cache miss on BigQuery (once per in-flight SQL - see _query_flight)."""
+    return _execute_and_cache_sql(miss.sql, miss.normalized_sql, miss.now, max_rows)
+
+
+def _fetch_cap(miss: CacheMiss, max_rows: int = None):
+    """
+    Rows to fetch for a miss - None (all) when the result will be cached.
     
-    result_iter = get_bq().execute_query(sql, "agent_query")
-    rows = [dict(row) for row in result_iter]
+    Cached results must be complete, so the display cap only limits the
+    fetch of queries that are not cached anyway.
+    """
+    if max_rows is None or is_cacheable(IsCacheableInput(sql=miss.sql)):
+        return None
+    return max_rows
 
-    result = {
+
+def _flight_key(miss: CacheMiss, max_rows: int = None):
+    """Single-flight key - capped fetches are only shared with the same cap."""
+    return miss.normalized_sql if max_rows is None else (miss.normalized_sql, max_rows)
+
+
+def _cap_rows(result: dict, max_rows: int = None) -> Dict[str, Any]:
+    """Caps a result to the caller's max_rows (total_rows keeps the full count)."""
+    result.setdefault("total_rows", len(result["rows"]))
+    if max_rows is not None and len(result["rows"]) > max_rows:
+        result["rows"] = result["rows"][:max_rows]
+    return result
+
+
+def _record_question_error(miss: CacheMiss, error: Exception) -> None:
+    """Remembers a BigQuery error under the question key too (fail fast on repeats)."""
+    if miss.normalized_q:
+        get_global_cache_state().negative.record_error("question", miss.normalized_q, error, miss.now)
+
+
+def _finish_miss(input: RunSQLInput, miss: CacheMiss, shared_result: dict) -> Dict[str, Any]:
+    """
+    Step 4 of run_sql - per caller result and question cache save.
+    
+    Args:
+        input: The caller's input (questions of coalesced callers may differ)
+        miss: Result of _lookup_caches
+        shared_result: Result of the BigQuery execution (shared - not mutated)
+    """
+    result = dict(shared_result)
+    result["sql"] = miss.sql
+    result["stale"] = False
+    _save_question_result(input, miss.normalized_q, miss.normalized_sql, shared_result, miss.sql, miss.now)
+    return _cap_rows(result, input.max_rows)
+
+
+def _execute_write(sql: str, written_tables: tuple, output_tables: list = None) -> Dict[str, Any]:
+    """
+    Executes a statement that writes tables, bypassing the cache.
+    
+    Entries that read the written tables are invalidated afterwards - also
+    when the statement fails, since a script may have written some tables
+    before failing.
+    
+    Args:
+        sql: Statement(s) to execute
+        written_tables: Tables the statement writes
+        output_tables: Tables reported by NL2SQL (default: written_tables)
+    
+    Returns:
+        Result dict with output_tables
+    """
+    print(f"[CACHE] ✍️ Statement writes {', '.join(written_tables)} - executing without cache")
+    try:
+        result_iter = get_bq().execute_query(sql, "agent_query")
+        rows = [dict(row) for row in result_iter]
+    finally:
+        invalidated = get_global_cache_state().invalidate_written(written_tables)
+        print(f"[CACHE] 🧹 Invalidated {invalidated} cached results that read the written tables")
+    return {
         "sql": sql,
         "rows": rows,
         "summary": f"Query returned {len(rows)} rows",
-        "from_cache": False
+        "from_cache": False,
+        "stale": False,
+        "output_tables": list(output_tables or written_tables),
+        "job_stats": getattr(result_iter, "job_stats", None)
     }
 
-    # ===================
-    # Step 4: Save to cache (both layers) if possible
-    # ===================
-    if is_cacheable(IsCacheableInput(sql=sql)):
-        # Save to SQL cache
-        cache_state.cache[normalized_sql] = result
-        cache_state.ttl[normalized_sql] = now
-        print(f"[CACHE] 💾 Saved to SQL cache: {normalized_sql[:60]}...")
-        
-        # Save to question cache (if exists)
-        if normalized_q:
-            cache_state.question_cache[normalized_q] = result
-            cache_state.question_ttl[normalized_q] = now
-            print(f"[CACHE] 💾 Saved to question cache: {normalized_q[:60]}...")
+
+def _save_question_result(input: RunSQLInput, normalized_q: str, normalized_sql: str,
+                          result: dict, sql: str, now: float = None) -> None:
+    """
+    Saves a result to the question cache (question key and, if they match the SQL, slot key).
+    
+    Args:
+        now: Time the result was read from BigQuery (default: that of the SQL entry)
+    """
+    if not normalized_q:
+        return
+    cache_state = get_global_cache_state()
+    if now is None:
+        now = cache_state.cache.ttl_store.get(normalized_sql) or time.time()
+    if not result["rows"]:
+        cache_state.negative.record("question", normalized_q, EMPTY_RESULT, now=now)
+        return
+    if not is_cacheable(IsCacheableInput(sql=sql)):
+        return
+
+    compute_seconds = cache_state.compute_seconds.get(("sql", normalized_sql))
+    if _save_to_cache(cache_state.question_cache, normalized_q, result, sql, now, compute_seconds):
+        print(f"[CACHE] 💾 Saved to question cache: {normalized_q[:60]}...")
+
+    # Also under the slot key - only if the slots really describe this SQL
+    slot_key = slot_cache_key(input.question_slots)
+    if slot_key and slots_match_sql(input.question_slots, sql):
+        if _save_to_cache(cache_state.question_cache, slot_key, result, sql, now, compute_seconds):
+            print(f"[CACHE] 💾 Saved to question cache (slots): {slot_key[:60]}...")
+
+
+def _derive_from_cache(sql: str, normalized_sql: str):
+    """
+    Computes a query from a cached finer-grained result (see subsumption.py).
+    
+    The derived result is saved to the SQL cache with the timestamp of the
+    entry it was computed from - it is exactly as old as that data.
+    
+    Returns:
+        Result dict, or None if no cached entry subsumes the query
+    """
+    if not is_cacheable(IsCacheableInput(sql=sql)):
+        return None
+    cache_state = get_global_cache_state()
+
+    def load(key):
+        value, _ = cache_state.get_fresh(cache_state.cache, key)
+        stored_at = cache_state.cache.ttl_store.get(key)
+        if value is None or stored_at is None:
+            return None
+        return value["rows"], stored_at
+
+    derived = cache_state.subsumption.derive(normalized_sql, load)
+    if derived is None:
+        return None
+    rows, source_key, stored_at = derived
+    print(f"[CACHE HIT] 🧮 Derived from a cached finer result: {sql[:60]}...")
+    print(f"[CACHE DEBUG] Source SQL key: {source_key[:60]}...")
+
+    result = {
+        "sql": sql,
+        "rows": ColumnarRows.from_rows(rows),
+        "summary": f"Query returned {len(rows)} rows",
+        "from_cache": True
+    }
+    if rows and _save_to_cache(cache_state.cache, normalized_sql, result, sql, stored_at):
+        cache_state.subsumption.add(normalized_sql)
+    return result
+
+
+def _execute_and_cache_sql(sql: str, normalized_sql: str, now: float, max_rows: int = None) -> Dict[str, Any]:
+    """
+    Executes a query on BigQuery and saves it to the SQL-level cache.
+    
+    Runs once per in-flight normalized SQL (see _query_flight).
+    Pages are read one at a time: cacheable results are streamed into
+    columnar form, others stop after max_rows rows (if set).
+    
+    Args:
+        max_rows: Rows to fetch - only for queries that are not cached (see _fetch_cap)
+    
+    Returns:
+        Result dict (shared by all coalesced callers - do not mutate)
+    """
+    cache_state = get_global_cache_state()
+    cacheable = is_cacheable(IsCacheableInput(sql=sql))
+    started = time.time()
+    bytes_scanned = None
+    total_rows = None
+    try:
+        plan = daily_plan(sql)
+        if plan is not None:
+            rows, job_stats, bytes_scanned = _fetch_by_day(plan, now)
+        else:
+            stream = StreamingRows(get_bq().execute_query(sql, "agent_query"))
+            bytes_scanned = stream.bytes_scanned
+            total_rows = stream.total_rows
+            job_stats = stream.job_stats
+            if cacheable:
+                # Full result, without a list of dicts of every row
+                rows = ColumnarRows.from_pages(stream.pages())
+            elif max_rows is not None:
+                rows = stream.head(max_rows)
+            else:
+                rows = list(stream)
+    except RuntimeError as e:
+        # Rejected SQL - repeats fail fast instead of starting another job
+        cache_state.negative.record_error("sql", normalized_sql, e, now)
+        raise
+    compute_seconds = time.time() - started
+
+    result = {
+        "sql": sql,
+        "rows": rows,
+        "total_rows": total_rows if total_rows is not None else len(rows),
+        "summary": f"Query returned {total_rows if total_rows is not None else len(rows)} rows",
+        "from_cache": False,
+        "job_stats": job_stats
+    }
+
+    if not rows:
+        # Empty results only go to the negative cache (short TTL - data may still arrive)
+        cache_state.negative.record("sql", normalized_sql, EMPTY_RESULT, now=now)
+        print(f"[CACHE] 🕳️ Empty result remembered briefly: {normalized_sql[:60]}...")
+    elif cacheable:
+        # Save to SQL cache - rows in columnar form (shared with the question layer)
+        result["rows"] = ColumnarRows.from_rows(rows)
+        if _save_to_cache(cache_state.cache, normalized_sql, result, sql, now, compute_seconds, bytes_scanned):
+            cache_state.subsumption.add(normalized_sql)
+            print(f"[CACHE] 💾 Saved to SQL cache: {normalized_sql[:60]}...")
     else:
-        print(f"[CACHE] ⏭️ Query not cacheable (relative date or LIMIT)")
+        print(f"[CACHE] ⏭️ Query not cacheable (relative date, today's data or LIMIT)")
 
     return result
 
 
+def _fetch_by_day(plan, now: float) -> list:
+    """
+    Computes a date-range query from per-day partials (see daily.py).
+    
+    Cached days are reused, all missing days are fetched in one BigQuery
+    query and cached one day at a time. The bytes the batch query processed
+    are split evenly across the fetched days, so admission sees each
+    partial's share of the cost.
+    
+    Returns:
+        (rows of the range query, job_stats, bytes_scanned) - job_stats and
+        bytes_scanned of the batch query, None if every day was cached
+    """
+    cache_state = get_global_cache_state()
+    parts, missing, job_stats, bytes_scanned = {}, [], None, None
+    for day in plan.days:
+        key = fingerprint_sql(day_sql(plan, day))
+        value, status = cache_state.get_fresh(cache_state.cache, key, now)
+        if value is not None and status not in _REFRESH_STATUSES:
+            parts[day] = value["rows"]
+            continue
+        negative = cache_state.negative.get("sql", key, now)
+        if negative is not None and negative.error_class == EMPTY_RESULT:
+            parts[day] = []
+        else:
+            missing.append(day)
+
+    if missing:
+        print(f"[CACHE] 📅 Fetching {len(missing)} of {len(plan.days)} days from BigQuery")
+        result_iter = get_bq().execute_query(batch_sql(plan, missing), "agent_query")
+        job_stats = getattr(result_iter, "job_stats", None)
+        bytes_scanned = getattr(result_iter, "total_bytes_processed", None)
+        day_bytes = bytes_scanned // len(missing) if bytes_scanned is not None else None
+        fetched = split_by_day(result_iter)
+        for day in missing:
+            parts[day] = fetched.get(day.isoformat(), [])
+            _save_day(plan, day, parts[day], now, day_bytes)
+    else:
+        print(f"[CACHE HIT] 📅 All {len(plan.days)} days found in cache")
+
+    return merge_days(plan, [parts[day] for day in plan.days]), job_stats, bytes_scanned
+
+
+def _save_day(plan, day, rows: list, now: float, bytes_scanned: int = None) -> None:
+    """Caches the partial of one day (an ordinary SQL cache entry) with its share of the batch bytes."""
+    cache_state = get_global_cache_state()
+    sql = day_sql(plan, day)
+    key = fingerprint_sql(sql)
+    if not rows:
+        cache_state.negative.record("sql", key, EMPTY_RESULT, now=now)
+    elif is_cacheable(IsCacheableInput(sql=sql)):
+        result = {
+            "sql": sql,
+            "rows": ColumnarRows.from_rows(rows),
+            "summary": f"Query returned {len(rows)} rows",
+            "from_cache": False
+        }
+        if _save_to_cache(cache_state.cache, key, result, sql, now, bytes_scanned=bytes_scanned):
+            cache_state.subsumption.add(key)
+
+
+def _save_to_cache(layer, key: str, result: dict, sql: str, now: float, compute_seconds: float = None,
+                   bytes_scanned: int = None) -> bool:
+    """
+    Saves a result with the tables and dates its query read (for freshness checks).
+    
+    A full cache only admits results that are looked up more often than
+    the entry they would evict, or that were expensive (see admission.py).
+    
+    Returns:
+        True if the result was stored
+    """
+    cache_state = get_global_cache_state()
+    if not cache_state.admit(layer, key, bytes_scanned):
+        print(f"[CACHE] 🚪 Not admitted (cache full, rarely asked): {key[:60]}...")
+        return False
+    date_range = date_range_in_sql(sql)
+    if date_range is not None:
+        date_range = (date_range[0].isoformat(), date_range[1].isoformat())
+    return cache_state.put(
+        layer, key, result, now, extract_source_tables(sql), date_range, compute_seconds=compute_seconds
+    )
+
+
+# =============================================================================
+# Background Refresh (stale-while-revalidate)
+# =============================================================================
+
+def schedule_refresh(sql: str, question_key: str = None) -> bool:
+    """
+    Re-executes a cached query in the background and replaces its entries.
+    
+    Scheduled at most once per query at a time - callers that hit the same
+    stale entry meanwhile keep getting the stale result.
+    
+    Args:
+        sql: SQL of the cached entry (absolute dates)
+        question_key: Question cache key to refresh too, or None
+    
+    Returns:
+        True if a refresh was scheduled, False if one is already pending
+    """
+    normalized_sql = fingerprint_sql(sql)
+    with _refreshing_lock:
+        if normalized_sql in _refreshing:
+            return False
+        _refreshing.add(normalized_sql)
+    print(f"[CACHE] 🔁 Background refresh scheduled: {sql[:60]}...")
+    _refresh_executor.submit(_refresh, sql, normalized_sql, question_key)
+    return True
+
+
+def _refresh(sql: str, normalized_sql: str, question_key: str) -> None:
+    cache_state = get_global_cache_state()
+    try:
+        now = time.time()
+        # Shares the job with a foreground miss of the same SQL, if any
+        result = _query_flight.do(
+            normalized_sql,
+            lambda: _execute_and_cache_sql(sql, normalized_sql, now)
+        )
+        if question_key and result["rows"] and is_cacheable(IsCacheableInput(sql=sql)):
+            _save_to_cache(cache_state.question_cache, question_key, result, sql, now,
+                           cache_state.compute_seconds.get(("sql", normalized_sql)))
+        print(f"[CACHE] 🔁 Background refresh done: {sql[:60]}...")
+    except Exception as e:
+        print(f"[CACHE] ⚠️ Background refresh failed: {e}")
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(normalized_sql)
+
+
+def get_coalescing_stats() -> dict:
+    """
+    Returns request-coalescing counters.
+    
+    Returns:
+        dict with executions (BigQuery jobs started), deduplicated
+        (misses that waited for an identical in-flight query) and in_flight
+    """
+    return _query_flight.stats()
+
+
+def get_job_stats():
+    """
+    Returns the rolling table of executed BigQuery jobs (see job_stats.py).
+    
+    Returns:
+        JobStatsLog, or None if no BigQuery client was created yet
+    """
+    return getattr(_bq_instance, "job_stats", None)
+
+
+def get_query_cost_stats():
+    """
+    Returns dry-run / bytes-billed budget counters (see cost_guard.py).
+    
+    Returns:
+        dict of CostGuard.stats(), or None if no BigQuery client was created yet
+    """
+    if _bq_instance is None or not hasattr(_bq_instance, "cost_guard"):
+        return None
+    return _bq_instance.cost_guard.stats()
+
+
 # =============================================================================
 # Wrapper for use by Agent
 # =============================================================================
@@ -219,4 +877,64 @@ def run_sql_tool(input: RunSQLInput, tool_context=None) -> Dict[str, Any]:
     Returns:
         Dict with query results
     """
-    return run_sql(input, tool_context)
\ No newline at end of file
+    return run_sql(input, tool_context)
+
+
+async def run_sql_tool_async(input: RunSQLInput, tool_context=None) -> Dict[str, Any]:
+    """
+    Async wrapper for the orchestrator - awaits run_sql_async.
+    
+    Args:
+        input: Model with SQL query and final_question (optional)
+        tool_context: Tool context from ADK
+    
+    Returns:
+        Dict with query results
+    """
+    return await run_sql_async(input, tool_context)
+
+
+async def execute_query_async(sql: str, query_type: str) -> list:
+    """
+    Runs a query on BigQuery without the cache, off the event loop.
+    
+    For async endpoints that query BigQuery directly (e.g. the /chat
+    anomaly dashboard). The rows are fetched in the query pool too -
+    iterating a RowIterator loads pages over the network.
+    
+    Args:
+        sql: SQL query
+        query_type: Label for the query log
+    
+    Returns:
+        List of BigQuery rows
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        _query_executor, lambda: list(get_bq().execute_query(sql, query_type))
+    )
+
+
+def fetch_arrow(sql: str, query_type: str):
+    """
+    Runs a query without the cache and returns its result as one Arrow table.
+    
+    For callers that read whole tables (anomaly dashboards) - batches come
+    from the Storage Read API when available (BQClient.execute_query_arrow).
+    
+    Args:
+        sql: SQL query
+        query_type: Label for the query log
+    
+    Returns:
+        pyarrow.Table (no columns if the result had no batches). The
+        batches are wrapped, not copied - callers convert it column-wise
+    """
+    batches = list(get_bq().execute_query_arrow(sql, query_type))
+    if not batches:
+        return pa.table({})
+    return pa.Table.from_batches(batches)
+
+
+async def fetch_arrow_async(sql: str, query_type: str):
+    """Async version of fetch_arrow - runs in the query pool, off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(_query_executor, fetch_arrow, sql, query_type)
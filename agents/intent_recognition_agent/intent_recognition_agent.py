@@ -21,7 +21,7 @@ from pathlib import Path
 project_root = Path(__file__).resolve().parent.parent.parent
 sys.path.insert(0, str(project_root))
 
-from typing import Optional, Literal
+from typing import List, Optional, Literal
 from pydantic import BaseModel, Field
 from google.adk.agents import Agent
 from config.schema import SQL_SCHEMA
@@ -30,6 +30,23 @@ from config.schema import SQL_SCHEMA
 # =============================================================================
 # Output schema
 # =============================================================================
+class SlotFilter(BaseModel):
+    field: str
+    values: List[str]
+
+
+class QuestionSlots(BaseModel):
+    """Structured form of final_question - the question cache key (cache_sql/slots.py)."""
+    metric: str
+    aggregation: Literal["sum", "avg", "max", "min"] = "sum"
+    dimensions: List[str] = Field(default_factory=list)
+    filters: List[SlotFilter] = Field(default_factory=list)
+    start_date: str
+    end_date: str
+    top_n: Optional[int] = None
+    order: Optional[Literal["asc", "desc"]] = None
+
+
 class IntentResult(BaseModel):
     status: Literal["not_relevant", "needs_clarification", "improved", "anomaly"]
     message_to_user: str
@@ -39,6 +56,7 @@ class IntentResult(BaseModel):
         "missing_critical_field",
         "missing_aggregation_or_filter"
     ]] = None
+    slots: Optional[QuestionSlots] = None
 
 
 # =============================================================================
@@ -95,7 +113,8 @@ Clarification:
 =============================================================================
 AVAILABLE DATA
 =============================================================================
-Metrics: clicks, impressions, revenue, cost
+Metrics (all counted in total_events): clicks (is_engaged_view = FALSE),
+views (is_engaged_view = TRUE), events (both)
 
 Filter fields:
 - date / event_time (REQUIRED)
@@ -145,6 +164,25 @@ FOLLOW-UP & EXPLANATION QUESTIONS (CRITICAL)
 =============================================================================
 If the user asks a follow-up, explanation, or metadata question (such as "why?", "based on what?", "which dates exist in the data?") after any analytical context, always treat as relevant and inherit context from the previous successful query. If the previous query was an anomaly, classify the follow-up as a drill-down.
 
+=============================================================================
+QUESTION SLOTS (CACHE KEY)
+=============================================================================
+If status == "improved" and the question has ABSOLUTE dates, also return
+slots - the same question in structured form, in English, whatever the
+user's language:
+- metric: one of clicks, views, events
+- aggregation: sum (totals / counts), avg, max or min of the metric
+- dimensions: schema field names the result is broken down by
+  (e.g. ["media_source"], ["hr"], ["date"] for per-day)
+- filters: every filter except the date, as {{"field": <schema field>, "values": [...]}}
+  (values exactly as they will appear in the SQL; booleans as "true"/"false")
+- start_date / end_date: YYYY-MM-DD (the same day twice for a single day)
+- top_n: N for "top N" questions, otherwise null
+- order: "desc" for top / highest / most, "asc" for bottom / lowest / least,
+  null if the question does not sort by the metric
+If the dates are relative (today, yesterday, last week) or anything is
+uncertain, slots MUST be null.
+
 =============================================================================
 OUTPUT RULES
 =============================================================================
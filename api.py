@@ -1,23 +1,44 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from pydantic import BaseModel
+from datetime import date, datetime, time
+from decimal import Decimal
+import json
 import logging
 import traceback
+import asyncio
 
 from agent import agent
 from google.genai.types import Content, Part
 from google.adk.runners import Runner
 from google.adk.sessions import InMemorySessionService
-from bq.bq import BQClient
+from agents.cache_sql.tools import get_global_cache_state
+from agents.cache_sql.expiry import run_expiry_sweeper
+from agents.cache_sql.freshness import run_freshness_checker, FRESHNESS_CHECK_INTERVAL
+from agents.cache_sql.snapshot import (
+    iter_snapshot_chunks,
+    export_snapshot,
+    load_snapshot_in_background,
+    snapshot_token_matches,
+    CACHE_SNAPSHOT_PATH,
+    CACHE_SNAPSHOT_SOURCE,
+    CACHE_SNAPSHOT_TOKEN,
+)
+from agents.db.tools import (
+    get_bq,
+    execute_query_async,
+    fetch_arrow,
+    fetch_arrow_async,
+    get_job_stats,
+    get_query_cost_stats,
+)
+from agents.db.job_stats import RANKINGS as JOB_STATS_RANKINGS
 
 # Global session service and session cache for persistence across turns
 session_service = InMemorySessionService()
 session_cache = {}
 
-# BigQuery client for anomaly endpoints
-bq_client = BQClient()
-
 # -----------------------------------------------------------------------------
 # App setup
 # -----------------------------------------------------------------------------
@@ -34,6 +55,71 @@ app.add_middleware(
 
 logging.basicConfig(level=logging.INFO)
 
+# Background cache tasks (expiry sweeper, freshness checker, snapshot warm-up)
+_background_tasks = []
+
+
+@app.on_event("startup")
+async def start_cache_sweeper():
+    _background_tasks.append(
+        asyncio.create_task(run_expiry_sweeper(get_global_cache_state()))
+    )
+    if FRESHNESS_CHECK_INTERVAL > 0:
+        _background_tasks.append(asyncio.create_task(
+            run_freshness_checker(get_global_cache_state(), get_bq, FRESHNESS_CHECK_INTERVAL)
+        ))
+    if CACHE_SNAPSHOT_SOURCE:
+        # Warm-up runs in the background - the app is ready immediately
+        _background_tasks.append(asyncio.create_task(
+            load_snapshot_in_background(get_global_cache_state(), CACHE_SNAPSHOT_SOURCE)
+        ))
+
+
+@app.on_event("shutdown")
+async def stop_cache_sweeper():
+    for task in _background_tasks:
+        task.cancel()
+    _background_tasks.clear()
+    # Buffered writes of the persistent cache reach the disk before the worker exits
+    get_global_cache_state().flush()
+
+# -----------------------------------------------------------------------------
+# Arrow Responses
+# -----------------------------------------------------------------------------
+
+def _arrow_rows(table) -> list:
+    """Row dicts of an Arrow table, converted column by column."""
+    columns = table.to_pydict()
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+
+def _group_rows(rows: list, key) -> dict:
+    """{key(row): [rows]} - rows are shared with the flat list, not copied."""
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(key(row), []).append(row)
+    return grouped
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _json_response(content) -> Response:
+    """
+    Serializes a response in one json.dumps pass.
+
+    Returning the dict would make FastAPI walk every cell of the
+    dashboard tables (jsonable_encoder) before serializing them.
+    """
+    body = json.dumps(content, default=_json_default, ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+    return Response(body, media_type="application/json")
+
 # -----------------------------------------------------------------------------
 # Models
 # -----------------------------------------------------------------------------
@@ -126,6 +212,7 @@ async def chat(req: ChatRequest):
         if any(keyword in final_answer.lower() for keyword in ["anomaly", "anomalies", "spike", "outlier", "abnormal"]):
             # Replace the technical response with a user-friendly message
             final_answer = "Anomaly Detection Complete - Displaying dashboard below"
+            # Awaited - BigQuery must not block the other sessions' requests
             try:
                 # Fetch top 10 anomalies
                 top10_sql = """
@@ -133,7 +220,7 @@ async def chat(req: ChatRequest):
                     FROM `practicode-2025.clicks_data_prac.media_source_anomaly_cv_top_10`
                     ORDER BY cv DESC
                 """
-                top10_rows = bq_client.execute_query(top10_sql, "top10_for_chat")
+                top10_rows = await execute_query_async(top10_sql, "top10_for_chat")
                 media_sources = []
                 for index, row in enumerate(top10_rows):
                     media_sources.append({
@@ -151,16 +238,11 @@ async def chat(req: ChatRequest):
                     FROM `practicode-2025.clicks_data_prac.media_source_anomaly_all_clicks`
                     ORDER BY media_source, event_date, event_hour
                 """
-                all_clicks_rows = bq_client.execute_query(all_clicks_sql, "all_clicks_for_chat")
-                clicks_data = [dict(row.items()) for row in all_clicks_rows]
+                # Whole tables - fetched as Arrow (Storage Read API when available)
+                clicks_data = _arrow_rows(await fetch_arrow_async(all_clicks_sql, "all_clicks_for_chat"))
                 
                 # Group by media_source for level2
-                grouped = {}
-                for item in clicks_data:
-                    media = item["media_source"]
-                    if media not in grouped:
-                        grouped[media] = []
-                    grouped[media].append(item)
+                grouped = _group_rows(clicks_data, lambda item: item["media_source"])
                 
                 # Fetch app-level data for drill-down (level3)
                 app_sql = """
@@ -168,16 +250,12 @@ async def chat(req: ChatRequest):
                     FROM `practicode-2025.clicks_data_prac.media_source_anomaly_app_root_cause`
                     ORDER BY media_source, event_date, event_hour, app_id
                 """
-                app_rows = bq_client.execute_query(app_sql, "app_level_for_chat")
-                app_data = [dict(row.items()) for row in app_rows]
+                app_data = _arrow_rows(await fetch_arrow_async(app_sql, "app_level_for_chat"))
                 
                 # Group by media_source + event_date + event_hour for level3
-                app_grouped = {}
-                for item in app_data:
-                    key = f"{item['media_source']}_{item['event_date']}_{item['event_hour']}"
-                    if key not in app_grouped:
-                        app_grouped[key] = []
-                    app_grouped[key].append(item)
+                app_grouped = _group_rows(
+                    app_data, lambda item: f"{item['media_source']}_{item['event_date']}_{item['event_hour']}"
+                )
                 
                 chart_data = {
                     "level1": {"media_sources": media_sources},
@@ -190,7 +268,7 @@ async def chat(req: ChatRequest):
                 logging.error(f"Failed to fetch chart data: {chart_error}")
                 has_anomaly_chart = False
 
-        return {
+        response = {
             "content": {
                 "parts": [
                     {"text": final_answer}
@@ -200,6 +278,8 @@ async def chat(req: ChatRequest):
             "has_chart": has_anomaly_chart,
             "chart_data": chart_data
         }
+        # Chart tables are large - serialized directly (see _json_response)
+        return _json_response(response) if has_anomaly_chart else response
 
     except Exception as e:
         # Log full traceback for debugging
@@ -222,11 +302,78 @@ def health():
 
 
 # -----------------------------------------------------------------------------
-# Anomaly Dashboard Endpoints
+# Cache Snapshot Endpoints
+# -----------------------------------------------------------------------------
+
+def _check_snapshot_token(authorization) -> None:
+    """Snapshots hold every cached result - internal nodes only (CACHE_SNAPSHOT_TOKEN)."""
+    if not CACHE_SNAPSHOT_TOKEN:
+        raise HTTPException(status_code=404, detail="Cache snapshots are disabled")
+    if not snapshot_token_matches(authorization):
+        raise HTTPException(status_code=401, detail="Invalid snapshot token")
+
+
+@app.get("/cache/snapshot")
+def download_cache_snapshot(authorization: str = Header(None)):
+    """
+    Streams a snapshot of the live cache.
+    
+    New nodes can warm up from it directly (with the same CACHE_SNAPSHOT_TOKEN):
+    CACHE_SNAPSHOT_SOURCE=http://<node>/cache/snapshot
+    """
+    _check_snapshot_token(authorization)
+    return StreamingResponse(
+        iter_snapshot_chunks(get_global_cache_state()),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": "attachment; filename=cache.snapshot"},
+    )
+
+
+@app.post("/cache/snapshot")
+def save_cache_snapshot(authorization: str = Header(None)):
+    """Writes a snapshot of the live cache to CACHE_SNAPSHOT_PATH."""
+    _check_snapshot_token(authorization)
+    try:
+        entries = export_snapshot(get_global_cache_state(), CACHE_SNAPSHOT_PATH)
+    except OSError as e:
+        logging.error(f"Cache snapshot failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"path": CACHE_SNAPSHOT_PATH, "entries": entries}
+
+
+# -----------------------------------------------------------------------------
+# BigQuery Job Stats Endpoint
 # -----------------------------------------------------------------------------
 
 from fastapi import Query
 
+@app.get("/bigquery/jobs")
+def bigquery_job_stats(by: str = Query("bytes_billed"), limit: int = Query(20, ge=1, le=500)):
+    """
+    Statistics of the recent BigQuery jobs of this worker.
+    
+    Queries are aggregated per SQL fingerprint and ranked by `by`
+    (bytes_billed, bytes_processed, slot_ms, queue_ms, execution_ms or count)
+    to find the queries that dominate cost and latency.
+    
+    Returns:
+        dict: summary, top queries, recent jobs, dry-run budget counters
+    """
+    if by not in JOB_STATS_RANKINGS:
+        raise HTTPException(status_code=400, detail=f"by must be one of {', '.join(JOB_STATS_RANKINGS)}")
+    job_stats = get_job_stats()
+    if job_stats is None:
+        # No query ran yet - the BigQuery client is created on first use
+        return {"summary": {"jobs": 0}, "top": [], "recent": [], "cost_guard": None}
+    report = job_stats.report(by, limit)
+    report["cost_guard"] = get_query_cost_stats()
+    return report
+
+
+# -----------------------------------------------------------------------------
+# Anomaly Dashboard Endpoints
+# -----------------------------------------------------------------------------
+
 @app.get("/api/anomalies/top10")
 def get_top10_anomalies(media: str = Query(None)):
     """
@@ -248,7 +395,7 @@ def get_top10_anomalies(media: str = Query(None)):
                 FROM `practicode-2025.clicks_data_prac.media_source_anomaly_cv_top_10`
                 ORDER BY cv DESC
             """
-        rows = bq_client.execute_query(sql, "top10_anomalies")
+        rows = get_bq().execute_query(sql, "top10_anomalies")
         # Convert data to structure suitable for component
         media_sources = []
         for index, row in enumerate(rows):
@@ -317,17 +464,11 @@ def get_all_clicks(media: str = Query(None)):
                 FROM `practicode-2025.clicks_data_prac.media_source_anomaly_all_clicks`
                 ORDER BY event_date, event_hour, media_source
             """
-        rows = bq_client.execute_query(sql, "all_clicks")
-        data = [dict(row.items()) for row in rows]
+        # Whole table - fetched as Arrow (Storage Read API when available)
+        data = _arrow_rows(fetch_arrow(sql, "all_clicks"))
         # Group by media_source or partner for level2
-        grouped = {}
-        key_name = "media_source"
-        for item in data:
-            key = item[key_name]
-            if key not in grouped:
-                grouped[key] = []
-            grouped[key].append(item)
-        return {"status": "success", "count": len(data), "data": data, "level2": grouped}
+        grouped = _group_rows(data, lambda item: item["media_source"])
+        return _json_response({"status": "success", "count": len(data), "data": data, "level2": grouped})
     except Exception as e:
         logging.error(f"Error in get_all_clicks: {e}")
         # Return mock data if BigQuery fails - 72 data points per media source (3 days x 24 hours)
@@ -384,17 +525,13 @@ def get_app_breakdown(media: str = Query(None)):
                 FROM `practicode-2025.clicks_data_prac.media_source_anomaly_app_root_cause`
                 ORDER BY media_source, event_date, event_hour, app_id
             """
-        rows = bq_client.execute_query(sql, "app_breakdown")
-        data = [dict(row.items()) for row in rows]
+        data = _arrow_rows(fetch_arrow(sql, "app_breakdown"))
         # Group by media_source/partner + event_date + event_hour for level3
-        app_grouped = {}
         key_name = "partner" if media == "partner" else "media_source"
-        for item in data:
-            key = f"{item[key_name]}_{item['event_date']}_{item['event_hour']}"
-            if key not in app_grouped:
-                app_grouped[key] = []
-            app_grouped[key].append(item)
-        return {"status": "success", "count": len(data), "level3": app_grouped}
+        app_grouped = _group_rows(
+            data, lambda item: f"{item[key_name]}_{item['event_date']}_{item['event_hour']}"
+        )
+        return _json_response({"status": "success", "count": len(data), "level3": app_grouped})
     except Exception as e:
         logging.error(f"Error in get_app_breakdown: {e}")
         return {"status": "error", "message": str(e), "level3": {}}
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Cache Hit Ratio With and Without TinyLFU Admission
+===============================================================
+Replays a query trace through a bounded CacheState the way run_sql uses
+it (lookup, then store on a miss) and compares:
+
+1. lru      - every miss is stored (admission off)
+2. tinylfu  - a full cache only admits results asked more often than
+              the LRU victim (see agents/cache_sql/admission.py)
+
+Trace:
+- Without arguments, a synthetic analyst workload: a skewed set of
+  recurring dashboard / report queries, interleaved with a long tail of
+  one-off exploratory queries that are never repeated, plus periodic
+  bursts of one-off queries (an analyst exploring)
+- With a JSONL chat log (QUESTION_LOG_PATH - see slots.py), the "sql"
+  of every line, keyed by fingerprint_sql
+
+Run:
+    python scripts/bench_admission.py [chat_log.jsonl]
+"""
+
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+import json
+import random
+import time
+
+from agents.cache_sql.tools import CacheState
+from agents.cache_sql.fingerprint import fingerprint_sql
+
+
+RECURRING_QUERIES = 2000
+TRACE_LENGTH = 100000
+ONE_OFF_SHARE = 0.5
+BURST_EVERY = 5000
+BURST_LENGTH = 1500
+CAPACITIES = [100, 250, 500, 1000]
+
+
+# =============================================================================
+# Traces
+# =============================================================================
+
+def synthetic_trace(length: int = TRACE_LENGTH, seed: int = 7) -> list:
+    """Recurring queries (Zipf-like) mixed with never-repeated one-off queries."""
+    rng = random.Random(seed)
+    recurring = [f"recurring {i}" for i in range(RECURRING_QUERIES)]
+    weights = [1.0 / (rank + 1) for rank in range(RECURRING_QUERIES)]
+    trace = []
+    one_off = 0
+    while len(trace) < length:
+        if len(trace) % BURST_EVERY == 0 and trace:
+            # An analyst exploring - a burst of unique questions
+            trace.extend(f"one-off {one_off + i}" for i in range(BURST_LENGTH))
+            one_off += BURST_LENGTH
+        elif rng.random() < ONE_OFF_SHARE:
+            trace.append(f"one-off {one_off}")
+            one_off += 1
+        else:
+            trace.append(rng.choices(recurring, weights=weights)[0])
+    return trace[:length]
+
+
+def log_trace(path: str) -> list:
+    """SQL keys of a JSONL chat log."""
+    trace = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                sql = json.loads(line).get("sql")
+                if sql:
+                    trace.append(fingerprint_sql(sql))
+    return trace
+
+
+# =============================================================================
+# Replay
+# =============================================================================
+
+def replay(trace: list, capacity: int, admission: bool) -> dict:
+    """Replays the trace through a bounded in-memory CacheState."""
+    state = CacheState(max_entries=capacity, max_bytes=0, admission=admission)
+    now = time.time()
+    hits = 0
+    for key in trace:
+        value, _ = state.get_fresh(state.cache, key, now)
+        if value is not None:
+            hits += 1
+        elif state.admit(state.cache, key):
+            state.put(state.cache, key, {"sql": key, "rows": [{"total_clicks": 1}]}, now)
+    return {
+        "hit_ratio": hits / len(trace),
+        "evictions": state.policy.evictions,
+        "rejected": state.admission.rejected if state.admission is not None else 0,
+    }
+
+
+def main():
+    if len(sys.argv) > 1:
+        trace = log_trace(sys.argv[1])
+        source = sys.argv[1]
+    else:
+        trace = synthetic_trace()
+        source = "synthetic analyst workload"
+    if not trace:
+        print("No queries in the trace.")
+        return
+
+    print("=" * 78)
+    print(f"  CACHE ADMISSION REPLAY - {len(trace)} queries ({source})")
+    print(f"  distinct keys: {len(set(trace))}")
+    print("=" * 78)
+    print(f"  {'capacity':>9}{'lru hit':>12}{'tinylfu hit':>14}{'lru evict':>12}{'tinylfu evict':>15}{'rejected':>10}")
+    print("-" * 78)
+    for capacity in CAPACITIES:
+        lru = replay(trace, capacity, admission=False)
+        tinylfu = replay(trace, capacity, admission=True)
+        print(
+            f"  {capacity:>9}{lru['hit_ratio']:>12.1%}{tinylfu['hit_ratio']:>14.1%}"
+            f"{lru['evictions']:>12}{tinylfu['evictions']:>15}{tinylfu['rejected']:>10}"
+        )
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
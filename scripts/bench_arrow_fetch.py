@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Dashboard Table Fetch: REST Rows vs Arrow Batches
+==============================================================
+The anomaly dashboards read whole tables (*_anomaly_all_clicks,
+*_app_root_cause). Compares the client-side cost of the two fetch paths
+on a table of the all_clicks shape (media_source, event_date,
+event_hour, total_clicks):
+
+1. rest rows      - what RowIterator does: JSON pages parsed, every cell
+                    converted (_rows_from_json), Row objects, then
+                    dict(row.items()) in api.py (before)
+2. arrow -> dicts - Arrow IPC record batches (what the Storage Read API
+                    streams) read and turned into dicts with to_pylist
+                    (api.py now - the JSON response needs dicts)
+3. arrow columnar - the same batches consumed directly: clicks per
+                    media_source with pyarrow.compute, no Python rows
+
+Network time is not included - both payloads are prepared up front.
+
+Run:
+    python scripts/bench_arrow_fetch.py [rows]
+"""
+
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+import json
+import time
+from datetime import date, timedelta
+
+import pyarrow as pa
+from google.cloud.bigquery import SchemaField
+from google.cloud.bigquery._helpers import _rows_from_json
+
+
+DEFAULT_ROWS = 200000
+REST_PAGE_ROWS = 10000
+MEDIA_SOURCES = [f"media_source_{i}" for i in range(60)]
+SCHEMA = [
+    SchemaField("media_source", "STRING"),
+    SchemaField("event_date", "DATE"),
+    SchemaField("event_hour", "INTEGER"),
+    SchemaField("total_clicks", "INTEGER"),
+]
+
+
+# =============================================================================
+# Payloads
+# =============================================================================
+
+def table_columns(rows: int) -> dict:
+    first = date(2025, 1, 1)
+    return {
+        "media_source": [MEDIA_SOURCES[i % len(MEDIA_SOURCES)] for i in range(rows)],
+        "event_date": [first + timedelta(days=(i // 1440) % 90) for i in range(rows)],
+        "event_hour": [(i // len(MEDIA_SOURCES)) % 24 for i in range(rows)],
+        "total_clicks": [(i * 37) % 5000 for i in range(rows)],
+    }
+
+
+def rest_pages(columns: dict) -> list:
+    """tabledata.list style JSON pages ({"f": [{"v": "..."}]} per row)."""
+    names = [field.name for field in SCHEMA]
+    rows = len(columns[names[0]])
+    pages = []
+    for start in range(0, rows, REST_PAGE_ROWS):
+        page = [
+            {"f": [{"v": str(columns[name][i])} for name in names]}
+            for i in range(start, min(start + REST_PAGE_ROWS, rows))
+        ]
+        pages.append(json.dumps({"rows": page}))
+    return pages
+
+
+def arrow_stream(columns: dict) -> bytes:
+    """Arrow IPC stream of record batches (the Storage Read API wire format)."""
+    table = pa.table(columns)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        for batch in table.to_batches(max_chunksize=REST_PAGE_ROWS):
+            writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+# =============================================================================
+# Fetch paths
+# =============================================================================
+
+def read_rest(pages: list) -> int:
+    data = []
+    for page in pages:
+        for row in _rows_from_json(json.loads(page)["rows"], SCHEMA):
+            data.append(dict(row.items()))
+    return len(data)
+
+
+def read_arrow_dicts(payload: bytes) -> int:
+    table = pa.ipc.open_stream(pa.py_buffer(payload)).read_all()
+    return len(table.to_pylist())
+
+
+def read_arrow_columnar(payload: bytes) -> int:
+    table = pa.ipc.open_stream(pa.py_buffer(payload)).read_all()
+    table.group_by("media_source").aggregate([("total_clicks", "sum")])
+    return table.num_rows
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    columns = table_columns(rows)
+    pages = rest_pages(columns)
+    payload = arrow_stream(columns)
+
+    paths = [
+        ("rest rows", lambda: read_rest(pages)),
+        ("arrow -> dicts", lambda: read_arrow_dicts(payload)),
+        ("arrow columnar", lambda: read_arrow_columnar(payload)),
+    ]
+
+    print("=" * 66)
+    print(f"  DASHBOARD TABLE FETCH - {rows:,} rows")
+    print(f"  payload: REST JSON {sum(map(len, pages)) / 1024 ** 2:.1f} MB, Arrow {len(payload) / 1024 ** 2:.1f} MB")
+    print("=" * 66)
+    print(f"  {'path':<18}{'seconds':>10}{'rows/s':>14}{'speedup':>10}")
+    print("-" * 66)
+    baseline = None
+    for name, read in paths:
+        started = time.perf_counter()
+        count = read()
+        elapsed = time.perf_counter() - started
+        assert count == rows, (name, count)
+        baseline = baseline or elapsed
+        print(f"  {name:<18}{elapsed:>10.3f}{rows / elapsed:>14,.0f}{baseline / elapsed:>9.1f}x")
+    print("=" * 66)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Chat Sessions While One BigQuery Query Runs
+========================================================
+Simulates one uvicorn worker: a single event loop serving several chat
+sessions. One session runs a slow BigQuery query (SLOW_SECONDS), the
+others keep asking short questions (half cached, half fast BigQuery
+queries) until it finishes.
+
+Compared execution paths:
+1. blocking - the orchestrator calls run_sql (job.result() on the loop)
+2. async    - the orchestrator awaits run_sql_async (bounded thread pool)
+
+Reported per path:
+- requests the other sessions completed during the slow query
+- their median / max latency
+- the longest event loop stall (a 10 ms ticker measures how late it wakes)
+
+BigQuery is simulated (sleep) - no credentials needed.
+
+Run:
+    python scripts/bench_async_sessions.py
+"""
+
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+import asyncio
+import contextlib
+import io
+import statistics
+import time
+
+import agents.db.tools as db_tools
+from agents.db.tools import RunSQLInput, run_sql, run_sql_async
+
+
+SLOW_SECONDS = 2.0
+FAST_SECONDS = 0.05
+OTHER_SESSIONS = 8
+HOT_QUERIES = 20
+TICK_SECONDS = 0.01
+
+
+class SimulatedBQClient:
+    """BQClient stand-in - queries marked 'slow' take SLOW_SECONDS, others FAST_SECONDS."""
+
+    def execute_query(self, query, query_type):
+        time.sleep(SLOW_SECONDS if "_slow'" in query else FAST_SECONDS)
+        return [{"total_clicks": 1}]
+
+
+def query(mode: str, name: str) -> RunSQLInput:
+    return RunSQLInput(
+        sql=f"SELECT SUM(total_clicks) AS total_clicks FROM `p.d.bench_clicks` WHERE app_id = '{mode}_{name}'"
+    )
+
+
+# =============================================================================
+# Benchmark
+# =============================================================================
+
+async def run_mode(mode: str) -> dict:
+    if mode == "blocking":
+        async def execute(input):
+            return run_sql(input)
+    else:
+        execute = run_sql_async
+
+    # Warm the hot (cached) questions
+    for i in range(HOT_QUERIES):
+        await execute(query(mode, f"hot{i}"))
+
+    slow_done = asyncio.Event()
+    latencies = []
+    stalls = []
+
+    async def slow_session():
+        await asyncio.sleep(TICK_SECONDS)  # let the other sessions start
+        await execute(query(mode, "slow"))
+        slow_done.set()
+
+    async def other_session(session: int):
+        i = 0
+        while not slow_done.is_set():
+            name = f"hot{i % HOT_QUERIES}" if i % 2 else f"s{session}_{i}"
+            started = time.perf_counter()
+            await execute(query(mode, name))
+            latencies.append(time.perf_counter() - started)
+            i += 1
+            await asyncio.sleep(0)
+
+    async def ticker():
+        while not slow_done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(TICK_SECONDS)
+            stalls.append(time.perf_counter() - started - TICK_SECONDS)
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        slow_session(), ticker(), *(other_session(s) for s in range(OTHER_SESSIONS))
+    )
+    return {
+        "elapsed": time.perf_counter() - started,
+        "requests": len(latencies),
+        "median_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "max_ms": max(latencies) * 1000 if latencies else 0.0,
+        "stall_ms": max(stalls) * 1000 if stalls else 0.0,
+    }
+
+
+def main():
+    db_tools._bq_instance = SimulatedBQClient()
+
+    print("=" * 78)
+    print(f"  ONE SLOW QUERY ({SLOW_SECONDS:.1f}s) + {OTHER_SESSIONS} OTHER SESSIONS ON ONE EVENT LOOP")
+    print(f"  pool: BQ_QUERY_WORKERS={db_tools.BQ_QUERY_WORKERS}, fast query {FAST_SECONDS * 1000:.0f} ms")
+    print("=" * 78)
+    print(f"  {'path':<10}{'elapsed s':>10}{'other requests':>16}{'median ms':>11}{'max ms':>10}{'max stall ms':>14}")
+    print("-" * 78)
+    for mode in ("blocking", "async"):
+        with contextlib.redirect_stdout(io.StringIO()):  # [CACHE] logs
+            result = asyncio.run(run_mode(mode))
+        print(
+            f"  {mode:<10}{result['elapsed']:>10.2f}{result['requests']:>16}"
+            f"{result['median_ms']:>11.1f}{result['max_ms']:>10.1f}{result['stall_ms']:>14.1f}"
+        )
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
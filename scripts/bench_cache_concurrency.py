@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Cache Throughput Under Concurrency
+===============================================
+Stress-tests CacheState from many threads (like FastAPI's thread pool)
+and reports throughput as the worker count grows.
+
+Each worker runs a request mix on a skewed key set:
+- 90% get_fresh (atomic get-or-expire)
+- 10% put (insert / refresh)
+with a short TTL and a small capacity, so expiry and LRU eviction
+happen all the time and race with lookups of the same keys.
+
+Compared configurations:
+1. 1 lock stripe   - one global lock
+2. 64 lock stripes - the default (CACHE_LOCK_STRIPES)
+
+After each run the cache is checked for consistency: every entry has a
+timestamp, and the LRU policy tracks exactly the stored entries.
+
+Run:
+    python scripts/bench_cache_concurrency.py
+"""
+
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+import random
+import threading
+import time
+
+from agents.cache_sql.tools import CacheState
+
+
+KEYS = [f"select {i}" for i in range(2000)]
+WEIGHTS = [1.0 / (rank + 1) for rank in range(len(KEYS))]
+OPS_PER_WORKER = 20000
+WORKER_COUNTS = [1, 2, 4, 8, 16]
+
+
+# =============================================================================
+# Benchmark
+# =============================================================================
+
+def worker(state: CacheState, seed: int, barrier: threading.Barrier, counters: list) -> None:
+    rng = random.Random(seed)
+    keys = rng.choices(KEYS, weights=WEIGHTS, k=OPS_PER_WORKER)
+    hits = 0
+    barrier.wait()
+    for key in keys:
+        if rng.random() < 0.9:
+            value, status = state.get_fresh(state.cache, key)
+            hits += status == "hit"
+        else:
+            state.put(state.cache, key, {"sql": key, "rows": [{"clicks": 1}]}, time.time())
+    counters.append(hits)
+
+
+def run(workers: int, stripes: int) -> dict:
+    state = CacheState(max_entries=500, max_bytes=0, ttl_seconds=0.05, lock_stripes=stripes)
+    barrier = threading.Barrier(workers + 1)
+    counters = []
+    threads = [
+        threading.Thread(target=worker, args=(state, seed, barrier, counters))
+        for seed in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    keys = set(state.cache.store)
+    consistent = keys == set(state.ttl.store) and len(state.policy) == len(keys)
+    total_ops = workers * OPS_PER_WORKER
+    return {
+        "ops_per_sec": total_ops / elapsed,
+        "hit_rate": sum(counters) / (total_ops * 0.9),
+        "consistent": consistent,
+    }
+
+
+def main():
+    print("=" * 78)
+    print(f"  CACHE CONCURRENCY BENCHMARK - {OPS_PER_WORKER} ops per worker")
+    print("=" * 78)
+    print(f"  {'workers':<10}{'stripes':>10}{'ops/sec':>14}{'hit rate':>12}{'consistent':>14}")
+    print("-" * 78)
+    for workers in WORKER_COUNTS:
+        for stripes in (1, 64):
+            r = run(workers, stripes)
+            print(
+                f"  {workers:<10}{stripes:>10}{r['ops_per_sec']:>14,.0f}"
+                f"{r['hit_rate']:>11.1%}{'yes' if r['consistent'] else 'NO':>14}"
+            )
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Memory of Cached Result Sets
+=========================================
+Compares the memory of one large cached result in three layouts:
+
+1. list of dicts      - the original rows layout
+2. columnar           - ColumnarRows (Arrow, dictionary-encoded strings)
+3. columnar + zstd    - ColumnarRows with compression
+
+The result is a typical large breakdown: hourly clicks by media_source
+and app over one month.
+
+Metrics:
+- memory: Python heap (tracemalloc) + Arrow buffers (pyarrow allocator)
+- stored: size written by the persistent backend (codec.py)
+- first 20 rows: time to read what format_answer shows
+
+Run:
+    python scripts/bench_cache_memory.py
+"""
+
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+import gc
+import random
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import pyarrow as pa
+
+from agents.cache_sql.codec import encode_value
+from agents.cache_sql.columnar import ColumnarRows
+
+
+MEDIA_SOURCES = ["Facebook Ads", "googleadwords_int", "tiktok_int", "snapchat_int", "applovin_int"]
+APP_IDS = ["com.example.game", "com.example.shop", "id123456789"]
+
+
+# =============================================================================
+# Data Generation
+# =============================================================================
+
+def build_rows(days: int = 30, seed: int = 7) -> list:
+    """
+    Hourly clicks by media_source and app - like BigQuery returns them.
+
+    Every string cell is a separate object, as when rows are decoded
+    from a BigQuery response.
+    """
+    rng = random.Random(seed)
+    start = date(2025, 1, 1)
+    rows = []
+    for day in range(days):
+        for hour in range(24):
+            for media_source in MEDIA_SOURCES:
+                for app_id in APP_IDS:
+                    rows.append({
+                        "event_date": start + timedelta(days=day),
+                        "hr": hour,
+                        "media_source": media_source.encode().decode(),
+                        "app_id": app_id.encode().decode(),
+                        "total_events": rng.randint(0, 50000),
+                        "engaged_ratio": rng.random(),
+                    })
+    return rows
+
+
+# =============================================================================
+# Benchmark
+# =============================================================================
+
+def measure(build) -> tuple:
+    """Returns (object, bytes allocated while building it)."""
+    gc.collect()
+    arrow_before = pa.total_allocated_bytes()
+    tracemalloc.start()
+    obj = build()
+    python_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, python_bytes + pa.total_allocated_bytes() - arrow_before
+
+
+def main():
+    source = build_rows()
+    cells = len(source) * len(source[0])
+
+    # Warm up - the first Arrow conversion loads modules and kernels
+    ColumnarRows.from_rows(source[:10], compression="zstd")
+
+    layouts = [
+        ("list of dicts", build_rows),
+        ("columnar", lambda: ColumnarRows.from_rows(source, compression="none")),
+        ("columnar + zstd", lambda: ColumnarRows.from_rows(source, compression="zstd")),
+    ]
+
+    print("=" * 78)
+    print(f"  CACHED RESULT MEMORY - {len(source)} rows x {len(source[0])} columns")
+    print("=" * 78)
+    print(f"  {'layout':<18}{'memory':>12}{'bytes/cell':>12}{'stored':>12}{'first 20 rows':>16}")
+    print("-" * 78)
+    for name, build in layouts:
+        rows, memory = measure(build)
+        stored = len(encode_value(rows))
+        started = time.perf_counter()
+        rows[:20]
+        read_ms = (time.perf_counter() - started) * 1000
+        print(
+            f"  {name:<18}{memory / 1024:>10.0f}KB{memory / cells:>12.1f}"
+            f"{stored / 1024:>10.0f}KB{read_ms:>14.2f}ms"
+        )
+        del rows
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
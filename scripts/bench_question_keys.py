@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Question Cache Key Hit Rate on Replayed Chat Logs
+==============================================================
+Replays a chat log through the question cache and compares two keys:
+
+1. text  - question_cache_key(final_question) (normalized text)
+2. slots - slot_cache_key(slots) first, text key as fallback
+           (slot entries are only saved when slots_match_sql agrees,
+           as in run_sql)
+
+Chat log format (JSONL, one answered question per line):
+    {"final_question": "...", "slots": {...} or null, "sql": "..."}
+    optional "meaning": id of the logical request (enables ideal / false hits)
+
+Without a log, a built-in sample is replayed: the same requests phrased
+in different English wordings and in Hebrew, as the Intent Agent returns
+them, sampled with a skew (popular questions repeat more).
+
+Metrics:
+- hit rate: share of questions answered from the question cache
+- ideal hit rate: share of questions whose meaning was already asked
+- false hits: hits on a question with a different meaning (wrong result!)
+
+Run:
+    python scripts/bench_question_keys.py [chat_log.jsonl]
+"""
+
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+import json
+import random
+
+from agents.cache_sql.tools import question_cache_key
+from agents.cache_sql.slots import slot_cache_key, slots_match_sql
+
+
+TABLE = "`practicode-2025.clicks_data_prac.partial_encoded_clicks`"
+
+
+# =============================================================================
+# Sample Chat Log
+# =============================================================================
+
+def _request(metric, dimensions, filters, day, phrasings):
+    """One logical request: its slots, its SQL and how users phrase it."""
+    slots = {
+        "metric": metric,
+        "dimensions": dimensions,
+        "filters": [{"field": f, "values": [v]} for f, v in filters],
+        "start_date": day,
+        "end_date": day,
+        "top_n": None,
+    }
+    select = ", ".join(dimensions + ["SUM(total_events) AS total_clicks"])
+    where = " AND ".join(
+        [f"DATE(event_time) = DATE('{day}')", "is_engaged_view = FALSE"] + [f"{f} = '{v}'" for f, v in filters]
+    )
+    sql = f"SELECT {select} FROM {TABLE} WHERE {where}"
+    if dimensions:
+        sql += f" GROUP BY {', '.join(dimensions)}"
+    return [{"final_question": q, "slots": slots, "sql": sql} for q in phrasings]
+
+
+def build_sample(size: int = 1000, seed: int = 11) -> list:
+    """Builds a stream of chat log records with meaning ids."""
+    meanings = []
+    for day, label, hebrew in [
+        ("2025-01-02", "Jan 2 2025", "2.1.2025"),
+        ("2025-01-03", "January 3rd, 2025", "3 בינואר 2025"),
+    ]:
+        meanings.append(_request("clicks", ["media_source"], [], day, [
+            f"clicks by media source on {day}",
+            f"media_source clicks for {label}",
+            f"How many clicks per media source on {day}?",
+            f"כמה קליקים היו לפי מדיה סורס ב-{hebrew}?",
+        ]))
+        meanings.append(_request("clicks", [], [("media_source", "Facebook")], day, [
+            f"total clicks from Facebook on {day}",
+            f"How many Facebook clicks were there on {label}?",
+            f"סה\"כ קליקים מפייסבוק ב-{hebrew}",
+        ]))
+        meanings.append(_request("clicks", ["hr"], [("app_id", "com.example.game")], day, [
+            f"hourly clicks for app com.example.game on {day}",
+            f"clicks per hour, app_id com.example.game, {label}",
+            f"קליקים לפי שעה לאפליקציה com.example.game ב-{hebrew}",
+        ]))
+
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) for rank in range(len(meanings))]
+    stream = []
+    for _ in range(size):
+        meaning_id = rng.choices(range(len(meanings)), weights=weights)[0]
+        record = dict(rng.choice(meanings[meaning_id]))
+        record["meaning"] = meaning_id
+        stream.append(record)
+    return stream
+
+
+def load_log(path: str) -> list:
+    """Reads a JSONL chat log (lines without final_question are skipped)."""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("final_question"):
+                records.append(record)
+    return records
+
+
+# =============================================================================
+# Replay
+# =============================================================================
+
+def replay(stream: list, use_slots: bool) -> dict:
+    """Replays the stream through an unbounded question cache."""
+    saved = {}  # {key: meaning of the question that saved it}
+    seen_meanings = set()
+    hits = false_hits = ideal_hits = slot_hits = 0
+
+    for record in stream:
+        meaning = record.get("meaning")
+        if meaning is not None:
+            if meaning in seen_meanings:
+                ideal_hits += 1
+            seen_meanings.add(meaning)
+
+        text_key = question_cache_key(record["final_question"])
+        slot_key = slot_cache_key(record.get("slots")) if use_slots else None
+        keys = [k for k in (slot_key, text_key) if k]
+
+        hit_key = next((k for k in keys if k in saved), None)
+        if hit_key is not None:
+            hits += 1
+            slot_hits += hit_key == slot_key
+            if meaning is not None and saved[hit_key] != meaning:
+                false_hits += 1
+            continue
+
+        saved[text_key] = meaning
+        sql = record.get("sql")
+        if slot_key and sql and slots_match_sql(record["slots"], sql):
+            saved[slot_key] = meaning
+
+    has_meanings = bool(seen_meanings)
+    return {
+        "hit_rate": hits / len(stream),
+        "ideal_hit_rate": ideal_hits / len(stream) if has_meanings else None,
+        "false_hits": false_hits if has_meanings else None,
+        "slot_hits": slot_hits,
+        "distinct_keys": len(saved),
+    }
+
+
+def _percent(value) -> str:
+    return f"{value:.1%}" if value is not None else "n/a"
+
+
+def main():
+    if len(sys.argv) > 1:
+        stream = load_log(sys.argv[1])
+        source = sys.argv[1]
+    else:
+        stream = build_sample()
+        source = "built-in sample"
+    if not stream:
+        print("No questions in the log.")
+        return
+
+    print("=" * 78)
+    print(f"  QUESTION CACHE KEY REPLAY - {len(stream)} questions ({source})")
+    print("=" * 78)
+    print(f"  {'key':<10}{'hit rate':>10}{'ideal':>10}{'false hits':>12}{'slot hits':>11}{'keys':>8}")
+    print("-" * 78)
+    for name, use_slots in [("text", False), ("slots", True)]:
+        r = replay(stream, use_slots)
+        false_hits = r["false_hits"] if r["false_hits"] is not None else "n/a"
+        print(
+            f"  {name:<10}{_percent(r['hit_rate']):>10}{_percent(r['ideal_hit_rate']):>10}"
+            f"{false_hits:>12}{r['slot_hits']:>11}{r['distinct_keys']:>8}"
+        )
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
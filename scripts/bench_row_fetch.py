@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Peak Memory of Reading a Query Result
+==================================================
+Measures (tracemalloc) the peak Python memory of reading one large
+result, simulated as a RowIterator whose pages are generated lazily
+(as BigQuery sends them):
+
+1. list of dicts         - [dict(row) for row in result] (before)
+2. list -> columnar      - the list, then ColumnarRows.from_rows (cache path before)
+3. pages -> columnar     - ColumnarRows.from_pages(StreamingRows.pages()) (cache path now)
+4. head(20)              - StreamingRows.head for a chat answer (uncached path now)
+
+tracemalloc only sees Python objects - Arrow buffers are reported
+separately (bytes the result holds in the Arrow memory pool).
+
+Run:
+    python scripts/bench_row_fetch.py [rows] [page_size]
+"""
+
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+import time
+import tracemalloc
+
+import pyarrow as pa
+
+from agents.cache_sql.columnar import ColumnarRows
+from agents.db.streaming import StreamingRows
+
+
+DEFAULT_ROWS = 200000
+DEFAULT_PAGE_SIZE = 1000
+MEDIA_SOURCES = [f"media_source_{i}" for i in range(40)]
+
+
+class SimulatedResult:
+    """RowIterator stand-in - each page is built when it is fetched."""
+
+    def __init__(self, rows: int, page_size: int):
+        self.total_rows = rows
+        self.page_size = page_size
+
+    @property
+    def pages(self):
+        for start in range(0, self.total_rows, self.page_size):
+            yield [
+                {
+                    "media_source": MEDIA_SOURCES[i % len(MEDIA_SOURCES)],
+                    "event_date": f"2025-01-{1 + i % 28:02d}",
+                    "event_hour": i % 24,
+                    "total_clicks": i * 7,
+                }
+                for i in range(start, min(start + self.page_size, self.total_rows))
+            ]
+
+    def __iter__(self):
+        for page in self.pages:
+            yield from page
+
+
+def measure(read) -> tuple:
+    """Runs read() and returns (peak Python MB, Arrow MB held, seconds, rows kept)."""
+    arrow_before = pa.total_allocated_bytes()
+    tracemalloc.start()
+    started = time.perf_counter()
+    kept = read()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    arrow_mb = (pa.total_allocated_bytes() - arrow_before) / 1024 ** 2
+    return peak / 1024 ** 2, arrow_mb, elapsed, len(kept)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    page_size = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_PAGE_SIZE
+
+    strategies = [
+        ("list of dicts", lambda: [dict(row) for row in SimulatedResult(rows, page_size)]),
+        ("list -> columnar", lambda: ColumnarRows.from_rows([dict(row) for row in SimulatedResult(rows, page_size)])),
+        ("pages -> columnar", lambda: ColumnarRows.from_pages(StreamingRows(SimulatedResult(rows, page_size)).pages())),
+        ("head(20)", lambda: StreamingRows(SimulatedResult(rows, page_size)).head(20)),
+    ]
+
+    print("=" * 70)
+    print(f"  PEAK MEMORY OF READING {rows:,} ROWS (page size {page_size:,})")
+    print("=" * 70)
+    print(f"  {'strategy':<20}{'python peak MB':>15}{'arrow MB':>10}{'seconds':>10}{'rows kept':>12}")
+    print("-" * 70)
+    for name, read in strategies:
+        peak_mb, arrow_mb, seconds, kept = measure(read)
+        print(f"  {name:<20}{peak_mb:>15.1f}{arrow_mb:>10.1f}{seconds:>10.2f}{kept:>12,}")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
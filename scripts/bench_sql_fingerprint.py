@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Benchmark - SQL Cache Key Hit Rate
+===================================
+Compares the SQL-layer cache key functions on a corpus of generated queries:
+
+1. lowercase_sql   - lowercase + whitespace collapse (original key)
+2. normalize_sql   - same, but string literals keep their case
+3. fingerprint_sql - canonical AST form (new SQL-layer key)
+
+The corpus contains the query shapes the NL2SQL agent produces, each
+written in several equivalent ways the LLM mixes between calls:
+aliases, predicate order, redundant parentheses, DATE('...') vs '...',
+keyword case. It also contains queries that differ only by literal case
+('Facebook' vs 'facebook') - these must NOT share a key.
+
+Metrics:
+- hit rate: share of queries whose key was already seen
+- ideal hit rate: share of queries whose meaning was already seen
+- false hits: key hits on a query with a different meaning (wrong result!)
+
+Run:
+    python scripts/bench_sql_fingerprint.py
+"""
+
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+import random
+import time
+
+from agents.cache_sql.tools import normalize_sql
+from agents.cache_sql.fingerprint import fingerprint_sql
+
+
+TABLE = "`practicode-2025.clicks_data_prac.optimized_clicks`"
+
+MEDIA_SOURCES = ["Facebook", "facebook", "googleadwords_int", "tiktok_int", "snapchat_int"]
+DATES = ["2025-01-01", "2025-01-02", "2025-01-03"]
+DIMENSIONS = ["media_source", "hr", "app_id"]
+
+
+# =============================================================================
+# Corpus Generation
+# =============================================================================
+
+def _date_filter(column: str, day: str, style: int) -> str:
+    """Equivalent ways of writing a single-day filter."""
+    return [
+        f"DATE({column}) = DATE('{day}')",
+        f"DATE({column}) = '{day}'",
+        f"(DATE({column}) = DATE('{day}'))",
+        f"DATE '{day}' = DATE({column})",
+    ][style]
+
+
+def _total_clicks_variants(media: str, day: str) -> list:
+    """Total clicks for one media source on one day."""
+    variants = []
+    for style in range(4):
+        date_filter = _date_filter("event_time", day, style)
+        variants.append(
+            f"SELECT SUM(total_events) AS total_clicks FROM {TABLE} "
+            f"WHERE {date_filter} AND media_source = '{media}' AND is_engaged_view = FALSE"
+        )
+        variants.append(
+            f"select sum(c.total_events) as total_clicks from {TABLE} c "
+            f"where c.is_engaged_view = false and c.media_source = '{media}' and "
+            f"{_date_filter('c.event_time', day, style)}"
+        )
+    return variants
+
+
+def _breakdown_variants(dimension: str, day: str) -> list:
+    """Clicks by one dimension on one day."""
+    variants = []
+    for style in range(4):
+        date_filter = _date_filter("event_time", day, style)
+        variants.append(
+            f"SELECT {dimension}, SUM(total_events) AS total_clicks FROM {TABLE} "
+            f"WHERE {date_filter} AND is_engaged_view = FALSE "
+            f"GROUP BY {dimension} ORDER BY {dimension}"
+        )
+        variants.append(
+            f"SELECT t.{dimension}, SUM(t.total_events) AS total_clicks\n"
+            f"FROM {TABLE} AS t\n"
+            f"WHERE (t.is_engaged_view = FALSE) AND ({_date_filter('t.event_time', day, style)})\n"
+            f"GROUP BY t.{dimension}\nORDER BY t.{dimension}"
+        )
+    return variants
+
+
+def _range_variants(media: str, start: str, end: str) -> list:
+    """Clicks over a date range for one media source."""
+    return [
+        f"SELECT SUM(total_events) AS total_clicks FROM {TABLE} "
+        f"WHERE DATE(event_time) BETWEEN DATE('{start}') AND DATE('{end}') "
+        f"AND media_source = '{media}' AND is_engaged_view = FALSE",
+        f"SELECT SUM(total_events) AS total_clicks FROM {TABLE} "
+        f"WHERE is_engaged_view = FALSE AND media_source = '{media}' "
+        f"AND DATE(event_time) BETWEEN '{start}' AND '{end}'",
+        f"SELECT SUM(x.total_events) AS total_clicks FROM {TABLE} x "
+        f"WHERE ('{media}' = x.media_source) AND (DATE(x.event_time) BETWEEN DATE('{start}') AND DATE('{end}')) "
+        f"AND (x.is_engaged_view = FALSE)",
+    ]
+
+
+def build_corpus(size: int = 2000, seed: int = 7) -> list:
+    """
+    Builds a stream of (meaning_id, sql) pairs.
+
+    Each meaning is one logical question; its variants are the
+    equivalent SQL texts. The stream samples meanings with a skew
+    (popular questions repeat more), then picks a random variant.
+    """
+    meanings = []
+    for media in MEDIA_SOURCES:
+        for day in DATES:
+            meanings.append(_total_clicks_variants(media, day))
+        meanings.append(_range_variants(media, DATES[0], DATES[-1]))
+    for dimension in DIMENSIONS:
+        for day in DATES:
+            meanings.append(_breakdown_variants(dimension, day))
+
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) for rank in range(len(meanings))]
+    stream = []
+    for _ in range(size):
+        meaning_id = rng.choices(range(len(meanings)), weights=weights)[0]
+        stream.append((meaning_id, rng.choice(meanings[meaning_id])))
+    return stream
+
+
+# =============================================================================
+# Benchmark
+# =============================================================================
+
+def lowercase_sql(sql: str) -> str:
+    """The original normalize_sql - lowercases everything, literals included."""
+    return " ".join(sql.lower().split())
+
+
+def replay(stream: list, key_func) -> dict:
+    """Replays the stream through an unbounded cache keyed by key_func."""
+    seen_keys = {}      # {key: meaning_id of the first query}
+    seen_meanings = set()
+    hits = false_hits = ideal_hits = 0
+
+    started = time.perf_counter()
+    keys = [key_func(sql) for _, sql in stream]
+    elapsed = time.perf_counter() - started
+
+    for (meaning_id, _), key in zip(stream, keys):
+        if meaning_id in seen_meanings:
+            ideal_hits += 1
+        seen_meanings.add(meaning_id)
+
+        if key in seen_keys:
+            hits += 1
+            if seen_keys[key] != meaning_id:
+                false_hits += 1
+        else:
+            seen_keys[key] = meaning_id
+
+    return {
+        "hit_rate": hits / len(stream),
+        "ideal_hit_rate": ideal_hits / len(stream),
+        "false_hits": false_hits,
+        "distinct_keys": len(seen_keys),
+        "us_per_key": elapsed / len(stream) * 1e6,
+    }
+
+
+def main():
+    stream = build_corpus()
+    print("=" * 78)
+    print(f"  SQL CACHE KEY BENCHMARK - {len(stream)} generated queries")
+    print("=" * 78)
+    print(f"  {'key function':<18}{'hit rate':>10}{'ideal':>10}{'false hits':>12}{'keys':>8}{'us/key':>10}")
+    print("-" * 78)
+    key_funcs = [
+        ("lowercase_sql", lowercase_sql),
+        ("normalize_sql", normalize_sql),
+        ("fingerprint_sql", fingerprint_sql),
+    ]
+    for name, key_func in key_funcs:
+        r = replay(stream, key_func)
+        print(
+            f"  {name:<18}{r['hit_rate']:>9.1%}{r['ideal_hit_rate']:>10.1%}"
+            f"{r['false_hits']:>12}{r['distinct_keys']:>8}{r['us_per_key']:>10.0f}"
+        )
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
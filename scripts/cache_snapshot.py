@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Cache Snapshot CLI
+==================
+Exports / imports cache snapshots of the persistent cache (CACHE_DB_PATH).
+
+Use it to seed a new node's cache file before it starts, or to keep a
+snapshot of a node's cache. Running nodes also serve snapshots over HTTP
+(GET /cache/snapshot) and load one at startup (CACHE_SNAPSHOT_SOURCE) -
+both need CACHE_SNAPSHOT_TOKEN, which is also sent when importing a URL.
+
+Run:
+    python scripts/cache_snapshot.py export cache.snapshot
+    python scripts/cache_snapshot.py import cache.snapshot
+    python scripts/cache_snapshot.py import http://node-1:8000/cache/snapshot
+"""
+
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+import argparse
+
+from agents.cache_sql.tools import get_global_cache_state
+from agents.cache_sql.snapshot import export_snapshot, load_snapshot, CACHE_SNAPSHOT_PATH
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export / import cache snapshots")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("source", nargs="?", default=CACHE_SNAPSHOT_PATH,
+                        help="Snapshot file (or URL for import)")
+    args = parser.parse_args()
+
+    state = get_global_cache_state()
+    if state.backend is None:
+        print("⚠️  CACHE_DB_PATH is not set - the cache is in memory only")
+
+    if args.command == "export":
+        entries = export_snapshot(state, args.source)
+        print(f"✅ Exported {entries} entries to {args.source}")
+    else:
+        counters = load_snapshot(state, args.source)
+        state.flush()
+        print(f"✅ Imported {counters['loaded']} entries ({counters['skipped']} skipped) from {args.source}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
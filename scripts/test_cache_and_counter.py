@@ -682,6 +682,20 @@ def test_is_cacheable():
             if assert_true(result, f"Cacheable: {sql[:50]}..."):
                 passed += 1
         
+        print_subtest("Today's partition follows the given TTL policy")
+        
+        from agents.cache_sql.dates import utc_today
+        from agents.cache_sql.ttl_policy import TTLPolicy
+        
+        today_sql = IsCacheableInput(sql=f"SELECT * FROM clicks WHERE date = '{utc_today().isoformat()}'")
+        total += 1
+        if assert_equals(
+            [is_cacheable_impl(today_sql, TTLPolicy(1000, live_seconds=60)),
+             is_cacheable_impl(today_sql, TTLPolicy(1000, live_seconds=0))],
+            [True, False], "Cached only with a live TTL"
+        ):
+            passed += 1
+        
     except Exception as e:
         print(f"   ❌ Exception: {e}")
         import traceback
@@ -761,6 +775,2978 @@ def test_cache_stats():
     return passed, total
 
 
+# =============================================================================
+# Test 8: Persistent Cache Backend
+# =============================================================================
+
+def test_persistent_backend():
+    """
+    בדיקה 8: קאש שנשמר בדיסק
+    
+    בודק שהקאש שורד "הפעלה מחדש" (יצירת CacheState חדש על אותו קובץ),
+    ושהערכים נטענים בעצלות רק כשניגשים אליהם.
+    """
+    print_test_header("Persistent Cache Backend")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        import os
+        import tempfile
+        from agents.cache_sql.tools import CacheState, normalize_question
+        from agents.cache_sql.storage import SQLiteBackend
+        
+        db_path = os.path.join(tempfile.mkdtemp(), "cache.db")
+        
+        print_subtest("Write entries and flush")
+        
+        state = CacheState(backend=SQLiteBackend(db_path, batch_size=1000))
+        key = normalize_question("How many clicks on 2025-01-02?")
+        state.question_cache[key] = {"rows": [{"total_clicks": 42}]}
+        state.question_ttl[key] = time.time()
+        
+        total += 1
+        if assert_in(key, state.question_cache, "Unflushed entry is visible"):
+            passed += 1
+        
+        state.backend.close()
+        
+        print_subtest("Entries survive restart")
+        
+        restarted = CacheState(backend=SQLiteBackend(db_path))
+        
+        total += 1
+        if assert_in(key, restarted.question_cache, "Key loaded after restart"):
+            passed += 1
+        
+        total += 1
+        if assert_false(key in restarted.question_cache.store._values,
+                        "Value not loaded before first access (lazy)"):
+            passed += 1
+        
+        total += 1
+        if assert_equals(restarted.question_cache[key]["rows"][0]["total_clicks"], 42,
+                         "Value loaded on access"):
+            passed += 1
+        
+        total += 1
+        if assert_equals(restarted.backend_name, "sqlite", "Backend name reported"):
+            passed += 1
+        
+        print_subtest("Deletes are persisted")
+        
+        restarted.question_cache.pop(key, None)
+        restarted.question_ttl.pop(key, None)
+        restarted.backend.close()
+        
+        reopened = CacheState(backend=SQLiteBackend(db_path))
+        total += 1
+        if assert_false(key in reopened.question_cache, "Deleted key is gone after restart"):
+            passed += 1
+        reopened.backend.close()
+        
+        print_subtest("Buffered writes are flushed without another write")
+        
+        import pickle
+        import sqlite3
+        from decimal import Decimal
+        from datetime import date
+        from agents.cache_sql.codec import CODEC_MAGIC
+        
+        backend = SQLiteBackend(db_path, batch_size=1000, flush_interval=0.05)
+        value = {"rows": [{"day": date(2025, 1, 2), "cost": Decimal("1.50")}], "sources": ("t",)}
+        backend.put("cache", "k", value)
+        time.sleep(0.3)
+        raw = sqlite3.connect(db_path).execute(
+            "SELECT value FROM cache_values WHERE namespace = 'cache' AND key = 'k'"
+        ).fetchone()
+        total += 1
+        if assert_true(raw is not None and raw[0].startswith(CODEC_MAGIC), "Flushed by the timer, not pickled"):
+            passed += 1
+        
+        print_subtest("Stored values are data only")
+        
+        class Payload:
+            def __reduce__(self):
+                return (print, ("pickle payload ran",))
+        
+        with backend._lock:
+            backend._conn.execute(
+                "INSERT OR REPLACE INTO cache_values VALUES ('cache', 'evil', ?)", (pickle.dumps(Payload()),)
+            )
+        total += 1
+        if assert_equals(backend.get("cache", "k"), value, "Dates, decimals and tuples round-trip"):
+            passed += 1
+        total += 1
+        try:
+            backend.get("cache", "evil")
+            print("   ❌ Pickled value was loaded")
+        except KeyError:
+            print("   ✅ Pickled value is treated as missing")
+            passed += 1
+        backend.close()
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+# =============================================================================
+# Test 9: Bounded LRU Eviction
+# =============================================================================
+
+def test_lru_eviction():
+    """
+    בדיקה 9: פינוי LRU מוגבל בגודל
+    
+    בודק ששתי שכבות הקאש חולקות תקציב אחד (רשומות ובתים),
+    שהרשומה שהכי פחות בשימוש מפונה ראשונה, ושהסטטיסטיקות מתעדכנות.
+    """
+    print_test_header("Bounded LRU Eviction")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        from agents.cache_sql.tools import CacheState
+        from agents.cache_sql.eviction import estimate_result_bytes
+        
+        print_subtest("Entry budget shared by both layers")
+        
+        state = CacheState(max_entries=3, max_bytes=0)
+        now = time.time()
+        for name in ["q1", "q2"]:
+            state.question_cache[name] = {"rows": [{"x": 1}]}
+            state.question_ttl[name] = now
+        state.cache["s1"] = {"rows": [{"x": 1}]}
+        state.ttl["s1"] = now
+        
+        # גישה ל-q1 הופכת אותו לחדש - q2 הוא עכשיו הכי ישן
+        _ = state.question_cache["q1"]
+        state.cache["s2"] = {"rows": [{"x": 2}]}
+        state.ttl["s2"] = now
+        
+        total += 1
+        if assert_false("q2" in state.question_cache, "Least recently used entry evicted"):
+            passed += 1
+        
+        total += 1
+        if assert_false("q2" in state.question_ttl, "Evicted entry TTL removed"):
+            passed += 1
+        
+        total += 1
+        if assert_true("q1" in state.question_cache and "s2" in state.cache,
+                       "Recently used entries kept"):
+            passed += 1
+        
+        total += 1
+        if assert_equals(state.policy.evictions, 1, "Eviction counted"):
+            passed += 1
+        
+        print_subtest("Byte budget")
+        
+        big = {"rows": [{"media_source": "facebook_int", "total_clicks": i} for i in range(1000)]}
+        size = estimate_result_bytes(big)
+        
+        total += 1
+        if assert_true(size > 1000 * 28, "Size estimate grows with row count"):
+            passed += 1
+        
+        state = CacheState(max_entries=0, max_bytes=int(size * 1.5))
+        state.cache["a"] = big
+        state.cache["b"] = big
+        
+        total += 1
+        if assert_false("a" in state.cache, "Entry evicted when bytes exceed budget"):
+            passed += 1
+        
+        total += 1
+        if assert_true(state.policy.total_bytes <= state.policy.max_bytes,
+                       "Total bytes within budget"):
+            passed += 1
+        
+        print_subtest("Eviction stats in get_cache_stats")
+        
+        from agents.cache_sql.tools import get_cache_stats
+        stats = get_cache_stats()
+        
+        total += 1
+        if assert_true(all(k in stats for k in ("evictions", "estimated_bytes", "max_bytes")),
+                       "Stats include eviction counters"):
+            passed += 1
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+# =============================================================================
+# Test 10: Expiry Index and Sweeper
+# =============================================================================
+
+def test_expiry_sweeper():
+    """
+    בדיקה 10: אינדקס תפוגה וניקוי ברקע
+    
+    בודק שרשומות שפג תוקפן נמחקות בלי שמישהו ישאל עליהן שוב,
+    שרשומה שרועננה לא נמחקת, ושהמשימה האסינכרונית מנקה ברקע.
+    """
+    print_test_header("Expiry Index and Sweeper")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        import asyncio
+        from agents.cache_sql.tools import CacheState
+        from agents.cache_sql.expiry import run_expiry_sweeper
+        
+        print_subtest("purge_expired removes only expired entries")
+        
+        state = CacheState(ttl_seconds=10)
+        now = time.time()
+        state.question_cache["old"] = {"rows": []}
+        state.question_ttl["old"] = now - 20
+        state.cache["fresh"] = {"rows": []}
+        state.ttl["fresh"] = now
+        
+        purged = state.purge_expired(now)
+        
+        total += 1
+        if assert_equals(purged, 1, "One expired entry purged"):
+            passed += 1
+        
+        total += 1
+        if assert_false("old" in state.question_cache or "old" in state.question_ttl,
+                        "Expired entry and TTL removed"):
+            passed += 1
+        
+        total += 1
+        if assert_in("fresh", state.cache, "Fresh entry kept"):
+            passed += 1
+        
+        print_subtest("Refreshed entry is not purged by its old heap item")
+        
+        state.cache["k"] = {"rows": []}
+        state.ttl["k"] = now - 20
+        state.ttl["k"] = now  # רענון
+        
+        total += 1
+        if assert_equals(state.purge_expired(now), 0, "Stale heap item skipped"):
+            passed += 1
+        
+        total += 1
+        if assert_in("k", state.cache, "Refreshed entry kept"):
+            passed += 1
+        
+        print_subtest("Heap grows with the cache, not with the writes")
+        
+        bounded = CacheState(ttl_seconds=10, max_entries=50)
+        for i in range(2000):
+            bounded.cache[f"s{i % 100}"] = {"rows": []}
+            bounded.ttl[f"s{i % 100}"] = now + i  # שמירה חוזרת / פינוי LRU
+        
+        total += 1
+        if assert_true(len(bounded.expiry) <= 3 * len(bounded.ttl) + 64,
+                       f"Heap compacted ({len(bounded.expiry)} items for {len(bounded.ttl)} entries)"):
+            passed += 1
+        
+        total += 1
+        if assert_equals(bounded.expiry.live, len(bounded.ttl), "Evicted entries dropped from the index"):
+            passed += 1
+        
+        print_subtest("Background sweeper task")
+        
+        async def run_sweeper_briefly():
+            task = asyncio.create_task(run_expiry_sweeper(state, interval=0.01, batch_size=2))
+            await asyncio.sleep(0.1)
+            task.cancel()
+        
+        import threading
+        purge_threads = []
+        original_purge = state.purge_expired
+        def purge(now, limit):
+            purge_threads.append(threading.current_thread())
+            return original_purge(now, limit)
+        state.purge_expired = purge
+        
+        for i in range(5):
+            state.question_cache[f"q{i}"] = {"rows": []}
+            state.question_ttl[f"q{i}"] = time.time() - 20
+        try:
+            asyncio.run(run_sweeper_briefly())
+        finally:
+            del state.purge_expired
+        
+        total += 1
+        if assert_equals(len(state.question_cache), 0, "Sweeper purged expired entries in batches"):
+            passed += 1
+        
+        total += 1
+        if assert_true(purge_threads and threading.main_thread() not in purge_threads,
+                       "Batches purged off the event loop"):
+            passed += 1
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+# =============================================================================
+# Test 11: SQL Fingerprint
+# =============================================================================
+
+def test_sql_fingerprint():
+    """
+    בדיקה 11: טביעת אצבע קנונית ל-SQL
+    
+    בודק ששאילתות שקולות (כינויים, סדר תנאים, סוגריים, DATE('...'))
+    מקבלות אותו מפתח, ושליטרלים שונים באותיות (Facebook/facebook) לא מתנגשים.
+    """
+    print_test_header("SQL Fingerprint")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        from agents.cache_sql.fingerprint import fingerprint_sql
+        from agents.cache_sql.tools import normalize_sql
+        
+        table = "`practicode-2025.clicks_data_prac.optimized_clicks`"
+        base = (
+            f"SELECT media_source, SUM(total_events) AS total_clicks FROM {table} "
+            "WHERE DATE(event_time) = DATE('2025-01-02') AND is_engaged_view = FALSE "
+            "GROUP BY media_source"
+        )
+        
+        print_subtest("Equivalent queries share one key")
+        
+        equivalents = [
+            ("alias", f"select c.media_source, sum(c.total_events) as total_clicks from {table} c "
+                      "where DATE(c.event_time) = DATE('2025-01-02') and c.is_engaged_view = false "
+                      "group by c.media_source"),
+            ("predicate order", f"SELECT media_source, SUM(total_events) AS total_clicks FROM {table} "
+                                "WHERE is_engaged_view = FALSE AND DATE(event_time) = DATE('2025-01-02') "
+                                "GROUP BY media_source"),
+            ("parentheses", f"SELECT media_source, SUM(total_events) AS total_clicks FROM {table} "
+                            "WHERE (DATE(event_time) = DATE('2025-01-02')) AND (is_engaged_view = FALSE) "
+                            "GROUP BY media_source"),
+            ("date literal", f"SELECT media_source, SUM(total_events) AS total_clicks FROM {table} "
+                             "WHERE DATE(event_time) = '2025-01-02' AND is_engaged_view = FALSE "
+                             "GROUP BY media_source"),
+        ]
+        for name, sql in equivalents:
+            total += 1
+            if assert_equals(fingerprint_sql(sql), fingerprint_sql(base), f"Same key ({name})"):
+                passed += 1
+        
+        print_subtest("Literal case is preserved")
+        
+        q_upper = f"SELECT SUM(total_events) FROM {table} WHERE media_source = 'Facebook'"
+        q_lower = f"SELECT SUM(total_events) FROM {table} WHERE media_source = 'facebook'"
+        
+        total += 1
+        if assert_true(fingerprint_sql(q_upper) != fingerprint_sql(q_lower),
+                       "'Facebook' and 'facebook' get different fingerprints"):
+            passed += 1
+        
+        total += 1
+        if assert_true(normalize_sql(q_upper) != normalize_sql(q_lower),
+                       "normalize_sql keeps literal case too"):
+            passed += 1
+        
+        print_subtest("Precedence-changing parentheses are kept")
+        
+        total += 1
+        if assert_true(
+            fingerprint_sql("SELECT a FROM t WHERE (x = 1 OR y = 2) AND z = 3")
+            != fingerprint_sql("SELECT a FROM t WHERE x = 1 OR y = 2 AND z = 3"),
+            "(x OR y) AND z differs from x OR (y AND z)"
+        ):
+            passed += 1
+        
+        total += 1
+        if assert_true(
+            fingerprint_sql("SELECT a FROM t WHERE (b = c) = d")
+            != fingerprint_sql("SELECT a FROM t WHERE b = (c = d)"),
+            "(b = c) = d differs from b = (c = d)"
+        ):
+            passed += 1
+        
+        print_subtest("Projected DATE literals keep their type")
+        
+        total += 1
+        if assert_true(
+            fingerprint_sql("SELECT DATE('2025-01-02') AS d, SUM(x) AS s FROM t GROUP BY d")
+            != fingerprint_sql("SELECT '2025-01-02' AS d, SUM(x) AS s FROM t GROUP BY d"),
+            "DATE column differs from STRING column"
+        ):
+            passed += 1
+        
+        print_subtest("Unparseable SQL falls back to normalize_sql")
+        
+        broken = "SELECT FROM WHERE (("
+        total += 1
+        if assert_equals(fingerprint_sql(broken), normalize_sql(broken), "Fallback key"):
+            passed += 1
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+# =============================================================================
+# Test 12: Orchestrator Short-Circuit on Question Cache Hit
+# =============================================================================
+
+class FakeSubAgent:
+    """מדמה סוכן ADK - רושם קריאות ומעדכן את ה-state בלי לקרוא ל-LLM"""
+    def __init__(self, state_key: str = None, value: dict = None):
+        self.calls = 0
+        self.state_key = state_key
+        self.value = value
+
+    async def run_async(self, context):
+        self.calls += 1
+        if self.state_key:
+            context.session.state[self.state_key] = self.value
+        return
+        yield
+
+
+def test_orchestrator_cache_shortcut():
+    """
+    בדיקה 12: קיצור דרך באורקסטרטור
+    
+    כששאלה כבר בקאש, האורקסטרטור עונה מיד אחרי סוכן הכוונה
+    ולא מפעיל את סוכן הולידציה ואת NL2SQL.
+    """
+    print_test_header("Orchestrator Cache Shortcut")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        import asyncio
+        import agent as orchestrator_module
+        from agents.cache_sql.tools import get_global_cache_state, normalize_question
+        
+        question = "How many clicks from Facebook on 2025-01-02?"
+        cache_state = get_global_cache_state()
+        cache_state.question_cache.clear()
+        cache_state.question_ttl.clear()
+        
+        intent = FakeSubAgent("intent_result", {
+            "status": "improved", "message_to_user": "", "final_question": question
+        })
+        validation = FakeSubAgent("validation_result", {"status": "approved"})
+        nl2sql = FakeSubAgent("nl2sql_output", {"sql_query": "FALLBACK_NO_EXECUTION"})
+        
+        originals = (
+            orchestrator_module.intent_recognition_agent,
+            orchestrator_module.validation_agent,
+            orchestrator_module.nl2sql_agent,
+        )
+        orchestrator_module.intent_recognition_agent = intent
+        orchestrator_module.validation_agent = validation
+        orchestrator_module.nl2sql_agent = nl2sql
+        
+        async def collect(context):
+            events = []
+            async for ev in orchestrator_module.root_agent._run_async_impl(context):
+                events.append(ev.content.parts[0].text)
+            return events
+        
+        try:
+            print_subtest("Cache miss runs the full pipeline")
+            
+            asyncio.run(collect(MockContext(question)))
+            total += 1
+            if assert_equals((validation.calls, nl2sql.calls), (1, 1),
+                             "Validation and NL2SQL called on miss"):
+                passed += 1
+            
+            print_subtest("Cache hit skips Validation and NL2SQL")
+            
+            key = normalize_question(question)
+            cache_state.question_cache[key] = {"sql": "SELECT 1", "rows": [{"total_clicks": 1234}]}
+            cache_state.question_ttl[key] = time.time()
+            
+            events = asyncio.run(collect(MockContext(question)))
+            total += 1
+            if assert_equals((validation.calls, nl2sql.calls), (1, 1),
+                             "Validation and NL2SQL not called on hit"):
+                passed += 1
+            
+            total += 1
+            if assert_true(events and "1,234" in events[-1] and "from cache" in events[-1],
+                           "Cached answer emitted"):
+                passed += 1
+        finally:
+            (
+                orchestrator_module.intent_recognition_agent,
+                orchestrator_module.validation_agent,
+                orchestrator_module.nl2sql_agent,
+            ) = originals
+            cache_state.question_cache.clear()
+            cache_state.question_ttl.clear()
+            cache_state.negative.clear()
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+# =============================================================================
+# Test 13: Single-Flight Coalescing
+# =============================================================================
+
+class FakeBQClient:
+    """מדמה BQClient - מחזיר שורות קבועות אחרי השהייה, וסופר הרצות"""
+    def __init__(self, rows=None, delay: float = 0.0):
+        self.rows = rows if rows is not None else [{"total_clicks": 1}]
+        self.delay = delay
+        self.calls = 0
+
+    def execute_query(self, query, query_type):
+        self.calls += 1
+        time.sleep(self.delay)
+        return [dict(row) for row in self.rows]
+
+
+def test_single_flight():
+    """
+    בדיקה 13: איחוד בקשות זהות במקביל
+    
+    כמה קוראים במקביל לאותה שאילתה שלא בקאש צריכים לגרום
+    להרצה אחת בלבד ב-BigQuery, גם מקוד סינכרוני וגם מקוד אסינכרוני.
+    """
+    print_test_header("Single-Flight Coalescing")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+        import agents.db.tools as db_tools
+        from agents.db.singleflight import SingleFlight
+        from agents.cache_sql.tools import get_global_cache_state
+        
+        cache_state = get_global_cache_state()
+        cache_state.cache.clear()
+        cache_state.ttl.clear()
+        
+        fake_bq = FakeBQClient(delay=0.3)
+        original_bq = db_tools._bq_instance
+        db_tools._bq_instance = fake_bq
+        
+        try:
+            print_subtest("Concurrent sync callers share one BigQuery job")
+            
+            sql = "SELECT SUM(total_events) AS total_clicks FROM t WHERE DATE(event_time) = '2025-01-02'"
+            before = db_tools.get_coalescing_stats()
+            with ThreadPoolExecutor(max_workers=5) as pool:
+                results = list(pool.map(
+                    lambda _: db_tools.run_sql(db_tools.RunSQLInput(sql=sql)), range(5)
+                ))
+            after = db_tools.get_coalescing_stats()
+            
+            total += 1
+            if assert_equals(fake_bq.calls, 1, "BigQuery executed once"):
+                passed += 1
+            
+            total += 1
+            if assert_equals(after["deduplicated"] - before["deduplicated"], 4,
+                             "Four executions deduplicated"):
+                passed += 1
+            
+            total += 1
+            if assert_true(all(r["rows"] == [{"total_clicks": 1}] for r in results),
+                           "All callers got the rows"):
+                passed += 1
+        finally:
+            db_tools._bq_instance = original_bq
+            cache_state.cache.clear()
+            cache_state.ttl.clear()
+        
+        print_subtest("Async and sync callers share in-flight executions")
+        
+        flight = SingleFlight()
+        calls = []
+        
+        def slow_work():
+            calls.append(1)
+            time.sleep(0.2)
+            return "done"
+        
+        async def mixed_callers():
+            loop = asyncio.get_running_loop()
+            sync_call = loop.run_in_executor(None, flight.do, "k", slow_work)
+            await asyncio.sleep(0.05)
+            async_results = await asyncio.gather(
+                flight.do_async("k", slow_work), flight.do_async("k", slow_work)
+            )
+            return [await sync_call] + list(async_results)
+        
+        results = asyncio.run(mixed_callers())
+        
+        total += 1
+        if assert_equals((len(calls), results), (1, ["done"] * 3), "One execution for three callers"):
+            passed += 1
+        
+        print_subtest("Leader errors reach every waiter")
+        
+        def failing_work():
+            time.sleep(0.1)
+            raise RuntimeError("BigQuery query failed")
+        
+        errors = []
+        def call_failing():
+            try:
+                flight.do("err", failing_work)
+            except RuntimeError as e:
+                errors.append(str(e))
+        
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            for _ in range(3):
+                pool.submit(call_failing)
+        
+        total += 1
+        if assert_equals(len(errors), 3, "All callers got the error"):
+            passed += 1
+        
+        print_subtest("A cancelled leader does not fail the other waiters")
+        
+        async def cancelled_leader():
+            loop = asyncio.get_running_loop()
+            leader = asyncio.create_task(flight.do_async("cancel", slow_work))
+            await asyncio.sleep(0.05)
+            sync_waiter = loop.run_in_executor(None, flight.do, "cancel", slow_work)
+            async_waiter = asyncio.create_task(flight.do_async("cancel", slow_work))
+            await asyncio.sleep(0.01)
+            leader.cancel()  # הלקוח התנתק
+            return await asyncio.gather(sync_waiter, async_waiter, return_exceptions=True)
+        
+        calls.clear()
+        total += 1
+        if assert_equals((asyncio.run(cancelled_leader()), len(calls)), (["done", "done"], 1),
+                         "Waiters got the result, one execution"):
+            passed += 1
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+def test_relative_dates():
+    """
+    בדיקה 14: המרת תאריכים יחסיים לתאריכים מוחלטים
+    
+    שאילתות עם "אתמול" (DATE_SUB, INTERVAL, CURRENT_DATE) מומרות לתאריכים
+    מוחלטים לפני ההרצה - ולכן נשמרות בקאש. שאלה יחסית נשמרת עם מפתח של היום,
+    ושאילתה שמגיעה עד היום עצמו לא נשמרת (הנתונים עדיין מתעדכנים).
+    """
+    print_test_header("Relative Date Resolution")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        from datetime import date, timedelta
+        import agents.db.tools as db_tools
+        from agents.cache_sql.dates import resolve_relative_dates, utc_today
+        from agents.cache_sql.tools import get_global_cache_state, question_cache_key
+        from agents.cache_sql.fingerprint import fingerprint_sql
+        
+        print_subtest("Relative expressions resolve to absolute dates")
+        
+        today = date(2025, 3, 31)
+        cases = [
+            ("DATE(event_time) = DATE('2025-03-31') - INTERVAL 1 DAY",
+             "DATE(event_time) = DATE('2025-03-30')"),
+            ("DATE(event_time) = DATE_SUB(CURRENT_DATE(), INTERVAL 1 MONTH)",
+             "DATE(event_time) = DATE('2025-02-28')"),
+            ("d BETWEEN DATE_TRUNC(DATE_SUB(CURRENT_DATE, INTERVAL 1 MONTH), MONTH) "
+             "AND LAST_DAY(DATE_SUB(CURRENT_DATE(), INTERVAL 1 MONTH))",
+             "d BETWEEN DATE('2025-02-01') AND DATE('2025-02-28')"),
+        ]
+        for sql, expected in cases:
+            total += 1
+            if assert_equals(resolve_relative_dates(sql, today), (expected, True), sql[:50]):
+                passed += 1
+        
+        total += 1
+        if assert_equals(resolve_relative_dates("ts < CURRENT_TIMESTAMP()", today),
+                         ("ts < CURRENT_TIMESTAMP()", False), "Sub-day expressions untouched"):
+            passed += 1
+        
+        print_subtest("Time zones, literals and comments")
+        
+        from datetime import datetime, timezone
+        clock = datetime(2025, 4, 1, 3, 0, tzinfo=timezone.utc)  # עדיין 31/3 בלוס אנג'לס
+        sql = (
+            "SELECT 'current_date' AS label FROM t -- current_date\n"
+            "WHERE d = CURRENT_DATE('America/Los_Angeles') OR d = CURRENT_DATE(\"UTC\") OR d = CURRENT_DATE()"
+        )
+        resolved, changed = resolve_relative_dates(sql, now=clock)
+        total += 1
+        if assert_true(
+            changed and "DATE('2025-03-31')" in resolved and resolved.count("DATE('2025-04-01')") == 2
+            and "'current_date' AS label" in resolved and "CURRENT_DATE(" not in resolved,
+            "Zone argument honoured, UTC default, literal kept"
+        ):
+            passed += 1
+        
+        total += 1
+        if assert_equals(resolve_relative_dates("SELECT 'current_date' AS x FROM t", today),
+                         ("SELECT 'current_date' AS x FROM t", False), "String literal untouched"):
+            passed += 1
+        
+        print_subtest("'Yesterday' question is cached for the rest of the day")
+        
+        cache_state = get_global_cache_state()
+        for layer in (cache_state.cache, cache_state.ttl, cache_state.question_cache, cache_state.question_ttl):
+            layer.clear()
+        
+        fake_bq = FakeBQClient()
+        original_bq = db_tools._bq_instance
+        db_tools._bq_instance = fake_bq
+        question = "How many clicks yesterday?"
+        yesterday_sql = (
+            "SELECT SUM(total_events) AS total_clicks FROM t "
+            "WHERE DATE(event_time) = DATE_SUB(CURRENT_DATE(), INTERVAL 1 DAY)"
+        )
+        try:
+            first = db_tools.run_sql(db_tools.RunSQLInput(sql=yesterday_sql, final_question=question))
+            second = db_tools.run_sql(db_tools.RunSQLInput(sql=yesterday_sql, final_question=question))
+            
+            total += 1
+            yesterday = (utc_today() - timedelta(days=1)).isoformat()
+            if assert_in(f"DATE('{yesterday}')", first["sql"], "Executed SQL has absolute date"):
+                passed += 1
+            
+            total += 1
+            if assert_equals((fake_bq.calls, second["from_cache"]), (1, True), "Second call hits the cache"):
+                passed += 1
+            
+            total += 1
+            if assert_true(
+                question_cache_key(question, utc_today()) in cache_state.question_cache
+                and question_cache_key(question) not in cache_state.question_cache,
+                "Question key scoped to today"
+            ):
+                passed += 1
+            
+            total += 1
+            if assert_true(db_tools.lookup_question_cache(question) is not None,
+                           "Orchestrator lookup finds today's entry"):
+                passed += 1
+            
+            print_subtest("Queries reaching today are cached with the live TTL")
+            
+            today_sql = "SELECT SUM(total_events) AS total_clicks FROM t WHERE DATE(event_time) = CURRENT_DATE()"
+            first = db_tools.run_sql(db_tools.RunSQLInput(sql=today_sql))
+            second = db_tools.run_sql(db_tools.RunSQLInput(sql=today_sql))
+            
+            total += 1
+            if assert_equals((fake_bq.calls, second["from_cache"]), (2, True), "Today's query served from cache"):
+                passed += 1
+            
+            total += 1
+            stored_at = cache_state.ttl[fingerprint_sql(first["sql"])]
+            if assert_equals(cache_state.entry_ttl("sql", fingerprint_sql(first["sql"]), stored_at),
+                             cache_state.ttl_policy.live_seconds, "Entry has the live TTL"):
+                passed += 1
+        finally:
+            db_tools._bq_instance = original_bq
+            for layer in (cache_state.cache, cache_state.ttl, cache_state.question_cache, cache_state.question_ttl):
+                layer.clear()
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+class FakeMetadataClient:
+    """מדמה את שאילתות המטא-דאטה של BQClient"""
+    def __init__(self, tables=None, partitions=None):
+        self.tables = tables or {}
+        self.partitions = partitions or {}
+        self.partition_requests = []
+
+    def get_tables_last_modified(self, tables):
+        return {t: self.tables[t] for t in tables if t in self.tables}
+
+    def get_partitions_last_modified(self, tables, since_ms=None):
+        self.partition_requests.append((tuple(tables), since_ms))
+        return {
+            t: {p: m for p, m in self.partitions.get(t, {}).items() if since_ms is None or m > since_ms}
+            for t in tables
+        }
+
+
+def test_freshness_invalidation():
+    """
+    בדיקה 15: ביטול רשומות לפי מטא-דאטה של טבלאות
+    
+    כל רשומה בקאש זוכרת את הטבלאות והתאריכים שקראה. כשמחיצה בטווח התאריכים
+    של הרשומה משתנה אחרי שמירתה - הרשומה נמחקת. רשומות היסטוריות נשארות.
+    """
+    print_test_header("Freshness Invalidation")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        import tempfile
+        import agents.db.tools as db_tools
+        from agents.cache_sql.tools import CacheState
+        from agents.cache_sql.storage import SQLiteBackend
+        from agents.cache_sql.freshness import extract_source_tables, FreshnessTracker, partition_date_span
+        
+        print_subtest("Source tables are extracted (CTEs excluded)")
+        
+        sql = (
+            "WITH daily AS (SELECT * FROM `practicode-2025.clicks_data_prac.optimized_clicks`) "
+            "SELECT * FROM daily JOIN clicks_data_prac.mv_total_events_by_day_hour_media m ON TRUE"
+        )
+        total += 1
+        if assert_equals(
+            extract_source_tables(sql),
+            ("clicks_data_prac.mv_total_events_by_day_hour_media",
+             "practicode-2025.clicks_data_prac.optimized_clicks"),
+            "Tables found"
+        ):
+            passed += 1
+        
+        print_subtest("A changed partition invalidates only entries that read it")
+        
+        table = "p.d.clicks"
+        state = CacheState()
+        original_state = db_tools.get_global_cache_state
+        original_bq = db_tools._bq_instance
+        db_tools.get_global_cache_state = lambda: state
+        db_tools._bq_instance = FakeBQClient()
+        try:
+            old_sql = f"SELECT SUM(total_events) FROM `{table}` WHERE DATE(event_time) = '2025-01-01'"
+            new_sql = f"SELECT SUM(total_events) FROM `{table}` WHERE DATE(event_time) = '2025-01-02'"
+            db_tools.run_sql(db_tools.RunSQLInput(sql=old_sql, final_question="clicks on jan 1"))
+            db_tools.run_sql(db_tools.RunSQLInput(sql=new_sql, final_question="clicks on jan 2"))
+            stored_ms = int(state.ttl[db_tools.fingerprint_sql(new_sql)] * 1000)
+            
+            client = FakeMetadataClient(
+                tables={table: stored_ms + 5000},
+                partitions={table: {"20250101": stored_ms - 5000, "20250102": stored_ms + 5000}},
+            )
+            invalidated = state.refresh_freshness(client)
+            
+            total += 1
+            if assert_equals(invalidated, 2, "SQL + question entries of Jan 2 invalidated"):
+                passed += 1
+            
+            total += 1
+            if assert_true(
+                db_tools.fingerprint_sql(old_sql) in state.cache
+                and db_tools.fingerprint_sql(new_sql) not in state.cache,
+                "Jan 1 entry kept"
+            ):
+                passed += 1
+            
+            print_subtest("Unchanged tables skip the partition query")
+            
+            state.refresh_freshness(client)
+            total += 1
+            if assert_equals(len(client.partition_requests), 1, "No second partition query"):
+                passed += 1
+            
+            print_subtest("Stale entries are dropped on lookup too")
+            
+            client.tables[table] = stored_ms + 9000
+            client.partitions[table]["20250101"] = stored_ms + 9000
+            state.freshness.table_versions[table] = stored_ms + 9000
+            state.freshness.partition_versions[table]["20250101"] = stored_ms + 9000
+            
+            total += 1
+            if assert_true(db_tools.lookup_question_cache("clicks on jan 1") is None, "Question lookup misses"):
+                passed += 1
+        finally:
+            db_tools.get_global_cache_state = original_state
+            db_tools._bq_instance = original_bq
+
+        print_subtest("A partition touches only its dependents, versions are pruned")
+
+        tracker = FreshnessTracker()
+        tracker.add_layer("sql", {})
+        for day in range(1, 31):
+            tracker.register("sql", f"k{day}", (table,), (f"2025-01-{day:02d}", f"2025-01-{day:02d}"))
+        tracker.register("sql", "all", (table,), None)
+
+        total += 1
+        if assert_equals(
+            tracker.dependents(table, partition_date_span("20250105")), {("sql", "k5"), ("sql", "all")},
+            "Jan 5 partition -> its entry + the undated one"
+        ):
+            passed += 1
+
+        import os
+        import time as time_module
+        from datetime import datetime, timezone
+        from agents.cache_sql.dates import utc_today
+        from agents.cache_sql.freshness import STREAMING_PARTITION_ID
+        original_tz = os.environ.get("TZ")
+        # A zone whose local date differs from the UTC date right now
+        os.environ["TZ"] = "Etc/GMT-12" if datetime.now(timezone.utc).hour >= 12 else "Etc/GMT+12"
+        time_module.tzset()
+        try:
+            total += 1
+            if assert_equals(partition_date_span(STREAMING_PARTITION_ID), (utc_today(), utc_today()),
+                             "Streaming buffer -> the current UTC day"):
+                passed += 1
+        finally:
+            if original_tz is None:
+                os.environ.pop("TZ", None)
+            else:
+                os.environ["TZ"] = original_tz
+            time_module.tzset()
+
+        checked = []
+        def stored_at_of(layer, key):
+            checked.append(key)
+            return 1000.0 if key in ("k5", "all") else 3000.0
+        client = FakeMetadataClient(tables={table: 2_000_000}, partitions={table: {"20250105": 2_000_000}})
+        stale = tracker.refresh(client, stored_at_of)
+        total += 1
+        if assert_equals(sorted(key for _, key in stale), ["all", "k5"], "Only the Jan 5 entries invalidated"):
+            passed += 1
+        total += 1
+        if assert_true(len(checked) < 30, f"Entries checked: {len(checked)}"):
+            passed += 1
+
+        client.tables[table] = 2_500_000
+        client.partitions[table] = {f"2024{month:02d}{day:02d}": 2_500_000 for month in (1, 2, 3) for day in range(1, 29)}
+        tracker.refresh(client, stored_at_of)
+        total += 1
+        if assert_equals(tracker.partition_versions.get(table), {}, "Partitions older than every entry pruned"):
+            passed += 1
+        total += 1
+        if assert_true(tracker.is_stale((table,), ("2025-01-01", "2025-01-01"), 2000.0), "Older copies count as stale"):
+            passed += 1
+
+        for day in range(1, 31):
+            tracker.forget("sql", f"k{day}")
+        total += 1
+        if assert_true(
+            table not in tracker.table_versions and table not in tracker.partition_versions,
+            "Versions of a table nothing reads are dropped"
+        ):
+            passed += 1
+
+        print_subtest("Dependencies survive a restart")
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = SQLiteBackend(f"{tmp}/cache.db")
+            state = CacheState(backend=backend)
+            state.cache["k"] = {"rows": []}
+            state.ttl["k"] = 1000.0
+            state.track_sources(state.cache, "k", (table,), ("2025-01-01", "2025-01-01"))
+            state.flush()
+            backend.close()
+            
+            restored = CacheState(backend=SQLiteBackend(f"{tmp}/cache.db"))
+            total += 1
+            if assert_equals(restored.freshness.tables(), [table], "Dependency index rebuilt"):
+                passed += 1
+            restored.backend.close()
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+def test_columnar_rows():
+    """
+    בדיקה 16: אחסון עמודתי של תוצאות בקאש
+    
+    תוצאות נשמרות בקאש כטבלת Arrow (עם קידוד מילון ודחיסה אופציונלית)
+    ומומרות לשורות רק כשקוראים אותן - format_answer ממשיך לעבוד כרגיל.
+    """
+    print_test_header("Columnar Cached Rows")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        import pickle
+        from datetime import date
+        import agents.db.tools as db_tools
+        from agent import format_answer
+        from agents.cache_sql.columnar import ColumnarRows
+        from agents.cache_sql.eviction import estimate_result_bytes
+        from agents.cache_sql.tools import get_global_cache_state
+        
+        rows = [
+            {"event_date": date(2025, 1, 1 + i % 28), "media_source": ["Facebook", "tiktok_int"][i % 2],
+             "total_events": i, "ratio": None if i % 3 else 0.5}
+            for i in range(500)
+        ]
+        
+        print_subtest("Rows read back unchanged")
+        
+        for compression in ("none", "zstd"):
+            columnar = ColumnarRows.from_rows(rows, compression=compression)
+            total += 1
+            if assert_true(
+                columnar == rows and columnar[-1] == rows[-1] and columnar[10:13] == rows[10:13]
+                and pickle.loads(pickle.dumps(columnar)) == rows,
+                f"Round trip ({compression})"
+            ):
+                passed += 1
+
+        import agents.cache_sql.columnar as columnar_module
+        compressed = ColumnarRows.from_rows(rows, compression="zstd")
+        original_deserialize = columnar_module._deserialize
+        decodes = []
+        columnar_module._deserialize = lambda payload: decodes.append(1) or original_deserialize(payload)
+        try:
+            format_answer({"rows": compressed})
+            compressed[0], compressed[:20], list(compressed)
+        finally:
+            columnar_module._deserialize = original_deserialize
+        total += 1
+        if assert_equals(len(decodes), 1, "Back-to-back reads decode a compressed table once"):
+            passed += 1
+
+        total += 1
+        if assert_true(
+            estimate_result_bytes({"rows": ColumnarRows.from_rows(rows)}) < estimate_result_bytes({"rows": rows}),
+            "Columnar entry is smaller"
+        ):
+            passed += 1
+        
+        total += 1
+        if assert_equals(ColumnarRows.from_rows([{"a": 1}, {"a": "x"}]), [{"a": 1}, {"a": "x"}],
+                         "Mixed-type columns stay a list"):
+            passed += 1
+        
+        print_subtest("Cached results are columnar and format the same")
+        
+        cache_state = get_global_cache_state()
+        for layer in (cache_state.cache, cache_state.ttl, cache_state.question_cache, cache_state.question_ttl):
+            layer.clear()
+        original_bq = db_tools._bq_instance
+        db_tools._bq_instance = FakeBQClient(rows=rows)
+        try:
+            sql = "SELECT event_date, media_source, total_events, ratio FROM t WHERE DATE(event_time) BETWEEN '2025-01-01' AND '2025-01-28'"
+            first = db_tools.run_sql(db_tools.RunSQLInput(sql=sql, final_question="clicks by day in january"))
+            cached = db_tools.lookup_question_cache("clicks by day in january")
+            
+            total += 1
+            if assert_true(
+                isinstance(cache_state.cache[db_tools.fingerprint_sql(sql)]["rows"], ColumnarRows),
+                "SQL layer holds ColumnarRows"
+            ):
+                passed += 1
+            
+            total += 1
+            expected = format_answer({"rows": rows, "from_cache": True})
+            if assert_equals(format_answer(cached), expected, "format_answer output unchanged"):
+                passed += 1
+        finally:
+            db_tools._bq_instance = original_bq
+            for layer in (cache_state.cache, cache_state.ttl, cache_state.question_cache, cache_state.question_ttl):
+                layer.clear()
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+def test_cache_snapshot():
+    """
+    בדיקה 17: ייצוא וייבוא של snapshot של הקאש
+    
+    snapshot נכתב מצומת אחד ונטען לצומת חדש: רשומות בתוקף נטענות עם
+    חותמת הזמן המקורית, רשומות שפג תוקפן מדולגות, וקובץ לא תקין נדחה.
+    """
+    print_test_header("Cache Snapshot")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        import io
+        import pickle
+        import struct
+        import asyncio
+        import tempfile
+        from agents.cache_sql.tools import CacheState
+        from agents.cache_sql.columnar import ColumnarRows
+        from agents.cache_sql.snapshot import (
+            export_snapshot, iter_snapshot_chunks, import_snapshot,
+            load_snapshot_in_background, snapshot_token_matches, SnapshotError,
+            SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+        )
+        
+        now = time.time()
+        source = CacheState(ttl_seconds=100)
+        rows = ColumnarRows.from_rows([{"media_source": "Facebook", "clicks": i} for i in range(50)])
+        source.question_cache["clicks on jan 1"] = {"sql": "q", "rows": rows}
+        source.question_ttl["clicks on jan 1"] = now - 10
+        source.cache["select 1"] = {"sql": "q", "rows": rows}
+        source.ttl["select 1"] = now - 10
+        source.track_sources(source.cache, "select 1", ("p.d.clicks",), ("2025-01-01", "2025-01-01"))
+        source.cache["expired"] = {"sql": "old", "rows": []}
+        source.ttl["expired"] = now - 500
+        
+        print_subtest("Export skips expired entries")
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f"{tmp}/cache.snapshot"
+            total += 1
+            if assert_equals(export_snapshot(source, path, now), 2, "Two live entries exported"):
+                passed += 1
+            
+            print_subtest("Import restores entries, timestamps and sources")
+            
+            target = CacheState(ttl_seconds=100)
+            asyncio.run(load_snapshot_in_background(target, path))
+            
+            total += 1
+            if assert_true(
+                target.cache["select 1"]["rows"] == rows.to_list()
+                and target.question_cache["clicks on jan 1"]["sql"] == "q",
+                "Entries loaded"
+            ):
+                passed += 1
+            
+            total += 1
+            if assert_equals(target.ttl["select 1"], now - 10, "Original timestamp kept"):
+                passed += 1
+            
+            total += 1
+            if assert_equals(target.freshness.tables(), ["p.d.clicks"], "Source tables imported"):
+                passed += 1
+        
+        print_subtest("TTLs are honored on import")
+        
+        stream = io.BytesIO(b"".join(iter_snapshot_chunks(source, now)))
+        late_target = CacheState(ttl_seconds=100)
+        counters = import_snapshot(late_target, stream, now=now + 85)
+        total += 1
+        if assert_equals(counters, {"loaded": 2, "skipped": 0}, "Still valid at +85s"):
+            passed += 1
+        
+        stream.seek(0)
+        counters = import_snapshot(CacheState(ttl_seconds=100), stream, now=now + 200)
+        total += 1
+        if assert_equals(counters, {"loaded": 0, "skipped": 2}, "Expired at +200s"):
+            passed += 1
+        
+        print_subtest("Imported SQL entries are subsumption sources")
+        
+        from agents.cache_sql.fingerprint import fingerprint_sql
+        fine_key = fingerprint_sql(
+            "SELECT media_source, hr, SUM(total_events) AS total_clicks "
+            "FROM `p.d.partial_encoded_clicks` WHERE DATE(event_time) = DATE('2025-01-02') "
+            "GROUP BY media_source, hr"
+        )
+        fine_source = CacheState(ttl_seconds=100)
+        fine_source.cache[fine_key] = {"sql": fine_key, "rows": [{"media_source": "a", "hr": 1, "total_clicks": 3}]}
+        fine_source.ttl[fine_key] = now
+        indexed_target = CacheState(ttl_seconds=100)
+        import_snapshot(indexed_target, io.BytesIO(b"".join(iter_snapshot_chunks(fine_source, now))), now=now)
+        total += 1
+        if assert_equals(len(indexed_target.subsumption), 1, "Imported entry indexed"):
+            passed += 1
+        
+        print_subtest("Invalid streams are rejected")
+        
+        total += 1
+        try:
+            import_snapshot(CacheState(), io.BytesIO(b"not a snapshot"))
+            assert_true(False, "SnapshotError raised")
+        except SnapshotError:
+            if assert_true(True, "SnapshotError raised"):
+                passed += 1
+
+        print_subtest("Pickled records are never loaded")
+
+        class Exploit:
+            def __reduce__(self):
+                return (exec, ("raise SystemExit('pickle loaded')",))
+
+        payload = pickle.dumps(("sql", "k", time.time(), Exploit(), None))
+        stream = io.BytesIO(
+            SNAPSHOT_MAGIC + struct.pack(">H", SNAPSHOT_VERSION) + struct.pack(">I", len(payload)) + payload
+        )
+        total += 1
+        try:
+            import_snapshot(CacheState(), stream)
+            assert_true(False, "Pickled record rejected")
+        except SnapshotError:
+            if assert_true(True, "Pickled record rejected"):
+                passed += 1
+
+        print_subtest("Snapshot endpoints need the token")
+
+        total += 1
+        if assert_true(
+            snapshot_token_matches("Bearer s3cret", "s3cret")
+            and not snapshot_token_matches("Bearer wrong", "s3cret")
+            and not snapshot_token_matches(None, "s3cret")
+            and not snapshot_token_matches("Bearer ", ""),
+            "Only the configured token is accepted"
+        ):
+            passed += 1
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+def test_concurrent_cache():
+    """
+    בדיקה 18: גישה מקבילית לקאש (lock striping)
+    
+    get_fresh מוחק רשומה שפג תוקפה ומחזיר רשומה בתוקף באופן אטומי,
+    וגישה מהרבה threads במקביל (כולל פינוי LRU ותפוגה) משאירה את הקאש עקבי.
+    """
+    print_test_header("Concurrent Cache Access")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        import random
+        import threading
+        from agents.cache_sql.tools import CacheState
+        
+        print_subtest("Atomic get-or-expire")
+        
+        state = CacheState(ttl_seconds=10)
+        now = time.time()
+        state.put(state.cache, "fresh", {"rows": [{"clicks": 1}]}, now)
+        state.put(state.cache, "old", {"rows": [{"clicks": 2}]}, now - 20)
+        
+        total += 1
+        if assert_equals(
+            (state.get_fresh(state.cache, "fresh", now), state.get_fresh(state.cache, "old", now)),
+            (({"rows": [{"clicks": 1}]}, "hit"), (None, "expired")),
+            "Fresh entry returned, expired entry reported"
+        ):
+            passed += 1
+        
+        total += 1
+        if assert_true("old" not in state.cache and "old" not in state.ttl, "Expired entry removed"):
+            passed += 1
+        
+        print_subtest("Many threads keep the cache consistent")
+        
+        state = CacheState(max_entries=50, max_bytes=0, ttl_seconds=0.01, lock_stripes=8)
+        errors = []
+        
+        def hammer(seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(3000):
+                    key = f"k{rng.randint(0, 100)}"
+                    layer = rng.choice([state.cache, state.question_cache])
+                    if rng.random() < 0.3:
+                        state.put(layer, key, {"rows": [{"clicks": seed}]}, time.time(), ("p.d.t",))
+                    else:
+                        state.get_fresh(layer, key)
+                    if rng.random() < 0.01:
+                        state.purge_expired()
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=hammer, args=(seed,)) for seed in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        total += 1
+        if assert_equals(errors, [], "No exceptions"):
+            passed += 1
+        
+        total += 1
+        consistent = all(
+            set(layer.store) == set(layer.ttl_store.store) for layer in (state.cache, state.question_cache)
+        )
+        if assert_true(consistent, "Every entry has a timestamp"):
+            passed += 1
+        
+        total += 1
+        if assert_equals(len(state.policy), len(state.cache) + len(state.question_cache),
+                         "LRU policy tracks exactly the stored entries"):
+            passed += 1
+        
+        total += 1
+        if assert_true(len(state.policy) <= 50, "Capacity respected"):
+            passed += 1
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+def test_shared_cache_tier():
+    """
+    בדיקה 19: שכבת קאש משותפת לכל ה-workers
+    
+    תוצאה שנשמרה ב-worker אחד נמצאת ב-worker אחר דרך השכבה המשותפת (L2)
+    ומועתקת לקאש המקומי שלו. רשומה לא עדכנית נמחקת גם מהשכבה המשותפת,
+    ושגיאות של השכבה המשותפת לא מפילות שאילתות.
+    """
+    print_test_header("Shared Cache Tier")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        from agents.cache_sql.tools import CacheState
+        from agents.cache_sql.shared import InMemorySharedTier, RedisSharedTier
+        
+        print_subtest("Entry stored by one worker is found by another")
+        
+        shared = InMemorySharedTier()
+        worker_a = CacheState(ttl_seconds=60, shared=shared)
+        worker_b = CacheState(ttl_seconds=60, shared=shared)
+        table = "proj.ds.events"
+        stored_at = time.time()
+        value = {"rows": [{"clicks": 7}], "sql": "SELECT 1"}
+        worker_a.put(worker_a.cache, "SELECT 1", value, stored_at, (table,), ("2025-01-01", "2025-01-01"))
+        
+        total += 1
+        if assert_equals(worker_b.get_fresh(worker_b.cache, "SELECT 1"), (value, "shared_hit"),
+                         "Worker B hits the shared tier"):
+            passed += 1
+        
+        total += 1
+        if assert_equals(worker_b.get_fresh(worker_b.cache, "SELECT 1"), (value, "hit"),
+                         "Second lookup is served from worker B's own cache"):
+            passed += 1
+        
+        total += 1
+        if assert_equals(worker_b.freshness.sources("sql", "SELECT 1"),
+                         ((table,), ("2025-01-01", "2025-01-01")),
+                         "Source tables travel with the shared entry"):
+            passed += 1
+        
+        print_subtest("Expired entries are not shared")
+        
+        worker_a.put(worker_a.cache, "SELECT 2", value, stored_at - 120)
+        total += 1
+        if assert_equals(worker_b.get_fresh(worker_b.cache, "SELECT 2"), (None, "miss"),
+                         "Entry past its TTL is not written to the shared tier"):
+            passed += 1
+        
+        print_subtest("Stale entries are deleted from the shared tier")
+        
+        # Worker C's last metadata check saw the entry's partition change
+        worker_c = CacheState(ttl_seconds=60, shared=shared)
+        stored_ms = stored_at * 1000
+        worker_c.freshness.table_versions[table] = stored_ms + 5000
+        worker_c.freshness.partition_versions[table] = {"20250101": stored_ms + 5000}
+        
+        total += 1
+        if assert_equals(worker_c.get_fresh(worker_c.cache, "SELECT 1"), (None, "stale"),
+                         "Worker C sees the shared entry is stale"):
+            passed += 1
+        
+        total += 1
+        if assert_equals(shared.get("sql", "SELECT 1"), None, "Stale entry removed from the shared tier"):
+            passed += 1
+        
+        print_subtest("Shared tier errors are treated as misses")
+        
+        class BrokenRedis:
+            def get(self, *args, **kwargs):
+                raise ConnectionError("connection refused")
+            set = delete = get
+        
+        broken = RedisSharedTier("redis://unused", client=BrokenRedis())
+        state = CacheState(ttl_seconds=60, shared=broken)
+        state.put(state.cache, "SELECT 3", value, time.time())
+        
+        total += 1
+        if assert_equals(state.get_fresh(state.cache, "SELECT 3"), (value, "hit"),
+                         "Local cache still works when the shared store is down"):
+            passed += 1
+        
+        total += 1
+        if assert_equals(state.get_fresh(state.cache, "SELECT 4"), (None, "miss"),
+                         "Lookup error is a miss"):
+            passed += 1
+        
+        total += 1
+        if assert_equals(broken.errors, 2, "Errors counted"):
+            passed += 1
+
+        print_subtest("Foreign payloads are never unpickled")
+
+        import pickle
+
+        class Exploit:
+            def __reduce__(self):
+                return (exec, ("raise SystemExit('pickle loaded')",))
+
+        class ForeignRedis:
+            def __init__(self):
+                self.values = {}
+            def get(self, name):
+                return self.values.get(name)
+            def set(self, name, payload, px=None):
+                self.values[name] = payload
+            def delete(self, name):
+                self.values.pop(name, None)
+
+        foreign = ForeignRedis()
+        tier = RedisSharedTier("redis://unused", client=foreign)
+        state = CacheState(ttl_seconds=60, shared=tier)
+        state.put(state.cache, "SELECT 5", value, time.time())
+        for name in foreign.values:
+            foreign.values[name] = pickle.dumps((time.time(), Exploit(), None))
+
+        fresh_worker = CacheState(ttl_seconds=60, shared=tier)
+        total += 1
+        if assert_equals(fresh_worker.get_fresh(fresh_worker.cache, "SELECT 5"), (None, "miss"),
+                         "Pickled payload is a miss"):
+            passed += 1
+
+        total += 1
+        if assert_equals(tier.misses, 1, "Counted as a miss"):
+            passed += 1
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+class FailingBQClient:
+    """מדמה BQClient ש-BigQuery דוחה את השאילתה שלו"""
+    def __init__(self):
+        self.calls = 0
+
+    def execute_query(self, query, query_type):
+        self.calls += 1
+        raise RuntimeError("BigQuery query failed: 400 Unrecognized name: clickz")
+
+
+def test_negative_cache():
+    """
+    בדיקה 20: קאש שלילי לתוצאות ריקות ולכשלונות
+    
+    תוצאה ריקה, SQL ש-BigQuery דוחה ו-FALLBACK_NO_EXECUTION נשמרים לזמן קצר
+    בנפרד מהקאש הרגיל, כך שחזרה על אותה שאלה עונה מיד בלי LLM ובלי BigQuery.
+    """
+    print_test_header("Negative Cache")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        import asyncio
+        import agent as orchestrator_module
+        import agents.db.tools as db_tools
+        from agents.cache_sql.tools import get_global_cache_state
+        from agents.cache_sql.negative import NegativeCache
+        from agents.cache_sql.fingerprint import fingerprint_sql
+        
+        cache_state = get_global_cache_state()
+        cache_state.negative.clear()
+        original_bq = db_tools._bq_instance
+        
+        try:
+            print_subtest("Empty result is remembered apart from positive entries")
+            
+            db_tools._bq_instance = FakeBQClient(rows=[])
+            sql = "SELECT SUM(total_events) AS total_clicks FROM t WHERE DATE(event_time) = '2025-01-05'"
+            question = "How many clicks on 2025-01-05?"
+            first = db_tools.run_sql(db_tools.RunSQLInput(sql=sql, final_question=question))
+            second = db_tools.run_sql(db_tools.RunSQLInput(sql=sql, final_question=question))
+            
+            total += 1
+            if assert_equals((db_tools._bq_instance.calls, first["rows"], second["rows"], second["from_cache"]),
+                             (1, [], [], True), "Repeat answered without BigQuery"):
+                passed += 1
+            
+            total += 1
+            if assert_true(fingerprint_sql(sql) not in cache_state.cache, "Not stored in the positive cache"):
+                passed += 1
+            
+            print_subtest("Rejected SQL fails fast on repeat")
+            
+            db_tools._bq_instance = FailingBQClient()
+            bad_sql = "SELECT clickz FROM t WHERE DATE(event_time) = '2025-01-05'"
+            errors = []
+            for _ in range(2):
+                try:
+                    db_tools.run_sql(db_tools.RunSQLInput(sql=bad_sql, final_question="Clickz on 2025-01-05?"))
+                except RuntimeError as e:
+                    errors.append(str(e))
+            
+            total += 1
+            if assert_equals(db_tools._bq_instance.calls, 1, "BigQuery called once"):
+                passed += 1
+            
+            total += 1
+            if assert_true(len(errors) == 2 and errors[0] == errors[1], "Same error raised again"):
+                passed += 1
+            
+            print_subtest("FALLBACK_NO_EXECUTION skips NL2SQL on repeat")
+            
+            fallback_question = "Which campaign feels the happiest?"
+            intent = FakeSubAgent("intent_result", {
+                "status": "improved", "message_to_user": "", "final_question": fallback_question
+            })
+            validation = FakeSubAgent("validation_result", {"status": "approved"})
+            nl2sql = FakeSubAgent("nl2sql_output", {"sql_query": "FALLBACK_NO_EXECUTION"})
+            originals = (
+                orchestrator_module.intent_recognition_agent,
+                orchestrator_module.validation_agent,
+                orchestrator_module.nl2sql_agent,
+            )
+            orchestrator_module.intent_recognition_agent = intent
+            orchestrator_module.validation_agent = validation
+            orchestrator_module.nl2sql_agent = nl2sql
+            
+            async def collect(context):
+                events = []
+                async for ev in orchestrator_module.root_agent._run_async_impl(context):
+                    events.append(ev.content.parts[0].text)
+                return events
+            
+            try:
+                first_events = asyncio.run(collect(MockContext(fallback_question)))
+                second_events = asyncio.run(collect(MockContext(fallback_question)))
+            finally:
+                (
+                    orchestrator_module.intent_recognition_agent,
+                    orchestrator_module.validation_agent,
+                    orchestrator_module.nl2sql_agent,
+                ) = originals
+            
+            total += 1
+            if assert_equals((validation.calls, nl2sql.calls), (1, 1), "NL2SQL not called on repeat"):
+                passed += 1
+            
+            total += 1
+            if assert_equals(second_events[-1:], first_events[-1:], "Same answer on repeat"):
+                passed += 1
+        finally:
+            db_tools._bq_instance = original_bq
+            cache_state.negative.clear()
+            cache_state.question_cache.clear()
+            cache_state.cache.clear()
+        
+        print_subtest("Entries expire after the short TTL")
+        
+        negative = NegativeCache(ttl_seconds=60)
+        now = time.time()
+        negative.record("sql", "old", "EmptyResult", now=now - 61)
+        negative.record("sql", "new", "EmptyResult", now=now)
+        
+        total += 1
+        if assert_equals((negative.get("sql", "old", now), negative.get("sql", "new", now).error_class),
+                         (None, "EmptyResult"), "Expired entry dropped, live entry returned"):
+            passed += 1
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+def test_stale_while_revalidate():
+    """
+    בדיקה 21: החזרת תוצאה ישנה תוך רענון ברקע (stale-while-revalidate)
+    
+    בין ה-TTL הרך ל-TTL הקשיח התוצאה הישנה מוחזרת מיד עם דגל stale,
+    ורענון אחד בלבד מתוזמן ברקע. רשומות חמות מתרעננות מוקדם באקראי (XFetch).
+    """
+    print_test_header("Stale-While-Revalidate")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        import agents.db.tools as db_tools
+        from agents.cache_sql.tools import CacheState, get_global_cache_state
+        from agents.cache_sql.fingerprint import fingerprint_sql
+        
+        cache_state = get_global_cache_state()
+        original = (db_tools._bq_instance, cache_state.soft_ttl_seconds, cache_state.early_refresh_beta)
+        fake_bq = FakeBQClient(rows=[{"total_clicks": 2}], delay=0.2)
+        db_tools._bq_instance = fake_bq
+        cache_state.soft_ttl_seconds = 10
+        cache_state.early_refresh_beta = 0
+        
+        try:
+            print_subtest("Between the TTLs the stale result is served, refreshed once")
+            
+            sql = "SELECT SUM(total_events) AS total_clicks FROM t WHERE DATE(event_time) = '2025-01-06'"
+            cache_state.put(cache_state.cache, fingerprint_sql(sql), {"sql": sql, "rows": [{"total_clicks": 1}]},
+                            time.time() - 20)
+            
+            first = db_tools.run_sql(db_tools.RunSQLInput(sql=sql))
+            second = db_tools.run_sql(db_tools.RunSQLInput(sql=sql))
+            
+            total += 1
+            if assert_equals((first["rows"], first["stale"], second["rows"], second["stale"]),
+                             ([{"total_clicks": 1}], True, [{"total_clicks": 1}], True),
+                             "Stale result returned immediately with the stale flag"):
+                passed += 1
+            
+            deadline = time.time() + 5
+            while db_tools._refreshing and time.time() < deadline:
+                time.sleep(0.05)
+            
+            total += 1
+            if assert_equals(fake_bq.calls, 1, "One background refresh for both requests"):
+                passed += 1
+            
+            third = db_tools.run_sql(db_tools.RunSQLInput(sql=sql))
+            total += 1
+            if assert_equals((third["rows"], third["stale"], third["from_cache"]),
+                             ([{"total_clicks": 2}], False, True), "Refreshed result served as fresh"):
+                passed += 1
+        finally:
+            db_tools._bq_instance, cache_state.soft_ttl_seconds, cache_state.early_refresh_beta = original
+            cache_state.cache.clear()
+            cache_state.ttl.clear()
+        
+        print_subtest("Probabilistic early refresh (XFetch)")
+        
+        state = CacheState(ttl_seconds=100, soft_ttl_seconds=50, early_refresh_beta=1.0)
+        now = time.time()
+        state.put(state.cache, "hot", {"rows": []}, now - 40, compute_seconds=5)
+        
+        state._random = lambda: 0.9
+        total += 1
+        if assert_equals(state.get_fresh(state.cache, "hot", now)[1], "hit", "Unlucky draw - plain hit"):
+            passed += 1
+        
+        state._random = lambda: 0.01  # 5 * ln(100) = 23s early
+        total += 1
+        if assert_equals(state.get_fresh(state.cache, "hot", now)[1], "early_refresh",
+                         "Lucky draw close to the soft TTL - early refresh"):
+            passed += 1
+        
+        state.put(state.cache, "cold", {"rows": []}, now, compute_seconds=5)
+        total += 1
+        if assert_equals(state.get_fresh(state.cache, "cold", now)[1], "hit",
+                         "Just stored entry is not refreshed"):
+            passed += 1
+        
+        total += 1
+        if assert_equals(
+            (state.get_fresh(state.cache, "hot", now + 20)[1], state.get_fresh(state.cache, "hot", now + 70)[1]),
+            ("soft_expired", "expired"), "Soft TTL serves stale, hard TTL expires"
+        ):
+            passed += 1
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+def test_slot_question_keys():
+    """
+    בדיקה 22: מפתחות קאש מובנים (slots) לשאלות
+    
+    ניסוחים שונים של אותה בקשה (כולל עברית ואנגלית) מקבלים אותו מפתח
+    כשה-slots זהים, ותוצאה נשמרת תחת מפתח ה-slots רק אם הם תואמים ל-SQL.
+    """
+    print_test_header("Slot Question Keys")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        import agents.db.tools as db_tools
+        from agents.cache_sql.tools import get_global_cache_state
+        from agents.cache_sql.slots import slot_cache_key, slots_match_sql
+        
+        print_subtest("Canonical slot key")
+        
+        english = {
+            "metric": "clicks", "dimensions": ["media_source"],
+            "filters": [{"field": "app_id", "values": ["com.a", "com.b"]}],
+            "start_date": "2025-01-02", "end_date": "2025-01-02", "top_n": None,
+        }
+        hebrew = {
+            "metric": "Clicks", "dimensions": ["media source"],
+            "filters": [{"field": "app", "values": ["com.b", "com.a"]}],
+            "start_date": "2025-01-02", "end_date": "2025-01-02",
+        }
+        
+        total += 1
+        if assert_equals(slot_cache_key(english), slot_cache_key(hebrew), "Same request - same key"):
+            passed += 1
+        
+        total += 1
+        other_app = dict(english, filters=[{"field": "app_id", "values": ["com.A", "com.b"]}])
+        if assert_true(slot_cache_key(other_app) != slot_cache_key(english),
+                       "Filter values keep their case"):
+            passed += 1
+        
+        total += 1
+        if assert_equals(slot_cache_key(dict(english, start_date="yesterday")), None,
+                         "Relative dates - no slot key"):
+            passed += 1
+        
+        print_subtest("Slots are checked against the SQL")
+        
+        sql = (
+            "SELECT media_source, SUM(total_events) AS total_clicks FROM t "
+            "WHERE DATE(event_time) = DATE('2025-01-02') AND app_id IN ('com.a', 'com.b') "
+            "AND is_engaged_view = FALSE GROUP BY media_source"
+        )
+        
+        total += 1
+        if assert_true(slots_match_sql(english, sql), "Matching slots accepted"):
+            passed += 1
+        
+        total += 1
+        if assert_true(not slots_match_sql(dict(english, filters=[]), sql), "Slots missing a filter rejected"):
+            passed += 1
+        
+        total += 1
+        if assert_true(not slots_match_sql(english, sql.replace("app_id IN", "NOT app_id IN")),
+                       "Negated filter rejected"):
+            passed += 1
+
+        print_subtest("Metric, aggregation and order are checked too")
+
+        total += 1
+        if assert_true(not slots_match_sql(dict(english, aggregation="avg"), sql), "AVG slots vs SUM query rejected"):
+            passed += 1
+
+        total += 1
+        if assert_true(not slots_match_sql(dict(english, metric="views"), sql), "Views slots vs clicks query rejected"):
+            passed += 1
+
+        total += 1
+        if assert_true(
+            not slots_match_sql(english, sql.replace("SUM(total_events)", "AVG(total_events)")),
+            "AVG query vs SUM slots rejected"
+        ):
+            passed += 1
+
+        top = dict(english, dimensions=["media_source"], top_n=3)
+        top_sql = sql + " ORDER BY total_clicks DESC LIMIT 3"
+        total += 1
+        if assert_true(
+            slots_match_sql(top, top_sql) and slots_match_sql(dict(top, order="desc"), top_sql)
+            and not slots_match_sql(dict(top, order="asc"), top_sql)
+            and not slots_match_sql(top, top_sql.replace("DESC", "ASC")),
+            "Top N: DESC matches, ASC rejected"
+        ):
+            passed += 1
+
+        total += 1
+        if assert_true(
+            slot_cache_key(dict(english, filters=english["filters"] + [{"field": "is_engaged_view", "values": ["false"]}]))
+            == slot_cache_key(english)
+            and slot_cache_key(dict(english, metric="revenue")) is None,
+            "Metric filter is part of the key, unknown metrics have none"
+        ):
+            passed += 1
+        
+        print_subtest("Different phrasing hits the slot entry")
+        
+        cache_state = get_global_cache_state()
+        original_bq = db_tools._bq_instance
+        db_tools._bq_instance = FakeBQClient(rows=[{"media_source": "x", "total_clicks": 3}])
+        try:
+            db_tools.run_sql(db_tools.RunSQLInput(
+                sql=sql, final_question="clicks by media source on 2025-01-02 for com.a and com.b",
+                question_slots=english
+            ))
+            hit = db_tools.lookup_question_cache("קליקים לפי מדיה סורס ב-2.1.2025 ל-com.a ו-com.b",
+                                                 slots=hebrew)
+            total += 1
+            if assert_true(hit is not None and hit["rows"] == [{"media_source": "x", "total_clicks": 3}],
+                           "Hebrew phrasing served from the English question's entry"):
+                passed += 1
+        finally:
+            db_tools._bq_instance = original_bq
+            cache_state.question_cache.clear()
+            cache_state.cache.clear()
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+def test_query_subsumption():
+    """
+    בדיקה 23: חישוב שאילתות גסות מתוצאה מפורטת שבקאש (subsumption)
+    
+    שאילתה שמקבצת לפי פחות עמודות (או מסננת לפי עמודה שבקיבוץ) מחושבת
+    מתוצאה מפורטת יותר שכבר בקאש - בלי BigQuery, ועם אותם מספרים בדיוק.
+    שאילתה שצריכה מסנן שאין בתוצאה השמורה נשלחת ל-BigQuery.
+    """
+    print_test_header("Query Subsumption")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        import agents.db.tools as db_tools
+        from agents.cache_sql.tools import get_global_cache_state
+        
+        table = "`practicode-2025.clicks_data_prac.partial_encoded_clicks`"
+        where = "WHERE DATE(event_time) = DATE('2025-01-02')"
+        fine_sql = (
+            f"SELECT media_source, hr, SUM(total_events) AS total_clicks, COUNT(*) AS n "
+            f"FROM {table} {where} GROUP BY media_source, hr"
+        )
+        fine_rows = [
+            {"media_source": "Facebook", "hr": 1, "total_clicks": 10, "n": 2},
+            {"media_source": "Facebook", "hr": 2, "total_clicks": 5, "n": 1},
+            {"media_source": "Google", "hr": 1, "total_clicks": 7, "n": 3},
+            {"media_source": None, "hr": 2, "total_clicks": None, "n": 4},
+        ]
+        
+        def by_source(rows):
+            return sorted((dict(r) for r in rows), key=lambda r: str(r["media_source"]))
+        
+        cache_state = get_global_cache_state()
+        original_bq = db_tools._bq_instance
+        fake = FakeBQClient(rows=fine_rows)
+        db_tools._bq_instance = fake
+        try:
+            db_tools.run_sql(db_tools.RunSQLInput(sql=fine_sql))
+            
+            print_subtest("Coarser GROUP BY from the cached result")
+            
+            result = db_tools.run_sql(db_tools.RunSQLInput(
+                sql=f"SELECT media_source, SUM(total_events) AS clicks FROM {table} {where} GROUP BY media_source"
+            ))
+            total += 1
+            if assert_equals(fake.calls, 1, "No BigQuery call"):
+                passed += 1
+            total += 1
+            if assert_equals(by_source(result["rows"]), [
+                {"media_source": "Facebook", "clicks": 15},
+                {"media_source": "Google", "clicks": 7},
+                {"media_source": None, "clicks": None},
+            ], "Re-aggregated sums (NULL group and NULL sum kept)"):
+                passed += 1
+            
+            print_subtest("Total and a filter on a cached dimension")
+            
+            result = db_tools.run_sql(db_tools.RunSQLInput(
+                sql=f"SELECT SUM(total_events) AS clicks, COUNT(*) AS n FROM {table} {where}"
+            ))
+            total += 1
+            if assert_equals([dict(r) for r in result["rows"]], [{"clicks": 22, "n": 10}],
+                             "Day total (COUNT summed, NULL sums skipped)"):
+                passed += 1
+            
+            result = db_tools.run_sql(db_tools.RunSQLInput(
+                sql=f"SELECT hr, SUM(total_events) AS clicks FROM {table} "
+                    f"{where} AND media_source = 'Facebook' GROUP BY hr ORDER BY hr"
+            ))
+            total += 1
+            if assert_equals([dict(r) for r in result["rows"]],
+                             [{"hr": 1, "clicks": 10}, {"hr": 2, "clicks": 5}],
+                             "Filtered by a cached dimension, ordered"):
+                passed += 1
+            total += 1
+            if assert_equals(fake.calls, 1, "Still no BigQuery call"):
+                passed += 1
+            
+            print_subtest("Filter the cached result cannot apply")
+            
+            db_tools.run_sql(db_tools.RunSQLInput(
+                sql=f"SELECT media_source, SUM(total_events) AS clicks FROM {table} "
+                    f"{where} AND app_id = 'com.a' GROUP BY media_source"
+            ))
+            total += 1
+            if assert_equals(fake.calls, 2, "Sent to BigQuery"):
+                passed += 1
+        finally:
+            db_tools._bq_instance = original_bq
+            cache_state.question_cache.clear()
+            cache_state.cache.clear()
+            cache_state.negative.clear()
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+class DailyBQClient:
+    """מדמה BQClient לשאילתות מפוצלות לימים - מחזיר שורות לפי היום, ושומר את ה-SQL שהורץ"""
+    def __init__(self, rows_by_day):
+        self.rows_by_day = rows_by_day
+        self.queries = []
+
+    def execute_query(self, query, query_type):
+        import re
+        from agents.cache_sql.daily import DAY_COLUMN
+        self.queries.append(query)
+        days = re.findall(r"'(\d{4}-\d{2}-\d{2})'", query.split(" IN ", 1)[-1])
+        return [dict(row, **{DAY_COLUMN: day}) for day in days for row in self.rows_by_day.get(day, [])]
+
+
+def test_daily_partials():
+    """
+    בדיקה 24: פיצול שאילתות טווח תאריכים לתוצאות חלקיות יומיות
+    
+    שאילתת טווח נשמרת בקאש יום אחרי יום. חלון שזז ביום אחד מביא
+    מ-BigQuery רק את היום החסר (בשאילתה אחת), והתוצאה מאוחדת מקומית.
+    """
+    print_test_header("Daily Partials")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        import agents.db.tools as db_tools
+        from agents.cache_sql.tools import get_global_cache_state
+        
+        table = "`practicode-2025.clicks_data_prac.optimized_clicks`"
+        
+        def range_sql(first, last):
+            return (
+                f"SELECT media_source, SUM(total_events) AS total_clicks FROM {table} "
+                f"WHERE DATE(event_time) BETWEEN DATE('{first}') AND DATE('{last}') "
+                f"AND is_engaged_view = FALSE GROUP BY media_source ORDER BY total_clicks DESC"
+            )
+        
+        rows_by_day = {
+            "2024-03-01": [{"media_source": "Facebook", "total_clicks": 10}],
+            "2024-03-02": [{"media_source": "Facebook", "total_clicks": 1},
+                           {"media_source": "Google", "total_clicks": 4}],
+            # 2024-03-03 - no data
+            "2024-03-04": [{"media_source": "Google", "total_clicks": 20}],
+        }
+        
+        cache_state = get_global_cache_state()
+        original_bq = db_tools._bq_instance
+        fake = DailyBQClient(rows_by_day)
+        db_tools._bq_instance = fake
+        try:
+            print_subtest("First range - all days in one query")
+            
+            result = db_tools.run_sql(db_tools.RunSQLInput(sql=range_sql("2024-03-01", "2024-03-03")))
+            total += 1
+            if assert_equals(len(fake.queries), 1, "One BigQuery query"):
+                passed += 1
+            total += 1
+            if assert_equals([dict(r) for r in result["rows"]], [
+                {"media_source": "Facebook", "total_clicks": 11},
+                {"media_source": "Google", "total_clicks": 4},
+            ], "Merged and ordered as the range query"):
+                passed += 1
+            
+            print_subtest("Sliding window - only the new day is fetched")
+            
+            result = db_tools.run_sql(db_tools.RunSQLInput(sql=range_sql("2024-03-02", "2024-03-04")))
+            total += 1
+            if assert_equals(len(fake.queries), 2, "One more BigQuery query"):
+                passed += 1
+            total += 1
+            if assert_true("'2024-03-04'" in fake.queries[-1] and "'2024-03-02'" not in fake.queries[-1],
+                           "Only 2024-03-04 fetched"):
+                passed += 1
+            total += 1
+            if assert_equals([dict(r) for r in result["rows"]], [
+                {"media_source": "Google", "total_clicks": 24},
+                {"media_source": "Facebook", "total_clicks": 1},
+            ], "Cached and fetched days merged"):
+                passed += 1
+            
+            print_subtest("A single day shares the partial")
+            
+            result = db_tools.run_sql(db_tools.RunSQLInput(
+                sql=f"SELECT media_source, SUM(total_events) AS total_clicks FROM {table} "
+                    f"WHERE DATE(event_time) = DATE('2024-03-01') AND is_engaged_view = FALSE GROUP BY media_source"
+            ))
+            total += 1
+            if assert_true(result["from_cache"] and len(fake.queries) == 2, "Served from the day's partial"):
+                passed += 1
+
+            print_subtest("Batch bytes are split across the fetched days")
+
+            class BilledRows(list):
+                total_bytes_processed = 3000
+
+            fake.execute_query = lambda query, query_type, fetch=fake.execute_query: BilledRows(fetch(query, query_type))
+            fake.rows_by_day["2024-03-05"] = [{"media_source": "Facebook", "total_clicks": 2}]
+            fake.rows_by_day["2024-03-06"] = [{"media_source": "Google", "total_clicks": 3}]
+            admitted = {}
+
+            def admit(layer, key, bytes_scanned=None):
+                admitted[key] = bytes_scanned
+                return True
+
+            sql = range_sql("2024-03-05", "2024-03-06")
+            cache_state.admit = admit
+            try:
+                db_tools.run_sql(db_tools.RunSQLInput(sql=sql))
+            finally:
+                del cache_state.admit
+            plan = db_tools.daily_plan(sql)
+            keys = [db_tools.fingerprint_sql(db_tools.day_sql(plan, day)) for day in plan.days]
+            total += 1
+            if assert_equals(
+                [admitted.get(key) for key in keys + [db_tools.fingerprint_sql(sql)]],
+                [1500, 1500, 3000],
+                "Each day gets its share, the range the whole batch"
+            ):
+                passed += 1
+        finally:
+            db_tools._bq_instance = original_bq
+            cache_state.question_cache.clear()
+            cache_state.cache.clear()
+            cache_state.negative.clear()
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+def test_adaptive_ttl():
+    """
+    בדיקה 25: TTL לפי עדכניות התאריכים שהשאילתה קוראת
+    
+    תוצאה של היום חיה דקות, תוצאה של הימים האחרונים - שעה,
+    ותוצאה היסטורית - את ה-TTL הארוך. ה-TTL נגזר מטווח התאריכים
+    ומזמן השמירה, כך שאחרי טעינה מחדש הוא נשאר אותו TTL.
+    """
+    print_test_header("Adaptive TTL")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        from datetime import datetime, timedelta
+        from agents.cache_sql.tools import CacheState
+        from agents.cache_sql.ttl_policy import TTLPolicy
+        
+        print_subtest("Tiers by the newest date")
+        
+        policy = TTLPolicy(1000, live_seconds=10, recent_seconds=100, recent_days=3,
+                           historical_seconds=float("inf"))
+        now = datetime(2025, 6, 10, 12, 0).timestamp()
+        cases = [
+            (("2025-06-01", "2025-06-10"), 10, "Range reaching today - live"),
+            (("2025-06-08", "2025-06-08"), 100, "Two days ago - recent"),
+            (("2025-05-01", "2025-05-31"), float("inf"), "Last month - historical"),
+            (None, 1000, "No dates - cache TTL"),
+        ]
+        for date_range, expected, description in cases:
+            total += 1
+            if assert_equals(policy.ttl_for(date_range, now), expected, description):
+                passed += 1
+        
+        print_subtest("Entries expire by their own TTL")
+        
+        state = CacheState(ttl_seconds=1000, ttl_policy=policy)
+        tables = ("p.d.optimized_clicks",)
+        state.put(state.cache, "live", {"rows": [{"c": 1}]}, now, tables, ("2025-06-10", "2025-06-10"))
+        state.put(state.cache, "old", {"rows": [{"c": 2}]}, now, tables, ("2025-05-01", "2025-05-31"))
+        
+        total += 1
+        if assert_equals(
+            [state.get_fresh(state.cache, key, now + 60)[1] for key in ("live", "old")],
+            ["expired", "hit"], "Live entry expired after 60s, historical entry kept"
+        ):
+            passed += 1
+        
+        total += 1
+        if assert_equals(state.get_fresh(state.cache, "old", now + 10 ** 9)[1], "hit",
+                         "Historical entry never expires"):
+            passed += 1
+        
+        total += 1
+        state.put(state.cache, "recent", {"rows": [{"c": 3}]}, now, tables, ("2025-06-09", "2025-06-09"))
+        if assert_equals(state.purge_expired(now + 200), 1, "Sweeper purges the recent entry"):
+            passed += 1
+        
+        total += 1
+        if assert_equals(state.stored_by_tier["live"], 1, "Stored entries counted per tier"):
+            passed += 1
+        
+        print_subtest("Tiers use the UTC day (BigQuery's CURRENT_DATE)")
+        
+        import os
+        import time as time_module
+        from datetime import timezone
+        original_tz = os.environ.get("TZ")
+        os.environ["TZ"] = "Asia/Jerusalem"
+        time_module.tzset()
+        try:
+            # 22:30 UTC on 06-10 is already 06-11 in Jerusalem
+            late_utc = datetime(2025, 6, 10, 22, 30, tzinfo=timezone.utc).timestamp()
+            total += 1
+            if assert_equals(policy.tier(("2025-06-10", "2025-06-10"), late_utc), "live",
+                             "Current UTC day is live after local midnight"):
+                passed += 1
+        finally:
+            if original_tz is None:
+                os.environ.pop("TZ", None)
+            else:
+                os.environ["TZ"] = original_tz
+            time_module.tzset()
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+def test_write_invalidation():
+    """
+    בדיקה 26: ביטול קאש כשפקודה כותבת לטבלה
+    
+    CREATE OR REPLACE TABLE שרץ דרך run_sql לא נשמר בקאש, ומבטל מיד
+    כל תוצאה (SQL ושאלה) שקראה מהטבלה שנכתבה - תוצאות על טבלאות אחרות נשארות.
+    """
+    print_test_header("Write-Aware Invalidation")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        import agents.db.tools as db_tools
+        from agents.cache_sql.tools import get_global_cache_state
+        from agents.cache_sql.fingerprint import fingerprint_sql
+        from agents.cache_sql.freshness import extract_written_tables
+        
+        dataset = "`practicode-2025.clicks_data_prac"
+        anomaly_table = "practicode-2025.clicks_data_prac.media_source_anomaly_cv_top_10"
+        read_anomaly = (
+            f"SELECT media_source, cv FROM {dataset}.media_source_anomaly_cv_top_10` "
+            f"WHERE DATE(created_at) = DATE('2025-01-02')"
+        )
+        read_clicks = (
+            f"SELECT SUM(total_events) AS total_clicks FROM {dataset}.partial_encoded_clicks` "
+            f"WHERE DATE(event_time) = DATE('2025-01-02')"
+        )
+        write = (
+            f"CREATE OR REPLACE TABLE {dataset}.media_source_anomaly_cv_top_10` AS "
+            f"SELECT media_source, 1.5 AS cv FROM {dataset}.mv_total_events_by_day_hour_media` "
+            f"WHERE event_date = '2025-01-02'"
+        )
+        
+        print_subtest("Written tables")
+        
+        total += 1
+        if assert_equals(extract_written_tables(write), (anomaly_table,), "CREATE OR REPLACE target"):
+            passed += 1
+        
+        total += 1
+        if assert_equals(extract_written_tables(read_anomaly), (), "SELECT writes nothing"):
+            passed += 1
+        
+        cache_state = get_global_cache_state()
+        original_bq = db_tools._bq_instance
+        fake = FakeBQClient(rows=[{"media_source": "x", "cv": 2.0}])
+        db_tools._bq_instance = fake
+        try:
+            print_subtest("The write invalidates its readers")
+            
+            db_tools.run_sql(db_tools.RunSQLInput(sql=read_anomaly, final_question="top anomalies on 2025-01-02"))
+            db_tools.run_sql(db_tools.RunSQLInput(sql=read_clicks))
+            
+            result = db_tools.run_sql(db_tools.RunSQLInput(sql=write, output_tables=[anomaly_table]))
+            total += 1
+            if assert_equals(result["output_tables"], [anomaly_table], "Output tables returned"):
+                passed += 1
+            
+            total += 1
+            if assert_true(
+                fingerprint_sql(read_anomaly) not in cache_state.cache
+                and "top anomalies on 2025-01-02" not in cache_state.question_cache,
+                "Reader removed from both layers"
+            ):
+                passed += 1
+            
+            total += 1
+            if assert_true(fingerprint_sql(read_clicks) in cache_state.cache, "Other tables stay cached"):
+                passed += 1
+            
+            print_subtest("The write itself is never cached")
+            
+            calls = fake.calls
+            db_tools.run_sql(db_tools.RunSQLInput(sql=write))
+            total += 1
+            if assert_equals(fake.calls, calls + 1, "Executed again"):
+                passed += 1
+            
+            print_subtest("Results read before the write are stale")
+            
+            before = time.time() - 60
+            cache_state.put(cache_state.cache, "late", {"rows": [{"cv": 2.0}]}, before, (anomaly_table,))
+            total += 1
+            if assert_equals(cache_state.get_fresh(cache_state.cache, "late")[1], "stale",
+                             "Result stored by a query that started before the write"):
+                passed += 1
+        finally:
+            db_tools._bq_instance = original_bq
+            cache_state.question_cache.clear()
+            cache_state.cache.clear()
+            cache_state.negative.clear()
+            cache_state.freshness.table_versions.pop(anomaly_table, None)
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+def test_admission():
+    """
+    בדיקה 27: סינון כניסה לקאש מלא (TinyLFU)
+    
+    כשהקאש מלא, שאילתה חד-פעמית לא מוציאה רשומה שמבקשים שוב ושוב.
+    שאילתה שחוזרת (או יקרה בבתים שנסרקו) כן נכנסת.
+    """
+    print_test_header("Cache Admission (TinyLFU)")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        from agents.cache_sql.tools import CacheState
+        from agents.cache_sql.admission import FrequencySketch
+        
+        print_subtest("Frequency sketch")
+        
+        sketch = FrequencySketch(64)
+        for _ in range(5):
+            sketch.increment("hot")
+        sketch.increment("cold")
+        
+        total += 1
+        if assert_equals((sketch.estimate("hot"), sketch.estimate("cold")), (5, 1), "Counts accesses"):
+            passed += 1
+        
+        for _ in range(sketch.width * 10):
+            sketch.increment("other")
+        total += 1
+        if assert_true(sketch.resets >= 1 and sketch.estimate("hot") < 5, "Aging halves old counts"):
+            passed += 1
+        
+        print_subtest("Full cache keeps hot entries")
+        
+        state = CacheState(max_entries=2, max_bytes=0, admission=True)
+        now = time.time()
+        
+        def ask(key, bytes_scanned=None):
+            value, _ = state.get_fresh(state.cache, key, now)
+            if value is None and state.admit(state.cache, key, bytes_scanned):
+                state.put(state.cache, key, {"rows": [{"c": 1}]}, now)
+            return value is not None
+        
+        for _ in range(3):
+            ask("hot a")
+            ask("hot b")
+        
+        total += 1
+        if assert_true(not ask("one-off") and "one-off" not in state.cache, "One-off query not admitted"):
+            passed += 1
+        
+        total += 1
+        if assert_true("hot a" in state.cache and "hot b" in state.cache, "Hot entries kept"):
+            passed += 1
+        
+        for _ in range(5):
+            ask("rising")
+        total += 1
+        if assert_true("rising" in state.cache, "Repeated query admitted"):
+            passed += 1
+        
+        ask("expensive", bytes_scanned=10 * 1024 ** 4)
+        total += 1
+        if assert_true("expensive" in state.cache, "Expensive query admitted"):
+            passed += 1
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+def test_async_run_sql():
+    """
+    בדיקה 28: הרצת BigQuery בלי לחסום את ה-event loop
+    
+    בזמן ששאילתה איטית רצה דרך run_sql_async, קורוטינות אחרות (סשנים אחרים)
+    ממשיכות לרוץ. שאילתות זהות במקביל מורצות פעם אחת, ופגיעה בקאש חוזרת מיד.
+    """
+    print_test_header("Async run_sql")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        import asyncio
+        import threading
+        import agents.db.tools as db_tools
+        from agents.db.tools import RunSQLInput, run_sql_async
+        from agents.cache_sql.tools import get_global_cache_state
+        
+        cache_state = get_global_cache_state()
+        original_bq = db_tools._bq_instance
+        original_lookup = db_tools._lookup_caches
+        fake_bq = FakeBQClient(rows=[{"total_clicks": 7}], delay=0.3)
+        db_tools._bq_instance = fake_bq
+        sql = "SELECT SUM(clicks) AS total_clicks FROM `p.d.async_t` WHERE app_id = 'async' AND DATE(event_time) = '2025-01-05'"
+        
+        try:
+            print_subtest("Other sessions progress during a slow query")
+            
+            async def sessions():
+                ticks = 0
+                query = asyncio.gather(
+                    run_sql_async(RunSQLInput(sql=sql)), run_sql_async(RunSQLInput(sql=sql))
+                )
+                while not query.done():
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+                return await query, ticks
+            
+            (first, second), ticks = asyncio.run(sessions())
+            
+            total += 1
+            if assert_true(ticks >= 10, f"Event loop kept running ({ticks} ticks)"):
+                passed += 1
+            
+            total += 1
+            if assert_equals(first["rows"][0]["total_clicks"], 7, "Result returned"):
+                passed += 1
+            
+            total += 1
+            if assert_equals((fake_bq.calls, second["rows"][0]["total_clicks"]), (1, 7),
+                             "Concurrent identical queries share one BigQuery job"):
+                passed += 1
+            
+            print_subtest("Cache lookups run off the loop")
+            
+            lookup_threads = []
+            def lookup(input):
+                lookup_threads.append(threading.current_thread().name)
+                return original_lookup(input)
+            db_tools._lookup_caches = lookup
+            cached = asyncio.run(run_sql_async(RunSQLInput(sql=sql)))
+            total += 1
+            if assert_equals((cached["from_cache"], fake_bq.calls), (True, 1), "Hit without BigQuery"):
+                passed += 1
+            total += 1
+            if assert_true(lookup_threads and lookup_threads[0].startswith("cache-lookup"),
+                           f"Lookup ran in the cache pool ({lookup_threads})"):
+                passed += 1
+            
+            def thread_name(prefix, suffix=""):
+                return prefix + threading.current_thread().name + suffix
+            total += 1
+            if assert_true(
+                asyncio.run(db_tools.run_in_cache_pool(thread_name, "<", suffix=">")).startswith("<cache-lookup"),
+                "Orchestrator cache calls run in the cache pool"
+            ):
+                passed += 1
+        finally:
+            db_tools._lookup_caches = original_lookup
+            db_tools._bq_instance = original_bq
+            cache_state.question_cache.clear()
+            cache_state.cache.clear()
+            cache_state.negative.clear()
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+class PagedResult:
+    """מדמה RowIterator - דפים נטענים רק כשמגיעים אליהם, וסופר כמה נטענו"""
+    def __init__(self, page_count: int, page_size: int):
+        self.page_count = page_count
+        self.page_size = page_size
+        self.total_rows = page_count * page_size
+        self.fetched = 0
+
+    @property
+    def pages(self):
+        for page in range(self.page_count):
+            self.fetched += 1
+            yield [{"app_id": f"app{page}_{i}", "clicks": i} for i in range(self.page_size)]
+
+
+class PagedBQClient:
+    """מדמה BQClient שמחזיר תוצאה מחולקת לדפים"""
+    def __init__(self, page_count: int = 10, page_size: int = 100):
+        self.page_count = page_count
+        self.page_size = page_size
+        self.results = []
+
+    def execute_query(self, query, query_type):
+        result = PagedResult(self.page_count, self.page_size)
+        self.results.append(result)
+        return result
+
+
+def test_streaming_rows():
+    """
+    בדיקה 29: קריאת תוצאות דף אחר דף
+    
+    תשובת צ'אט (max_rows) לשאילתה שלא נשמרת בקאש קוראת רק את הדפים שמוצגים.
+    תוצאה שנשמרת בקאש נקראת במלואה ונבנית בפורמט עמודות דף אחר דף.
+    """
+    print_test_header("Streaming Rows")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        import agents.db.tools as db_tools
+        from agents.db.tools import RunSQLInput, run_sql
+        from agents.db.streaming import StreamingRows, StreamConsumedError
+        from agents.cache_sql.columnar import ColumnarRows
+        from agents.cache_sql.fingerprint import fingerprint_sql
+        from agents.cache_sql.tools import get_global_cache_state
+        
+        print_subtest("StreamingRows")
+        
+        result = PagedResult(10, 100)
+        stream = StreamingRows(result)
+        head = stream.head(150)
+        total += 1
+        if assert_equals((len(head), result.fetched, stream.total_rows), (150, 2, 1000),
+                         "head() fetches only the pages it needs"):
+            passed += 1
+        
+        stream = StreamingRows([{"clicks": i} for i in range(25)], page_size=10)
+        total += 1
+        if assert_equals([len(page) for page in stream.pages()], [10, 10, 5], "Lists are paged by page_size"):
+            passed += 1
+        
+        pages = list(PagedResult(3, 4).pages)
+        total += 1
+        if assert_equals(ColumnarRows.from_pages(iter(pages)).to_list(), [row for page in pages for row in page],
+                         "from_pages == rows of every page"):
+            passed += 1
+        
+        print_subtest("run_sql with max_rows")
+        
+        cache_state = get_global_cache_state()
+        original_bq = db_tools._bq_instance
+        fake_bq = PagedBQClient(page_count=10, page_size=100)
+        db_tools._bq_instance = fake_bq
+        
+        try:
+            capped = run_sql(RunSQLInput(
+                sql="SELECT app_id, clicks FROM `p.d.stream_t` WHERE DATE(event_time) = '2025-01-05' LIMIT 1000",
+                max_rows=20
+            ))
+            total += 1
+            if assert_equals((len(capped["rows"]), capped["total_rows"], fake_bq.results[-1].fetched), (20, 1000, 1),
+                             "Uncached query stops after the shown rows"):
+                passed += 1
+            
+            cached_sql = "SELECT app_id, clicks FROM `p.d.stream_t` WHERE DATE(event_time) = '2025-01-06'"
+            first = run_sql(RunSQLInput(sql=cached_sql, max_rows=20))
+            entry = cache_state.cache.get(fingerprint_sql(cached_sql))
+            total += 1
+            if assert_equals((len(first["rows"]), fake_bq.results[-1].fetched, len(entry["rows"])), (20, 10, 1000),
+                             "Cached query is read in full, caller gets max_rows"):
+                passed += 1
+            
+            total += 1
+            if assert_true(isinstance(entry["rows"], ColumnarRows), "Cached columnar"):
+                passed += 1
+            
+            again = run_sql(RunSQLInput(sql=cached_sql, max_rows=20))
+            total += 1
+            if assert_equals((again["from_cache"], len(again["rows"]), again["total_rows"]), (True, 20, 1000),
+                             "Cache hit capped too"):
+                passed += 1
+
+            print_subtest("Reading a stream twice is not a rejected query")
+
+            class ConsumedRows(StreamingRows):
+                def __init__(self, result):
+                    super().__init__(result)
+                    list(super().pages())
+
+            reused_sql = "SELECT app_id, clicks FROM `p.d.stream_t` WHERE DATE(event_time) = '2025-01-07'"
+            db_tools.StreamingRows = ConsumedRows
+            try:
+                run_sql(RunSQLInput(sql=reused_sql))
+                raised = None
+            except Exception as e:
+                raised = e
+            finally:
+                db_tools.StreamingRows = StreamingRows
+            total += 1
+            if assert_true(
+                isinstance(raised, StreamConsumedError)
+                and cache_state.negative.get("sql", fingerprint_sql(reused_sql)) is None,
+                "StreamConsumedError raised, nothing recorded in the negative cache"
+            ):
+                passed += 1
+        finally:
+            db_tools._bq_instance = original_bq
+            cache_state.question_cache.clear()
+            cache_state.cache.clear()
+            cache_state.negative.clear()
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+class FakeArrowJob:
+    """מדמה QueryJob - התוצאה זמינה כ-Arrow דרך Storage API או REST"""
+    def __init__(self, table, storage_error=None, batch_error=None):
+        self.table = table
+        self.storage_error = storage_error
+        self.batch_error = batch_error
+        self.storage_reads = 0
+        self.rest_reads = 0
+
+    def result(self, page_size=None):
+        return self
+
+    def to_arrow_iterable(self, bqstorage_client=None):
+        if self.storage_error is not None:
+            raise self.storage_error
+        self.storage_reads += 1
+        for index, batch in enumerate(self.table.to_batches(max_chunksize=2)):
+            if index > 0 and self.batch_error is not None:
+                raise self.batch_error
+            yield batch
+
+    def to_arrow(self, create_bqstorage_client=True):
+        self.rest_reads += 1
+        return self.table
+
+
+def test_arrow_fetch():
+    """
+    בדיקה 30: שליפת טבלאות שלמות כ-Arrow
+    
+    execute_query_arrow מחזיר record batches דרך Storage Read API,
+    ואם ה-API נדחה (הרשאות) - חוזר ל-to_arrow דרך REST.
+    """
+    print_test_header("Arrow Fetch")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        import pyarrow as pa
+        from types import SimpleNamespace
+        from google.api_core.exceptions import PermissionDenied, BadRequest, Forbidden
+        import agents.db.tools as db_tools
+        from agents.db.bq_client import BQClient
+        from agents.db.tools import fetch_arrow
+        from agents.db.cost_guard import CostGuard
+        from agents.db.job_stats import JobStatsLog
+        
+        table = pa.table({"media_source": ["a", "b", "c"], "total_clicks": [1, 2, 3]})
+        
+        def client_for(job):
+            bq = BQClient.__new__(BQClient)
+            bq.bq_client = SimpleNamespace(query=lambda query, job_config=None: job)
+            bq.sa_email, bq.project_id = "sa", "p"
+            bq.cost_guard = CostGuard(enabled=False)
+            bq.job_stats = JobStatsLog()
+            bq._storage_client = object()  # Storage API "available"
+            return bq
+        
+        print_subtest("Storage Read API")
+        
+        job = FakeArrowJob(table)
+        batches = list(client_for(job).execute_query_arrow("SELECT 1", "test"))
+        total += 1
+        if assert_equals((pa.Table.from_batches(batches).to_pylist(), job.storage_reads, job.rest_reads),
+                         (table.to_pylist(), 1, 0), "Batches streamed from the Storage API"):
+            passed += 1
+        
+        print_subtest("Fallback to REST")
+        
+        job = FakeArrowJob(table, storage_error=PermissionDenied("readsessions.create"))
+        bq = client_for(job)
+        batches = list(bq.execute_query_arrow("SELECT 1", "test"))
+        total += 1
+        if assert_equals((pa.Table.from_batches(batches).num_rows, job.rest_reads), (3, 1),
+                         "Refused Storage API falls back to to_arrow"):
+            passed += 1
+        
+        total += 1
+        if assert_true(bq._get_storage_client() is None, "Storage API not retried"):
+            passed += 1
+        
+        print_subtest("Errors of lazily fetched batches")
+        
+        batches = client_for(FakeArrowJob(table, batch_error=BadRequest("stream broke"))).execute_query_arrow("SELECT 1", "test")
+        error = None
+        try:
+            list(batches)
+        except Exception as e:
+            error = e
+        total += 1
+        if assert_true(isinstance(error, RuntimeError) and "stream broke" in str(error),
+                       "BadRequest after the first batch -> RuntimeError"):
+            passed += 1
+        
+        batches = client_for(FakeArrowJob(table, batch_error=Forbidden("denied"))).execute_query_arrow("SELECT 1", "test")
+        error = None
+        try:
+            list(batches)
+        except Exception as e:
+            error = e
+        total += 1
+        if assert_true(isinstance(error, PermissionError), "Forbidden after the first batch -> PermissionError"):
+            passed += 1
+        
+        print_subtest("fetch_arrow")
+        
+        original_bq = db_tools._bq_instance
+        try:
+            db_tools._bq_instance = client_for(FakeArrowJob(table))
+            total += 1
+            if assert_equals(fetch_arrow("SELECT 1", "test").to_pylist(), table.to_pylist(), "One table of all batches"):
+                passed += 1
+            
+            db_tools._bq_instance = SimpleNamespace(execute_query_arrow=lambda sql, query_type: iter([]))
+            total += 1
+            if assert_equals(fetch_arrow("SELECT 1", "test").to_pylist(), [], "No batches - empty table"):
+                passed += 1
+        finally:
+            db_tools._bq_instance = original_bq
+        
+        print_subtest("Dashboard responses from Arrow")
+        
+        import json
+        from datetime import date
+        from api import _arrow_rows, _group_rows, _json_response
+        
+        dashboard = pa.table({
+            "media_source": ["a", "b", "a"],
+            "event_date": [date(2025, 10, 1)] * 3,
+            "total_clicks": [1, 2, 3],
+        })
+        rows = _arrow_rows(dashboard)
+        total += 1
+        if assert_equals(rows, dashboard.to_pylist(), "Column-wise rows equal to_pylist"):
+            passed += 1
+        
+        grouped = _group_rows(rows, lambda row: row["media_source"])
+        total += 1
+        if assert_true([len(grouped["a"]), len(grouped["b"])] == [2, 1] and grouped["a"][0] is rows[0],
+                       "Groups share the row dicts"):
+            passed += 1
+        
+        body = json.loads(_json_response({"data": rows}).body)
+        total += 1
+        if assert_equals(body["data"][0], {"media_source": "a", "event_date": "2025-10-01", "total_clicks": 1},
+                         "Dates serialized as ISO strings"):
+            passed += 1
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+class ResultRows(list):
+    """רשימת שורות שאפשר להוסיף לה מאפיינים (כמו RowIterator.job_stats)"""
+
+
+class FakeDryRunBigQuery:
+    """מדמה bigquery.Client - dry run מחזיר הערכת בתים, ושומר את ה-job configs"""
+    def __init__(self, bytes_by_marker: dict, dry_run_error=None):
+        self.bytes_by_marker = bytes_by_marker
+        self.dry_run_error = dry_run_error
+        self.dry_runs = 0
+        self.jobs = []
+
+    def query(self, query, job_config=None):
+        from types import SimpleNamespace
+        if job_config is not None and job_config.dry_run:
+            self.dry_runs += 1
+            if self.dry_run_error is not None:
+                raise self.dry_run_error
+            estimate = next(value for marker, value in self.bytes_by_marker.items() if marker in query)
+            return SimpleNamespace(total_bytes_processed=estimate)
+        self.jobs.append(job_config)
+        return SimpleNamespace(result=lambda page_size=None: ResultRows([{"total_clicks": 1}]))
+
+
+def test_cost_guard():
+    """
+    בדיקה 31: הערכת עלות (dry run) ותקרת bytes billed
+    
+    כל שאילתה עוברת dry run לפני הריצה (פעם אחת לכל fingerprint בזמן ה-TTL).
+    שאילתה מעל התקציב נדחית לפני שנוצר job, וכל job רץ עם maximum_bytes_billed.
+    """
+    print_test_header("Cost Guard")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        from google.api_core.exceptions import BadRequest
+        from agents.db.bq_client import BQClient
+        from agents.db.cost_guard import CostGuard, QueryBudgetExceeded
+        from agents.db.job_stats import JobStatsLog
+        
+        gib = 1024 ** 3
+        
+        print_subtest("Memoized dry runs")
+        
+        guard = CostGuard(max_bytes=10 * gib, ttl_seconds=60, enabled=True)
+        dry_runs = []
+        
+        def dry_run(query):
+            dry_runs.append(query)
+            return 2 * gib
+        
+        now = time.time()
+        guard.check("SELECT a FROM t WHERE d = '2025-01-01'", dry_run, now)
+        estimated = guard.check("select  a\nfrom t where d = '2025-01-01'", dry_run, now)
+        total += 1
+        if assert_equals((estimated, len(dry_runs), guard.memo_hits), (2 * gib, 1, 1), "Same fingerprint - one dry run"):
+            passed += 1
+        
+        guard.check("SELECT a FROM t WHERE d = '2025-01-01'", dry_run, now + 61)
+        total += 1
+        if assert_equals(len(dry_runs), 2, "Estimate expires after the TTL"):
+            passed += 1
+        
+        print_subtest("Budget")
+        
+        over_guard = CostGuard(max_bytes=gib, enabled=True)
+        try:
+            over_guard.check("SELECT * FROM optimized_clicks", lambda query: 5 * gib)
+            rejected = False
+        except QueryBudgetExceeded as e:
+            rejected = "limit" in str(e) and e.bytes_estimated == 5 * gib
+        total += 1
+        if assert_true(rejected and over_guard.rejected == 1, "Over-budget query rejected"):
+            passed += 1
+        
+        print_subtest("BQClient")
+        
+        def client_for(fake, max_bytes):
+            bq = BQClient.__new__(BQClient)
+            bq.bq_client = fake
+            bq.sa_email, bq.project_id = "sa", "p"
+            bq.cost_guard = CostGuard(max_bytes=max_bytes, enabled=True)
+            bq.job_stats = JobStatsLog()
+            return bq
+        
+        fake = FakeDryRunBigQuery({"filtered": gib, "full_scan": 500 * gib})
+        bq = client_for(fake, 10 * gib)
+        rows = list(bq.execute_query("SELECT 1 FROM t WHERE filtered", "test"))
+        total += 1
+        if assert_equals((rows, fake.jobs[-1].maximum_bytes_billed), ([{"total_clicks": 1}], 10 * gib),
+                         "Job runs with maximum_bytes_billed"):
+            passed += 1
+        
+        try:
+            bq.execute_query("SELECT * FROM t WHERE full_scan", "test")
+            rejected = False
+        except QueryBudgetExceeded:
+            rejected = True
+        total += 1
+        if assert_true(rejected and len(fake.jobs) == 1, "Full scan rejected before a job starts"):
+            passed += 1
+        
+        failing = FakeDryRunBigQuery({}, dry_run_error=BadRequest("dry run not supported"))
+        bq = client_for(failing, 10 * gib)
+        total += 1
+        if assert_equals(len(list(bq.execute_query("SELECT 1", "test"))), 1, "Failed dry run does not block"):
+            passed += 1
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
+class FakeFinishedJob:
+    """מדמה QueryJob שהסתיים - עם סטטיסטיקות כמו ש-BigQuery מחזיר"""
+    def __init__(self, job_id: str, bytes_billed: int, slot_ms: int, cache_hit: bool = False):
+        from datetime import datetime, timedelta
+        self.job_id = job_id
+        self.statement_type = "SELECT"
+        self.total_bytes_processed = bytes_billed
+        self.total_bytes_billed = bytes_billed
+        self.slot_millis = slot_ms
+        self.cache_hit = cache_hit
+        self.created = datetime(2025, 1, 5, 12, 0, 0)
+        self.started = self.created + timedelta(milliseconds=150)
+        self.ended = self.started + timedelta(milliseconds=2000)
+
+    def result(self, page_size=None):
+        return ResultRows([{"total_clicks": 1}])
+
+
+def test_job_stats():
+    """
+    בדיקה 32: סטטיסטיקות של כל job ב-BigQuery
+    
+    כל שאילתה שרצה מחזירה job_stats (bytes billed, slot ms, cache hit,
+    זמני המתנה וריצה), ונשמרת בטבלה מתגלגלת שמסכמת לפי fingerprint.
+    """
+    print_test_header("Job Stats")
+    
+    passed = 0
+    total = 0
+    
+    try:
+        from types import SimpleNamespace
+        import agents.db.tools as db_tools
+        from agents.db.tools import RunSQLInput, run_sql
+        from agents.db.bq_client import BQClient
+        from agents.db.cost_guard import CostGuard
+        from agents.db.job_stats import JobStatsLog, collect_job_stats
+        from agents.cache_sql.tools import get_global_cache_state
+        
+        print_subtest("collect_job_stats")
+        
+        stats = collect_job_stats(FakeFinishedJob("job_1", 1000, 50), "agent_query", "SELECT 1")
+        total += 1
+        if assert_equals(
+            (stats["job_id"], stats["bytes_billed"], stats["slot_ms"], stats["queue_ms"], stats["execution_ms"]),
+            ("job_1", 1000, 50, 150, 2000), "Job statistics and timings"
+        ):
+            passed += 1
+        
+        print_subtest("Rolling table")
+        
+        log = JobStatsLog(max_jobs=3)
+        for job_id, sql, billed in [("a", "SELECT 1 FROM t", 10), ("b", "select 1 from t", 30),
+                                    ("c", "SELECT 2 FROM t", 25), ("d", "SELECT 3 FROM t", 5)]:
+            log.record(collect_job_stats(FakeFinishedJob(job_id, billed, billed), "agent_query", sql))
+        top = log.top("bytes_billed")
+        total += 1
+        if assert_equals([(query["last_job_id"], query["count"], query["bytes_billed"]) for query in top],
+                         [("b", 1, 30), ("c", 1, 25), ("d", 1, 5)], "Oldest job dropped, ranked by bytes billed"):
+            passed += 1
+        
+        log.record(collect_job_stats(FakeFinishedJob("e", 40, 40), "agent_query", "select 2 from t"))
+        total += 1
+        if assert_equals((log.top("count")[0]["count"], log.top("count")[0]["bytes_billed"], log.summary()["recorded"]),
+                         (2, 65, 5), "Same fingerprint aggregated"):
+            passed += 1
+        
+        print_subtest("run_sql result")
+        
+        job = FakeFinishedJob("job_run", 2048, 300, cache_hit=True)
+        bq = BQClient.__new__(BQClient)
+        bq.bq_client = SimpleNamespace(query=lambda query, job_config=None: job)
+        bq.sa_email, bq.project_id = "sa", "p"
+        bq.cost_guard = CostGuard(enabled=False)
+        bq.job_stats = JobStatsLog()
+        
+        cache_state = get_global_cache_state()
+        original_bq = db_tools._bq_instance
+        db_tools._bq_instance = bq
+        try:
+            result = run_sql(RunSQLInput(
+                sql="SELECT SUM(clicks) AS total_clicks FROM `p.d.stats_t` WHERE DATE(event_time) = '2025-01-05'"
+            ))
+            total += 1
+            if assert_equals((result["job_stats"]["job_id"], result["job_stats"]["cache_hit"]), ("job_run", True),
+                             "job_stats attached to the result"):
+                passed += 1
+            
+            total += 1
+            if assert_equals(db_tools.get_job_stats().summary()["bytes_billed"], 2048, "Recorded in BQClient.job_stats"):
+                passed += 1
+        finally:
+            db_tools._bq_instance = original_bq
+            cache_state.question_cache.clear()
+            cache_state.cache.clear()
+            cache_state.negative.clear()
+        
+    except Exception as e:
+        print(f"   ❌ Exception: {e}")
+        import traceback
+        traceback.print_exc()
+    
+    return passed, total
+
+
 # =============================================================================
 # Main
 # =============================================================================
@@ -785,6 +3771,31 @@ def main():
         ("Counter Flow", test_counter_flow),
         ("is_cacheable", test_is_cacheable),
         ("Cache Stats", test_cache_stats),
+        ("Persistent Backend", test_persistent_backend),
+        ("LRU Eviction", test_lru_eviction),
+        ("Expiry Sweeper", test_expiry_sweeper),
+        ("SQL Fingerprint", test_sql_fingerprint),
+        ("Orchestrator Cache Shortcut", test_orchestrator_cache_shortcut),
+        ("Single-Flight", test_single_flight),
+        ("Relative Date Resolution", test_relative_dates),
+        ("Freshness Invalidation", test_freshness_invalidation),
+        ("Columnar Cached Rows", test_columnar_rows),
+        ("Cache Snapshot", test_cache_snapshot),
+        ("Concurrent Cache Access", test_concurrent_cache),
+        ("Shared Cache Tier", test_shared_cache_tier),
+        ("Negative Cache", test_negative_cache),
+        ("Stale-While-Revalidate", test_stale_while_revalidate),
+        ("Slot Question Keys", test_slot_question_keys),
+        ("Query Subsumption", test_query_subsumption),
+        ("Daily Partials", test_daily_partials),
+        ("Adaptive TTL", test_adaptive_ttl),
+        ("Write-Aware Invalidation", test_write_invalidation),
+        ("Cache Admission", test_admission),
+        ("Async run_sql", test_async_run_sql),
+        ("Streaming Rows", test_streaming_rows),
+        ("Arrow Fetch", test_arrow_fetch),
+        ("Cost Guard", test_cost_guard),
+        ("Job Stats", test_job_stats),
     ]
     
     for name, test_func in tests: